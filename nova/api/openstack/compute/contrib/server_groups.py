@@ -158,7 +158,7 @@ class ServerGroupController(wsgi.Controller):
             # Display the instances that are not deleted.
             filters = {'uuid': group.members, 'deleted': False}
             instances = instance_obj.InstanceList.get_by_filters(
-                context, filters=filters)
+                context, filters=filters, columns=[])
             members = [instance.uuid for instance in instances]
         server_group['members'] = members
         return server_group
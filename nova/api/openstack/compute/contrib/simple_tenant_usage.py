@@ -16,18 +16,21 @@
 import datetime
 
 import iso8601
+from oslo.config import cfg
 import six.moves.urllib.parse as urlparse
 from webob import exc
 
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import tenant_usage
 from nova import exception
-from nova.objects import flavor as flavor_obj
-from nova.objects import instance as instance_obj
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import timeutils
 
+CONF = cfg.CONF
+CONF.import_opt('tenant_usage_rollup', 'nova.compute.tenant_usage')
+
 authorize_show = extensions.extension_authorizer('compute',
                                                  'simple_tenant_usage:show')
 authorize_list = extensions.extension_authorizer('compute',
@@ -75,144 +78,6 @@ class SimpleTenantUsagesTemplate(xmlutil.TemplateBuilder):
 
 
 class SimpleTenantUsageController(object):
-    def _hours_for(self, instance, period_start, period_stop):
-        launched_at = instance.launched_at
-        terminated_at = instance.terminated_at
-        if terminated_at is not None:
-            if not isinstance(terminated_at, datetime.datetime):
-                # NOTE(mriedem): Instance object DateTime fields are
-                # timezone-aware so convert using isotime.
-                terminated_at = timeutils.parse_isotime(terminated_at)
-
-        if launched_at is not None:
-            if not isinstance(launched_at, datetime.datetime):
-                launched_at = timeutils.parse_isotime(launched_at)
-
-        if terminated_at and terminated_at < period_start:
-            return 0
-        # nothing if it started after the usage report ended
-        if launched_at and launched_at > period_stop:
-            return 0
-        if launched_at:
-            # if instance launched after period_started, don't charge for first
-            start = max(launched_at, period_start)
-            if terminated_at:
-                # if instance stopped before period_stop, don't charge after
-                stop = min(period_stop, terminated_at)
-            else:
-                # instance is still running, so charge them up to current time
-                stop = period_stop
-            dt = stop - start
-            seconds = (dt.days * 3600 * 24 + dt.seconds +
-                       dt.microseconds / 100000.0)
-
-            return seconds / 3600.0
-        else:
-            # instance hasn't launched, so no charge
-            return 0
-
-    def _get_flavor(self, context, instance, flavors_cache):
-        """Get flavor information from the instance's system_metadata,
-        allowing a fallback to lookup by-id for deleted instances only.
-        """
-        try:
-            return instance.get_flavor()
-        except KeyError:
-            if not instance.deleted:
-                # Only support the fallback mechanism for deleted instances
-                # that would have been skipped by migration #153
-                raise
-
-        flavor_type = instance.instance_type_id
-        if flavor_type in flavors_cache:
-            return flavors_cache[flavor_type]
-
-        try:
-            flavor_ref = flavor_obj.Flavor.get_by_id(context, flavor_type)
-            flavors_cache[flavor_type] = flavor_ref
-        except exception.FlavorNotFound:
-            # can't bill if there is no flavor
-            flavor_ref = None
-
-        return flavor_ref
-
-    def _tenant_usages_for_period(self, context, period_start,
-                                  period_stop, tenant_id=None, detailed=True):
-
-        instances = instance_obj.InstanceList.get_active_by_window_joined(
-                        context, period_start, period_stop, tenant_id,
-                        expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS)
-        rval = {}
-        flavors = {}
-
-        for instance in instances:
-            info = {}
-            info['hours'] = self._hours_for(instance,
-                                            period_start,
-                                            period_stop)
-            flavor = self._get_flavor(context, instance, flavors)
-            if not flavor:
-                continue
-
-            info['instance_id'] = instance.uuid
-            info['name'] = instance.display_name
-
-            info['memory_mb'] = flavor.memory_mb
-            info['local_gb'] = flavor.root_gb + flavor.ephemeral_gb
-            info['vcpus'] = flavor.vcpus
-
-            info['tenant_id'] = instance.project_id
-
-            info['flavor'] = flavor.name
-
-            # NOTE(mriedem): We need to normalize the start/end times back
-            # to timezone-naive so the response doesn't change after the
-            # conversion to objects.
-            info['started_at'] = timeutils.normalize_time(instance.launched_at)
-
-            info['ended_at'] = (
-                timeutils.normalize_time(instance.terminated_at) if
-                    instance.terminated_at else None)
-
-            if info['ended_at']:
-                info['state'] = 'terminated'
-            else:
-                info['state'] = instance.vm_state
-
-            now = timeutils.utcnow()
-
-            if info['state'] == 'terminated':
-                delta = info['ended_at'] - info['started_at']
-            else:
-                delta = now - info['started_at']
-
-            info['uptime'] = delta.days * 24 * 3600 + delta.seconds
-
-            if info['tenant_id'] not in rval:
-                summary = {}
-                summary['tenant_id'] = info['tenant_id']
-                if detailed:
-                    summary['server_usages'] = []
-                summary['total_local_gb_usage'] = 0
-                summary['total_vcpus_usage'] = 0
-                summary['total_memory_mb_usage'] = 0
-                summary['total_hours'] = 0
-                summary['start'] = timeutils.normalize_time(period_start)
-                summary['stop'] = timeutils.normalize_time(period_stop)
-                rval[info['tenant_id']] = summary
-
-            summary = rval[info['tenant_id']]
-            summary['total_local_gb_usage'] += info['local_gb'] * info['hours']
-            summary['total_vcpus_usage'] += info['vcpus'] * info['hours']
-            summary['total_memory_mb_usage'] += (info['memory_mb'] *
-                                                 info['hours'])
-
-            summary['total_hours'] += info['hours']
-            if detailed:
-                summary['server_usages'].append(info)
-
-        return rval.values()
-
     def _parse_datetime(self, dtstr):
         if not dtstr:
             value = timeutils.utcnow()
@@ -270,10 +135,15 @@ class SimpleTenantUsageController(object):
         now = timeutils.parse_isotime(timeutils.strtime())
         if period_stop > now:
             period_stop = now
-        usages = self._tenant_usages_for_period(context,
-                                                period_start,
-                                                period_stop,
-                                                detailed=detailed)
+        if detailed or not CONF.tenant_usage_rollup:
+            usages = tenant_usage.get_tenant_usages(context,
+                                                    period_start,
+                                                    period_stop,
+                                                    detailed=detailed)
+        else:
+            usages = tenant_usage.get_tenant_usage_totals(context,
+                                                          period_start,
+                                                          period_stop)
         return {'tenant_usages': usages}
 
     @wsgi.serializers(xml=SimpleTenantUsageTemplate)
@@ -293,7 +163,7 @@ class SimpleTenantUsageController(object):
         now = timeutils.parse_isotime(timeutils.strtime())
         if period_stop > now:
             period_stop = now
-        usage = self._tenant_usages_for_period(context,
+        usage = tenant_usage.get_tenant_usages(context,
                                                period_start,
                                                period_stop,
                                                tenant_id=tenant_id,
@@ -52,6 +52,12 @@ server_opts = [
                      ' or rescue, If the hypervisor does not support'
                      ' password injection then the password returned will'
                      ' not be correct'),
+    cfg.IntOpt('osapi_servers_stream_page_size',
+               default=0,
+               help='Server listings longer than this are read from the'
+                    ' database this many servers at a time and written out'
+                    ' as they are read, when the response is JSON. 0'
+                    ' disables streaming'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(server_opts)
@@ -594,12 +600,45 @@ class Controller(wsgi.Controller):
                 search_opts['user_id'] = context.user_id
 
         limit, marker = common.get_limit_and_marker(req)
+        # The index only shows the names and links of the servers.
+        columns = None if is_detail else ['display_name']
+
+        # The IP filters are applied after the instances are read, so that
+        # a short page does not tell that the listing is over.
+        page_size = CONF.osapi_servers_stream_page_size
+        if (page_size and limit > page_size and
+                not set(['ip', 'ip6', 'fixed_ip']) & set(search_opts)):
+            instance_list = self._get_instance_list(context, search_opts,
+                                                    page_size, marker,
+                                                    columns)
+            pages = self._get_instance_pages(req, search_opts, limit,
+                                             page_size, columns,
+                                             instance_list, is_detail)
+            if is_detail:
+                servers = self._view_builder.detail_pages(req, pages)
+            else:
+                servers = self._view_builder.index_pages(req, pages)
+            return wsgi.StreamedResponseObject('servers', servers)
+
+        instance_list = self._get_instance_list(context, search_opts, limit,
+                                                marker, columns)
+        if is_detail:
+            instance_list.fill_faults()
+            response = self._view_builder.detail(req, instance_list)
+        else:
+            response = self._view_builder.index(req, instance_list)
+        req.cache_db_instances(instance_list)
+        return response
+
+    def _get_instance_list(self, context, search_opts, limit, marker,
+                           columns):
         try:
-            instance_list = self.compute_api.get_all(context,
-                                                     search_opts=search_opts,
-                                                     limit=limit,
-                                                     marker=marker,
-                                                     want_objects=True)
+            return self.compute_api.get_all(context,
+                                            search_opts=search_opts,
+                                            limit=limit,
+                                            marker=marker,
+                                            want_objects=True,
+                                            columns=columns)
         except exception.MarkerNotFound:
             msg = _('marker [%s] not found') % marker
             raise exc.HTTPBadRequest(explanation=msg)
@@ -607,15 +646,43 @@ class Controller(wsgi.Controller):
             log_msg = _("Flavor '%s' could not be found ")
             LOG.debug(log_msg, search_opts['flavor'])
             # TODO(mriedem): Move to ObjectListBase.__init__ for empty lists.
-            instance_list = instance_obj.InstanceList(objects=[])
+            return instance_obj.InstanceList(objects=[])
 
-        if is_detail:
-            instance_list.fill_faults()
-            response = self._view_builder.detail(req, instance_list)
-        else:
-            response = self._view_builder.index(req, instance_list)
-        req.cache_db_instances(instance_list)
-        return response
+    def _get_instance_pages(self, req, search_opts, limit, page_size,
+                            columns, instance_list, is_detail):
+        """Generate the pages of a server listing, starting with
+        instance_list, until limit servers are read.
+
+        Only the instances of the current page are cached in the request,
+        for the extensions processing its view.
+        """
+        context = req.environ['nova.context']
+        while True:
+            req.uncache_db_instances()
+            req.cache_db_instances(instance_list)
+            if is_detail:
+                instance_list.fill_faults()
+            yield instance_list
+
+            limit -= len(instance_list)
+            if len(instance_list) < page_size or not limit:
+                break
+            marker = instance_list[-1]['uuid']
+            # NOTE: The response has started, so an error can only end the
+            # listing early.
+            try:
+                instance_list = self.compute_api.get_all(
+                        context, search_opts=search_opts,
+                        limit=min(page_size, limit), marker=marker,
+                        want_objects=True, columns=columns)
+            except exception.MarkerNotFound:
+                LOG.warn(_("Server listing ended early, the instance %s "
+                           "ending the last page was deleted"), marker)
+                break
+            except exception.FlavorNotFound:
+                LOG.warn(_("Server listing ended early, flavor '%s' could "
+                           "not be found"), search_opts.get('flavor'))
+                break
 
     def _get_server(self, context, req, instance_uuid):
         """Utility function for looking up an instance by uuid."""
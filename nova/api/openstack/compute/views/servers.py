@@ -134,6 +134,35 @@ class ViewBuilder(common.ViewBuilder):
 
         return servers_dict
 
+    def index_pages(self, request, pages):
+        """Show a list of servers read page by page, without details."""
+        return self._list_view_pages(self.basic, request, pages)
+
+    def detail_pages(self, request, pages):
+        """Detailed view of a list of instances read page by page."""
+        return self._list_view_pages(self.show, request, pages)
+
+    def _list_view_pages(self, func, request, pages):
+        """Provide a view for each page of a list of servers.
+
+        The links to the next servers are added to the view of the last
+        page.
+        """
+        count = 0
+        last_page = []
+        for servers in pages:
+            count += len(servers)
+            if servers:
+                last_page = servers
+            yield dict(servers=[func(request, server)["server"]
+                                for server in servers])
+        servers_links = self._get_collection_links(request,
+                                                   last_page,
+                                                   self._collection_name,
+                                                   count=count)
+        if servers_links:
+            yield dict(servers=[], servers_links=servers_links)
+
     @staticmethod
     def _get_metadata(instance):
         # FIXME(danms): Transitional support for objects
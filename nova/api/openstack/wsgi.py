@@ -89,6 +89,14 @@ class Request(webob.Request):
         for item in items:
             db_items[item[item_key]] = item
 
+    def uncache_db_items(self, key):
+        """Forget the objects stored under key.
+
+        A streamed response uses this to drop each chunk of objects once
+        it has been written out.
+        """
+        self._extension_data['db_items'].pop(key, None)
+
     def get_db_items(self, key):
         """Allow an API extension to get previously stored objects within
         the same API request.
@@ -111,6 +119,9 @@ class Request(webob.Request):
     def cache_db_instance(self, instance):
         self.cache_db_items('instances', [instance], 'uuid')
 
+    def uncache_db_instances(self):
+        self.uncache_db_items('instances')
+
     def get_db_instances(self):
         return self.get_db_items('instances')
 
@@ -637,6 +648,94 @@ class ResponseObject(object):
         return self._headers.copy()
 
 
+class StreamedResponseObject(ResponseObject):
+    """A response object listing items which are serialized as they come.
+
+    chunks is an iterable of dicts each holding a list of items under key,
+    e.g. {'servers': [...]}; the other members of the chunks, such as
+    'servers_links', are written after the list.  Only the first chunk is
+    read before the response is returned, so memory does not grow with
+    the number of items.
+
+    Post-processing extensions are run on every chunk as if it were a
+    whole response, which suits the extensions decorating each listed
+    item.  Only JSON is streamed; for other media types, or when an
+    extension needs the whole response, the chunks are merged with
+    materialize() and serialized as usual.
+    """
+
+    def __init__(self, key, chunks, code=None, headers=None, **serializers):
+        super(StreamedResponseObject, self).__init__(None, code=code,
+                                                     headers=headers,
+                                                     **serializers)
+        self.key = key
+        self.chunks = chunks
+
+    def can_stream(self, extensions):
+        return (isinstance(self.serializer, JSONDictSerializer) and
+                not any(inspect.isgenerator(ext) for ext in extensions))
+
+    def materialize(self):
+        """Read all the chunks into a single response dict."""
+        obj = {self.key: []}
+        for chunk in self.chunks:
+            obj[self.key].extend(chunk.pop(self.key))
+            obj.update(chunk)
+        self.obj = obj
+
+    def _chunk_object(self, chunk):
+        chunk_obj = ResponseObject(chunk)
+        chunk_obj.media_type = self.media_type
+        chunk_obj.serializer = self.serializer
+        return chunk_obj
+
+    def serialize_stream(self, request, content_type, process_chunk):
+        """Return a webob.Response streaming the wrapped chunks.
+
+        process_chunk is called with a ResponseObject for each chunk
+        before it is written out.  If it returns a response for the first
+        chunk, that response is returned instead; later chunks can no
+        longer change the response, so the listing is cut short.
+        """
+        chunks = iter(self.chunks)
+        chunk_obj = self._chunk_object(next(chunks, {self.key: []}))
+        response = process_chunk(chunk_obj)
+        if response:
+            return response
+
+        response = webob.Response(app_iter=self._iter_body(chunk_obj, chunks,
+                                                           process_chunk))
+        response.status_int = self.code
+        for hdr, value in self._headers.items():
+            response.headers[hdr] = utils.utf8(str(value))
+        response.headers['Content-Type'] = utils.utf8(content_type)
+        return response
+
+    def _iter_body(self, chunk_obj, chunks, process_chunk):
+        serialize = self.serializer.serialize
+        yield '{%s: [' % serialize(self.key)
+        trailer = {}
+        separator = ''
+        while True:
+            items = chunk_obj.obj.pop(self.key)
+            if items:
+                yield separator + ', '.join(serialize(item) for item in items)
+                separator = ', '
+            trailer.update(chunk_obj.obj)
+            try:
+                chunk_obj = self._chunk_object(next(chunks))
+            except StopIteration:
+                break
+            if process_chunk(chunk_obj):
+                LOG.error(_("Extension failed on a chunk of a streamed "
+                            "response, the response is truncated"))
+                return
+        yield ']'
+        for name, value in trailer.items():
+            yield ', %s: %s' % (serialize(name), serialize(value))
+        yield '}'
+
+
 def action_peek_json(body):
     """Determine action to invoke."""
 
@@ -1006,9 +1105,26 @@ class Resource(wsgi.Application):
                     resp_obj._default_code = meth.wsgi_code
                 resp_obj.preserialize(accept, self.default_serializers)
 
-                # Process post-processing extensions
-                response = self.post_process_extensions(post, resp_obj,
-                                                        request, action_args)
+                streamed = isinstance(resp_obj, StreamedResponseObject)
+                if streamed:
+                    post = list(post)
+                    streamed = resp_obj.can_stream(post)
+                    if not streamed:
+                        resp_obj.materialize()
+
+                if streamed:
+                    # Post-processing extensions are run on each chunk
+                    # as it is written out
+                    def process_chunk(chunk_obj):
+                        return self.post_process_extensions(
+                            post, chunk_obj, request, action_args)
+
+                    response = resp_obj.serialize_stream(request, accept,
+                                                         process_chunk)
+                else:
+                    # Process post-processing extensions
+                    response = self.post_process_extensions(
+                        post, resp_obj, request, action_args)
 
             if resp_obj and not response:
                 response = resp_obj.serialize(request, accept,
@@ -56,6 +56,7 @@ from __future__ import print_function
 
 import os
 import sys
+import time
 
 import netaddr
 from oslo.config import cfg
@@ -69,6 +70,7 @@ from nova import config
 from nova import context
 from nova import db
 from nova.db import migration
+from nova.db import stats as db_stats
 from nova import exception
 from nova.openstack.common import cliutils
 from nova.openstack.common.db import exception as db_exc
@@ -94,6 +96,9 @@ CONF.import_opt('public_interface', 'nova.network.linux_net')
 
 QUOTAS = quota.QUOTAS
 
+# Seconds between the progress reports of db archive_deleted_rows
+ARCHIVE_REPORT_INTERVAL = 10
+
 
 # Decorators for actions
 def args(*args, **kwargs):
@@ -890,17 +895,113 @@ class DbCommands(object):
 
     @args('--max_rows', metavar='<number>',
             help='Maximum number of deleted rows to archive')
-    def archive_deleted_rows(self, max_rows):
+    @args('--batch_size', metavar='<number>',
+            help='Number of rows of a table archived in each transaction '
+                 '(default: 1000)')
+    @args('--workers', metavar='<number>',
+            help='Number of groups of tables archived in parallel '
+                 '(default: 1)')
+    def archive_deleted_rows(self, max_rows=None, batch_size=None,
+                             workers=None):
         """Move up to max_rows deleted rows from production tables to shadow
         tables.
+
+        An interrupted run is resumed by running the command again.
         """
         if max_rows is not None:
             max_rows = int(max_rows)
             if max_rows < 0:
                 print(_("Must supply a positive value for max_rows"))
                 return(1)
+        batch_size = int(batch_size or 1000)
+        workers = int(workers or 1)
+        if batch_size <= 0 or workers <= 0:
+            print(_("Must supply a positive value for batch_size and "
+                    "workers"))
+            return(1)
+
+        rows_by_table = {}
+        start = time.time()
+        last_report = [start]
+
+        def progress(tablename, rows):
+            rows_by_table[tablename] = rows_by_table.get(tablename, 0) + rows
+            now = time.time()
+            if now - last_report[0] >= ARCHIVE_REPORT_INTERVAL:
+                last_report[0] = now
+                print(_("%(rows)d rows archived, %(rate).1f rows/s") %
+                      self._archive_stats(rows_by_table, now - start))
+
         admin_context = context.get_admin_context()
-        db.archive_deleted_rows(admin_context, max_rows)
+        db.archive_deleted_rows(admin_context, max_rows,
+                                batch_size=batch_size, workers=workers,
+                                progress=progress)
+
+        stats = self._archive_stats(rows_by_table, time.time() - start)
+        for tablename in sorted(rows_by_table):
+            print("%-40s %d" % (tablename, rows_by_table[tablename]))
+        print(_("%(rows)d rows archived in %(elapsed).1fs, "
+                "%(rate).1f rows/s") % stats)
+
+    @staticmethod
+    def _archive_stats(rows_by_table, elapsed):
+        rows = sum(rows_by_table.values())
+        return {'rows': rows, 'elapsed': elapsed,
+                'rate': rows / elapsed if elapsed else 0.0}
+
+    @args('--path', metavar='<path>',
+            help='Directory of the statistics (default: db_stats_dir)')
+    @args('--sort', metavar='<total|calls|statements|rows>',
+            help='Figure the functions, requests and periodic tasks are '
+                 'sorted by (default: total)')
+    @args('--limit', metavar='<number>',
+            help='Number of functions, requests and periodic tasks '
+                 'printed (default: 20)')
+    def stats(self, path=None, sort=None, limit=None):
+        """Print the database API statistics written by the services
+        which collect them.
+        """
+        path = path or CONF.db_stats_dir
+        if not path:
+            print(_("Must supply the directory of the statistics with "
+                    "--path or db_stats_dir"))
+            return(1)
+        sort = sort or 'total'
+        if sort not in ('total', 'calls', 'statements', 'rows'):
+            print(_("Invalid sort key %s") % sort)
+            return(1)
+        limit = int(limit or 20)
+        try:
+            report = db_stats.merge_reports(db_stats.load_reports(path))
+        except (IOError, OSError, ValueError) as e:
+            print(_("Failed to read the statistics: %s") % e)
+            return(1)
+
+        def top(figures):
+            return sorted(figures.iteritems(), key=lambda item: item[1][sort],
+                          reverse=True)[:limit]
+
+        print_format = "%-48s %10s %10s %10s %10s %10s %10s"
+        print(print_format % (_('Function'), _('Calls'), _('Total (s)'),
+                              _('Avg (ms)'), _('Max (ms)'),
+                              _('Statements'), _('Rows')))
+        for name, timing in top(report['functions']):
+            print(print_format % (name, timing['calls'],
+                                  '%.3f' % timing['total'],
+                                  '%.3f' % (1000 * timing['average']),
+                                  '%.3f' % (1000 * timing['max']),
+                                  timing['statements'], timing['rows']))
+        print_format = "%-48s %10s %10s %10s %10s"
+        for kind, callers in ((_('Periodic task'), report['tasks']),
+                              (_('Request'), report['requests'])):
+            print()
+            print(print_format % (kind, _('Calls'), _('Total (s)'),
+                                  _('Statements'), _('Rows')))
+            for name, figures in top(callers):
+                print(print_format % (name, figures['calls'],
+                                      '%.3f' % figures['total'],
+                                      figures['statements'],
+                                      figures['rows']))
 
 
 class FlavorCommands(object):
@@ -72,6 +72,7 @@ from nova.openstack.common import uuidutils
 import nova.policy
 from nova import quota
 from nova import rpc
+from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import servicegroup
 from nova import utils
 from nova import volume
@@ -1826,7 +1827,7 @@ class API(base.Base):
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
                 sort_dir='desc', limit=None, marker=None, want_objects=False,
-                expected_attrs=None):
+                expected_attrs=None, columns=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1838,6 +1839,10 @@ class API(base.Base):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        If 'columns' is given, only those fields of the instances are read
+        up front, along with 'expected_attrs', and the other ones are
+        lazy-loaded on access.
         """
 
         #TODO(bcwaldon): determine the best argument for target here
@@ -1897,9 +1902,13 @@ class API(base.Base):
                     except ValueError:
                         return []
 
+        if 'ip6' in filters or 'ip' in filters:
+            # The IP filters need the network info of every instance.
+            columns = None
+
         inst_models = self._get_instances_by_filters(context, filters,
                 sort_key, sort_dir, limit=limit, marker=marker,
-                expected_attrs=expected_attrs)
+                expected_attrs=expected_attrs, columns=columns)
 
         if 'ip6' in filters or 'ip' in filters:
             inst_models = self._ip_filter(inst_models, filters)
@@ -1936,14 +1945,19 @@ class API(base.Base):
     def _get_instances_by_filters(self, context, filters,
                                   sort_key, sort_dir,
                                   limit=None,
-                                  marker=None, expected_attrs=None):
-        fields = ['metadata', 'system_metadata', 'info_cache',
-                  'security_groups']
+                                  marker=None, expected_attrs=None,
+                                  columns=None):
+        if columns is None:
+            fields = ['metadata', 'system_metadata', 'info_cache',
+                      'security_groups']
+        else:
+            fields = []
         if expected_attrs:
             fields.extend(expected_attrs)
         return instance_obj.InstanceList.get_by_filters(
             context, filters=filters, sort_key=sort_key, sort_dir=sort_dir,
-            limit=limit, marker=marker, expected_attrs=fields)
+            limit=limit, marker=marker, expected_attrs=fields,
+            columns=columns)
 
     @wrap_check_policy
     @check_instance_cell
@@ -3305,6 +3319,7 @@ class AggregateAPI(base.Base):
     """Sub-set of the Compute Manager API for managing host aggregates."""
     def __init__(self, **kwargs):
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
+        self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         super(AggregateAPI, self).__init__(**kwargs)
 
     @wrap_exception()
@@ -3362,6 +3377,7 @@ class AggregateAPI(base.Base):
         if values:
             aggregate.metadata = values
         aggregate.save()
+        self.scheduler_rpcapi.aggregates_changed(context)
         # If updated values include availability_zones, then the cache
         # which stored availability_zones and host need to be reset
         if values.get('availability_zone'):
@@ -3375,6 +3391,7 @@ class AggregateAPI(base.Base):
         self.is_safe_to_update_az(context, aggregate,
                          metadata, "update aggregate metadata")
         aggregate.update_metadata(metadata)
+        self.scheduler_rpcapi.aggregates_changed(context)
         # If updated metadata include availability_zones, then the cache
         # which stored availability_zones and host need to be reset
         if metadata and metadata.get('availability_zone'):
@@ -3443,6 +3460,7 @@ class AggregateAPI(base.Base):
                 self._check_az_for_host(aggregate_meta, host_az, aggregate_id)
         aggregate = aggregate_obj.Aggregate.get_by_id(context, aggregate_id)
         aggregate.add_host(context, host_name)
+        self.scheduler_rpcapi.aggregates_changed(context)
         self._update_az_cache_for_host(context, host_name, aggregate.metadata)
         #NOTE(jogo): Send message to host to support resource pools
         self.compute_rpcapi.add_aggregate_host(context,
@@ -3465,6 +3483,7 @@ class AggregateAPI(base.Base):
         service_obj.Service.get_by_compute_host(context, host_name)
         aggregate = aggregate_obj.Aggregate.get_by_id(context, aggregate_id)
         aggregate.delete_host(host_name)
+        self.scheduler_rpcapi.aggregates_changed(context)
         self._update_az_cache_for_host(context, host_name, aggregate.metadata)
         self.compute_rpcapi.remove_aggregate_host(context,
                 aggregate=aggregate, host_param=host_name, host=host_name)
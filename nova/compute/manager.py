@@ -135,6 +135,24 @@ interval_opts = [
                default=600,
                help='Interval to sync power states between '
                     'the database and the hypervisor'),
+    cfg.BoolOpt('sync_power_state_from_events',
+                default=False,
+                help='Keep the power states in sync from the lifecycle '
+                     'events of the hypervisor. The periodic sync then only '
+                     'checks the instances whose power state was not '
+                     'confirmed for sync_power_state_max_age seconds. Only '
+                     'for the hypervisors emitting lifecycle events, such '
+                     'as libvirt'),
+    cfg.IntOpt('sync_power_state_max_age',
+               default=3600,
+               help='Number of seconds after which the power state of an '
+                    'instance is checked by the periodic sync when it is '
+                    'kept in sync from the lifecycle events'),
+    cfg.IntOpt('sync_power_state_max_instances',
+               default=50,
+               help='Maximum number of instances checked by each periodic '
+                    'sync when the power states are kept in sync from the '
+                    'lifecycle events'),
     cfg.IntOpt("heal_instance_info_cache_interval",
                default=60,
                help="Number of seconds between instance info_cache self "
@@ -604,6 +622,8 @@ class ComputeManager(manager.Manager):
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         self._resource_tracker_dict = {}
         self.instance_events = InstanceEvents()
+        # When the power state of each instance was last confirmed, by uuid
+        self._power_state_confirmed = {}
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -1061,9 +1081,10 @@ class ComputeManager(manager.Manager):
                         event.get_transition())
 
         if vm_power_state is not None:
-            self._sync_instance_power_state(context,
-                                            instance,
-                                            vm_power_state)
+            if self._sync_instance_power_state(context,
+                                               instance,
+                                               vm_power_state):
+                self._power_state_confirmed[instance.uuid] = time.time()
 
     def handle_events(self, event):
         if isinstance(event, virtevent.LifecycleEvent):
@@ -4885,6 +4906,7 @@ class ComputeManager(manager.Manager):
                         context, instance, "live_migration.rollback.dest.end",
                         network_info=network_info)
 
+    @manager.periodic_task_options(priority=-5)
     @periodic_task.periodic_task(
         spacing=CONF.heal_instance_info_cache_interval)
     def _heal_instance_info_cache(self, context):
@@ -5152,6 +5174,7 @@ class ComputeManager(manager.Manager):
                                       num_instances,
                                       time.time() - start_time))
 
+    @manager.periodic_task_options(priority=-5)
     @periodic_task.periodic_task(spacing=CONF.bandwidth_poll_interval)
     def _poll_bandwidth_usage(self, context):
 
@@ -5269,6 +5292,7 @@ class ComputeManager(manager.Manager):
                                                 usage['wr_bytes'],
                                                 usage['instance'])
 
+    @manager.periodic_task_options(priority=-5)
     @periodic_task.periodic_task(spacing=CONF.volume_usage_poll_interval)
     def _poll_volume_usage(self, context, start_time=None):
         if CONF.volume_usage_poll_interval == 0:
@@ -5290,6 +5314,7 @@ class ComputeManager(manager.Manager):
 
         self._update_volume_usage_cache(context, vol_usages)
 
+    @manager.periodic_task_options(priority=5)
     @periodic_task.periodic_task(spacing=CONF.sync_power_state_interval,
                                  run_immediately=True)
     def _sync_power_states(self, context):
@@ -5300,6 +5325,10 @@ class ComputeManager(manager.Manager):
         number of virtual machines known by the database, we proceed in a lazy
         loop, one database record at a time, checking if the hypervisor has the
         same power state as is in the database.
+
+        When the power states are kept in sync from the lifecycle events,
+        only the instances whose power state was not confirmed recently are
+        checked.
         """
         db_instances = instance_obj.InstanceList.get_by_host(context,
                                                              self.host,
@@ -5314,42 +5343,103 @@ class ComputeManager(manager.Manager):
                      {'num_db_instances': num_db_instances,
                       'num_vm_instances': num_vm_instances})
 
-        for db_instance in db_instances:
-            if db_instance['task_state'] is not None:
-                LOG.info(_("During sync_power_state the instance has a "
-                           "pending task (%(task)s). Skip."),
-                         {'task': db_instance['task_state']},
-                         instance=db_instance)
-                continue
-            # No pending tasks. Now try to figure out the real vm_power_state.
+        if CONF.sync_power_state_from_events:
+            db_instances = self._get_unconfirmed_power_states(db_instances)
+
+        # NOTE: The power states found out of sync are saved all at once
+        # at the end, rather than one instance at a time.
+        power_state_updates = instance_obj.InstanceList(objects=[])
+        with self.driver.cached_host_stats():
+            for db_instance in db_instances:
+                self._sync_power_state_of(context, db_instance,
+                                          power_state_updates)
+
+        if power_state_updates:
+            # NOTE: A task may have started on an instance since it was
+            # refreshed, in which case its power state is left alone.
+            skipped = power_state_updates.save(context,
+                                               expected_task_state=[None])
+            if skipped:
+                LOG.info(_("During sync_power_state the power state of "
+                           "%d instances was not updated, as they have a "
+                           "pending task or were deleted."), len(skipped))
+                for uuid in skipped:
+                    self._power_state_confirmed.pop(uuid, None)
+
+    def _get_unconfirmed_power_states(self, db_instances):
+        """Return the instances whose power state was not confirmed by a
+        lifecycle event or a sync for CONF.sync_power_state_max_age seconds,
+        the least recently confirmed first, and at most
+        CONF.sync_power_state_max_instances of them.
+        """
+        confirmed = self._power_state_confirmed
+        uuids = set(db_instance.uuid for db_instance in db_instances)
+        for uuid in confirmed.keys():
+            if uuid not in uuids:
+                # No longer on this host
+                del confirmed[uuid]
+
+        confirmed_before = time.time() - CONF.sync_power_state_max_age
+        unconfirmed = [db_instance for db_instance in db_instances
+                       if confirmed.get(db_instance.uuid, 0) <=
+                       confirmed_before]
+        unconfirmed.sort(key=lambda db_instance:
+                         confirmed.get(db_instance.uuid, 0))
+        if len(unconfirmed) > CONF.sync_power_state_max_instances:
+            LOG.debug(_("The power state of %(unconfirmed)d instances was "
+                        "not confirmed recently, checking %(checked)d of "
+                        "them"),
+                      {'unconfirmed': len(unconfirmed),
+                       'checked': CONF.sync_power_state_max_instances})
+        return unconfirmed[:CONF.sync_power_state_max_instances]
+
+    def _sync_power_state_of(self, context, db_instance, power_state_updates):
+        if db_instance['task_state'] is not None:
+            LOG.info(_("During sync_power_state the instance has a "
+                       "pending task (%(task)s). Skip."),
+                     {'task': db_instance['task_state']},
+                     instance=db_instance)
+            return
+        # No pending tasks. Now try to figure out the real vm_power_state.
+        try:
             try:
-                try:
-                    vm_instance = self.driver.get_info(db_instance)
-                    vm_power_state = vm_instance['state']
-                except exception.InstanceNotFound:
-                    vm_power_state = power_state.NOSTATE
-                # Note(maoy): the above get_info call might take a long time,
-                # for example, because of a broken libvirt driver.
-                try:
-                    self._sync_instance_power_state(context,
-                                                    db_instance,
-                                                    vm_power_state,
-                                                    use_slave=True)
-                except exception.InstanceNotFound:
-                    # NOTE(hanlind): If the instance gets deleted during sync,
-                    # silently ignore and move on to next instance.
-                    continue
-            except Exception:
-                LOG.exception(_("Periodic sync_power_state task had an error "
-                                "while processing an instance."),
-                                instance=db_instance)
+                vm_instance = self.driver.get_info(db_instance)
+                vm_power_state = vm_instance['state']
+            except exception.InstanceNotFound:
+                vm_power_state = power_state.NOSTATE
+            # Note(maoy): the above get_info call might take a long time,
+            # for example, because of a broken libvirt driver.
+            try:
+                if self._sync_instance_power_state(
+                        context, db_instance, vm_power_state,
+                        use_slave=True,
+                        power_state_updates=power_state_updates):
+                    # NOTE: The confirmation is dropped again if the bulk
+                    # save of the power states skips the instance.
+                    self._power_state_confirmed[db_instance.uuid] = (
+                            time.time())
+            except exception.InstanceNotFound:
+                # NOTE(hanlind): If the instance gets deleted during sync,
+                # silently ignore and move on to next instance.
+                pass
+        except Exception:
+            LOG.exception(_("Periodic sync_power_state task had an error "
+                            "while processing an instance."),
+                            instance=db_instance)
 
     def _sync_instance_power_state(self, context, db_instance, vm_power_state,
-                                   use_slave=False):
+                                   use_slave=False, power_state_updates=None):
         """Align instance power state between the database and hypervisor.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
+
+        If power_state_updates is an InstanceList, the instance is added to
+        it instead of being saved when its power state is updated, so that
+        the caller can save the updates in bulk.
+
+        Returns whether the power states were compared, which they are not
+        when the instance moved to another host or has a pending task.
         """
 
         # We re-query the DB to get the latest instance info to minimize
@@ -5372,7 +5462,7 @@ class ComputeManager(manager.Manager):
                        {'src': self.host,
                         'dst': db_instance.host},
                      instance=db_instance)
-            return
+            return False
         elif db_instance.task_state is not None:
             # on the receiving end of nova-compute, it could happen
             # that the DB instance already report the new resident
@@ -5383,12 +5473,15 @@ class ComputeManager(manager.Manager):
                        "pending task (%(task)s). Skip."),
                      {'task': db_instance.task_state},
                      instance=db_instance)
-            return
+            return False
 
         if vm_power_state != db_power_state:
             # power_state is always updated from hypervisor to db
             db_instance.power_state = vm_power_state
-            db_instance.save()
+            if power_state_updates is None:
+                db_instance.save()
+            else:
+                power_state_updates.objects.append(db_instance)
             db_power_state = vm_power_state
 
         # Note(maoy): Now resolve the discrepancy between vm_state and
@@ -5478,6 +5571,7 @@ class ComputeManager(manager.Manager):
                 # _cleanup_running_deleted_instances().
                 LOG.warn(_("Instance is not (soft-)deleted."),
                          instance=db_instance)
+        return True
 
     @periodic_task.periodic_task
     def _reclaim_queued_deletes(self, context):
@@ -5513,6 +5607,7 @@ class ComputeManager(manager.Manager):
                                   "instance: %s"),
                                 unicode(e), instance=instance)
 
+    @manager.periodic_task_options(priority=10)
     @periodic_task.periodic_task
     def update_available_resource(self, context):
         """See driver.get_available_resource()
@@ -5736,6 +5831,7 @@ class ComputeManager(manager.Manager):
             else:
                 self._process_instance_event(instance, event)
 
+    @manager.periodic_task_options(priority=-10)
     @periodic_task.periodic_task(spacing=CONF.image_cache_manager_interval,
                                  external_process_ok=True)
     def _run_image_cache_manager_pass(self, context):
@@ -19,6 +19,8 @@ scheduler with useful information about availability through the ComputeNode
 model.
 """
 
+import time
+
 from oslo.config import cfg
 
 from nova.compute import claims
@@ -39,6 +41,7 @@ from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.pci import pci_manager
 from nova import rpc
+from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import utils
 
 resource_tracker_opts = [
@@ -48,7 +51,13 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.IntOpt('resource_audit_interval', default=0,
+               help='Seconds between the full audits of the instances and '
+                    'migrations of the host by the resource tracker.  In '
+                    'between, the usage maintained from the resource claims '
+                    'is kept and only the hypervisor resources are '
+                    'refreshed.  0 audits the usage on every run'),
 ]
 
 CONF = cfg.CONF
@@ -58,6 +67,25 @@ LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
 CONF.import_opt('my_ip', 'nova.netconf')
+CONF.import_opt('scheduler_host_state_updates', 'nova.scheduler.rpcapi')
+
+# Compute node fields the scheduler builds its host states from.
+HOST_STATE_FIELDS = ('memory_mb', 'free_ram_mb', 'local_gb', 'local_gb_used',
+                     'free_disk_gb', 'disk_available_least', 'vcpus',
+                     'vcpus_used', 'updated_at', 'pci_stats', 'host_ip',
+                     'hypervisor_type', 'hypervisor_version',
+                     'hypervisor_hostname', 'cpu_info',
+                     'supported_instances', 'stats', 'metrics')
+
+# Compute node fields maintained from the resource claims between the full
+# audits of the usage.
+TRACKED_USAGE_FIELDS = ('memory_mb_used', 'local_gb_used', 'vcpus_used',
+                        'running_vms', 'current_workload', 'stats',
+                        'pci_stats')
+
+# Compute node fields which are not resource values.
+RECORD_FIELDS = ('id', 'service', 'created_at', 'updated_at', 'deleted_at',
+                 'deleted')
 
 
 class ResourceTracker(object):
@@ -75,6 +103,15 @@ class ResourceTracker(object):
         self.tracked_instances = {}
         self.tracked_migrations = {}
         self.conductor_api = conductor.API()
+        self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
+        # Last compute node values sent to the schedulers and the
+        # generation of that update.
+        self.reported_host_state = {}
+        self.host_state_generation = 0
+        # Compute node values last written to the DB and the time of the
+        # last full audit of the usage.
+        self.written_compute_node = {}
+        self.last_full_audit = 0
         monitor_handler = monitors.ResourceMonitorHandler()
         self.monitors = monitor_handler.choose_monitors(self)
         self.notifier = rpc.get_notifier()
@@ -121,15 +158,16 @@ class ResourceTracker(object):
         claim = claims.Claim(instance_ref, self, self.compute_node,
                              overhead=overhead, limits=limits)
 
-        self._set_instance_host_and_node(context, instance_ref)
-
         # Mark resources in-use and update stats
         self._update_usage_from_instance(self.compute_node, instance_ref)
 
         elevated = context.elevated()
-        # persist changes to the compute node:
+        # persist changes to the compute node before tagging the instance,
+        # which releases the resources a scheduler reserved for it:
         self._update(elevated, self.compute_node)
 
+        self._set_instance_host_and_node(context, instance_ref)
+
         return claim
 
     @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
@@ -310,6 +348,32 @@ class ResourceTracker(object):
             self.pci_tracker.set_hvdevs(jsonutils.loads(resources.pop(
                 'pci_passthrough_devices')))
 
+        full_audit = self._full_audit_due()
+        if full_audit:
+            self._audit_usage(context, resources)
+            self.last_full_audit = time.time()
+        else:
+            self._update_usage_from_tracked(resources)
+
+        self._report_final_resource_view(resources)
+
+        metrics = self._get_host_metrics(context, self.nodename)
+        resources['metrics'] = jsonutils.dumps(metrics)
+        self._sync_compute_node(context, resources)
+
+    def _full_audit_due(self):
+        """Whether the usage has to be audited from the instances and
+        migrations of the host rather than kept from the claims.
+        """
+        if not self.compute_node or self.tracked_migrations:
+            return True
+        return (time.time() - self.last_full_audit >=
+                CONF.resource_audit_interval)
+
+    def _audit_usage(self, context, resources):
+        """Calculate the usage from the instances, migrations and orphans
+        of the host.
+        """
         # Grab all instances assigned to this node:
         instances = instance_obj.InstanceList.get_by_host_and_node(
             context, self.host, self.nodename)
@@ -339,11 +403,19 @@ class ResourceTracker(object):
         else:
             resources['pci_stats'] = jsonutils.dumps([])
 
-        self._report_final_resource_view(resources)
-
-        metrics = self._get_host_metrics(context, self.nodename)
-        resources['metrics'] = jsonutils.dumps(metrics)
-        self._sync_compute_node(context, resources)
+    def _update_usage_from_tracked(self, resources):
+        """Keep the usage maintained from the claims since the last audit,
+        on top of the hypervisor resources.
+        """
+        for key in TRACKED_USAGE_FIELDS:
+            if key in self.compute_node:
+                resources[key] = self.compute_node[key]
+        if self.pci_tracker:
+            resources['pci_stats'] = jsonutils.dumps(self.pci_tracker.stats)
+        resources['free_ram_mb'] = (resources['memory_mb'] -
+                                    resources['memory_mb_used'])
+        resources['free_disk_gb'] = (resources['local_gb'] -
+                                     resources['local_gb_used'])
 
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
@@ -374,15 +446,17 @@ class ResourceTracker(object):
 
         else:
             # just update the record:
-            self._update(context, resources)
-            LOG.info(_('Compute_service record updated for %(host)s:%(node)s')
-                    % {'host': self.host, 'node': self.nodename})
+            if self._update(context, resources):
+                LOG.info(_('Compute_service record updated for '
+                           '%(host)s:%(node)s')
+                        % {'host': self.host, 'node': self.nodename})
 
     def _create(self, context, values):
         """Create the compute node in the DB."""
         # initialize load stats from existing instances:
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
+        self.written_compute_node = dict(values)
 
     def _get_service(self, context):
         try:
@@ -442,13 +516,48 @@ class ResourceTracker(object):
             LOG.audit(_("Free PCI devices: %s") % resources['pci_devices'])
 
     def _update(self, context, values):
-        """Persist the compute node updates to the DB."""
+        """Persist the compute node updates to the DB.
+
+        Only the values which changed since the last write are written.
+        Returns whether the record was written.
+        """
         if "service" in self.compute_node:
             del self.compute_node['service']
-        self.compute_node = self.conductor_api.compute_node_update(
-            context, self.compute_node, values)
+        changes = {}
+        for key, value in values.iteritems():
+            if key in RECORD_FIELDS:
+                continue
+            if (key not in self.written_compute_node or
+                    self.written_compute_node[key] != value):
+                changes[key] = value
+        if changes:
+            self.compute_node = self.conductor_api.compute_node_update(
+                context, self.compute_node, dict(changes))
+            self.written_compute_node.update(changes)
         if self.pci_tracker:
             self.pci_tracker.save(context)
+        if CONF.scheduler_host_state_updates:
+            self._send_host_state_update(context)
+        return bool(changes)
+
+    def _send_host_state_update(self, context):
+        """Send the compute node fields the scheduler uses which changed
+        since the last update to all schedulers.
+        """
+        values = {}
+        for key in HOST_STATE_FIELDS:
+            value = self.compute_node.get(key)
+            if (key not in self.reported_host_state or
+                    self.reported_host_state[key] != value):
+                values[key] = value
+        if not values:
+            return
+
+        self.host_state_generation += 1
+        self.reported_host_state.update(values)
+        self.scheduler_rpcapi.update_host_state(context, self.host,
+                self.nodename, jsonutils.to_primitive(values),
+                self.host_state_generation)
 
     def _update_usage(self, resources, usage, sign=1):
         mem_usage = usage['memory_mb']
@@ -0,0 +1,347 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Usage of the instances of the tenants, and its hourly rollups.
+
+The simple tenant usage API computes the usage of the tenants from the
+instances active during the requested period.  For long periods, the
+usage of the hours rolled up by rollup_tenant_usages() is read from the
+tenant_usages table instead.
+"""
+
+import datetime
+
+import iso8601
+from oslo.config import cfg
+
+from nova import db
+from nova import exception
+from nova.objects import flavor as flavor_obj
+from nova.objects import instance as instance_obj
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova import utils
+
+tenant_usage_opts = [
+    cfg.BoolOpt('tenant_usage_rollup',
+                default=False,
+                help='Roll up the usage of the tenants hour by hour, so '
+                     'that the simple tenant usage API does not compute '
+                     'it from the instances for the hours rolled up'),
+    cfg.IntOpt('tenant_usage_rollup_interval',
+               default=600,
+               help='Interval in seconds between the rollups of the usage '
+                    'of the tenants'),
+    cfg.IntOpt('tenant_usage_rollup_hours',
+               default=24 * 31,
+               help='Number of past hours which are rolled up'),
+    cfg.IntOpt('tenant_usage_rollup_max_hours',
+               default=24,
+               help='Maximum number of hours rolled up at once. The most '
+                    'recent hours are rolled up first'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(tenant_usage_opts)
+CONF.import_opt('host', 'nova.netconf')
+
+LOG = logging.getLogger(__name__)
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def hours_for(instance, period_start, period_stop):
+    """Return the number of hours instance ran between period_start and
+    period_stop.
+    """
+    launched_at = instance.launched_at
+    terminated_at = instance.terminated_at
+    if terminated_at is not None:
+        if not isinstance(terminated_at, datetime.datetime):
+            # NOTE(mriedem): Instance object DateTime fields are
+            # timezone-aware so convert using isotime.
+            terminated_at = timeutils.parse_isotime(terminated_at)
+
+    if launched_at is not None:
+        if not isinstance(launched_at, datetime.datetime):
+            launched_at = timeutils.parse_isotime(launched_at)
+
+    if terminated_at and terminated_at < period_start:
+        return 0
+    # nothing if it started after the usage report ended
+    if launched_at and launched_at > period_stop:
+        return 0
+    if launched_at:
+        # if instance launched after period_started, don't charge for first
+        start = max(launched_at, period_start)
+        if terminated_at:
+            # if instance stopped before period_stop, don't charge after
+            stop = min(period_stop, terminated_at)
+        else:
+            # instance is still running, so charge them up to current time
+            stop = period_stop
+        dt = stop - start
+        seconds = (dt.days * 3600 * 24 + dt.seconds +
+                   dt.microseconds / 100000.0)
+
+        return seconds / 3600.0
+    else:
+        # instance hasn't launched, so no charge
+        return 0
+
+
+def get_flavor(context, instance, flavors_cache):
+    """Get flavor information from the instance's system_metadata,
+    allowing a fallback to lookup by-id for deleted instances only.
+    """
+    try:
+        return instance.get_flavor()
+    except KeyError:
+        if not instance.deleted:
+            # Only support the fallback mechanism for deleted instances
+            # that would have been skipped by migration #153
+            raise
+
+    flavor_type = instance.instance_type_id
+    if flavor_type in flavors_cache:
+        return flavors_cache[flavor_type]
+
+    try:
+        flavor_ref = flavor_obj.Flavor.get_by_id(context, flavor_type)
+        flavors_cache[flavor_type] = flavor_ref
+    except exception.FlavorNotFound:
+        # can't bill if there is no flavor
+        flavor_ref = None
+
+    return flavor_ref
+
+
+def _utc(value):
+    """Make a naive UTC datetime comparable to the instance fields."""
+    return value.replace(tzinfo=iso8601.iso8601.Utc())
+
+
+def rollup_hour(context, period_beginning, flavors_cache=None):
+    """Roll up the usage of the tenants during the hour beginning at
+    period_beginning, a naive UTC datetime.
+    """
+    if flavors_cache is None:
+        flavors_cache = {}
+    period_ending = period_beginning + HOUR
+    instances = instance_obj.InstanceList.get_active_by_window_joined(
+            context, period_beginning, period_ending,
+            expected_attrs=['system_metadata'])
+
+    usages = {}
+    for instance in instances:
+        flavor = get_flavor(context, instance, flavors_cache)
+        if not flavor:
+            continue
+        hours = hours_for(instance, _utc(period_beginning),
+                          _utc(period_ending))
+        usage = usages.setdefault(instance.project_id,
+                                  {'project_id': instance.project_id,
+                                   'hours': 0,
+                                   'vcpus_hours': 0,
+                                   'memory_mb_hours': 0,
+                                   'local_gb_hours': 0})
+        usage['hours'] += hours
+        usage['vcpus_hours'] += flavor.vcpus * hours
+        usage['memory_mb_hours'] += flavor.memory_mb * hours
+        usage['local_gb_hours'] += (flavor.root_gb +
+                                    flavor.ephemeral_gb) * hours
+
+    db.tenant_usage_rollup_create(
+            context, period_beginning, period_ending, usages.values(),
+            message=_("Rolled up %(instances)d instances on %(host)s") %
+                    {'instances': len(instances), 'host': CONF.host})
+    return len(usages)
+
+
+def rollup_tenant_usages(context):
+    """Roll up the hours of the last CONF.tenant_usage_rollup_hours which
+    were not rolled up yet, the most recent ones first.
+
+    Several services may roll up the same hour concurrently: only the
+    first one to record its rollup is kept.
+    """
+    if not CONF.tenant_usage_rollup:
+        return
+    last_beginning = utils.last_completed_audit_period(unit='hour')[0]
+    first_beginning = (last_beginning -
+                       (CONF.tenant_usage_rollup_hours - 1) * HOUR)
+    done = set(db.tenant_usage_rollup_get_periods(
+            context, first_beginning, last_beginning + HOUR))
+
+    flavors_cache = {}
+    rolled_up = 0
+    period_beginning = last_beginning
+    while (period_beginning >= first_beginning and
+           rolled_up < CONF.tenant_usage_rollup_max_hours):
+        if period_beginning not in done:
+            try:
+                tenants = rollup_hour(context, period_beginning,
+                                      flavors_cache)
+                LOG.debug(_("Rolled up the usage of %(tenants)d tenants "
+                            "from %(begin)s"),
+                          {'tenants': tenants, 'begin': period_beginning})
+            except exception.TaskAlreadyRunning:
+                LOG.debug(_("The usage from %s was already rolled up"),
+                          period_beginning)
+            rolled_up += 1
+        period_beginning -= HOUR
+
+
+def get_tenant_usages(context, period_start, period_stop, tenant_id=None,
+                      detailed=True):
+    """Return the usage of the tenants between period_start and
+    period_stop, timezone-aware datetimes, computed from the instances
+    active during the period.
+
+    If detailed is True, the usage of each instance is included.
+    """
+    instances = instance_obj.InstanceList.get_active_by_window_joined(
+                    context, period_start, period_stop, tenant_id,
+                    expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS)
+    rval = {}
+    flavors = {}
+
+    for instance in instances:
+        info = {}
+        info['hours'] = hours_for(instance, period_start, period_stop)
+        flavor = get_flavor(context, instance, flavors)
+        if not flavor:
+            continue
+
+        info['instance_id'] = instance.uuid
+        info['name'] = instance.display_name
+
+        info['memory_mb'] = flavor.memory_mb
+        info['local_gb'] = flavor.root_gb + flavor.ephemeral_gb
+        info['vcpus'] = flavor.vcpus
+
+        info['tenant_id'] = instance.project_id
+
+        info['flavor'] = flavor.name
+
+        # NOTE(mriedem): We need to normalize the start/end times back
+        # to timezone-naive so the response doesn't change after the
+        # conversion to objects.
+        info['started_at'] = timeutils.normalize_time(instance.launched_at)
+
+        info['ended_at'] = (
+            timeutils.normalize_time(instance.terminated_at) if
+                instance.terminated_at else None)
+
+        if info['ended_at']:
+            info['state'] = 'terminated'
+        else:
+            info['state'] = instance.vm_state
+
+        now = timeutils.utcnow()
+
+        if info['state'] == 'terminated':
+            delta = info['ended_at'] - info['started_at']
+        else:
+            delta = now - info['started_at']
+
+        info['uptime'] = delta.days * 24 * 3600 + delta.seconds
+
+        summary = _get_summary(rval, info['tenant_id'], period_start,
+                               period_stop, detailed)
+        summary['total_local_gb_usage'] += info['local_gb'] * info['hours']
+        summary['total_vcpus_usage'] += info['vcpus'] * info['hours']
+        summary['total_memory_mb_usage'] += (info['memory_mb'] *
+                                             info['hours'])
+
+        summary['total_hours'] += info['hours']
+        if detailed:
+            summary['server_usages'].append(info)
+
+    return rval.values()
+
+
+def _get_summary(summaries, tenant_id, period_start, period_stop,
+                 detailed=False):
+    if tenant_id not in summaries:
+        summary = {}
+        summary['tenant_id'] = tenant_id
+        if detailed:
+            summary['server_usages'] = []
+        summary['total_local_gb_usage'] = 0
+        summary['total_vcpus_usage'] = 0
+        summary['total_memory_mb_usage'] = 0
+        summary['total_hours'] = 0
+        summary['start'] = timeutils.normalize_time(period_start)
+        summary['stop'] = timeutils.normalize_time(period_stop)
+        summaries[tenant_id] = summary
+    return summaries[tenant_id]
+
+
+def get_tenant_usage_totals(context, period_start, period_stop):
+    """Return the total usage of the tenants between period_start and
+    period_stop, timezone-aware datetimes.
+
+    The usage of the hours rolled up is read from their rollups, and only
+    the rest of the period is computed from the instances.
+    """
+    first_hour = _utc(timeutils.normalize_time(period_start).replace(
+            minute=0, second=0, microsecond=0))
+    if first_hour < period_start:
+        first_hour += HOUR
+    last_hour = _utc(timeutils.normalize_time(period_stop).replace(
+            minute=0, second=0, microsecond=0))
+
+    rolled_up = set()
+    if first_hour < last_hour:
+        rolled_up = set(_utc(period_beginning) for period_beginning in
+                        db.tenant_usage_rollup_get_periods(
+                            context, timeutils.normalize_time(first_hour),
+                            timeutils.normalize_time(last_hour)))
+
+    # The parts of the period which are not rolled up
+    gaps = []
+    gap_start = period_start
+    hour = first_hour
+    while hour < last_hour:
+        if hour in rolled_up:
+            if gap_start < hour:
+                gaps.append((gap_start, hour))
+            gap_start = hour + HOUR
+        hour += HOUR
+    if gap_start < period_stop:
+        gaps.append((gap_start, period_stop))
+
+    summaries = {}
+    if rolled_up:
+        for usage in db.tenant_usage_rollup_get_by_window(
+                context, timeutils.normalize_time(first_hour),
+                timeutils.normalize_time(last_hour)):
+            summary = _get_summary(summaries, usage['project_id'],
+                                   period_start, period_stop)
+            summary['total_hours'] += usage['hours']
+            summary['total_vcpus_usage'] += usage['vcpus_hours']
+            summary['total_memory_mb_usage'] += usage['memory_mb_hours']
+            summary['total_local_gb_usage'] += usage['local_gb_hours']
+    for gap_start, gap_stop in gaps:
+        for usage in get_tenant_usages(context, gap_start, gap_stop,
+                                       detailed=False):
+            summary = _get_summary(summaries, usage['tenant_id'],
+                                   period_start, period_stop)
+            for key in ('total_hours', 'total_vcpus_usage',
+                        'total_memory_mb_usage', 'total_local_gb_usage'):
+                summary[key] += usage[key]
+    return summaries.values()
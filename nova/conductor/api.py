@@ -66,6 +66,16 @@ class LocalAPI(object):
         return self._manager.instance_update(context, instance_uuid,
                                              updates, 'compute')
 
+    def instance_update_bulk(self, context, updates):
+        """Perform the updates of several instances in one database
+        transaction.
+
+        :param updates: a dict mapping instance uuids to their updates
+        :returns: the list of the updated instances
+        """
+        return self._manager.instance_update_bulk(context, updates,
+                                                  'compute')
+
     def instance_get_by_uuid(self, context, instance_uuid,
                              columns_to_join=None):
         return self._manager.instance_get_by_uuid(context, instance_uuid,
@@ -363,6 +373,16 @@ class API(LocalAPI):
         return self._manager.instance_update(context, instance_uuid,
                                              updates, 'conductor')
 
+    def instance_update_bulk(self, context, updates):
+        """Perform the updates of several instances in one database
+        transaction.
+
+        :param updates: a dict mapping instance uuids to their updates
+        :returns: the list of the updated instances
+        """
+        return self._manager.instance_update_bulk(context, updates,
+                                                  'conductor')
+
 
 class ComputeTaskAPI(object):
     """ComputeTask API that queues up compute tasks for nova-conductor."""
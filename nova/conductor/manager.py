@@ -14,6 +14,7 @@
 
 """Handles database requests from other nova services."""
 
+from oslo.config import cfg
 from oslo import messaging
 import six
 
@@ -23,6 +24,7 @@ from nova.cells import rpcapi as cells_rpcapi
 from nova.compute import api as compute_api
 from nova.compute import rpcapi as compute_rpcapi
 from nova.compute import task_states
+from nova.compute import tenant_usage
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova.conductor.tasks import live_migrate
@@ -41,6 +43,7 @@ from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import periodic_task
 from nova.openstack.common import timeutils
 from nova import quota
 from nova.scheduler import rpcapi as scheduler_rpcapi
@@ -48,6 +51,9 @@ from nova.scheduler import utils as scheduler_utils
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+CONF.import_opt('tenant_usage_rollup_interval', 'nova.compute.tenant_usage')
+
 # Instead of having a huge list of arguments to instance_update(), we just
 # accept a dict of fields to update and use this whitelist to validate it.
 allowed_updates = ['task_state', 'vm_state', 'expected_task_state',
@@ -111,12 +117,7 @@ class ConductorManager(manager.Manager):
         # now a part of the base rpc API.
         return jsonutils.to_primitive({'service': 'conductor', 'arg': arg})
 
-    @messaging.expected_exceptions(KeyError, ValueError,
-                                   exception.InvalidUUID,
-                                   exception.InstanceNotFound,
-                                   exception.UnexpectedTaskStateError)
-    def instance_update(self, context, instance_uuid,
-                        updates, service=None):
+    def _check_instance_updates(self, instance_uuid, updates):
         for key, value in updates.iteritems():
             if key not in allowed_updates:
                 LOG.error(_("Instance update attempted for "
@@ -126,11 +127,31 @@ class ConductorManager(manager.Manager):
             if key in datetime_fields and isinstance(value, six.string_types):
                 updates[key] = timeutils.parse_strtime(value)
 
+    @messaging.expected_exceptions(KeyError, ValueError,
+                                   exception.InvalidUUID,
+                                   exception.InstanceNotFound,
+                                   exception.UnexpectedTaskStateError)
+    def instance_update(self, context, instance_uuid,
+                        updates, service=None):
+        self._check_instance_updates(instance_uuid, updates)
         old_ref, instance_ref = self.db.instance_update_and_get_original(
             context, instance_uuid, updates)
         notifications.send_update(context, old_ref, instance_ref, service)
         return jsonutils.to_primitive(instance_ref)
 
+    @messaging.expected_exceptions(KeyError, ValueError,
+                                   exception.InvalidUUID)
+    def instance_update_bulk(self, context, updates, service=None):
+        for instance_uuid, instance_updates in updates.iteritems():
+            self._check_instance_updates(instance_uuid, instance_updates)
+
+        results = self.db.instance_update_bulk(context, updates)
+        for old_ref, instance_ref in results:
+            notifications.send_update(context, old_ref, instance_ref,
+                                      service)
+        return jsonutils.to_primitive(
+                [instance_ref for old_ref, instance_ref in results])
+
     # NOTE(russellb): This method is now deprecated and can be removed in
     # version 2.0 of the RPC API
     @messaging.expected_exceptions(exception.InstanceNotFound)
@@ -623,10 +644,11 @@ class ConductorManager(manager.Manager):
             if not objinst.obj_attr_is_set(name):
                 # Avoid demand-loading anything
                 continue
+            # NOTE: getattr() rather than [], which indexes object lists
             if (not oldobj.obj_attr_is_set(name) or
-                    oldobj[name] != objinst[name]):
+                    getattr(oldobj, name) != getattr(objinst, name)):
                 updates[name] = field.to_primitive(objinst, name,
-                                                   objinst[name])
+                                                   getattr(objinst, name))
         # This is safe since a field named this would conflict with the
         # method anyway
         updates['obj_what_changed'] = objinst.obj_what_changed()
@@ -640,6 +662,11 @@ class ConductorManager(manager.Manager):
     def object_backport(self, context, objinst, target_version):
         return objinst.obj_to_primitive(target_version=target_version)
 
+    @periodic_task.periodic_task(spacing=CONF.tenant_usage_rollup_interval,
+                                 run_immediately=True)
+    def _rollup_tenant_usages(self, context):
+        tenant_usage.rollup_tenant_usages(context)
+
 
 class ComputeTaskManager(base.Base):
     """Namespace for compute methods.
@@ -876,7 +903,7 @@ class ComputeTaskManager(base.Base):
 
 class _ConductorManagerV2Proxy(object):
 
-    target = messaging.Target(version='2.0')
+    target = messaging.Target(version='2.1')
 
     def __init__(self, manager):
         self.manager = manager
@@ -886,6 +913,9 @@ class _ConductorManagerV2Proxy(object):
         return self.manager.instance_update(context, instance_uuid, updates,
                 service)
 
+    def instance_update_bulk(self, context, updates, service):
+        return self.manager.instance_update_bulk(context, updates, service)
+
     def instance_get_by_uuid(self, context, instance_uuid,
                              columns_to_join):
         return self.manager.instance_get_by_uuid(context, instance_uuid,
@@ -133,6 +133,7 @@ class ConductorAPI(object):
     ...  - Remove block_device_mapping_destroy()
 
     2.0  - Drop backwards compatibility
+    2.1  - Added instance_update_bulk()
     """
 
     VERSION_ALIASES = {
@@ -160,6 +161,13 @@ class ConductorAPI(object):
                           updates=updates_p,
                           service=service)
 
+    def instance_update_bulk(self, context, updates, service=None):
+        updates_p = jsonutils.to_primitive(updates)
+        cctxt = self.client.prepare(version='2.1')
+        return cctxt.call(context, 'instance_update_bulk',
+                          updates=updates_p,
+                          service=service)
+
     def instance_get_by_uuid(self, context, instance_uuid,
                              columns_to_join=None):
         kwargs = {'instance_uuid': instance_uuid,
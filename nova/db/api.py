@@ -30,6 +30,7 @@ these objects be simple dictionaries.
 from oslo.config import cfg
 
 from nova.cells import rpcapi as cells_rpcapi
+from nova.db import stats as db_stats
 from nova.openstack.common.db import api as db_api
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
@@ -55,8 +56,9 @@ CONF.import_opt('backend', 'nova.openstack.common.db.options',
 _BACKEND_MAPPING = {'sqlalchemy': 'nova.db.sqlalchemy.api'}
 
 
-IMPL = db_api.DBAPI(CONF.database.backend, backend_mapping=_BACKEND_MAPPING,
-                    lazy=True)
+IMPL = db_stats.InstrumentedDBAPI(
+        db_api.DBAPI(CONF.database.backend, backend_mapping=_BACKEND_MAPPING,
+                     lazy=True))
 LOG = logging.getLogger(__name__)
 
 # The maximum value a signed INT type may have
@@ -179,7 +181,8 @@ def compute_node_get_by_service_id(context, service_id):
     return IMPL.compute_node_get_by_service_id(context, service_id)
 
 
-def compute_node_get_all(context, no_date_fields=False):
+def compute_node_get_all(context, no_date_fields=False, limit=None,
+                         marker=None):
     """Get all computeNodes.
 
     :param context: The security context
@@ -187,11 +190,15 @@ def compute_node_get_all(context, no_date_fields=False):
                            'deleted_at' and 'deleted' fields from the output,
                            thus significantly reducing its size.
                            Set to False by default
+    :param limit: Maximum number of compute nodes to return, ordered by id.
+                  All of them are returned by default
+    :param marker: Only return compute nodes with an id greater than this one
 
     :returns: List of dictionaries each containing compute node properties,
               including corresponding service
     """
-    return IMPL.compute_node_get_all(context, no_date_fields)
+    return IMPL.compute_node_get_all(context, no_date_fields, limit=limit,
+                                     marker=marker)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -233,6 +240,42 @@ def compute_node_update(context, compute_id, values):
     return IMPL.compute_node_update(context, compute_id, values)
 
 
+def compute_node_claim_resources(context, compute_id, instance_uuid,
+                                 resources, ratios, expire):
+    """Reserve resources on a compute node if they are still available.
+
+    The reservation is kept apart from the usage of the compute node, which
+    the resource tracker owns.  It counts against the compute node until
+    the instance claims the resources on the compute host, either as a new
+    instance or with a migration to it, the instance is deleted or
+    rescheduled, or the reservation expires.  The compute node
+    is locked while its usage and reservations are checked, so concurrent
+    claims on the same compute node cannot both succeed past its limits.
+
+    :param context: The security context
+    :param compute_id: ID of the compute node
+    :param instance_uuid: UUID of the instance the resources are reserved
+                          for, replacing its previous reservation.  If
+                          None, the resources are only checked
+    :param resources: Dictionary of the 'memory_mb', 'vcpus' and 'local_gb'
+                      to reserve
+    :param ratios: Dictionary of the allocation ratios of 'memory_mb',
+                   'vcpus' and 'local_gb' limiting the usage of the compute
+                   node.  Resources without a ratio are not checked
+    :param expire: Time the reservation expires at
+
+    :returns: True if the resources were reserved, False otherwise
+    """
+    return IMPL.compute_node_claim_resources(context, compute_id,
+                                             instance_uuid, resources,
+                                             ratios, expire)
+
+
+def compute_node_reservation_expire(context):
+    """Purge the expired reservations of the compute nodes."""
+    return IMPL.compute_node_reservation_expire(context)
+
+
 def compute_node_delete(context, compute_id):
     """Delete a compute node from the database.
 
@@ -651,13 +694,20 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None, use_slave=False):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, use_slave=False,
+                                columns=None):
+    """Get all instances that match all filters.
+
+    If columns is given, only those columns of the instances are read.
+    """
+    kwargs = {}
+    if columns is not None:
+        kwargs['columns'] = columns
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
                                             columns_to_join=columns_to_join,
-                                            use_slave=use_slave)
+                                            use_slave=use_slave, **kwargs)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -748,6 +798,31 @@ def instance_update_and_get_original(context, instance_uuid, values,
     return rv
 
 
+def instance_update_bulk(context, updates, update_cells=True,
+                         columns_to_join=None):
+    """Set the given properties on several instances in one transaction.
+
+    :param context: = request context object
+    :param updates: = dict mapping instance uuids to dicts of column values
+
+    Instances which do not exist or are not in their expected task or VM
+    state are left untouched.
+
+    :returns: a list of (old_instance_ref, new_instance_ref) tuples for the
+              updated instances
+    """
+    rv = IMPL.instance_update_bulk(context, updates,
+                                   columns_to_join=columns_to_join)
+    if update_cells:
+        for old_ref, new_ref in rv:
+            try:
+                cells_rpcapi.CellsAPI().instance_update_at_top(context,
+                                                               new_ref)
+            except Exception:
+                LOG.exception(_("Failed to notify cells of instance update"))
+    return rv
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -1985,6 +2060,37 @@ def task_log_end_task(context, task_name,
                                   message)
 
 
+####################
+
+
+def tenant_usage_rollup_create(context, period_beginning, period_ending,
+                               usages, message=None):
+    """Record the usages of the tenants rolled up for a period.
+
+    :param usages: a list of dicts with the project_id, hours,
+                   vcpus_hours, memory_mb_hours and local_gb_hours of each
+                   tenant during the period
+
+    Raises TaskAlreadyRunning if the period was already rolled up.
+    """
+    return IMPL.tenant_usage_rollup_create(context, period_beginning,
+                                           period_ending, usages,
+                                           message=message)
+
+
+def tenant_usage_rollup_get_periods(context, begin, end):
+    """Get the beginnings of the periods rolled up between begin and end."""
+    return IMPL.tenant_usage_rollup_get_periods(context, begin, end)
+
+
+def tenant_usage_rollup_get_by_window(context, begin, end, project_id=None):
+    """Get the usages of the tenants summed over the periods rolled up
+    which begin between begin and end.
+    """
+    return IMPL.tenant_usage_rollup_get_by_window(context, begin, end,
+                                                  project_id=project_id)
+
+
 def task_log_begin_task(context, task_name,
                         period_beginning,
                         period_ending,
@@ -2015,13 +2121,19 @@ def task_log_get(context, task_name, period_beginning,
 ####################
 
 
-def archive_deleted_rows(context, max_rows=None):
+def archive_deleted_rows(context, max_rows=None, batch_size=1000, workers=1,
+                         progress=None):
     """Move up to max_rows rows from production tables to corresponding shadow
-    tables.
+    tables, batch_size rows of a table at a time, archiving up to workers
+    groups of tables in parallel.
 
+    :param progress: called with the table name and the number of rows
+                     archived after each batch.
     :returns: number of rows archived.
     """
-    return IMPL.archive_deleted_rows(context, max_rows=max_rows)
+    return IMPL.archive_deleted_rows(context, max_rows=max_rows,
+                                     batch_size=batch_size, workers=workers,
+                                     progress=progress)
 
 
 def archive_deleted_rows_for_table(context, tablename, max_rows=None):
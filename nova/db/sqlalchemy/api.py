@@ -18,15 +18,19 @@
 """Implementation of SQLAlchemy backend."""
 
 import collections
+import contextlib
 import copy
 import datetime
 import functools
 import sys
+import threading
 import time
 import uuid
 
+from eventlet import greenpool
 from oslo.config import cfg
 import six
+import sqlalchemy
 from sqlalchemy import and_
 from sqlalchemy import Boolean
 from sqlalchemy.exc import DataError
@@ -51,6 +55,7 @@ from nova.compute import task_states
 from nova.compute import vm_states
 import nova.context
 from nova.db.sqlalchemy import models
+from nova.db import stats as db_stats
 from nova import exception
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common.db.sqlalchemy import session as db_session
@@ -75,6 +80,29 @@ connection_opts = [
                secret=True,
                help='The SQLAlchemy connection string used to connect to the '
                     'slave database'),
+    cfg.ListOpt('slave_connections',
+                default=[],
+                secret=True,
+                help='The SQLAlchemy connection strings of more slave '
+                     'databases. The reads sent to the slaves are spread '
+                     'over these and slave_connection'),
+    cfg.IntOpt('slave_max_lag',
+               default=10,
+               help='Number of seconds a slave database may lag behind the '
+                    'master database for reads to be sent to it. The lag '
+                    'is measured by the last service heartbeat the slave '
+                    'has seen'),
+    cfg.IntOpt('slave_lag_check_interval',
+               default=10,
+               help='Number of seconds between two measures of the lag of a '
+                    'slave database'),
+    cfg.DictOpt('slave_read_policy',
+                default={},
+                help='Number of seconds of slave lag tolerated by the reads '
+                     'of each read-only DB API function sent to the slave '
+                     'databases, e.g. instance_get_all_by_host:60, when it '
+                     'is not slave_max_lag. A negative value keeps the '
+                     'reads of a function on the master database'),
 ]
 
 CONF = cfg.CONF
@@ -89,28 +117,146 @@ LOG = logging.getLogger(__name__)
 
 
 _MASTER_FACADE = None
-_SLAVE_FACADE = None
+_SLAVE_FACADES = {}
 
 
 def _create_facade_lazily(use_slave=False):
     global _MASTER_FACADE
-    global _SLAVE_FACADE
 
-    return_slave = use_slave and CONF.database.slave_connection
-    if not return_slave:
+    slave_connection = _SLAVE_ROUTER.get_routed_connection()
+    if slave_connection is None and use_slave:
+        slave_connection = _SLAVE_ROUTER.get_slave_connection(
+                CONF.database.slave_max_lag)
+    if not slave_connection:
         if _MASTER_FACADE is None:
             _MASTER_FACADE = db_session.EngineFacade(
                 CONF.database.connection,
                 **dict(CONF.database.iteritems())
             )
+            _count_statements(_MASTER_FACADE.get_engine())
         return _MASTER_FACADE
     else:
-        if _SLAVE_FACADE is None:
-            _SLAVE_FACADE = db_session.EngineFacade(
-                CONF.database.slave_connection,
-                **dict(CONF.database.iteritems())
-            )
-        return _SLAVE_FACADE
+        return _get_slave_facade(slave_connection)
+
+
+def _get_slave_facade(connection):
+    if connection not in _SLAVE_FACADES:
+        _SLAVE_FACADES[connection] = db_session.EngineFacade(
+            connection,
+            **dict(CONF.database.iteritems())
+        )
+        _count_statements(_SLAVE_FACADES[connection].get_engine())
+    return _SLAVE_FACADES[connection]
+
+
+def _count_statements(engine):
+    """Account the statements executed by engine in the DB API statistics.
+    """
+    def after_cursor_execute(conn, cursor, statement, parameters, context,
+                             executemany):
+        db_stats.statement_executed()
+
+    sqlalchemy.event.listen(engine, 'after_cursor_execute',
+                            after_cursor_execute)
+
+
+class _SlaveRouter(object):
+    """Route reads to the slave databases which are not lagging too far
+    behind the master database.
+
+    The lag of a slave is the age of the last service heartbeat it has
+    seen, compared to the master.  It is measured every
+    CONF.database.slave_lag_check_interval seconds.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lags = {}
+        self._next = 0
+
+    def _get_slave_connections(self):
+        return [connection for connection in
+                [CONF.database.slave_connection] +
+                CONF.database.slave_connections if connection]
+
+    def get_routed_connection(self):
+        """Return the slave connection the reads of the current thread
+        are routed to, if any.
+        """
+        return getattr(self._local, 'connection', None)
+
+    def get_slave_connection(self, max_lag):
+        """Return one of the slave connections lagging at most max_lag
+        seconds, or None.
+        """
+        if max_lag < 0:
+            return None
+        connections = [connection for connection in
+                       self._get_slave_connections()
+                       if self._get_lag(connection) <= max_lag]
+        if not connections:
+            return None
+        self._next += 1
+        return connections[self._next % len(connections)]
+
+    @contextlib.contextmanager
+    def route(self, connection):
+        """Route the reads of the current thread to connection."""
+        self._local.connection = connection
+        try:
+            yield
+        finally:
+            self._local.connection = None
+
+    def _get_lag(self, connection):
+        now = time.time()
+        checked_at, lag = self._lags.get(connection, (None, None))
+        if (checked_at is None or
+                now - checked_at >= CONF.database.slave_lag_check_interval):
+            lag = self._measure_lag(connection)
+            self._lags[connection] = (now, lag)
+        return lag
+
+    def _measure_lag(self, connection):
+        query = lambda session: session.query(
+                func.max(models.Service.updated_at)).scalar()
+        try:
+            master_heartbeat = query(_create_facade_lazily().get_session())
+            slave_heartbeat = query(
+                    _get_slave_facade(connection).get_session())
+        except Exception:
+            LOG.exception(_("Could not measure the lag of a slave "
+                            "database, reading from the master database"))
+            return float('inf')
+        if master_heartbeat is None:
+            return 0
+        if slave_heartbeat is None:
+            return float('inf')
+        return max(timeutils.delta_seconds(slave_heartbeat,
+                                           master_heartbeat), 0)
+
+
+_SLAVE_ROUTER = _SlaveRouter()
+
+
+def _slave_read(f):
+    """Decorator sending the reads of a read-only DB API function to a
+    slave database, when one is configured and lags less than the
+    function tolerates.
+    """
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        if (kwargs.get('session') is not None or
+                _SLAVE_ROUTER.get_routed_connection() is not None):
+            return f(*args, **kwargs)
+        max_lag = int(CONF.database.slave_read_policy.get(
+                f.__name__, CONF.database.slave_max_lag))
+        connection = _SLAVE_ROUTER.get_slave_connection(max_lag)
+        if connection is None:
+            return f(*args, **kwargs)
+        with _SLAVE_ROUTER.route(connection):
+            return f(*args, **kwargs)
+    return wrapper
 
 
 def get_engine(use_slave=False):
@@ -567,7 +713,7 @@ def compute_node_get_by_service_id(context, service_id):
 
 
 @require_admin_context
-def compute_node_get_all(context, no_date_fields):
+def compute_node_get_all(context, no_date_fields, limit=None, marker=None):
 
     # NOTE(msdubov): Using lower-level 'select' queries and joining the tables
     #                manually here allows to gain 3x speed-up and to have 5x
@@ -587,14 +733,31 @@ def compute_node_get_all(context, no_date_fields):
             return [c for c in table.c if c.name not in redundant_columns]
 
         compute_node_query = select(filter_columns(compute_node)).\
-                                where(compute_node.c.deleted == 0).\
-                                order_by(compute_node.c.service_id)
+                                where(compute_node.c.deleted == 0)
+        if limit is None and marker is None:
+            compute_node_query = compute_node_query.\
+                                    order_by(compute_node.c.service_id)
+        else:
+            # Pages are ordered by the primary key, so that the next page
+            # starts right after the marker.
+            if marker is not None:
+                compute_node_query = compute_node_query.\
+                                        where(compute_node.c.id > marker)
+            compute_node_query = compute_node_query.\
+                                    order_by(compute_node.c.id).\
+                                    limit(limit)
         compute_node_rows = conn.execute(compute_node_query).fetchall()
 
         service_query = select(filter_columns(service)).\
                             where((service.c.deleted == 0) &
                                   (service.c.binary == 'nova-compute')).\
                             order_by(service.c.id)
+        if limit is not None or marker is not None:
+            service_ids = set(row['service_id'] for row in compute_node_rows)
+            if not service_ids:
+                return []
+            service_query = service_query.\
+                                where(service.c.id.in_(service_ids))
         service_rows = conn.execute(service_query).fetchall()
 
     # Join ComputeNode & Service manually.
@@ -655,6 +818,111 @@ def compute_node_update(context, compute_id, values):
     return compute_ref
 
 
+# Resources reserved by compute_node_claim_resources() and the compute node
+# columns holding their used amount.
+_COMPUTE_NODE_CLAIM_COLUMNS = (('memory_mb', 'memory_mb_used'),
+                               ('vcpus', 'vcpus_used'),
+                               ('local_gb', 'local_gb_used'))
+
+
+@require_admin_context
+@_retry_on_deadlock
+def compute_node_claim_resources(context, compute_id, instance_uuid,
+                                 resources, ratios, expire):
+    session = get_session()
+    with session.begin():
+        compute_node = model_query(context, models.ComputeNode,
+                                   session=session).\
+                           filter_by(id=compute_id).\
+                           with_lockmode('update').\
+                           first()
+        if not compute_node:
+            return False
+
+        # A reservation for the same instance is replaced, as the instance
+        # is rescheduled.
+        reservation_model = models.ComputeNodeReservation
+        stale = reservation_model.expire <= timeutils.utcnow()
+        if instance_uuid is not None:
+            model_query(context, reservation_model, session=session).\
+                    filter_by(instance_uuid=instance_uuid).\
+                    soft_delete(synchronize_session=False)
+        model_query(context, reservation_model, session=session).\
+                filter_by(compute_node_id=compute_id).\
+                filter(stale).\
+                soft_delete(synchronize_session=False)
+
+        # Reservations are released once their instance claimed the
+        # resources on the compute host, which accounts for them in the
+        # used columns from then on, or once their instance is deleted.
+        query = model_query(context,
+                            func.sum(reservation_model.memory_mb),
+                            func.sum(reservation_model.vcpus),
+                            func.sum(reservation_model.local_gb),
+                            base_model=reservation_model,
+                            session=session).\
+                    outerjoin(models.Instance,
+                        models.Instance.uuid ==
+                            reservation_model.instance_uuid).\
+                    filter(reservation_model.compute_node_id == compute_id)
+        elsewhere = [models.Instance.host == None,
+                     models.Instance.node == None]
+        unclaimed = [models.Instance.deleted == 0]
+        if compute_node.service is not None:
+            host = compute_node.service.host
+            node = compute_node.hypervisor_hostname
+            elsewhere.extend([models.Instance.host != host,
+                              models.Instance.node != node])
+            # An instance resized or migrated to the node claims the
+            # resources with the migration the resource tracker creates.
+            migrating = sqlalchemy.exists().where(and_(
+                    models.Migration.instance_uuid ==
+                        reservation_model.instance_uuid,
+                    models.Migration.dest_compute == host,
+                    models.Migration.dest_node == node,
+                    models.Migration.deleted == 0,
+                    ~models.Migration.status.in_(['confirmed', 'reverted',
+                                                  'error'])))
+            unclaimed.append(~migrating)
+        unclaimed.append(or_(*elsewhere))
+        query = query.filter(or_(models.Instance.id == None,
+                                 and_(*unclaimed)))
+        reserved = dict(zip(('memory_mb', 'vcpus', 'local_gb'),
+                            query.first()))
+
+        values = {}
+        for resource, used_key in _COMPUTE_NODE_CLAIM_COLUMNS:
+            amount = resources.get(resource) or 0
+            values[resource] = amount
+            total = compute_node[resource]
+            ratio = ratios.get(resource)
+            if not amount or not total or ratio is None:
+                continue
+            used = ((compute_node[used_key] or 0) +
+                    (reserved[resource] or 0))
+            if used + amount > total * ratio:
+                return False
+
+        if instance_uuid is None:
+            # Nothing would release the reservation before it expires
+            return True
+        reservation = models.ComputeNodeReservation()
+        reservation.update(values)
+        reservation.compute_node_id = compute_id
+        reservation.instance_uuid = instance_uuid
+        reservation.expire = expire
+        session.add(reservation)
+    return True
+
+
+@require_admin_context
+def compute_node_reservation_expire(context):
+    model_query(context, models.ComputeNodeReservation).\
+            filter(models.ComputeNodeReservation.expire <=
+                   timeutils.utcnow()).\
+            soft_delete(synchronize_session=False)
+
+
 @require_admin_context
 def compute_node_delete(context, compute_id):
     """Delete a ComputeNode record."""
@@ -1823,9 +2091,10 @@ def instance_get_all(context, columns_to_join=None):
 
 
 @require_context
+@_slave_read
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                use_slave=False):
+                                use_slave=False, columns=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1858,6 +2127,12 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
         'soft_deleted' - modify behavior of 'deleted' to either
                          include or exclude instances whose
                          vm_state is SOFT_DELETED.
+
+    When columns is given, only those columns of the instances table (and
+    uuid) are read and each instance is returned as a dict of them.  Such a
+    projection cannot load relationships, so only the manually joined
+    'metadata', 'system_metadata' and 'pci_devices' of columns_to_join are
+    honoured.
     """
 
     sort_fn = {'desc': desc, 'asc': asc}
@@ -1873,9 +2148,14 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     else:
         manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
 
-    query_prefix = session.query(models.Instance)
-    for column in columns_to_join:
-        query_prefix = query_prefix.options(joinedload(column))
+    if columns is None:
+        query_prefix = session.query(models.Instance)
+        for column in columns_to_join:
+            query_prefix = query_prefix.options(joinedload(column))
+    else:
+        columns = sorted(set(columns) | set(['uuid']))
+        query_prefix = session.query(*[getattr(models.Instance, column)
+                                       for column in columns])
 
     query_prefix = query_prefix.order_by(sort_fn[sort_dir](
             getattr(models.Instance, sort_key)))
@@ -1946,18 +2226,51 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               filters)
 
     # paginate query
+    sort_keys = [sort_key]
+    for key in ('created_at', 'id'):
+        if key not in sort_keys:
+            sort_keys.append(key)
     if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
+        # Only the sort key values of the marker are needed.
+        marker_uuid = marker
+        marker_columns = [getattr(models.Instance, key) for key in sort_keys]
+        marker = model_query(context, *marker_columns, session=session,
+                             base_model=models.Instance,
+                             project_only=True).\
+                        filter_by(uuid=marker_uuid).\
+                        first()
+        if marker is None:
+            raise exception.MarkerNotFound(marker_uuid)
+        query_prefix = _keyset_bound(query_prefix,
+                                     getattr(models.Instance, sort_key),
+                                     getattr(marker, sort_key), sort_dir)
     query_prefix = sqlalchemyutils.paginate_query(query_prefix,
                            models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
+                           sort_keys,
                            marker=marker,
                            sort_dir=sort_dir)
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    instances = query_prefix.all()
+    if columns is not None:
+        instances = [dict(zip(columns, row)) for row in instances]
+    return _instances_fill_metadata(context, instances, manual_joins)
+
+
+def _keyset_bound(query, column, value, sort_dir):
+    """Restrict query to the rows which can follow a marker whose first
+    sort key is value.
+
+    paginate_query() selects the rows after the marker with one OR clause
+    per sort key, which databases cannot turn into an index range.  This
+    redundant bound on the first sort key lets the scan start at the marker
+    instead of skipping every row before it, so deep pages cost as much
+    as the first one.
+    """
+    if value is None:
+        return query
+    if sort_dir == 'desc':
+        return query.filter(column <= value)
+    return query.filter(column >= value)
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2052,6 +2365,7 @@ def regex_filter(query, model, filters):
 
 
 @require_context
+@_slave_read
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Return instances and joins that were active during window."""
@@ -2087,6 +2401,7 @@ def _instance_get_all_query(context, project_only=False,
 
 
 @require_admin_context
+@_slave_read
 def instance_get_all_by_host(context, host,
                              columns_to_join=None,
                              use_slave=False):
@@ -2216,6 +2531,52 @@ def instance_update_and_get_original(context, instance_uuid, values,
                             columns_to_join=columns_to_join)
 
 
+@require_context
+@_retry_on_deadlock
+def instance_update_bulk(context, updates, columns_to_join=None):
+    """Set the given properties on several instances in one transaction.
+
+    :param context: = request context object
+    :param updates: = dict mapping instance uuids to dicts of column values
+
+    "expected_task_state" and "expected_vm_state" are checked like in
+    instance_update_and_get_original(), but an instance which is not in
+    the expected states is left untouched instead of failing the whole
+    update, and so is an instance which does not exist.
+
+    :returns: a list of (old_instance_ref, new_instance_ref) tuples for the
+              updated instances
+    """
+    for instance_uuid in updates:
+        if not uuidutils.is_uuid_like(instance_uuid):
+            raise exception.InvalidUUID(instance_uuid)
+
+    result = []
+    if not updates:
+        return result
+    session = get_session()
+    with session.begin():
+        instance_refs = _build_instance_get(context, session=session,
+                                            columns_to_join=columns_to_join).\
+                filter(models.Instance.uuid.in_(updates.keys())).\
+                all()
+        for instance_ref in instance_refs:
+            # NOTE: The values are copied, as the checks pop their keys
+            # and the transaction may be retried.
+            values = dict(updates[instance_ref['uuid']])
+            try:
+                old_instance_ref = _instance_update_ref(
+                        context, session, instance_ref, values,
+                        copy_old_instance=True)
+            except (exception.UnexpectedTaskStateError,
+                    exception.UnexpectedVMStateError) as e:
+                LOG.debug(_("Instance %(uuid)s not updated: %(error)s"),
+                          {'uuid': instance_ref['uuid'], 'error': e})
+                continue
+            result.append((old_instance_ref, instance_ref))
+    return result
+
+
 # NOTE(danms): This updates the instance's metadata list in-place and in
 # the database to avoid stale data and refresh issues. It assumes the
 # delete=True behavior of instance_metadata_update(...)
@@ -2253,63 +2614,77 @@ def _instance_update(context, instance_uuid, values, copy_old_instance=False,
         instance_ref = _instance_get_by_uuid(context, instance_uuid,
                                              session=session,
                                              columns_to_join=columns_to_join)
-        if "expected_task_state" in values:
-            # it is not a db column so always pop out
-            expected = values.pop("expected_task_state")
-            if not isinstance(expected, (tuple, list, set)):
-                expected = (expected,)
-            actual_state = instance_ref["task_state"]
-            if actual_state not in expected:
-                if actual_state == task_states.DELETING:
-                    raise exception.UnexpectedDeletingTaskStateError(
-                            actual=actual_state, expected=expected)
-                else:
-                    raise exception.UnexpectedTaskStateError(
-                            actual=actual_state, expected=expected)
-        if "expected_vm_state" in values:
-            expected = values.pop("expected_vm_state")
-            if not isinstance(expected, (tuple, list, set)):
-                expected = (expected,)
-            actual_state = instance_ref["vm_state"]
-            if actual_state not in expected:
-                raise exception.UnexpectedVMStateError(actual=actual_state,
-                                                       expected=expected)
-
-        instance_hostname = instance_ref['hostname'] or ''
-        if ("hostname" in values and
-                values["hostname"].lower() != instance_hostname.lower()):
-                _validate_unique_server_name(context,
-                                             session,
-                                             values['hostname'])
-
-        if copy_old_instance:
-            old_instance_ref = copy.copy(instance_ref)
-        else:
-            old_instance_ref = None
-
-        metadata = values.get('metadata')
-        if metadata is not None:
-            _instance_metadata_update_in_place(context, instance_ref,
-                                               'metadata',
-                                               models.InstanceMetadata,
-                                               values.pop('metadata'),
-                                               session)
-
-        system_metadata = values.get('system_metadata')
-        if system_metadata is not None:
-            _instance_metadata_update_in_place(context, instance_ref,
-                                               'system_metadata',
-                                               models.InstanceSystemMetadata,
-                                               values.pop('system_metadata'),
-                                               session)
-
-        _handle_objects_related_type_conversions(values)
-        instance_ref.update(values)
-        session.add(instance_ref)
+        old_instance_ref = _instance_update_ref(context, session,
+                                                instance_ref, values,
+                                                copy_old_instance)
 
     return (old_instance_ref, instance_ref)
 
 
+def _instance_update_ref(context, session, instance_ref, values,
+                         copy_old_instance=False):
+    """Apply values to instance_ref within the transaction of session.
+
+    Returns a shallow copy of the original instance reference if
+    copy_old_instance is True, None otherwise.
+    """
+    if "expected_task_state" in values:
+        # it is not a db column so always pop out
+        expected = values.pop("expected_task_state")
+        if not isinstance(expected, (tuple, list, set)):
+            expected = (expected,)
+        actual_state = instance_ref["task_state"]
+        if actual_state not in expected:
+            if actual_state == task_states.DELETING:
+                raise exception.UnexpectedDeletingTaskStateError(
+                        actual=actual_state, expected=expected)
+            else:
+                raise exception.UnexpectedTaskStateError(
+                        actual=actual_state, expected=expected)
+    if "expected_vm_state" in values:
+        expected = values.pop("expected_vm_state")
+        if not isinstance(expected, (tuple, list, set)):
+            expected = (expected,)
+        actual_state = instance_ref["vm_state"]
+        if actual_state not in expected:
+            raise exception.UnexpectedVMStateError(actual=actual_state,
+                                                   expected=expected)
+
+    instance_hostname = instance_ref['hostname'] or ''
+    if ("hostname" in values and
+            values["hostname"].lower() != instance_hostname.lower()):
+            _validate_unique_server_name(context,
+                                         session,
+                                         values['hostname'])
+
+    if copy_old_instance:
+        old_instance_ref = copy.copy(instance_ref)
+    else:
+        old_instance_ref = None
+
+    metadata = values.get('metadata')
+    if metadata is not None:
+        _instance_metadata_update_in_place(context, instance_ref,
+                                           'metadata',
+                                           models.InstanceMetadata,
+                                           values.pop('metadata'),
+                                           session)
+
+    system_metadata = values.get('system_metadata')
+    if system_metadata is not None:
+        _instance_metadata_update_in_place(context, instance_ref,
+                                           'system_metadata',
+                                           models.InstanceSystemMetadata,
+                                           values.pop('system_metadata'),
+                                           session)
+
+    _handle_objects_related_type_conversions(values)
+    instance_ref.update(values)
+    session.add(instance_ref)
+
+    return old_instance_ref
+
+
 def instance_add_security_group(context, instance_uuid, security_group_id):
     """Associate the given security group with the given instance."""
     sec_group_ref = models.SecurityGroupInstanceAssociation()
@@ -3305,13 +3680,14 @@ def _reservation_create(context, uuid, usage, project_id, user_id, resource,
 # on reservations.
 
 def _get_project_user_quota_usages(context, session, project_id,
-                                   user_id):
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   with_lockmode('update').\
-                   all()
+                                   user_id, resources=None):
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+                   filter_by(project_id=project_id)
+    if resources is not None:
+        query = query.filter(models.QuotaUsage.resource.in_(resources))
+    rows = query.with_lockmode('update').all()
     proj_result = dict()
     user_result = dict()
     # Get the total count of in_use,reserved
@@ -3326,213 +3702,396 @@ def _get_project_user_quota_usages(context, session, project_id,
     return proj_result, user_result
 
 
+class _QuotaReservation(object):
+    """A quota_reserve() call waiting for its reservations."""
+
+    def __init__(self, context, resources, project_quotas, user_quotas,
+                 deltas, expire, until_refresh, max_age, project_id,
+                 user_id):
+        self.context = context
+        self.resources = resources
+        self.project_quotas = project_quotas
+        self.user_quotas = user_quotas
+        self.deltas = deltas
+        self.expire = expire
+        self.until_refresh = until_refresh
+        self.max_age = max_age
+        self.project_id = project_id
+        self.user_id = user_id
+        self.event = threading.Event()
+        self.done = False
+        self.result = None
+        self.exc_info = None
+
+    def set_result(self, result=None, exc_info=None):
+        self.result = result
+        self.exc_info = exc_info
+        self.done = True
+
+    def get_result(self):
+        if self.exc_info is not None:
+            six.reraise(*self.exc_info)
+        return self.result
+
+
+class _QuotaReserveBatcher(object):
+    """Make the concurrent reservations of a project in one transaction.
+
+    The first caller reserving for a project makes its reservations
+    right away.  The callers reserving for the same project meanwhile
+    wait for it to be done, then the first of them makes all their
+    reservations in a single transaction, and so on.  Each transaction
+    thus takes the locks on the quota usages of the project once for
+    the whole batch instead of once per reservation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._running = set()
+
+    def reserve(self, reservation):
+        key = reservation.project_id
+        with self._lock:
+            self._waiting.setdefault(key, []).append(reservation)
+            lead = key not in self._running
+            self._running.add(key)
+        while not lead:
+            try:
+                reservation.event.wait()
+            except BaseException:
+                with excutils.save_and_reraise_exception():
+                    self._leave(reservation)
+            with self._lock:
+                if reservation.done:
+                    return reservation.get_result()
+                # The previous batch is done and only the first caller
+                # waiting runs the next
+                waiting = self._waiting.get(key)
+                lead = bool(waiting) and waiting[0] is reservation
+                if not lead:
+                    reservation.event.clear()
+
+        with self._lock:
+            batch = self._waiting.pop(key)
+        try:
+            _quota_reserve_batch(batch)
+        except BaseException:
+            # The batch was interrupted, by eventlet.Timeout or
+            # GreenletExit for instance, before every reservation got its
+            # result.
+            with excutils.save_and_reraise_exception():
+                error = exception.NovaException(
+                        _("The quota reservation batch was interrupted"))
+                for other in batch:
+                    if not other.done:
+                        other.set_result(
+                            exc_info=(type(error), error, None))
+        finally:
+            with self._lock:
+                waiting = self._waiting.get(key)
+                if waiting:
+                    waiting[0].event.set()
+                else:
+                    self._running.discard(key)
+                for other in batch:
+                    other.event.set()
+        return reservation.get_result()
+
+    def _leave(self, reservation):
+        """Drop a caller interrupted while waiting, handing the next batch
+        over if it was its turn to run it.
+        """
+        key = reservation.project_id
+        with self._lock:
+            waiting = self._waiting.get(key)
+            if reservation.done or not waiting or reservation not in waiting:
+                # Its reservations are made by the batch running
+                return
+            turn = waiting[0] is reservation and reservation.event.is_set()
+            waiting.remove(reservation)
+            if not waiting:
+                del self._waiting[key]
+            if turn:
+                if waiting:
+                    waiting[0].event.set()
+                else:
+                    self._running.discard(key)
+
+
+_QUOTA_RESERVE_BATCHER = _QuotaReserveBatcher()
+
+
 @require_context
-@_retry_on_deadlock
 def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
                   expire, until_refresh, max_age, project_id=None,
                   user_id=None):
-    elevated = context.elevated()
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    reservation = _QuotaReservation(context, resources, project_quotas,
+                                    user_quotas, deltas, expire,
+                                    until_refresh, max_age, project_id,
+                                    user_id)
+    return _QUOTA_RESERVE_BATCHER.reserve(reservation)
+
+
+def _quota_reserve_batch(batch):
+    """Make the reservations of a batch and set their results."""
+    try:
+        results = _quota_reserve_in_transaction(batch)
+    except Exception:
+        if len(batch) == 1:
+            batch[0].set_result(exc_info=sys.exc_info())
+            return
+        # Do not fail the whole batch because of one of its reservations
+        for reservation in batch:
+            _quota_reserve_batch([reservation])
+        return
+
+    for reservation, (result, unders, overs) in zip(batch, results):
+        if unders:
+            LOG.warning(_("Change will make usage less than 0 for the "
+                          "following resources: %s"), unders)
+        if overs:
+            reservation.set_result(exc_info=(type(overs), overs, None))
+        else:
+            reservation.set_result(result)
+
+
+@_retry_on_deadlock
+def _quota_reserve_in_transaction(batch):
     session = get_session()
+    # The usages refreshed by a sync routine are only refreshed once for
+    # the batch, since they do not change in the transaction.
+    synced = {}
     with session.begin():
+        return [_quota_reserve(session, reservation, synced)
+                for reservation in batch]
 
-        if project_id is None:
-            project_id = context.project_id
-        if user_id is None:
-            user_id = context.user_id
 
-        # Get the current usages
-        project_usages, user_usages = _get_project_user_quota_usages(
-                context, session, project_id, user_id)
+def _quota_reserve(session, reservation, synced):
+    """Make a reservation in the transaction of session.
 
-        # Handle usage refresh
-        work = set(deltas.keys())
-        while work:
-            resource = work.pop()
-
-            # Do we need to refresh the usage?
-            refresh = False
-            if ((resource not in PER_PROJECT_QUOTAS) and
-                    (resource not in user_usages)):
-                user_usages[resource] = _quota_usage_create(elevated,
-                                                      project_id,
-                                                      user_id,
-                                                      resource,
-                                                      0, 0,
-                                                      until_refresh or None,
-                                                      session=session)
-                refresh = True
-            elif ((resource in PER_PROJECT_QUOTAS) and
-                    (resource not in user_usages)):
-                user_usages[resource] = _quota_usage_create(elevated,
-                                                      project_id,
-                                                      None,
-                                                      resource,
-                                                      0, 0,
-                                                      until_refresh or None,
-                                                      session=session)
-                refresh = True
-            elif user_usages[resource].in_use < 0:
-                # Negative in_use count indicates a desync, so try to
-                # heal from that...
-                refresh = True
-            elif user_usages[resource].until_refresh is not None:
-                user_usages[resource].until_refresh -= 1
-                if user_usages[resource].until_refresh <= 0:
-                    refresh = True
-            elif max_age and (user_usages[resource].updated_at -
-                              timeutils.utcnow()).seconds >= max_age:
-                refresh = True
+    Returns the reservation uuids, the resources the deltas make go
+    under 0 and, if the deltas go over quota, the OverQuota exception to
+    raise once the transaction is committed.
+    """
+    context = reservation.context
+    resources = reservation.resources
+    project_quotas = reservation.project_quotas
+    user_quotas = reservation.user_quotas
+    deltas = reservation.deltas
+    until_refresh = reservation.until_refresh
+    max_age = reservation.max_age
+    project_id = reservation.project_id
+    user_id = reservation.user_id
+    elevated = context.elevated()
 
-            # OK, refresh the usage
-            if refresh:
-                # Grab the sync routine
+    # Only the usages of the deltas, and those refreshed along with them,
+    # are locked.
+    syncs = set(resources[res].sync for res in deltas)
+    usage_resources = [res for res in resources
+                       if getattr(resources[res], 'sync', None) in syncs]
+
+    # Get the current usages
+    project_usages, user_usages = _get_project_user_quota_usages(
+            context, session, project_id, user_id, usage_resources)
+
+    # Handle usage refresh
+    work = set(deltas.keys())
+    while work:
+        resource = work.pop()
+
+        # Do we need to refresh the usage?
+        refresh = False
+        if ((resource not in PER_PROJECT_QUOTAS) and
+                (resource not in user_usages)):
+            user_usages[resource] = _quota_usage_create(elevated,
+                                                  project_id,
+                                                  user_id,
+                                                  resource,
+                                                  0, 0,
+                                                  until_refresh or None,
+                                                  session=session)
+            refresh = True
+        elif ((resource in PER_PROJECT_QUOTAS) and
+                (resource not in user_usages)):
+            user_usages[resource] = _quota_usage_create(elevated,
+                                                  project_id,
+                                                  None,
+                                                  resource,
+                                                  0, 0,
+                                                  until_refresh or None,
+                                                  session=session)
+            refresh = True
+        elif user_usages[resource].in_use < 0:
+            # Negative in_use count indicates a desync, so try to
+            # heal from that...
+            refresh = True
+        elif user_usages[resource].until_refresh is not None:
+            user_usages[resource].until_refresh -= 1
+            if user_usages[resource].until_refresh <= 0:
+                refresh = True
+        elif max_age and (user_usages[resource].updated_at -
+                          timeutils.utcnow()).seconds >= max_age:
+            refresh = True
+
+        # OK, refresh the usage
+        if refresh:
+            # Grab the sync routine
+            sync_key = (resources[resource].sync, project_id, user_id)
+            if sync_key not in synced:
                 sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
-
-                updates = sync(elevated, project_id, user_id, session)
-                for res, in_use in updates.items():
-                    # Make sure we have a destination for the usage!
-                    if ((res not in PER_PROJECT_QUOTAS) and
-                            (res not in user_usages)):
-                        user_usages[res] = _quota_usage_create(elevated,
-                                                         project_id,
-                                                         user_id,
-                                                         res,
-                                                         0, 0,
-                                                         until_refresh or None,
-                                                         session=session)
-                    if ((res in PER_PROJECT_QUOTAS) and
-                            (res not in user_usages)):
-                        user_usages[res] = _quota_usage_create(elevated,
-                                                         project_id,
-                                                         None,
-                                                         res,
-                                                         0, 0,
-                                                         until_refresh or None,
-                                                         session=session)
-
-                    if user_usages[res].in_use != in_use:
-                        LOG.debug(_('quota_usages out of sync, updating. '
-                                    'project_id: %(project_id)s, '
-                                    'user_id: %(user_id)s, '
-                                    'resource: %(res)s, '
-                                    'tracked usage: %(tracked_use)s, '
-                                    'actual usage: %(in_use)s'),
-                            {'project_id': project_id,
-                             'user_id': user_id,
-                             'res': res,
-                             'tracked_use': user_usages[res].in_use,
-                             'in_use': in_use})
-
-                    # Update the usage
-                    user_usages[res].in_use = in_use
-                    user_usages[res].until_refresh = until_refresh or None
-
-                    # Because more than one resource may be refreshed
-                    # by the call to the sync routine, and we don't
-                    # want to double-sync, we make sure all refreshed
-                    # resources are dropped from the work set.
-                    work.discard(res)
-
-                    # NOTE(Vek): We make the assumption that the sync
-                    #            routine actually refreshes the
-                    #            resources that it is the sync routine
-                    #            for.  We don't check, because this is
-                    #            a best-effort mechanism.
-
-        # Check for deltas that would go negative
-        unders = [res for res, delta in deltas.items()
-                  if delta < 0 and
-                  delta + user_usages[res].in_use < 0]
-
-        # Now, let's check the quotas
-        # NOTE(Vek): We're only concerned about positive increments.
-        #            If a project has gone over quota, we want them to
-        #            be able to reduce their usage without any
-        #            problems.
-        for key, value in user_usages.items():
-            if key not in project_usages:
-                project_usages[key] = value
-        overs = [res for res, delta in deltas.items()
-                 if user_quotas[res] >= 0 and delta >= 0 and
-                 (project_quotas[res] < delta +
-                  project_usages[res]['total'] or
-                  user_quotas[res] < delta +
-                  user_usages[res].total)]
-
-        # NOTE(Vek): The quota check needs to be in the transaction,
-        #            but the transaction doesn't fail just because
-        #            we're over quota, so the OverQuota raise is
-        #            outside the transaction.  If we did the raise
-        #            here, our usage updates would be discarded, but
-        #            they're not invalidated by being over-quota.
-
-        # Create the reservations
-        if not overs:
-            reservations = []
-            for res, delta in deltas.items():
-                reservation = _reservation_create(elevated,
-                                                 str(uuid.uuid4()),
-                                                 user_usages[res],
-                                                 project_id,
-                                                 user_id,
-                                                 res, delta, expire,
-                                                 session=session)
-                reservations.append(reservation.uuid)
-
-                # Also update the reserved quantity
-                # NOTE(Vek): Again, we are only concerned here about
-                #            positive increments.  Here, though, we're
-                #            worried about the following scenario:
-                #
-                #            1) User initiates resize down.
-                #            2) User allocates a new instance.
-                #            3) Resize down fails or is reverted.
-                #            4) User is now over quota.
-                #
-                #            To prevent this, we only update the
-                #            reserved value if the delta is positive.
-                if delta > 0:
-                    user_usages[res].reserved += delta
-
-        # Apply updates to the usages table
-        for usage_ref in user_usages.values():
-            session.add(usage_ref)
-
-    if unders:
-        LOG.warning(_("Change will make usage less than 0 for the following "
-                      "resources: %s"), unders)
-    if overs:
-        if project_quotas == user_quotas:
-            usages = project_usages
+                synced[sync_key] = sync(elevated, project_id, user_id,
+                                        session)
+
+            updates = synced[sync_key]
+            for res, in_use in updates.items():
+                # Make sure we have a destination for the usage!
+                if ((res not in PER_PROJECT_QUOTAS) and
+                        (res not in user_usages)):
+                    user_usages[res] = _quota_usage_create(elevated,
+                                                     project_id,
+                                                     user_id,
+                                                     res,
+                                                     0, 0,
+                                                     until_refresh or None,
+                                                     session=session)
+                if ((res in PER_PROJECT_QUOTAS) and
+                        (res not in user_usages)):
+                    user_usages[res] = _quota_usage_create(elevated,
+                                                     project_id,
+                                                     None,
+                                                     res,
+                                                     0, 0,
+                                                     until_refresh or None,
+                                                     session=session)
+
+                if user_usages[res].in_use != in_use:
+                    LOG.debug(_('quota_usages out of sync, updating. '
+                                'project_id: %(project_id)s, '
+                                'user_id: %(user_id)s, '
+                                'resource: %(res)s, '
+                                'tracked usage: %(tracked_use)s, '
+                                'actual usage: %(in_use)s'),
+                        {'project_id': project_id,
+                         'user_id': user_id,
+                         'res': res,
+                         'tracked_use': user_usages[res].in_use,
+                         'in_use': in_use})
+
+                # Update the usage
+                user_usages[res].in_use = in_use
+                user_usages[res].until_refresh = until_refresh or None
+
+                # Because more than one resource may be refreshed
+                # by the call to the sync routine, and we don't
+                # want to double-sync, we make sure all refreshed
+                # resources are dropped from the work set.
+                work.discard(res)
+
+                # NOTE(Vek): We make the assumption that the sync
+                #            routine actually refreshes the
+                #            resources that it is the sync routine
+                #            for.  We don't check, because this is
+                #            a best-effort mechanism.
+
+    # Check for deltas that would go negative
+    unders = [res for res, delta in deltas.items()
+              if delta < 0 and
+              delta + user_usages[res].in_use < 0]
+
+    # Now, let's check the quotas
+    # NOTE(Vek): We're only concerned about positive increments.
+    #            If a project has gone over quota, we want them to
+    #            be able to reduce their usage without any
+    #            problems.
+    for key, value in user_usages.items():
+        if key not in project_usages:
+            project_usages[key] = value
+    overs = [res for res, delta in deltas.items()
+             if user_quotas[res] >= 0 and delta >= 0 and
+             (project_quotas[res] < delta +
+              project_usages[res]['total'] or
+              user_quotas[res] < delta +
+              user_usages[res].total)]
+
+    # NOTE(Vek): The quota check needs to be in the transaction,
+    #            but the transaction doesn't fail just because
+    #            we're over quota, so the OverQuota raise is
+    #            outside the transaction.  If we did the raise
+    #            here, our usage updates would be discarded, but
+    #            they're not invalidated by being over-quota.
+
+    # Create the reservations
+    reservations = []
+    if not overs:
+        for res, delta in deltas.items():
+            reservation_ref = _reservation_create(elevated,
+                                                  str(uuid.uuid4()),
+                                                  user_usages[res],
+                                                  project_id,
+                                                  user_id,
+                                                  res, delta,
+                                                  reservation.expire,
+                                                  session=session)
+            reservations.append(reservation_ref.uuid)
+
+            # Also update the reserved quantity
+            # NOTE(Vek): Again, we are only concerned here about
+            #            positive increments.  Here, though, we're
+            #            worried about the following scenario:
+            #
+            #            1) User initiates resize down.
+            #            2) User allocates a new instance.
+            #            3) Resize down fails or is reverted.
+            #            4) User is now over quota.
+            #
+            #            To prevent this, we only update the
+            #            reserved value if the delta is positive.
+            if delta > 0:
+                user_usages[res].reserved += delta
+
+    # Apply updates to the usages table
+    for usage_ref in user_usages.values():
+        session.add(usage_ref)
+
+    if not overs:
+        return reservations, unders, None
+
+    if project_quotas == user_quotas:
+        usages = project_usages
+    else:
+        usages = user_usages
+    usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
+                  for k, v in usages.items())
+    headroom = dict((res, user_quotas[res] -
+                         (usages[res]['in_use'] + usages[res]['reserved']))
+                    for res in user_quotas.keys())
+
+    # If quota_cores is unlimited [-1]:
+    # - set cores headroom based on instances headroom:
+    if user_quotas.get('cores') == -1:
+        if deltas['cores']:
+            hc = headroom['instances'] * deltas['cores']
+            headroom['cores'] = hc / deltas['instances']
         else:
-            usages = user_usages
-        usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
-                      for k, v in usages.items())
-        headroom = dict((res, user_quotas[res] -
-                             (usages[res]['in_use'] + usages[res]['reserved']))
-                        for res in user_quotas.keys())
-
-        # If quota_cores is unlimited [-1]:
-        # - set cores headroom based on instances headroom:
-        if user_quotas.get('cores') == -1:
-            if deltas['cores']:
-                hc = headroom['instances'] * deltas['cores']
-                headroom['cores'] = hc / deltas['instances']
-            else:
-                headroom['cores'] = headroom['instances']
-
-        # If quota_ram is unlimited [-1]:
-        # - set ram headroom based on instances headroom:
-        if user_quotas.get('ram') == -1:
-            if deltas['ram']:
-                hr = headroom['instances'] * deltas['ram']
-                headroom['ram'] = hr / deltas['instances']
-            else:
-                headroom['ram'] = headroom['instances']
-        raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
-                                  usages=usages, headroom=headroom)
-
-    return reservations
+            headroom['cores'] = headroom['instances']
+
+    # If quota_ram is unlimited [-1]:
+    # - set ram headroom based on instances headroom:
+    if user_quotas.get('ram') == -1:
+        if deltas['ram']:
+            hr = headroom['instances'] * deltas['ram']
+            headroom['ram'] = hr / deltas['instances']
+        else:
+            headroom['ram'] = headroom['instances']
+    return reservations, unders, exception.OverQuota(
+            overs=sorted(overs), quotas=user_quotas, usages=usages,
+            headroom=headroom)
 
 
 def _quota_reservations_query(session, context, reservations):
@@ -4369,6 +4928,7 @@ def migration_get_in_progress_by_host_and_node(context, host, node):
 
 
 @require_admin_context
+@_slave_read
 def migration_get_all_by_filters(context, filters):
     query = model_query(context, models.Migration)
     if "status" in filters:
@@ -4561,6 +5121,7 @@ def _flavor_get_query(context, session=None, read_deleted=None):
 
 
 @require_context
+@_slave_read
 def flavor_get_all(context, inactive=False, filters=None,
                    sort_key='flavorid', sort_dir='asc', limit=None,
                    marker=None):
@@ -5050,6 +5611,7 @@ def bw_usage_get(context, uuid, start_period, mac, use_slave=False):
 
 
 @require_context
+@_slave_read
 def bw_usage_get_by_uuids(context, uuids, start_period):
     return model_query(context, models.BandwidthUsage, read_deleted="yes").\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
@@ -5573,6 +6135,7 @@ def instance_fault_create(context, values):
     return dict(fault_ref.iteritems())
 
 
+@_slave_read
 def instance_fault_get_by_instance_uuids(context, instance_uuids):
     """Get all instance faults for the provided instance_uuids."""
     if not instance_uuids:
@@ -5786,6 +6349,7 @@ def task_log_get(context, task_name, period_beginning, period_ending, host,
 
 
 @require_admin_context
+@_slave_read
 def task_log_get_all(context, task_name, period_beginning, period_ending,
                      host=None, state=None):
     return _task_log_get_query(context, task_name, period_beginning,
@@ -5829,6 +6393,76 @@ def task_log_end_task(context, task_name, period_beginning, period_ending,
             raise exception.TaskNotRunning(task_name=task_name, host=host)
 
 
+###################
+
+
+# The rollups of each hour are recorded in task_log, under a task which is
+# not specific to any host.
+_TENANT_USAGE_ROLLUP_TASK = 'tenant_usage_rollup'
+_TENANT_USAGE_ROLLUP_HOST = ''
+
+
+@require_admin_context
+def tenant_usage_rollup_create(context, period_beginning, period_ending,
+                               usages, message=None):
+    task = models.TaskLog()
+    task.task_name = _TENANT_USAGE_ROLLUP_TASK
+    task.host = _TENANT_USAGE_ROLLUP_HOST
+    task.period_beginning = period_beginning
+    task.period_ending = period_ending
+    task.state = "DONE"
+    task.task_items = len(usages)
+    task.message = message or ''
+
+    session = get_session()
+    try:
+        with session.begin():
+            session.add(task)
+            for values in usages:
+                usage = models.TenantUsage()
+                usage.update(values)
+                usage.period_beginning = period_beginning
+                session.add(usage)
+    except db_exc.DBDuplicateEntry:
+        raise exception.TaskAlreadyRunning(
+                task_name=_TENANT_USAGE_ROLLUP_TASK,
+                host=_TENANT_USAGE_ROLLUP_HOST)
+
+
+@require_context
+def tenant_usage_rollup_get_periods(context, begin, end):
+    rows = model_query(context, models.TaskLog.period_beginning,
+                       base_model=models.TaskLog).\
+            filter_by(task_name=_TENANT_USAGE_ROLLUP_TASK).\
+            filter_by(host=_TENANT_USAGE_ROLLUP_HOST).\
+            filter_by(state="DONE").\
+            filter(models.TaskLog.period_beginning >= begin).\
+            filter(models.TaskLog.period_ending <= end).\
+            all()
+    return [row[0] for row in rows]
+
+
+@require_context
+def tenant_usage_rollup_get_by_window(context, begin, end, project_id=None):
+    query = model_query(context, models.TenantUsage.project_id,
+                        func.sum(models.TenantUsage.hours),
+                        func.sum(models.TenantUsage.vcpus_hours),
+                        func.sum(models.TenantUsage.memory_mb_hours),
+                        func.sum(models.TenantUsage.local_gb_hours),
+                        base_model=models.TenantUsage).\
+            filter(models.TenantUsage.period_beginning >= begin).\
+            filter(models.TenantUsage.period_beginning < end)
+    if project_id is not None:
+        query = query.filter_by(project_id=project_id)
+    query = query.group_by(models.TenantUsage.project_id)
+    return [{'project_id': row[0],
+             'hours': row[1],
+             'vcpus_hours': row[2],
+             'memory_mb_hours': row[3],
+             'local_gb_hours': row[4]}
+            for row in query.all()]
+
+
 def _get_default_deleted_value(table):
     # TODO(dripton): It would be better to introspect the actual default value
     # from the column, but I don't see a way to do that in the low-level APIs
@@ -5848,87 +6482,165 @@ def _get_default_deleted_value(table):
         return None
 
 
-@require_admin_context
-def archive_deleted_rows_for_table(context, tablename, max_rows):
-    """Move up to max_rows rows from one tables to the corresponding
-    shadow table. The context argument is only used for the decorator.
+def _archive_deleted_rows_for_table(conn, table, shadow_table, max_rows,
+                                    after=None):
+    """Move up to max_rows deleted rows of table, whose key is greater
+    than after, to shadow_table, in one transaction.
 
-    :returns: number of rows archived
+    :returns: the number of rows archived and the key of the last of them,
+              which is None if no row was archived
     """
     # NOTE(guochbo): There is a circular import, nova.db.sqlalchemy.utils
     # imports nova.db.sqlalchemy.api.
     from nova.db.sqlalchemy import utils as db_utils
 
-    engine = get_engine()
-    conn = engine.connect()
-    metadata = MetaData()
-    metadata.bind = engine
-    table = Table(tablename, metadata, autoload=True)
-    default_deleted_value = _get_default_deleted_value(table)
-    shadow_tablename = _SHADOW_TABLE_PREFIX + tablename
-    rows_archived = 0
-    try:
-        shadow_table = Table(shadow_tablename, metadata, autoload=True)
-    except NoSuchTableError:
-        # No corresponding shadow table; skip it.
-        return rows_archived
-
-    if tablename == "dns_domains":
+    if table.name == "dns_domains":
         # We have one table (dns_domains) where the key is called
         # "domain" rather than "id"
         column = table.c.domain
-        column_name = "domain"
     else:
         column = table.c.id
-        column_name = "id"
-    # NOTE(guochbo): Use InsertFromSelect and DeleteFromSelect to avoid
-    # database's limit of maximum parameter in one SQL statement.
-    query_insert = select([table],
-                          table.c.deleted != default_deleted_value).\
-                          order_by(column).limit(max_rows)
-    query_delete = select([column],
-                          table.c.deleted != default_deleted_value).\
-                          order_by(column).limit(max_rows)
-
-    insert_statement = db_utils.InsertFromSelect(shadow_table, query_insert)
-    delete_statement = db_utils.DeleteFromSelect(table, query_delete, column)
+    deleted = table.c.deleted != _get_default_deleted_value(table)
+    if after is not None:
+        deleted = and_(deleted, column > after)
+
+    # The rows are archived in key order, the range of keys of the batch
+    # is looked up first so that the statements do not need a LIMIT.
+    keys = select([column], deleted).order_by(column).limit(max_rows).\
+            alias()
+    last = conn.execute(select([func.max(keys.c[column.name])])).scalar()
+    if last is None:
+        return 0, None
+
+    batch = and_(deleted, column <= last)
+    insert_statement = db_utils.InsertFromSelect(shadow_table,
+                                                 select([table], batch))
+    delete_statement = table.delete().where(batch)
     try:
         # Group the insert and delete in a transaction.
         with conn.begin():
-            result_insert = conn.execute(insert_statement)
+            conn.execute(insert_statement)
             result_delete = conn.execute(delete_statement)
     except IntegrityError:
         # A foreign key constraint keeps us from deleting some of
         # these rows until we clean up a dependent table.  Just
         # skip this table for now; we'll come back to it later.
-        msg = _("IntegrityError detected when archiving table %s") % tablename
+        msg = _("IntegrityError detected when archiving table %s") % \
+                table.name
         LOG.warn(msg)
-        return rows_archived
+        return 0, None
 
-    rows_archived = result_delete.rowcount
+    return result_delete.rowcount, last
 
-    return rows_archived
+
+@require_admin_context
+def archive_deleted_rows_for_table(context, tablename, max_rows):
+    """Move up to max_rows rows from one tables to the corresponding
+    shadow table. The context argument is only used for the decorator.
+
+    :returns: number of rows archived
+    """
+    engine = get_engine()
+    metadata = MetaData()
+    metadata.bind = engine
+    table = Table(tablename, metadata, autoload=True)
+    shadow_tablename = _SHADOW_TABLE_PREFIX + tablename
+    try:
+        shadow_table = Table(shadow_tablename, metadata, autoload=True)
+    except NoSuchTableError:
+        # No corresponding shadow table; skip it.
+        return 0
+
+    conn = engine.connect()
+    try:
+        return _archive_deleted_rows_for_table(conn, table, shadow_table,
+                                               max_rows)[0]
+    finally:
+        conn.close()
+
+
+def _get_archived_table_groups(engine):
+    """Return the groups of tables to archive, in a list of lists.
+
+    Only the tables with soft-deleted rows and a shadow table are
+    archived.  The tables linked by foreign keys are in the same group,
+    where the tables referencing another one come before it.
+    """
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    tables = [table for table in metadata.sorted_tables
+              if _SHADOW_TABLE_PREFIX + table.name in metadata.tables and
+              'deleted' in table.c]
+
+    parents = dict((table.name, table.name) for table in tables)
+
+    def _root(name):
+        while parents[name] != name:
+            name = parents[name]
+        return name
+
+    for table in tables:
+        for foreign_key in table.foreign_keys:
+            referenced = foreign_key.column.table.name
+            if referenced in parents:
+                parents[_root(table.name)] = _root(referenced)
+
+    groups = collections.OrderedDict()
+    for table in reversed(tables):
+        groups.setdefault(_root(table.name), []).append(
+                (table, metadata.tables[_SHADOW_TABLE_PREFIX + table.name]))
+    return groups.values()
 
 
 @require_admin_context
-def archive_deleted_rows(context, max_rows=None):
+def archive_deleted_rows(context, max_rows=None, batch_size=1000, workers=1,
+                         progress=None):
     """Move up to max_rows rows from production tables to the corresponding
     shadow tables.
 
+    The tables are archived after the tables referencing them, batch_size
+    rows at a time, each batch in its own transaction.  Up to workers
+    groups of tables which are not linked by foreign keys are archived in
+    parallel, each on its own connection.  An interrupted archiving is
+    resumed by running it again.
+
+    :param progress: called with the name of the table and the number of
+                     rows archived after each batch
     :returns: Number of rows archived.
     """
     # The context argument is only used for the decorator.
-    tablenames = []
-    for model_class in models.__dict__.itervalues():
-        if hasattr(model_class, "__tablename__"):
-            tablenames.append(model_class.__tablename__)
-    rows_archived = 0
-    for tablename in tablenames:
-        rows_archived += archive_deleted_rows_for_table(context, tablename,
-                                         max_rows=max_rows - rows_archived)
-        if rows_archived >= max_rows:
-            break
-    return rows_archived
+    engine = get_engine()
+    # The rows which may still be archived, the batches take theirs
+    # before they run.
+    left = [max_rows]
+
+    def _archive_group(tables):
+        rows_archived = 0
+        conn = engine.connect()
+        try:
+            for table, shadow_table in tables:
+                after = None
+                while left[0] is None or left[0] > 0:
+                    rows = batch_size
+                    if left[0] is not None:
+                        rows = min(rows, left[0])
+                        left[0] -= rows
+                    count, after = _archive_deleted_rows_for_table(
+                            conn, table, shadow_table, rows, after)
+                    if left[0] is not None:
+                        left[0] += rows - count
+                    if count and progress:
+                        progress(table.name, count)
+                    rows_archived += count
+                    if count < rows:
+                        break
+        finally:
+            conn.close()
+        return rows_archived
+
+    pool = greenpool.GreenPool(workers)
+    return sum(pool.imap(_archive_group,
+                         _get_archived_table_groups(engine)))
 
 
 ####################
@@ -6067,11 +6779,13 @@ def instance_group_delete(context, group_uuid):
                     soft_delete()
 
 
+@_slave_read
 def instance_group_get_all(context):
     """Get all groups."""
     return _instance_group_get_query(context, models.InstanceGroup).all()
 
 
+@_slave_read
 def instance_group_get_all_by_project_id(context, project_id):
     """Get all groups."""
     return _instance_group_get_query(context, models.InstanceGroup).\
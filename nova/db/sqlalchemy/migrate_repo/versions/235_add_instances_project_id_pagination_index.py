@@ -0,0 +1,62 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+INDEX_COLUMNS = ['project_id', 'deleted', 'created_at', 'id']
+
+
+def _get_project_id_pagination_index(table):
+    for idx in table.indexes:
+        if idx.columns.keys() == INDEX_COLUMNS:
+            return idx
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+    if _get_project_id_pagination_index(instances):
+        LOG.info(_('Skipped adding instances_project_id_deleted_created_at_'
+                   'id_idx because an equivalent index already exists.'))
+        return
+
+    # Based on the instance_get_all_by_filters query listing the instances
+    # of a project page by page, ordered by created_at and id
+    # from: nova/db/sqlalchemy/api.py
+    index = Index('instances_project_id_deleted_created_at_id_idx',
+                  *[instances.c[name] for name in INDEX_COLUMNS])
+
+    index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+
+    index = _get_project_id_pagination_index(instances)
+    if index:
+        index.drop(migrate_engine)
+    else:
+        LOG.info(_('Skipped removing instances_project_id_deleted_created_at_'
+                   'id_idx because index does not exist.'))
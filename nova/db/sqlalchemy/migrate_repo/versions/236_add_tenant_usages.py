@@ -0,0 +1,64 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from migrate.changeset import UniqueConstraint
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData
+from sqlalchemy import String, Table
+
+
+def _tenant_usages_columns():
+    return [
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Integer),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('project_id', String(length=255), nullable=False),
+        Column('period_beginning', DateTime, nullable=False),
+        Column('hours', Float, nullable=False),
+        Column('vcpus_hours', Float, nullable=False),
+        Column('memory_mb_hours', Float, nullable=False),
+        Column('local_gb_hours', Float, nullable=False),
+    ]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    columns = _tenant_usages_columns()
+    columns.append(UniqueConstraint(
+        'project_id', 'period_beginning', 'deleted',
+        name='uniq_tenant_usages0project_id0period_beginning0deleted'))
+    columns.append(Index('tenant_usages_period_beginning_idx',
+                         'period_beginning'))
+    tenant_usages = Table('tenant_usages', meta, *columns,
+                          mysql_engine='InnoDB',
+                          mysql_charset='utf8')
+    tenant_usages.create()
+
+    shadow_tenant_usages = Table('shadow_tenant_usages', meta,
+                                 *_tenant_usages_columns(),
+                                 mysql_engine='InnoDB',
+                                 mysql_charset='utf8')
+    shadow_tenant_usages.create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name in ('tenant_usages', 'shadow_tenant_usages'):
+        Table(table_name, meta, autoload=True).drop()
@@ -0,0 +1,63 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String
+from sqlalchemy import Table
+
+
+def _compute_node_reservations_columns():
+    return [
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Integer),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('compute_node_id', Integer, nullable=False),
+        Column('instance_uuid', String(length=36)),
+        Column('memory_mb', Integer, nullable=False),
+        Column('vcpus', Integer, nullable=False),
+        Column('local_gb', Integer, nullable=False),
+        Column('expire', DateTime, nullable=False),
+    ]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    columns = _compute_node_reservations_columns()
+    columns.append(Index('compute_node_reservations_compute_node_id_idx',
+                         'compute_node_id'))
+    columns.append(Index('compute_node_reservations_instance_uuid_idx',
+                         'instance_uuid'))
+    reservations = Table('compute_node_reservations', meta, *columns,
+                         mysql_engine='InnoDB',
+                         mysql_charset='utf8')
+    reservations.create()
+
+    shadow_reservations = Table('shadow_compute_node_reservations', meta,
+                                *_compute_node_reservations_columns(),
+                                mysql_engine='InnoDB',
+                                mysql_charset='utf8')
+    shadow_reservations.create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name in ('compute_node_reservations',
+                       'shadow_compute_node_reservations'):
+        Table(table_name, meta, autoload=True).drop()
@@ -166,6 +166,8 @@ class Instance(BASE, NovaBase):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_project_id_deleted_created_at_id_idx',
+              'project_id', 'deleted', 'created_at', 'id'),
     )
     injected_files = []
 
@@ -1318,6 +1320,46 @@ class TaskLog(BASE, NovaBase):
     errors = Column(Integer(), default=0)
 
 
+class TenantUsage(BASE, NovaBase):
+    """Usage of the instances of a tenant during one hour, as rolled up for
+    the simple tenant usage API.
+    """
+    __tablename__ = 'tenant_usages'
+    __table_args__ = (
+        schema.UniqueConstraint(
+            'project_id', 'period_beginning', 'deleted',
+            name='uniq_tenant_usages0project_id0period_beginning0deleted'),
+        Index('tenant_usages_period_beginning_idx', 'period_beginning'),
+    )
+    id = Column(Integer, primary_key=True, nullable=False)
+    project_id = Column(String(255), nullable=False)
+    period_beginning = Column(DateTime, nullable=False)
+    hours = Column(Float, nullable=False)
+    vcpus_hours = Column(Float, nullable=False)
+    memory_mb_hours = Column(Float, nullable=False)
+    local_gb_hours = Column(Float, nullable=False)
+
+
+class ComputeNodeReservation(BASE, NovaBase):
+    """Resources of a compute node reserved by a scheduler for an instance
+    until the instance claims them on the compute host.
+    """
+    __tablename__ = 'compute_node_reservations'
+    __table_args__ = (
+        Index('compute_node_reservations_compute_node_id_idx',
+              'compute_node_id'),
+        Index('compute_node_reservations_instance_uuid_idx',
+              'instance_uuid'),
+    )
+    id = Column(Integer, primary_key=True, nullable=False)
+    compute_node_id = Column(Integer, nullable=False)
+    instance_uuid = Column(String(36))
+    memory_mb = Column(Integer, nullable=False)
+    vcpus = Column(Integer, nullable=False)
+    local_gb = Column(Integer, nullable=False)
+    expire = Column(DateTime, nullable=False)
+
+
 class InstanceGroupMember(BASE, NovaBase):
     """Represents the members for an instance group."""
     __tablename__ = 'instance_group_member'
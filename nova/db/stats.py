@@ -0,0 +1,353 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Statistics of the calls to the database API.
+
+When db_collect_stats is set, the wall time of every call to a function of
+nova.db, the number of SQL statements it executes and the number of rows it
+returns are accumulated in STATS under the name of the function.  The calls
+are also accounted under the request id of their context and under the
+periodic task making them, so that the requests and periodic tasks issuing
+many queries stand out.
+
+Every db_stats_log_interval seconds, the figures are logged at debug level,
+written to db_stats_dir when it is set, where 'nova-manage db stats' reads
+them, and reset.  STATS.report() gives the current figures, e.g. from the
+eventlet backdoor.
+"""
+
+import collections
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+
+db_stats_opts = [
+    cfg.BoolOpt('db_collect_stats',
+                default=False,
+                help='Collect the latency, the number of SQL statements and '
+                     'the number of rows returned of the calls to the '
+                     'database API, by function, request and periodic task.'),
+    cfg.IntOpt('db_stats_log_interval',
+               default=600,
+               help='How often in seconds the collected database API '
+                    'statistics are logged and reset.'),
+    cfg.IntOpt('db_stats_max_requests',
+               default=100,
+               help='Number of most recent requests whose database API '
+                    'statistics are kept.'),
+    cfg.StrOpt('db_stats_dir',
+               help='Directory where the database API statistics of each '
+                    'process are written when they are logged, for '
+                    '"nova-manage db stats".'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(db_stats_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets.  The last
+# bucket counts everything slower.
+HISTOGRAM_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+_local = threading.local()
+
+
+def enabled():
+    return CONF.db_collect_stats
+
+
+class Timing(object):
+    """Accumulated figures of the calls to one database API function."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, elapsed, statements, rows):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.statements += statements
+        self.rows += rows
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if elapsed <= bound:
+                break
+        else:
+            i = len(HISTOGRAM_BOUNDS)
+        self.histogram[i] += 1
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'total': self.total,
+                'average': self.total / self.calls if self.calls else 0.0,
+                'max': self.max,
+                'statements': self.statements,
+                'rows': self.rows,
+                'histogram': list(self.histogram)}
+
+
+class Caller(object):
+    """Accumulated figures of the calls made by one request or periodic
+    task, with the number of calls to each function.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.functions = {}
+
+    def add(self, name, elapsed, statements, rows):
+        self.calls += 1
+        self.total += elapsed
+        self.statements += statements
+        self.rows += rows
+        self.functions[name] = self.functions.get(name, 0) + 1
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'total': self.total,
+                'statements': self.statements,
+                'rows': self.rows,
+                'functions': dict(self.functions)}
+
+
+class DbApiStats(object):
+    """Figures of the database API calls, by function, request id and
+    periodic task.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.functions = {}
+        self.requests = collections.OrderedDict()
+        self.tasks = {}
+        self.started = timeutils.utcnow()
+        self._started_at = time.time()
+
+    def record(self, name, elapsed, statements=0, rows=0, request_id=None,
+               task=None):
+        timing = self.functions.get(name)
+        if timing is None:
+            timing = self.functions[name] = Timing()
+        timing.add(elapsed, statements, rows)
+
+        if request_id is not None:
+            caller = self.requests.pop(request_id, None)
+            if caller is None:
+                caller = Caller()
+                while len(self.requests) >= max(CONF.db_stats_max_requests,
+                                                1):
+                    self.requests.popitem(last=False)
+            # Most recent requests last
+            self.requests[request_id] = caller
+            caller.add(name, elapsed, statements, rows)
+        if task is not None:
+            caller = self.tasks.get(task)
+            if caller is None:
+                caller = self.tasks[task] = Caller()
+            caller.add(name, elapsed, statements, rows)
+
+        if time.time() - self._started_at >= CONF.db_stats_log_interval:
+            self.dump_and_reset()
+
+    def report(self):
+        """Return the figures as a dict of dicts, with the figures of the
+        functions, requests and periodic tasks.
+        """
+        return {'started': timeutils.strtime(self.started),
+                'functions': dict((name, timing.to_dict()) for name, timing
+                                  in self.functions.iteritems()),
+                'requests': dict((request_id, caller.to_dict())
+                                 for request_id, caller
+                                 in self.requests.iteritems()),
+                'tasks': dict((task, caller.to_dict()) for task, caller
+                              in self.tasks.iteritems())}
+
+    def dump_and_reset(self):
+        report = self.report()
+        self.reset()
+        if report['functions']:
+            self._log(report)
+            if CONF.db_stats_dir:
+                self._write(report)
+
+    @staticmethod
+    def _log(report):
+        LOG.debug(_("Database API statistics since %s:"), report['started'])
+        for name, timing in sorted(report['functions'].iteritems()):
+            LOG.debug(_("%(name)s: %(calls)d calls, %(average).6fs average, "
+                        "%(max).6fs max, %(statements)d statements, "
+                        "%(rows)d rows, latency %(histogram)s"),
+                      dict(timing, name=name,
+                           histogram=format_histogram(timing['histogram'])))
+        for kind, callers in ((_("Request"), report['requests']),
+                              (_("Periodic task"), report['tasks'])):
+            for caller, figures in sorted(callers.iteritems()):
+                LOG.debug(_("%(kind)s %(caller)s: %(calls)d calls, "
+                            "%(total).6fs, %(statements)d statements, "
+                            "%(rows)d rows, %(functions)s"),
+                          dict(figures, kind=kind, caller=caller))
+
+    @staticmethod
+    def _write(report):
+        binary = os.path.basename(sys.argv[0]) or 'nova'
+        path = os.path.join(CONF.db_stats_dir,
+                            '%s-%d.json' % (binary, os.getpid()))
+        try:
+            with open(path + '.tmp', 'w') as f:
+                f.write(jsonutils.dumps(report))
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError) as e:
+            LOG.warn(_("Failed to write the database API statistics to "
+                       "%(path)s: %(error)s"), {'path': path, 'error': e})
+
+
+STATS = DbApiStats()
+
+
+def format_histogram(histogram):
+    buckets = ['<=%ss:%d' % (bound, count)
+               for bound, count in zip(HISTOGRAM_BOUNDS, histogram)]
+    buckets.append('>%ss:%d' % (HISTOGRAM_BOUNDS[-1], histogram[-1]))
+    return ' '.join(buckets)
+
+
+def load_reports(path):
+    """Return the reports written to the directory path by the processes.
+    """
+    reports = []
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith('.json'):
+            with open(os.path.join(path, filename)) as f:
+                reports.append(jsonutils.loads(f.read()))
+    return reports
+
+
+def _merge_figures(merged, figures):
+    for key, value in figures.iteritems():
+        if key == 'max':
+            merged[key] = max(merged.get(key, 0.0), value)
+        elif key == 'histogram':
+            merged[key] = [a + b for a, b in
+                           zip(merged.get(key, [0] * len(value)), value)]
+        elif key == 'functions':
+            functions = merged.setdefault(key, {})
+            for name, calls in value.iteritems():
+                functions[name] = functions.get(name, 0) + calls
+        elif key != 'average':
+            merged[key] = merged.get(key, 0) + value
+
+
+def merge_reports(reports):
+    """Sum the figures of several reports, e.g. of all the processes."""
+    merged = {'functions': {}, 'requests': {}, 'tasks': {}}
+    for report in reports:
+        for kind in ('functions', 'requests', 'tasks'):
+            for name, figures in report[kind].iteritems():
+                _merge_figures(merged[kind].setdefault(name, {}), figures)
+    for timing in merged['functions'].itervalues():
+        timing['average'] = (timing['total'] / timing['calls']
+                             if timing['calls'] else 0.0)
+    return merged
+
+
+def _count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def statement_executed():
+    """Account a SQL statement to the database API calls in progress."""
+    calls = getattr(_local, 'calls', None)
+    if calls:
+        calls[-1] += 1
+
+
+def instrument(name, func):
+    """Wrap the database API function func to record its calls under name.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        calls = getattr(_local, 'calls', None)
+        if calls is None:
+            calls = _local.calls = []
+        calls.append(0)
+        result = None
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            elapsed = time.time() - start
+            statements = calls.pop()
+            if calls:
+                # The statements of nested calls count for the outer ones
+                calls[-1] += statements
+            context = args[0] if args else kwargs.get('context')
+            STATS.record(name, elapsed, statements, _count_rows(result),
+                         request_id=getattr(context, 'request_id', None),
+                         task=getattr(_local, 'task', None))
+    return wrapper
+
+
+class InstrumentedDBAPI(object):
+    """Proxy of a database API backend recording the calls to its functions
+    when db_collect_stats is set.
+    """
+
+    def __init__(self, impl):
+        self._impl = impl
+
+    def __getattr__(self, key):
+        attr = getattr(self._impl, key)
+        if not enabled() or not callable(attr):
+            return attr
+        return instrument(key, attr)
+
+
+@contextlib.contextmanager
+def periodic_task(name):
+    """Account the database API calls of the enclosed block to the periodic
+    task name.
+    """
+    previous = getattr(_local, 'task', None)
+    _local.task = name
+    try:
+        yield
+    finally:
+        _local.task = previous
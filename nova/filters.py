@@ -64,6 +64,14 @@ class BaseFilterHandler(loadables.BaseLoader):
     This class should be subclassed where one needs to use filters.
     """
 
+    def _filter_all(self, filter, objs, filter_properties):
+        """Run one filter over objs.
+
+        Can be overridden in a subclass to change how a filter is applied,
+        for example to reuse earlier results.
+        """
+        return filter.filter_all(objs, filter_properties)
+
     def get_filtered_objects(self, filter_classes, objs,
             filter_properties, index=0):
         list_objs = list(objs)
@@ -73,8 +81,8 @@ class BaseFilterHandler(loadables.BaseLoader):
             filter = filter_cls()
 
             if filter.run_filter_for_index(index):
-                objs = filter.filter_all(list_objs,
-                                               filter_properties)
+                objs = self._filter_all(filter, list_objs,
+                                        filter_properties)
                 if objs is None:
                     LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
                           {'cls_name': cls_name})
@@ -51,19 +51,61 @@ This module provides Manager, a base class for managers.
 
 """
 
+import datetime
+import functools
+import time
+
+from eventlet import greenpool
+from eventlet import queue
 from oslo.config import cfg
 
 from nova.db import base
+from nova.db import stats as db_stats
+from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
+from nova.openstack.common import timeutils
 from nova import rpc
 
 
+manager_opts = [
+    cfg.IntOpt('periodic_task_workers',
+               default=1,
+               help='Number of periodic tasks of a service run at the same '
+                    'time.  The due tasks are started by decreasing '
+                    'priority.  1 runs them one after another'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(manager_opts)
 CONF.import_opt('host', 'nova.netconf')
 LOG = logging.getLogger(__name__)
 
 
+def periodic_task_options(priority=0, deadline=None):
+    """Decorator setting the priority and the deadline of a periodic task.
+
+    The due periodic tasks are started by decreasing priority.  A task
+    running for longer than its deadline, in seconds, is logged and is no
+    longer waited for by the pass of the periodic tasks which started it.
+    The deadline defaults to the spacing of the task.
+    """
+    def decorator(f):
+        f._periodic_priority = priority
+        f._periodic_deadline = deadline
+        return f
+    return decorator
+
+
+def _account_db_calls(task, full_task_name):
+    """Account the DB API calls of the periodic task to it."""
+    @functools.wraps(task)
+    def wrapper(self, context):
+        with db_stats.periodic_task(full_task_name):
+            return task(self, context)
+    return wrapper
+
+
 class Manager(base.Base, periodic_task.PeriodicTasks):
 
     def __init__(self, host=None, db_driver=None, service_name='undefined'):
@@ -75,11 +117,181 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         self.notifier = rpc.get_notifier(self.service_name, self.host)
         self.additional_endpoints = []
         super(Manager, self).__init__(db_driver)
+        # Run time and lag of the periodic tasks, and the tasks running in
+        # the pool of the periodic tasks.
+        self.periodic_task_stats = {}
+        self._periodic_pool = None
+        self._periodic_running = set()
+        if db_stats.enabled():
+            self._periodic_tasks = [
+                (name, _account_db_calls(task, '.'.join(
+                    [self.__class__.__name__, name])))
+                for name, task in self._periodic_tasks]
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
         return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
 
+    def run_periodic_tasks(self, context, raise_on_error=False):
+        """Run the due periodic tasks by decreasing priority, up to
+        CONF.periodic_task_workers of them at the same time.
+
+        Returns the number of seconds until the next task is due.
+        """
+        idle_for, due = self._get_due_periodic_tasks()
+        if CONF.periodic_task_workers <= 1:
+            for task_name, task, due_at in due:
+                self._run_periodic_task(context, task_name, task, due_at,
+                                        raise_on_error)
+            return idle_for
+
+        if self._periodic_pool is None:
+            self._periodic_pool = greenpool.GreenPool(
+                    CONF.periodic_task_workers)
+        done = queue.LightQueue()
+        errors = []
+        # Deadlines of the tasks started by this pass
+        waiting = {}
+        for task_name, task, due_at in due:
+            while (not self._periodic_pool.free() and
+                   self._wait_periodic_tasks(done, waiting)):
+                pass
+            if not self._periodic_pool.free():
+                # All the workers are busy with tasks past their deadline,
+                # retry the remaining tasks shortly
+                idle_for = min(idle_for, 1)
+                break
+            self._periodic_running.add(task_name)
+            waiting[task_name] = (time.time() +
+                                  self._get_periodic_deadline(task_name, task))
+            self._periodic_pool.spawn_n(self._run_pooled_periodic_task,
+                                        context, task_name, task, due_at,
+                                        raise_on_error, done, errors)
+        while self._wait_periodic_tasks(done, waiting):
+            pass
+
+        if errors:
+            raise errors[0]
+        return idle_for
+
+    def _get_due_periodic_tasks(self):
+        """Return the number of seconds until the next periodic task is due,
+        and the list of (task name, task, due time) of the due tasks, by
+        decreasing priority.
+        """
+        idle_for = periodic_task.DEFAULT_INTERVAL
+        now = timeutils.utcnow()
+        due = []
+        for task_name, task in self._periodic_tasks:
+            if task_name in self._periodic_running:
+                continue
+
+            spacing = self._periodic_spacing[task_name]
+            last_run = self._periodic_last_run[task_name]
+            due_at = now
+
+            # If a periodic task is _nearly_ due, then we'll run it early
+            if spacing is not None and last_run is not None:
+                due_at = last_run + datetime.timedelta(seconds=spacing)
+                if not timeutils.is_soon(due_at, 0.2):
+                    idle_for = min(idle_for,
+                                   timeutils.delta_seconds(now, due_at))
+                    continue
+
+            if spacing is not None:
+                idle_for = min(idle_for, spacing)
+
+            due.append((task_name, task, due_at))
+
+        due.sort(key=lambda item: getattr(item[1], '_periodic_priority', 0),
+                 reverse=True)
+        return idle_for, due
+
+    def _get_periodic_deadline(self, task_name, task):
+        deadline = getattr(task, '_periodic_deadline', None)
+        if deadline is None:
+            deadline = (self._periodic_spacing[task_name] or
+                        periodic_task.DEFAULT_INTERVAL)
+        return deadline
+
+    def _run_periodic_task(self, context, task_name, task, due_at,
+                           raise_on_error):
+        """Run a periodic task and report its run time and lag."""
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        start = timeutils.utcnow()
+        lag = max(0, timeutils.delta_seconds(due_at, start))
+
+        LOG.debug(_("Running periodic task %(full_task_name)s"),
+                  {"full_task_name": full_task_name})
+        self._periodic_last_run[task_name] = start
+
+        try:
+            task(self, context)
+        except Exception as e:
+            if raise_on_error:
+                raise
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          {"full_task_name": full_task_name, "e": e})
+        finally:
+            run_time = timeutils.delta_seconds(start, timeutils.utcnow())
+            self._report_periodic_task(task_name, task, run_time, lag)
+        time.sleep(0)
+
+    def _run_pooled_periodic_task(self, context, task_name, task, due_at,
+                                  raise_on_error, done, errors):
+        try:
+            self._run_periodic_task(context, task_name, task, due_at,
+                                    raise_on_error)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            self._periodic_running.discard(task_name)
+            done.put(task_name)
+
+    def _wait_periodic_tasks(self, done, waiting):
+        """Wait until one of the waiting periodic tasks ends or passes its
+        deadline.  Returns False if there is no task to wait for.
+        """
+        if not waiting:
+            return False
+        try:
+            timeout = max(0, min(waiting.values()) - time.time())
+            waiting.pop(done.get(timeout=timeout), None)
+        except queue.Empty:
+            now = time.time()
+            for task_name, deadline in waiting.items():
+                if deadline <= now:
+                    del waiting[task_name]
+                    LOG.warn(_("Periodic task %(task)s.%(task_name)s is "
+                               "still running past its deadline"),
+                             {'task': self.__class__.__name__,
+                              'task_name': task_name})
+        return True
+
+    def _report_periodic_task(self, task_name, task, run_time, lag):
+        """Record and log the run time and lag of a periodic task run."""
+        stats = self.periodic_task_stats.setdefault(task_name, {
+                'runs': 0, 'run_time': 0, 'max_run_time': 0, 'lag': 0,
+                'max_lag': 0})
+        stats['runs'] += 1
+        stats['run_time'] = run_time
+        stats['max_run_time'] = max(stats['max_run_time'], run_time)
+        stats['lag'] = lag
+        stats['max_lag'] = max(stats['max_lag'], lag)
+
+        params = {'task': self.__class__.__name__, 'task_name': task_name,
+                  'run_time': run_time, 'lag': lag,
+                  'deadline': self._get_periodic_deadline(task_name, task)}
+        if run_time > params['deadline']:
+            LOG.warn(_("Periodic task %(task)s.%(task_name)s ran for "
+                       "%(run_time).2f seconds, past its deadline of "
+                       "%(deadline)s seconds, and started %(lag).2f "
+                       "seconds late"), params)
+        else:
+            LOG.debug(_("Periodic task %(task)s.%(task_name)s ran for "
+                        "%(run_time).2f seconds and started %(lag).2f "
+                        "seconds late"), params)
+
     def init_host(self):
         """Hook to do additional manager initialization when one requests
         the service be started.  This is called before any service record
@@ -50,6 +50,8 @@ INSTANCE_OPTIONAL_ATTRS = (_INSTANCE_OPTIONAL_JOINED_FIELDS +
 # These are fields that most query calls load by default
 INSTANCE_DEFAULT_FIELDS = ['metadata', 'system_metadata',
                            'info_cache', 'security_groups']
+# These are fields that are lazy-loaded for a whole listing at once
+_INSTANCE_LISTING_LOADED_FIELDS = ['metadata', 'system_metadata']
 
 
 def _expected_cols(expected_attrs):
@@ -60,6 +62,16 @@ def _expected_cols(expected_attrs):
                  if attr in _INSTANCE_OPTIONAL_JOINED_FIELDS]
 
 
+def _projected_cols(columns):
+    """Return the columns to read in order to fill the fields in columns."""
+    if columns is None:
+        return None
+    columns = set(columns)
+    if 'deleted' in columns:
+        columns.add('id')
+    return list(columns)
+
+
 class Instance(base.NovaPersistentObject, base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: Added info_cache
@@ -169,6 +181,11 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
     def __init__(self, *args, **kwargs):
         super(Instance, self).__init__(*args, **kwargs)
         self._reset_metadata_tracking()
+        # The instances listed along with this one, see _load_for_listing().
+        # An InstanceList links its instances again when it is deserialized,
+        # but a projected instance sent over RPC on its own loses its
+        # listing and cannot lazy-load the columns left out of it.
+        self._listing = None
 
     def _reset_metadata_tracking(self, fields=None):
         if fields is None or 'system_metadata' in fields:
@@ -251,10 +268,12 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         return base_name
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        columns=None):
         """Method to help with migration to objects.
 
-        Converts a database entity to a formal object.
+        Converts a database entity to a formal object.  If columns is
+        given, only those fields are read from db_inst.
         """
         if expected_attrs is None:
             expected_attrs = []
@@ -262,6 +281,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         for field in instance.fields:
             if field in INSTANCE_OPTIONAL_ATTRS:
                 continue
+            elif columns is not None and field not in columns:
+                continue
             elif field == 'deleted':
                 instance.deleted = db_inst['deleted'] == db_inst['id']
             elif field == 'cleaned':
@@ -384,6 +405,57 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         # be dropped.
         pass
 
+    def _get_save_updates(self, context, expected_vm_state=None,
+                          expected_task_state=None):
+        """Save the nested objects of this instance and return the
+        column-wise updates to save, or {} if there are none.
+        """
+        updates = {}
+        changes = self.obj_what_changed()
+        for field in self.fields:
+            if (self.obj_attr_is_set(field) and
+                    isinstance(self[field], base.NovaObject)):
+                try:
+                    getattr(self, '_save_%s' % field)(context)
+                except AttributeError:
+                    LOG.exception(_('No save handler for %s') % field,
+                                  instance=self)
+            elif field in changes:
+                updates[field] = self[field]
+
+        if not updates:
+            return updates
+
+        # Cleaned needs to be turned back into an int here
+        if 'cleaned' in updates:
+            if updates['cleaned']:
+                updates['cleaned'] = 1
+            else:
+                updates['cleaned'] = 0
+
+        if expected_task_state is not None:
+            if (self.VERSION == '1.9' and
+                    expected_task_state == 'image_snapshot'):
+                # NOTE(danms): Icehouse introduced a pending state which
+                # Havana doesn't know about. If we're an old instance,
+                # tolerate the pending state as well
+                expected_task_state = [
+                    expected_task_state, 'image_snapshot_pending']
+            updates['expected_task_state'] = expected_task_state
+        if expected_vm_state is not None:
+            updates['expected_vm_state'] = expected_vm_state
+        return updates
+
+    def _get_save_expected_attrs(self):
+        expected_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
+                               if self.obj_attr_is_set(attr)]
+        # NOTE(alaski): We need to pull system_metadata for the
+        # notification.send_update() below.  If we don't there's a KeyError
+        # when it tries to extract the flavor.
+        if 'system_metadata' not in expected_attrs:
+            expected_attrs.append('system_metadata')
+        return expected_attrs
+
     @base.remotable
     def save(self, context, expected_vm_state=None,
              expected_task_state=None, admin_state_reset=False):
@@ -424,50 +496,14 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         else:
             stale_instance = None
 
-        updates = {}
-        changes = self.obj_what_changed()
-        for field in self.fields:
-            if (self.obj_attr_is_set(field) and
-                    isinstance(self[field], base.NovaObject)):
-                try:
-                    getattr(self, '_save_%s' % field)(context)
-                except AttributeError:
-                    LOG.exception(_('No save handler for %s') % field,
-                                  instance=self)
-            elif field in changes:
-                updates[field] = self[field]
-
+        updates = self._get_save_updates(context, expected_vm_state,
+                                         expected_task_state)
         if not updates:
             if stale_instance:
                 _handle_cell_update_from_api()
             return
 
-        # Cleaned needs to be turned back into an int here
-        if 'cleaned' in updates:
-            if updates['cleaned']:
-                updates['cleaned'] = 1
-            else:
-                updates['cleaned'] = 0
-
-        if expected_task_state is not None:
-            if (self.VERSION == '1.9' and
-                    expected_task_state == 'image_snapshot'):
-                # NOTE(danms): Icehouse introduced a pending state which
-                # Havana doesn't know about. If we're an old instance,
-                # tolerate the pending state as well
-                expected_task_state = [
-                    expected_task_state, 'image_snapshot_pending']
-            updates['expected_task_state'] = expected_task_state
-        if expected_vm_state is not None:
-            updates['expected_vm_state'] = expected_vm_state
-
-        expected_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
-                               if self.obj_attr_is_set(attr)]
-        # NOTE(alaski): We need to pull system_metadata for the
-        # notification.send_update() below.  If we don't there's a KeyError
-        # when it tries to extract the flavor.
-        if 'system_metadata' not in expected_attrs:
-            expected_attrs.append('system_metadata')
+        expected_attrs = self._get_save_expected_attrs()
         old_ref, inst_ref = db.instance_update_and_get_original(
                 context, self.uuid, updates, update_cells=False,
                 columns_to_join=_expected_cols(expected_attrs))
@@ -504,8 +540,40 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                     self[field] = current[field]
         self.obj_reset_changes()
 
+    def _load_for_listing(self, attrname):
+        """Load attrname of the instances listed along with this one.
+
+        Rather than one query per instance, every instance of the listing
+        which lacks attrname gets it from a single query.  A column left
+        out of a projected listing brings all the others with it.
+        """
+        if attrname in INSTANCE_OPTIONAL_ATTRS:
+            columns = []
+            expected_attrs = [attrname]
+        else:
+            columns = [field for field in self.fields
+                       if field not in INSTANCE_OPTIONAL_ATTRS]
+            expected_attrs = []
+        instances = {}
+        for instance in self._listing:
+            fields = [field for field in columns + expected_attrs
+                      if not instance.obj_attr_is_set(field)]
+            if fields:
+                instances[instance.uuid] = (instance, fields)
+        loaded = InstanceList.get_by_filters(
+            self._context, {'uuid': instances.keys()},
+            expected_attrs=expected_attrs, columns=columns)
+        for loaded_instance in loaded:
+            instance, fields = instances[loaded_instance.uuid]
+            for field in fields:
+                instance[field] = loaded_instance[field]
+            instance.obj_reset_changes(fields)
+        if not self.obj_attr_is_set(attrname):
+            raise exception.InstanceNotFound(instance_id=self.uuid)
+
     def obj_load_attr(self, attrname):
-        if attrname not in INSTANCE_OPTIONAL_ATTRS:
+        if (attrname not in INSTANCE_OPTIONAL_ATTRS and
+                self._listing is None):
             raise exception.ObjectActionError(
                 action='obj_load_attr',
                 reason='attribute %s not lazy-loadable' % attrname)
@@ -518,6 +586,12 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                    'name': self.obj_name(),
                    'uuid': self.uuid,
                    })
+        if self._listing is not None and (
+                attrname in _INSTANCE_LISTING_LOADED_FIELDS or
+                attrname not in INSTANCE_OPTIONAL_ATTRS):
+            self._load_for_listing(attrname)
+            return
+
         # FIXME(comstud): This should be optimized to only load the attr.
         instance = self.__class__.get_by_uuid(self._context,
                                               uuid=self.uuid,
@@ -571,7 +645,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
             self.obj_reset_changes(['metadata'])
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        columns=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
@@ -587,9 +662,11 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     inst_list.objects = []
     for db_inst in db_inst_list:
         inst_obj = Instance._from_db_object(context, Instance(), db_inst,
-                                            expected_attrs=expected_attrs)
+                                            expected_attrs=expected_attrs,
+                                            columns=columns)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
+        inst_obj._listing = inst_list.objects
         inst_list.objects.append(inst_obj)
     inst_list.obj_reset_changes()
     return inst_list
@@ -604,7 +681,9 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 1.4: Instance <= version 1.12
     # Version 1.5: Added method get_active_by_window_joined.
     # Version 1.6: Instance <= version 1.13
-    VERSION = '1.6'
+    # Version 1.7: Added columns to get_by_filters
+    # Version 1.8: Added save()
+    VERSION = '1.8'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -617,18 +696,48 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         '1.4': '1.12',
         '1.5': '1.12',
         '1.6': '1.13',
+        '1.7': '1.13',
+        '1.8': '1.13',
         }
 
+    @classmethod
+    def _obj_from_primitive(cls, context, objver, primitive):
+        self = super(InstanceList, cls)._obj_from_primitive(context, objver,
+                                                            primitive)
+        # NOTE: The listing is not serialized, link the instances again so
+        # that a projected listing received over RPC can still lazy-load
+        # the columns left out of it.
+        for inst_obj in self.objects:
+            inst_obj._listing = self.objects
+        return self
+
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
-                       marker=None, expected_attrs=None, use_slave=False):
+                       marker=None, expected_attrs=None, use_slave=False,
+                       columns=None):
+        """Get the instances matching filters.
+
+        If columns is given, only those fields and uuid are read and the
+        other ones are lazy-loaded.  Relationships such as info_cache and
+        security_groups are then lazy-loaded too, even if they are in
+        expected_attrs.  The instances of such a listing must be sent over
+        RPC within their InstanceList, an instance sent on its own cannot
+        lazy-load the columns left out of it.
+        """
+        kwargs = {}
+        if columns is not None:
+            columns = list(set(columns) | set(['uuid']))
+            expected_attrs = [attr for attr in expected_attrs or []
+                              if attr not in ('info_cache',
+                                              'security_groups')]
+            kwargs['columns'] = _projected_cols(columns)
         db_inst_list = db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, limit=limit, marker=marker,
             columns_to_join=_expected_cols(expected_attrs),
-            use_slave=use_slave)
+            use_slave=use_slave, **kwargs)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
     def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
@@ -713,6 +822,65 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     def get_by_security_group(cls, context, security_group):
         return cls.get_by_security_group_id(context, security_group.id)
 
+    @base.remotable
+    def save(self, context, expected_vm_state=None, expected_task_state=None):
+        """Save the updates to the instances of this list.
+
+        The column-wise updates of all the instances are made in one
+        transaction, instead of one per instance with Instance.save().
+        The expected states are checked for each instance like
+        Instance.save() does, but an instance which is not in them or was
+        deleted is skipped instead of failing the others, and keeps its
+        pending changes.
+
+        :returns: A list of the uuids of the instances which were skipped.
+        """
+        cell_type = cells_opts.get_cell_type()
+        skipped = []
+        updates = {}
+        expected_attrs = {}
+        for instance in self.objects:
+            if cell_type == 'api' and instance.cell_name:
+                # NOTE: Instance.save() forwards the updates of the
+                # instances of child cells to them.
+                try:
+                    instance.save(context,
+                                  expected_vm_state=expected_vm_state,
+                                  expected_task_state=expected_task_state)
+                except (exception.InstanceNotFound,
+                        exception.UnexpectedTaskStateError,
+                        exception.UnexpectedVMStateError):
+                    skipped.append(instance.uuid)
+                continue
+            instance_updates = instance._get_save_updates(
+                    context, expected_vm_state, expected_task_state)
+            if instance_updates:
+                updates[instance.uuid] = instance_updates
+                expected_attrs[instance.uuid] = (
+                        instance._get_save_expected_attrs())
+        if not updates:
+            return skipped
+
+        columns_to_join = set()
+        for attrs in expected_attrs.values():
+            columns_to_join.update(_expected_cols(attrs))
+        results = db.instance_update_bulk(
+                context, updates, update_cells=False,
+                columns_to_join=list(columns_to_join))
+        instances = dict((instance.uuid, instance) for instance in self)
+        for old_ref, inst_ref in results:
+            instance = instances[inst_ref['uuid']]
+            if cell_type == 'compute':
+                cells_api = cells_rpcapi.CellsAPI()
+                cells_api.instance_update_at_top(context, inst_ref)
+            Instance._from_db_object(context, instance, inst_ref,
+                                     expected_attrs[instance.uuid])
+            notifications.send_update(context, old_ref, inst_ref)
+            instance.obj_reset_changes()
+        saved = set(inst_ref['uuid'] for old_ref, inst_ref in results)
+        skipped.extend(uuid for uuid in updates if uuid not in saved)
+        return skipped
+
     def fill_faults(self):
         """Batch query the database for our instances' faults.
 
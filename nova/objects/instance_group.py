@@ -155,7 +155,8 @@ class InstanceGroup(base.NovaPersistentObject, base.NovaObject):
             filter_uuids = set(filter_uuids) - set(exclude)
         filters = {'uuid': filter_uuids, 'deleted': False}
         instances = instance_obj.InstanceList.get_by_filters(context,
-                                                             filters=filters)
+                                                             filters=filters,
+                                                             columns=['host'])
         return list(set([instance.host for instance in instances
                          if instance.host]))
 
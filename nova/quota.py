@@ -17,10 +17,12 @@
 """Quotas for instances, and floating ips."""
 
 import datetime
+import functools
 
 from oslo.config import cfg
 import six
 
+import nova.context
 from nova import db
 from nova import exception
 from nova.objects import keypair as keypair_obj
@@ -81,17 +83,96 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='Default driver to use for quota checks'),
+    cfg.IntOpt('quota_cache_ttl',
+               default=0,
+               help='Number of seconds the quota limits and quota class '
+                    'defaults read by the database quota driver are '
+                    'cached for. Changes made through the API of the same '
+                    'process are seen at once, other changes after at most '
+                    'this long. 0 disables the cache'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
 
 
+class LimitCache(object):
+    """Cache of the quota limits read from the database.
+
+    The entries expire after CONF.quota_cache_ttl seconds.  Invalidating
+    the cache drops all its entries and bumps its generation, so that a
+    read which was in progress meanwhile is not cached.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generation = 0
+
+    def get(self, key, read):
+        """Return the limits cached under key, calling read to get them
+        when they are not cached.
+        """
+        now = timeutils.utcnow_ts()
+        entry = self._entries.get(key)
+        if (entry is not None and entry[0] == self._generation and
+                entry[1] > now):
+            return dict(entry[2])
+
+        generation = self._generation
+        limits = read()
+        if generation == self._generation:
+            self._entries[key] = (generation, now + CONF.quota_cache_ttl,
+                                  dict(limits))
+        return limits
+
+    def invalidate(self):
+        self._entries.clear()
+        self._generation += 1
+
+
 class DbQuotaDriver(object):
     """Driver to perform necessary checks to enforce quotas and obtain
     quota information.  The default driver utilizes the local
     database.
     """
+
+    def __init__(self):
+        self._limit_cache = LimitCache()
+
+    def _get_limits(self, context, key, read, *args):
+        """Read quota limits from the database, or from the cache of
+        the driver when CONF.quota_cache_ttl is set.
+        """
+        if CONF.quota_cache_ttl <= 0:
+            return read(context, *args)
+
+        # The database API checks the access to the limits on each read,
+        # the cache has to check it on each hit.
+        nova.context.require_context(context)
+        if key[0] == 'class':
+            nova.context.authorize_quota_class_context(context, key[1])
+        elif key[0] == 'project':
+            nova.context.authorize_project_context(context, key[1])
+        return self._limit_cache.get(key,
+                                     functools.partial(read, context, *args))
+
+    def _get_project_limits(self, context, project_id):
+        return self._get_limits(context, ('project', project_id),
+                                db.quota_get_all_by_project, project_id)
+
+    def _get_project_user_limits(self, context, project_id, user_id):
+        return self._get_limits(context, ('project', project_id, user_id),
+                                db.quota_get_all_by_project_and_user,
+                                project_id, user_id)
+
+    def _get_class_limits(self, context, quota_class):
+        return self._get_limits(context, ('class', quota_class),
+                                db.quota_class_get_all_by_name, quota_class)
+
+    def invalidate_limits(self):
+        """Drop the cached quota limits, after they were changed."""
+        self._limit_cache.invalidate()
+
     def get_by_project_and_user(self, context, project_id, user_id, resource):
         """Get a specific quota by project and user."""
 
@@ -117,7 +198,8 @@ class DbQuotaDriver(object):
         """
 
         quotas = {}
-        default_quotas = db.quota_class_get_default(context)
+        default_quotas = self._get_limits(context, ('default',),
+                                          db.quota_class_get_default)
         for resource in resources.values():
             quotas[resource.name] = default_quotas.get(resource.name,
                                                        resource.default)
@@ -139,7 +221,7 @@ class DbQuotaDriver(object):
         """
 
         quotas = {}
-        class_quotas = db.quota_class_get_all_by_name(context, quota_class)
+        class_quotas = self._get_class_limits(context, quota_class)
         for resource in resources.values():
             if defaults or resource.name in class_quotas:
                 quotas[resource.name] = class_quotas.get(resource.name,
@@ -158,7 +240,7 @@ class DbQuotaDriver(object):
         if project_id == context.project_id:
             quota_class = context.quota_class
         if quota_class:
-            class_quotas = db.quota_class_get_all_by_name(context, quota_class)
+            class_quotas = self._get_class_limits(context, quota_class)
         else:
             class_quotas = {}
 
@@ -221,10 +303,10 @@ class DbQuotaDriver(object):
         :param user_quotas: Quotas dictionary for the specified project
                             and user.
         """
-        user_quotas = user_quotas or db.quota_get_all_by_project_and_user(
+        user_quotas = user_quotas or self._get_project_user_limits(
             context, project_id, user_id)
         # Use the project quota for default user quota.
-        proj_quotas = project_quotas or db.quota_get_all_by_project(
+        proj_quotas = project_quotas or self._get_project_limits(
             context, project_id)
         for key, value in proj_quotas.iteritems():
             if key not in user_quotas.keys():
@@ -262,7 +344,7 @@ class DbQuotaDriver(object):
                         will be returned.
         :param project_quotas: Quotas dictionary for the specified project.
         """
-        project_quotas = project_quotas or db.quota_get_all_by_project(
+        project_quotas = project_quotas or self._get_project_limits(
             context, project_id)
         project_usages = None
         if usages:
@@ -404,7 +486,7 @@ class DbQuotaDriver(object):
             user_id = context.user_id
 
         # Get the applicable quotas
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = self._get_project_limits(context, project_id)
         quotas = self._get_quotas(context, resources, values.keys(),
                                   has_sync=False, project_id=project_id,
                                   project_quotas=project_quotas)
@@ -493,7 +575,7 @@ class DbQuotaDriver(object):
         # NOTE(Vek): We're not worried about races at this point.
         #            Yes, the admin may be in the process of reducing
         #            quotas, but that's a pretty rare thing.
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = self._get_project_limits(context, project_id)
         quotas = self._get_quotas(context, resources, deltas.keys(),
                                   has_sync=True, project_id=project_id,
                                   project_quotas=project_quotas)
@@ -597,6 +679,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project_and_user(context, project_id, user_id)
+        self.invalidate_limits()
 
     def destroy_all_by_project(self, context, project_id):
         """Destroy all quotas, usages, and reservations associated with a
@@ -607,6 +690,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project(context, project_id)
+        self.invalidate_limits()
 
     def expire(self, context):
         """Expire reservations.
@@ -892,6 +976,10 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def invalidate_limits(self):
+        """Drop the cached quota limits, after they were changed."""
+        pass
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -1369,6 +1457,18 @@ class QuotaEngine(object):
 
         self._driver.expire(context)
 
+    def invalidate_limits(self):
+        """Drop the quota limits cached by the driver.
+
+        To be called after the quota limits or the quota classes are
+        changed.  Drivers which do not cache the limits need not implement
+        it.
+        """
+
+        invalidate_limits = getattr(self._driver, 'invalidate_limits', None)
+        if invalidate_limits is not None:
+            invalidate_limits()
+
     @property
     def resources(self):
         return sorted(self._resources.keys())
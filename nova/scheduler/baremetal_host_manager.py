@@ -27,8 +27,11 @@ class BaremetalNodeState(host_manager.HostState):
     previously used and lock down access.
     """
 
+    __slots__ = ()
+
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
+        self._bump_generation()
         all_ram_mb = compute['memory_mb']
 
         free_disk_mb = compute['free_disk_gb'] * 1024
@@ -41,6 +44,7 @@ class BaremetalNodeState(host_manager.HostState):
         self.vcpus_used = compute['vcpus_used']
 
     def consume_from_instance(self, instance):
+        self._bump_generation()
         self.free_ram_mb = 0
         self.free_disk_mb = 0
         self.vcpus_used = self.vcpus_total
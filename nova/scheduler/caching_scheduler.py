@@ -48,6 +48,14 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
     In a similar way, if you have a high number of server deletes, the
     extra capacity from those deletes will not show up until the cache is
     refreshed.
+
+    Both issues are reduced by enabling scheduler_host_state_updates, as
+    the cached host states are then updated in place by every scheduler
+    worker each time a compute node's resource usage changes.
+
+    When scheduler_host_state_prefetch_interval is set, the host manager
+    keeps its host states fresh in the background itself, and they are
+    used instead of the cached list.
     """
 
     def __init__(self, *args, **kwargs):
@@ -64,6 +72,8 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
 
     def _get_all_host_states(self, context):
         """Called from the filter scheduler, in a template pattern."""
+        if self.host_manager.prefetching:
+            return self.host_manager.get_all_host_states(context)
         if self.all_host_states is None:
             # NOTE(johngarbutt) We only get here when we a scheduler request
             # comes in before the first run of the periodic task.
@@ -0,0 +1,97 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache of host filter results for requests of the same shape.
+
+Filters such as ComputeCapabilitiesFilter or AvailabilityZoneFilter only
+look at the parts of a request that are shared by many builds (flavor extra
+specs, image properties, availability zone, tenant) and at host data which
+rarely changes (capabilities, aggregates).  Such filters return a request
+fingerprint and their per-host result is kept here, keyed by the filter, the
+host and that fingerprint.  A result is reused as long as the HostState it
+was computed for has not changed, the aggregates have not changed and it is
+younger than scheduler_filter_result_cache_ttl seconds.
+"""
+
+from oslo.config import cfg
+
+from nova.openstack.common import timeutils
+
+filter_cache_opts = [
+    cfg.IntOpt('scheduler_filter_result_cache_ttl',
+               default=0,
+               help='Seconds during which the result of a filter which only '
+                    'depends on static host data and on the request '
+                    'flavor, image, availability zone or tenant is reused '
+                    'for requests of the same shape. 0 disables the '
+                    'cache.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(filter_cache_opts)
+
+
+def freeze(value):
+    """Return a hashable copy of value, made of nested tuples."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(val))
+                            for key, val in value.iteritems()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(val) for val in value)
+    return value
+
+
+class FilterResultCache(object):
+    """Per host results of filters, grouped by filter and fingerprint."""
+
+    def __init__(self):
+        # { (filter class name, fingerprint) :
+        #       (created, { (host, node) : (host state generation, result) }) }
+        self.results = {}
+
+    def enabled(self):
+        return CONF.scheduler_filter_result_cache_ttl > 0
+
+    def clear(self):
+        """Forget every result, e.g. because aggregates changed."""
+        self.results = {}
+
+    def _get_results(self, cls_name, fingerprint):
+        ttl = CONF.scheduler_filter_result_cache_ttl
+        for key, (created, results) in self.results.items():
+            if timeutils.is_older_than(created, ttl):
+                del self.results[key]
+        key = (cls_name, fingerprint)
+        if key not in self.results:
+            self.results[key] = (timeutils.utcnow(), {})
+        return self.results[key][1]
+
+    def filter_all(self, filter, fingerprint, host_states,
+                   filter_properties):
+        """Return the host states passing filter, reusing cached results."""
+        results = self._get_results(filter.__class__.__name__, fingerprint)
+        passing = []
+        for host_state in host_states:
+            state_key = (host_state.host, host_state.nodename)
+            cached = results.get(state_key)
+            if cached is not None and cached[0] == host_state.generation:
+                passes = cached[1]
+            else:
+                passes = filter._filter_one(host_state, filter_properties)
+                results[state_key] = (host_state.generation, passes)
+            if passes:
+                passing.append(host_state)
+        return passing
@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import random
 
 from oslo.config import cfg
@@ -32,6 +33,7 @@ from nova.pci import pci_request
 from nova import rpc
 from nova.scheduler import driver
 from nova.scheduler import scheduler_options
+from nova.scheduler import stats
 from nova.scheduler import utils as scheduler_utils
 
 
@@ -48,7 +50,14 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_single_pass_placement',
+                default=False,
+                help='Place all the instances of a multiple create request '
+                     'filtering and weighing the hosts only once. After '
+                     'each placement only the chosen host is filtered and '
+                     'weighed again. Requests with server group policies '
+                     'are still placed one instance at a time.'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -314,14 +323,23 @@ class FilterScheduler(driver.Scheduler):
         # Note: remember, we are using an iterator here. So only
         # traverse this list once. This can bite you if the hosts
         # are being scanned in a filter or weighing function.
-        hosts = self._get_all_host_states(elevated)
+        with stats.timed('get_all_host_states'):
+            hosts = self._get_all_host_states(elevated)
 
-        selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+        if (CONF.scheduler_single_pass_placement and num_instances > 1 and
+                not update_group_hosts):
+            return self._schedule_single_pass(elevated, hosts,
+                                              filter_properties,
+                                              instance_properties,
+                                              num_instances, instance_uuids)
+
+        selected_hosts = []
         for num in xrange(num_instances):
+            instance_uuid = instance_uuids[num] if instance_uuids else None
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
                     filter_properties, index=num)
@@ -336,23 +354,231 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
-
-            chosen_host = random.choice(
-                weighed_hosts[0:scheduler_host_subset_size])
+            while weighed_hosts:
+                scheduler_host_subset_size = CONF.scheduler_host_subset_size
+                if scheduler_host_subset_size > len(weighed_hosts):
+                    scheduler_host_subset_size = len(weighed_hosts)
+                if scheduler_host_subset_size < 1:
+                    scheduler_host_subset_size = 1
+
+                chosen_host = random.choice(
+                    weighed_hosts[0:scheduler_host_subset_size])
+
+                # Now consume the resources so the filter/weights
+                # will change for the next instance.
+                if self.host_manager.claim_from_instance(elevated,
+                        chosen_host.obj, instance_properties,
+                        instance_uuid):
+                    break
+                weighed_hosts.remove(chosen_host)
+                hosts.remove(chosen_host.obj)
+            else:
+                # Can't get any more locally.
+                break
             selected_hosts.append(chosen_host)
-
-            # Now consume the resources so the filter/weights
-            # will change for the next instance.
-            chosen_host.obj.consume_from_instance(instance_properties)
             if update_group_hosts is True:
                 filter_properties['group_hosts'].add(chosen_host.obj.host)
         return selected_hosts
 
+    def _schedule_single_pass(self, context, hosts, filter_properties,
+                              instance_properties, num_instances,
+                              instance_uuids=None):
+        """Place num_instances instances filtering and weighing all the
+        hosts only once.
+
+        Consuming an instance only changes the chosen host, so that host
+        alone is filtered and weighed again before the next placement.
+        This gives the same placements as _schedule() as long as filters
+        and weighers judge each host on its own, which holds when no server
+        group policy applies to the request.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
+
+        weighed_hosts = _WeighedHostHeap(self.host_manager, hosts,
+                                         filter_properties)
+        selected_hosts = []
+        for num in xrange(num_instances):
+            instance_uuid = instance_uuids[num] if instance_uuids else None
+            if selected_hosts:
+                # Only the host chosen last has changed since it was
+                # filtered and weighed.
+                host_state = selected_hosts[-1].obj
+                if self.host_manager.get_filtered_hosts([host_state],
+                        filter_properties, index=num):
+                    weighed_hosts.reweigh(host_state)
+                else:
+                    weighed_hosts.remove(host_state)
+
+            while True:
+                chosen_host = weighed_hosts.choose(
+                        CONF.scheduler_host_subset_size)
+                if chosen_host is None:
+                    break
+                # Now consume the resources so the filter/weights
+                # will change for the next instance.
+                if self.host_manager.claim_from_instance(context,
+                        chosen_host.obj, instance_properties,
+                        instance_uuid):
+                    break
+                weighed_hosts.remove(chosen_host.obj)
+            if chosen_host is None:
+                # Can't get any more locally.
+                break
+            selected_hosts.append(chosen_host)
+        return selected_hosts
+
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
+
+
+class _WeighedHostHeap(object):
+    """Filtered hosts ordered by weight, for _schedule_single_pass().
+
+    Each host is weighed once by every weigher.  Combined weights are
+    normalized across the remaining hosts exactly as in
+    BaseWeightHandler.get_weighed_objects(), and the heap is only rebuilt
+    when reweighing or removing a host changes the normalization in a way
+    that may reorder the other hosts.
+    """
+
+    def __init__(self, host_manager, hosts, weight_properties):
+        self.object_class = host_manager.weight_handler.object_class
+        self.weight_properties = weight_properties
+        self.hosts = list(hosts)
+        self.positions = dict((id(host), i)
+                              for i, host in enumerate(self.hosts))
+        self.alive = [True] * len(self.hosts)
+        self.versions = [0] * len(self.hosts)
+
+        self.weighers = [cls() for cls in host_manager.weight_classes]
+        self.multipliers = [weigher.weight_multiplier()
+                            for weigher in self.weighers]
+        weighed_objs = [self.object_class(host, 0.0) for host in self.hosts]
+        self.raw_weights = [list(weigher.weigh_objects(weighed_objs,
+                                                       weight_properties))
+                            for weigher in self.weighers]
+        self.bounds = [self._bounds(w) for w in xrange(len(self.weighers))]
+        self._build()
+
+    def _bounds(self, w):
+        """Return the normalization bounds of the w-th weigher.
+
+        As in BaseWeigher.weigh_objects(), bounds preset on the weigher
+        class are widened to cover every weight.
+        """
+        values = [value for i, value in enumerate(self.raw_weights[w])
+                  if self.alive[i]]
+        cls = type(self.weighers[w])
+        minval, maxval = min(values), max(values)
+        if cls.minval is not None:
+            minval = min(cls.minval, minval)
+        if cls.maxval is not None:
+            maxval = max(cls.maxval, maxval)
+        return minval, maxval
+
+    def _ordering_weighers(self):
+        """Return the weighers whose weights can tell hosts apart."""
+        return [w for w, (minval, maxval) in enumerate(self.bounds)
+                if self.multipliers[w] and minval != maxval]
+
+    def _weight(self, i):
+        weight = 0.0
+        for w, (minval, maxval) in enumerate(self.bounds):
+            if minval == maxval:
+                normalized = 0
+            else:
+                minval = float(minval)
+                normalized = ((self.raw_weights[w][i] - minval) /
+                              (float(maxval) - minval))
+            weight += self.multipliers[w] * normalized
+        return weight
+
+    def _key(self, i):
+        # With a single weigher ordering the hosts the normalization is a
+        # monotonic function of its raw weights, so those can be compared
+        # directly and the heap survives changes of the bounds.
+        if len(self.ordering) == 1:
+            w = self.ordering[0]
+            return -self.multipliers[w] * self.raw_weights[w][i]
+        if not self.ordering:
+            return 0.0
+        return -self._weight(i)
+
+    def _build(self):
+        self.ordering = self._ordering_weighers()
+        self.heap = [(self._key(i), i, self.versions[i])
+                     for i in xrange(len(self.hosts)) if self.alive[i]]
+        heapq.heapify(self.heap)
+
+    def _update(self, i, old_weights):
+        """Restore the heap after the weights of host i changed."""
+        self.versions[i] += 1
+        if not any(self.alive):
+            self.heap = []
+            return
+
+        changed = False
+        for w, (minval, maxval) in enumerate(self.bounds):
+            old = old_weights[w]
+            new = self.raw_weights[w][i] if self.alive[i] else old
+            if new == old:
+                # Only a removed host at a bound can move the bounds.
+                if self.alive[i] or old not in (minval, maxval):
+                    continue
+            elif old not in (minval, maxval):
+                if minval <= new <= maxval:
+                    continue
+                self.bounds[w] = min(minval, new), max(maxval, new)
+                changed = True
+                continue
+            bounds = self._bounds(w)
+            if bounds != self.bounds[w]:
+                self.bounds[w] = bounds
+                changed = True
+
+        if changed and (len(self.ordering) > 1 or
+                        self._ordering_weighers() != self.ordering):
+            self._build()
+        elif self.alive[i]:
+            heapq.heappush(self.heap, (self._key(i), i, self.versions[i]))
+
+    def reweigh(self, host_state):
+        i = self.positions[id(host_state)]
+        old_weights = [weights[i] for weights in self.raw_weights]
+        for w, weigher in enumerate(self.weighers):
+            self.raw_weights[w][i] = weigher._weigh_object(
+                    host_state, self.weight_properties)
+        self._update(i, old_weights)
+
+    def remove(self, host_state):
+        i = self.positions[id(host_state)]
+        self.alive[i] = False
+        self._update(i, [weights[i] for weights in self.raw_weights])
+
+    def choose(self, subset_size):
+        """Return a WeighedHost randomly chosen among the subset_size best
+        hosts, or None if no host is left.
+        """
+        best = []
+        while self.heap and len(best) < max(subset_size, 1):
+            entry = heapq.heappop(self.heap)
+            key, i, version = entry
+            if self.alive[i] and version == self.versions[i]:
+                best.append(entry)
+        if not best:
+            return None
+
+        chosen = random.choice(best)
+        for entry in best:
+            if entry is not chosen:
+                heapq.heappush(self.heap, entry)
+        i = chosen[1]
+        # Drop the chosen host until it is reweighed or removed.
+        self.versions[i] += 1
+        return self.object_class(self.hosts[i], self._weight(i))
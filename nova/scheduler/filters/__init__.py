@@ -17,7 +17,16 @@
 Scheduler host filters
 """
 
+import time
+
 from nova import filters
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler import filter_cache
+from nova.scheduler import host_columns
+from nova.scheduler import stats
+
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -32,10 +41,100 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def hosts_pass_batch(self, columns, filter_properties):
+        """Return a boolean array telling which hosts pass the filter.
+
+        columns is a host_columns.HostColumns.  Override this in a subclass
+        to evaluate every host in one array operation.  Returning None means
+        the filter has no batch form and host_passes() is used instead.
+        """
+        return None
+
+    def cache_fingerprint(self, filter_properties):
+        """Return a hashable summary of the request parts the filter uses.
+
+        Override this in a subclass whose host_passes() result only depends
+        on that summary, on the host capabilities and on aggregates, so that
+        it can be reused for other requests with the same fingerprint.
+        Returning None means results are not cached.
+        """
+        return None
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
+        self.result_cache = filter_cache.FilterResultCache()
+
+    def _filter_all(self, filter, objs, filter_properties):
+        if not stats.enabled():
+            return self._run_filter(filter, objs, filter_properties)
+        start = time.time()
+        result = self._run_filter(filter, objs, filter_properties)
+        if result is not None:
+            result = list(result)
+        stats.STATS.record('filter.%s' % filter.__class__.__name__,
+                           time.time() - start, len(objs),
+                           len(result) if result is not None else 0)
+        return result
+
+    def _run_filter(self, filter, objs, filter_properties):
+        if self.result_cache.enabled():
+            fingerprint = filter.cache_fingerprint(filter_properties)
+            if fingerprint is not None:
+                return self.result_cache.filter_all(filter, fingerprint,
+                                                    objs, filter_properties)
+        return filter.filter_all(objs, filter_properties)
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0):
+        if not host_columns.batch_enabled():
+            return super(HostFilterHandler, self).get_filtered_objects(
+                    filter_classes, objs, filter_properties, index)
+
+        columns = host_columns.HostColumns(objs)
+        host_states = columns.host_states
+        passing = host_columns.numpy.ones(len(columns), dtype=bool)
+        obj_len = len(columns)
+        LOG.debug(_("Starting with %d host(s)"), obj_len)
+        for filter_cls in filter_classes:
+            cls_name = filter_cls.__name__
+            filter = filter_cls()
+
+            if not filter.run_filter_for_index(index):
+                continue
+
+            start = time.time()
+            mask = filter.hosts_pass_batch(columns, filter_properties)
+            if mask is not None:
+                passing &= mask
+                if stats.enabled():
+                    stats.STATS.record('filter.%s' % cls_name,
+                                       time.time() - start, obj_len,
+                                       int(passing.sum()))
+            else:
+                candidates = host_columns.numpy.flatnonzero(passing)
+                objs = self._filter_all(filter,
+                                        [host_states[i] for i in candidates],
+                                        filter_properties)
+                if objs is None:
+                    LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
+                              {'cls_name': cls_name})
+                    return
+                kept = set(id(obj) for obj in objs)
+                for i in candidates:
+                    if id(host_states[i]) not in kept:
+                        passing[i] = False
+
+            obj_len = int(passing.sum())
+            if not obj_len:
+                LOG.info(_("Filter %s returned 0 hosts"), cls_name)
+                break
+            LOG.debug(_("Filter %(cls_name)s returned "
+                        "%(obj_len)d host(s)"),
+                      {'cls_name': cls_name, 'obj_len': obj_len})
+        return [host_states[i]
+                for i in host_columns.numpy.flatnonzero(passing)]
 
 
 def all_filters():
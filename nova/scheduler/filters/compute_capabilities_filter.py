@@ -15,6 +15,7 @@
 
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
+from nova.scheduler import filter_cache
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
 
@@ -28,6 +29,10 @@ class ComputeCapabilitiesFilter(filters.BaseHostFilter):
     # Instance type and host capabilities do not change within a request
     run_filter_once_per_request = True
 
+    def cache_fingerprint(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        return filter_cache.freeze(instance_type.get('extra_specs'))
+
     def _satisfies_extra_specs(self, host_state, instance_type):
         """Check that the host_state provided by the compute service
         satisfy the extra specs associated with the instance type.
@@ -45,3 +45,6 @@ class IoOpsFilter(filters.BaseHostFilter):
                         {'host_state': host_state,
                          'max_io_ops': max_io_ops})
         return passes
+
+    def hosts_pass_batch(self, columns, filter_properties):
+        return columns.num_io_ops < CONF.max_io_ops_per_host
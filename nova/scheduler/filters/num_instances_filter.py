@@ -42,3 +42,6 @@ class NumInstancesFilter(filters.BaseHostFilter):
                         {'host_state': host_state,
                          'max_instances': max_instances})
         return passes
+
+    def hosts_pass_batch(self, columns, filter_properties):
+        return columns.num_instances < CONF.max_instances_per_host
@@ -0,0 +1,78 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of HostStates used by batch filters and weighers.
+
+When enabled, the consumable resources of every host taking part in a
+scheduling request are copied into NumPy arrays once, and filters or
+weighers that provide a batch implementation evaluate all hosts with a
+single array operation instead of one Python call per host.
+"""
+
+try:
+    import numpy
+except ImportError:
+    # This module needs to be importable despite numpy not being a
+    # requirement; the batch mode is simply unavailable without it.
+    numpy = None
+
+from oslo.config import cfg
+
+host_columns_opts = [
+    cfg.BoolOpt('scheduler_use_batch_filters',
+                default=False,
+                help='Evaluate filters and weighers that provide a batch '
+                     'implementation over all hosts at once using NumPy '
+                     'arrays. Filters and weighers without a batch form '
+                     'keep running once per host. Requires numpy.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(host_columns_opts)
+
+# HostState attributes copied into arrays.
+COLUMNS = ('free_ram_mb', 'total_usable_ram_mb', 'free_disk_mb',
+           'total_usable_disk_gb', 'vcpus_total', 'vcpus_used',
+           'num_io_ops', 'num_instances')
+
+
+def batch_enabled():
+    """Return True if filters and weighers should use their batch form."""
+    return CONF.scheduler_use_batch_filters and numpy is not None
+
+
+class HostColumns(object):
+    """Consumable resources of a list of HostStates as parallel arrays.
+
+    host_states[i] is described by the i-th element of every column, so a
+    boolean array returned by a batch filter can be mapped straight back to
+    the hosts it selects.
+    """
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        for name in COLUMNS:
+            values = [getattr(host_state, name) or 0
+                      for host_state in self.host_states]
+            setattr(self, name, numpy.array(values, dtype=numpy.float64))
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def set_limits(self, key, limits, mask):
+        """Record limits[i] as host_states[i].limits[key] where mask[i]."""
+        for i in numpy.flatnonzero(mask):
+            self.host_states[i].limits[key] = float(limits[i])
@@ -18,9 +18,13 @@ Manage hosts in the current zone.
 """
 
 import collections
+import datetime
+import itertools
 import UserDict
 
+from eventlet import greenthread
 from oslo.config import cfg
+import six
 
 from nova.compute import task_states
 from nova.compute import vm_states
@@ -33,6 +37,8 @@ from nova.openstack.common import timeutils
 from nova.pci import pci_request
 from nova.pci import pci_stats
 from nova.scheduler import filters
+from nova.scheduler import host_columns
+from nova.scheduler import stats
 from nova.scheduler import weights
 
 host_manager_opts = [
@@ -58,10 +64,43 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.IntOpt('scheduler_host_state_resync_interval',
+               default=50,
+               help='When scheduler_host_state_updates is enabled, the '
+                    'longest time in seconds host states are kept up to '
+                    'date from compute node updates alone before every '
+                    'compute node is read from the database again.  Must '
+                    'be below service_down_time.'),
+    cfg.BoolOpt('scheduler_preload_aggregates',
+                default=False,
+                help='Load the aggregate metadata of all hosts with a single '
+                     'query and attach it to the host states, instead of '
+                     'letting aggregate based filters query it host by '
+                     'host. It is reloaded along with the compute nodes and '
+                     'whenever aggregates change.'),
+    cfg.BoolOpt('scheduler_claim_resources',
+                default=False,
+                help='Reserve the resources of each instance on the compute '
+                     'node record of the chosen host before returning it. '
+                     'A host whose resources were taken by another '
+                     'scheduler meanwhile is dropped and another one is '
+                     'chosen, instead of the build failing on the compute '
+                     'host and being rescheduled.'),
+    cfg.IntOpt('scheduler_claim_expire',
+               default=300,
+               help='Seconds after which the resources reserved for an '
+                    'instance which did not claim them on its compute host '
+                    'are released.'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(host_manager_opts)
+CONF.import_opt('scheduler_host_state_updates', 'nova.scheduler.rpcapi')
+CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
+CONF.import_opt('service_down_time', 'nova.service')
+CONF.import_opt('cpu_allocation_ratio', 'nova.scheduler.filters.core_filter')
+CONF.import_opt('disk_allocation_ratio', 'nova.scheduler.filters.disk_filter')
+CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
 
 LOG = logging.getLogger(__name__)
 
@@ -102,6 +141,40 @@ class ReadOnlyDict(UserDict.IterableUserDict):
 MetricItem = collections.namedtuple(
              'MetricItem', ['value', 'timestamp', 'source'])
 
+# Instance counters reported in the compute node stats, parsed once per
+# stats value.
+ParsedStats = collections.namedtuple(
+              'ParsedStats', ['stats', 'num_instances', 'num_io_ops',
+                              'num_instances_by_project', 'vm_states',
+                              'task_states', 'num_instances_by_os_type'])
+
+# Prefixes of the per project, vm_state, task_state and os_type counters in
+# the compute node stats, and the ParsedStats field they are collected in.
+_STATS_COUNTER_PREFIXES = (('num_proj_', 'num_instances_by_project'),
+                           ('num_vm_', 'vm_states'),
+                           ('num_task_', 'task_states'),
+                           ('num_os_type_', 'num_instances_by_os_type'))
+
+# Source of HostState generations, unique across all HostStates.
+_generations = itertools.count()
+
+
+def parse_stats(stats):
+    """Parse the JSON stats of a compute node into a ParsedStats."""
+    stats = jsonutils.loads(stats)
+    counters = dict((field, {}) for prefix, field in _STATS_COUNTER_PREFIXES)
+    for key, value in stats.iteritems():
+        if not key.startswith('num_'):
+            continue
+        for prefix, field in _STATS_COUNTER_PREFIXES:
+            if key.startswith(prefix):
+                counters[field][key[len(prefix):]] = int(value)
+                break
+    return ParsedStats(stats=stats,
+                       num_instances=int(stats.get('num_instances', 0)),
+                       num_io_ops=int(stats.get('io_workload', 0)),
+                       **counters)
+
 
 class HostState(object):
     """Mutable and immutable information tracked for a host.
@@ -109,9 +182,31 @@ class HostState(object):
     previously used and lock down access.
     """
 
+    # The scheduler keeps one HostState per compute node in memory, so
+    # they have no per instance __dict__.  Subclasses which do not define
+    # __slots__ themselves get one back.
+    __slots__ = ('host', 'nodename', 'compute_node_id', 'generation',
+                 'capabilities', 'service',
+                 'total_usable_ram_mb', 'total_usable_disk_gb',
+                 'disk_mb_used', 'free_ram_mb', 'free_disk_mb',
+                 'vcpus_total', 'vcpus_used', 'vm_states', 'task_states',
+                 'num_instances', 'num_instances_by_project',
+                 'num_instances_by_os_type', 'num_io_ops', 'host_ip',
+                 'hypervisor_type', 'hypervisor_version',
+                 'hypervisor_hostname', 'cpu_info', 'supported_instances',
+                 'limits', 'metrics', 'pci_stats', 'stats',
+                 'aggregate_metadata', 'updated', '_stats_source',
+                 '_parsed_stats', '_metrics_source',
+                 '_supported_instances_source')
+
     def __init__(self, host, node, capabilities=None, service=None):
         self.host = host
         self.nodename = node
+        self.compute_node_id = None
+        # Changes whenever information filters can look at changes, so
+        # cached filter results for this host are known to be stale.
+        self.generation = next(_generations)
+        self.capabilities = ReadOnlyDict()
         self.update_capabilities(capabilities, service)
 
         # Mutable available resources.
@@ -124,7 +219,10 @@ class HostState(object):
         self.vcpus_total = 0
         self.vcpus_used = 0
 
-        # Additional host information from the compute node stats:
+        # Additional host information from the compute node stats, parsed
+        # only when they change.  The counters are shared with that parse
+        # and copied before being changed.
+        self.stats = {}
         self.vm_states = {}
         self.task_states = {}
         self.num_instances = 0
@@ -145,24 +243,52 @@ class HostState(object):
 
         # Generic metrics from compute nodes
         self.metrics = {}
+        self.pci_stats = None
+
+        # Last stats, metrics and supported_instances JSON parsed.
+        self._stats_source = None
+        self._parsed_stats = None
+        self._metrics_source = None
+        self._supported_instances_source = None
+
+        # Metadata of the aggregates the host belongs to, as a dict of
+        # sets, or None if it was not preloaded by the HostManager.
+        self.aggregate_metadata = None
 
         self.updated = None
 
+    def _bump_generation(self):
+        self.generation = next(_generations)
+
     def update_capabilities(self, capabilities=None, service=None):
         # Read-only capability dicts
 
         if capabilities is None:
             capabilities = {}
+        if self.capabilities != capabilities:
+            self._bump_generation()
         self.capabilities = ReadOnlyDict(capabilities)
+        self.update_service(service)
+
+    def update_service(self, service=None):
         if service is None:
             service = {}
         self.service = ReadOnlyDict(service)
 
+    def update_aggregate_metadata(self, metadata):
+        """Set the metadata of the aggregates the host belongs to."""
+        if self.aggregate_metadata != metadata:
+            self._bump_generation()
+        self.aggregate_metadata = metadata
+
     def _update_metrics_from_compute_node(self, compute):
         #NOTE(llu): The 'or []' is to avoid json decode failure of None
         #           returned from compute.get, because DB schema allows
         #           NULL in the metrics column
         metrics = compute.get('metrics', []) or []
+        if metrics == self._metrics_source:
+            return
+        self._metrics_source = metrics
         if metrics:
             metrics = jsonutils.loads(metrics)
         for metric in metrics:
@@ -183,6 +309,9 @@ class HostState(object):
         if (self.updated and compute['updated_at']
                 and self.updated > compute['updated_at']):
             return
+        if (compute['updated_at'] is None or
+                compute['updated_at'] != self.updated):
+            self._bump_generation()
         all_ram_mb = compute['memory_mb']
 
         # Assume virtual size is all consumed by instances if use qcow2 disk.
@@ -207,6 +336,7 @@ class HostState(object):
         self.vcpus_total = compute['vcpus']
         self.vcpus_used = compute['vcpus_used']
         self.updated = compute['updated_at']
+        self.compute_node_id = compute.get('id')
         if 'pci_stats' in compute:
             self.pci_stats = pci_stats.PciDeviceStats(compute['pci_stats'])
         else:
@@ -218,54 +348,35 @@ class HostState(object):
         self.hypervisor_version = compute.get('hypervisor_version')
         self.hypervisor_hostname = compute.get('hypervisor_hostname')
         self.cpu_info = compute.get('cpu_info')
-        if compute.get('supported_instances'):
-            self.supported_instances = jsonutils.loads(
-                    compute.get('supported_instances'))
+        supported_instances = compute.get('supported_instances')
+        if (supported_instances and
+                supported_instances != self._supported_instances_source):
+            self.supported_instances = jsonutils.loads(supported_instances)
+            self._supported_instances_source = supported_instances
 
         # Don't store stats directly in host_state to make sure these don't
         # overwrite any values, or get overwritten themselves. Store in self so
         # filters can schedule with them.
         stats = compute.get('stats', None) or '{}'
-        self.stats = jsonutils.loads(stats)
+        if stats != self._stats_source:
+            self._parsed_stats = parse_stats(stats)
+            self._stats_source = stats
+        self._set_stats(self._parsed_stats)
 
         self.hypervisor_version = compute['hypervisor_version']
 
-        # Track number of instances on host
-        self.num_instances = int(self.stats.get('num_instances', 0))
-
-        # Track number of instances by project_id
-        project_id_keys = [k for k in self.stats.keys() if
-                k.startswith("num_proj_")]
-        for key in project_id_keys:
-            project_id = key[9:]
-            self.num_instances_by_project[project_id] = int(self.stats[key])
-
-        # Track number of instances in certain vm_states
-        vm_state_keys = [k for k in self.stats.keys() if
-                k.startswith("num_vm_")]
-        for key in vm_state_keys:
-            vm_state = key[7:]
-            self.vm_states[vm_state] = int(self.stats[key])
-
-        # Track number of instances in certain task_states
-        task_state_keys = [k for k in self.stats.keys() if
-                k.startswith("num_task_")]
-        for key in task_state_keys:
-            task_state = key[9:]
-            self.task_states[task_state] = int(self.stats[key])
-
-        # Track number of instances by host_type
-        os_keys = [k for k in self.stats.keys() if
-                k.startswith("num_os_type_")]
-        for key in os_keys:
-            os = key[12:]
-            self.num_instances_by_os_type[os] = int(self.stats[key])
-
-        self.num_io_ops = int(self.stats.get('io_workload', 0))
-
         # update metrics
         self._update_metrics_from_compute_node(compute)
 
+    def _set_stats(self, parsed):
+        self.stats = parsed.stats
+        self.num_instances = parsed.num_instances
+        self.num_io_ops = parsed.num_io_ops
+        self.num_instances_by_project = parsed.num_instances_by_project
+        self.vm_states = parsed.vm_states
+        self.task_states = parsed.task_states
+        self.num_instances_by_os_type = parsed.num_instances_by_os_type
+
     def consume_from_instance(self, instance):
         """Incrementally update host state from an instance."""
         disk_mb = (instance['root_gb'] + instance['ephemeral_gb']) * 1024
@@ -275,9 +386,14 @@ class HostState(object):
         self.free_disk_mb -= disk_mb
         self.vcpus_used += vcpus
         self.updated = timeutils.utcnow()
+        self._bump_generation()
 
         # Track number of instances on host
         self.num_instances += 1
+        self.num_instances_by_project = dict(self.num_instances_by_project)
+        self.vm_states = dict(self.vm_states)
+        self.task_states = dict(self.task_states)
+        self.num_instances_by_os_type = dict(self.num_instances_by_os_type)
 
         # Track number of instances by project_id
         project_id = instance.get('project_id')
@@ -331,12 +447,36 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
+        # Compute node records and last update generation for each
+        # (host, node), used when applying compute node updates.
+        self.compute_node_map = {}
+        self.host_state_generations = {}
+        self.last_full_sync = None
+        self.full_sync_needed = True
+        self.aggregates_stale = True
+        # Set when the host states are rebuilt in the background by
+        # prefetch_host_states() rather than when they are requested.
+        self.prefetching = False
+        # Instances consumed and compute node updates received while
+        # prefetch_host_states() runs.
+        self.pending_consumptions = None
+        self.pending_updates = None
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
         self.weight_handler = weights.HostWeightHandler()
         self.weight_classes = self.weight_handler.get_matching_classes(
                 CONF.scheduler_weight_classes)
+        if (CONF.scheduler_host_state_updates and
+                CONF.scheduler_host_state_resync_interval >=
+                CONF.service_down_time):
+            raise exception.InvalidInput(reason=_(
+                    "scheduler_host_state_resync_interval must be below "
+                    "service_down_time"))
+        if (CONF.scheduler_use_batch_filters and
+                not host_columns.batch_enabled()):
+            LOG.warn(_("scheduler_use_batch_filters is set but numpy is not "
+                       "available, filtering hosts one at a time"))
 
     def _choose_host_filters(self, filter_cls_names):
         """Since the caller may specify which filters to use we need
@@ -440,14 +580,158 @@ class HostManager(object):
         return self.weight_handler.get_weighed_objects(self.weight_classes,
                 hosts, weight_properties)
 
+    def update_host_state(self, host, node, values, generation):
+        """Apply an update of a compute node record sent by its host.
+
+        values only holds the fields which changed since the previous
+        update, which had generation - 1.  A missed, repeated or unknown
+        update makes the next get_all_host_states() call read every compute
+        node from the database again.
+
+        Updates received while host states are prefetched are applied again
+        to the new host states.
+        """
+        if self.pending_updates is not None:
+            self.pending_updates.append((host, node, values, generation))
+        state_key = (host, node)
+        compute = self.compute_node_map.get(state_key)
+        host_state = self.host_state_map.get(state_key)
+        if compute is None or host_state is None:
+            self.full_sync_needed = True
+            return
+
+        last_generation = self.host_state_generations.get(state_key)
+        if last_generation is not None:
+            if generation == last_generation:
+                return
+            if generation != last_generation + 1:
+                LOG.debug(_("Update %(generation)d of %(host)s:%(node)s does "
+                            "not follow %(last)d, resyncing host states"),
+                          {'generation': generation, 'host': host,
+                           'node': node, 'last': last_generation})
+                self.full_sync_needed = True
+        self.host_state_generations[state_key] = generation
+
+        updated_at = values.get('updated_at')
+        if isinstance(updated_at, six.string_types):
+            values = dict(values,
+                          updated_at=timeutils.parse_strtime(updated_at))
+        compute.update(values)
+        host_state.update_from_compute_node(compute)
+
+    def consume_from_instance(self, host_state, instance):
+        """Deduct the resources of instance from host_state.
+
+        When host states are prefetched, the deduction is also made on the
+        host states being built and on the one which replaced host_state, if
+        it was replaced since the request read it.
+        """
+        host_state.consume_from_instance(instance)
+        state_key = (host_state.host, host_state.nodename)
+        if self.pending_consumptions is not None:
+            self.pending_consumptions.append((state_key, instance))
+        current = self.host_state_map.get(state_key)
+        if current is not None and current is not host_state:
+            current.consume_from_instance(instance)
+
+    def claim_from_instance(self, context, host_state, instance,
+                            instance_uuid=None):
+        """Reserve the resources of instance on the compute node of
+        host_state, then consume them from host_state.
+
+        The compute node only gets the reservation if its usage and the
+        reservations of other instances leave room for it within the
+        allocation ratios.  The reservation is released when the instance
+        claims the resources on the compute host or when it expires.
+        Return False if another scheduler took the resources first.
+        """
+        if (CONF.scheduler_claim_resources and
+                host_state.compute_node_id is not None):
+            resources = {'memory_mb': instance['memory_mb'],
+                         'vcpus': instance['vcpus'],
+                         'local_gb': (instance['root_gb'] +
+                                      instance['ephemeral_gb'])}
+            ratios = {'memory_mb': CONF.ram_allocation_ratio,
+                      'vcpus': CONF.cpu_allocation_ratio,
+                      'local_gb': CONF.disk_allocation_ratio}
+            expire = timeutils.utcnow() + datetime.timedelta(
+                    seconds=CONF.scheduler_claim_expire)
+            with stats.timed('db.compute_node_claim_resources'):
+                claimed = db.compute_node_claim_resources(context,
+                        host_state.compute_node_id, instance_uuid,
+                        resources, ratios, expire)
+            if not claimed:
+                LOG.debug(_("Resources of %(host)s:%(node)s were claimed by "
+                            "another request"),
+                          {'host': host_state.host,
+                           'node': host_state.nodename})
+                return False
+        self.consume_from_instance(host_state, instance)
+        return True
+
+    def aggregates_changed(self):
+        """Forget filter results and aggregates, which changed."""
+        self.filter_handler.result_cache.clear()
+        self.aggregates_stale = True
+
+    def _update_aggregates(self, context, host_states=None):
+        """Attach to every HostState the metadata of its aggregates."""
+        if host_states is None:
+            host_states = self.host_state_map.itervalues()
+        host_metadata = collections.defaultdict(
+                lambda: collections.defaultdict(set))
+        with stats.timed('db.aggregate_get_all'):
+            aggregates = db.aggregate_get_all(context)
+        for aggregate in aggregates:
+            for host in aggregate['hosts']:
+                for key, value in aggregate['metadetails'].iteritems():
+                    host_metadata[host][key].add(value)
+        for host_state in host_states:
+            metadata = host_metadata.get(host_state.host, {})
+            host_state.update_aggregate_metadata(dict(metadata))
+        self.aggregates_stale = False
+
+    def _update_services(self, context):
+        """Refresh the service records of the host states, whose disabled
+        flag and heartbeat change between two reads of the compute nodes.
+        """
+        with stats.timed('db.service_get_all'):
+            services = db.service_get_all(context)
+        services = dict((service['host'], service) for service in services
+                        if service['topic'] == CONF.compute_topic)
+        for host_state in self.host_state_map.itervalues():
+            service = services.get(host_state.host)
+            if service is not None:
+                host_state.update_service(dict(service.iteritems()))
+
+    def _host_states_up_to_date(self):
+        """Return True if the host states are kept fresh without reading the
+        compute nodes on behalf of a request, either in the background or
+        from compute node updates.
+        """
+        if self.prefetching and self.last_full_sync is not None:
+            return True
+        if not CONF.scheduler_host_state_updates:
+            return False
+        if self.full_sync_needed or self.last_full_sync is None:
+            return False
+        return not timeutils.is_older_than(
+                self.last_full_sync, CONF.scheduler_host_state_resync_interval)
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
         """
+        if self._host_states_up_to_date():
+            self._update_services(context)
+            if CONF.scheduler_preload_aggregates and self.aggregates_stale:
+                self._update_aggregates(context)
+            return self.host_state_map.itervalues()
 
         # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        with stats.timed('db.compute_node_get_all'):
+            compute_nodes = db.compute_node_get_all(context)
         seen_nodes = set()
         for compute in compute_nodes:
             service = compute['service']
@@ -469,6 +753,8 @@ class HostManager(object):
                 self.host_state_map[state_key] = host_state
             host_state.update_from_compute_node(compute)
             seen_nodes.add(state_key)
+            if CONF.scheduler_host_state_updates:
+                self.compute_node_map[state_key] = dict(compute.iteritems())
 
         # remove compute nodes from host_state_map if they are not active
         dead_nodes = set(self.host_state_map.keys()) - seen_nodes
@@ -477,5 +763,86 @@ class HostManager(object):
             LOG.info(_("Removing dead compute node %(host)s:%(node)s "
                        "from scheduler") % {'host': host, 'node': node})
             del self.host_state_map[state_key]
+            self.compute_node_map.pop(state_key, None)
+
+        if CONF.scheduler_preload_aggregates:
+            self._update_aggregates(context)
+
+        # Updates following a full sync are applied whatever their
+        # generation, the database record being the new baseline.
+        self.host_state_generations = {}
+        self.last_full_sync = timeutils.utcnow()
+        self.full_sync_needed = False
 
         return self.host_state_map.itervalues()
+
+    def _get_compute_nodes_by_pages(self, context, page_size):
+        """Yield every compute node, reading page_size of them at a time."""
+        marker = None
+        while True:
+            with stats.timed('db.compute_node_get_all'):
+                compute_nodes = db.compute_node_get_all(context,
+                                                        limit=page_size,
+                                                        marker=marker)
+            for compute in compute_nodes:
+                yield compute
+            if len(compute_nodes) < page_size:
+                return
+            marker = compute_nodes[-1]['id']
+            # Let scheduling requests run between two pages.
+            greenthread.sleep(0)
+
+    def prefetch_host_states(self, context, page_size):
+        """Build new HostStates from the database and swap them in.
+
+        The compute nodes are read page by page and the current host states
+        keep serving requests meanwhile.  Instances consumed from them in
+        the meantime are consumed again from the new host states, and the
+        compute node updates received are applied again to them, before
+        they replace the current ones at once.
+        """
+        self.pending_consumptions = []
+        self.pending_updates = []
+        try:
+            host_state_map = {}
+            compute_node_map = {}
+            for compute in self._get_compute_nodes_by_pages(context,
+                                                            page_size):
+                service = compute['service']
+                if not service:
+                    LOG.warn(_("No service for compute ID %s") %
+                             compute['id'])
+                    continue
+                host = service['host']
+                node = compute.get('hypervisor_hostname')
+                state_key = (host, node)
+                host_state = self.host_state_cls(host, node,
+                        capabilities=self.service_states.get(state_key),
+                        service=dict(service.iteritems()))
+                host_state.update_from_compute_node(compute)
+                host_state_map[state_key] = host_state
+                if CONF.scheduler_host_state_updates:
+                    compute_node_map[state_key] = dict(compute.iteritems())
+
+            if CONF.scheduler_preload_aggregates:
+                self._update_aggregates(context,
+                                        host_state_map.itervalues())
+
+            # Nothing below yields, so a request sees either the old or the
+            # new host states, never a mix of both.
+            for state_key, instance in self.pending_consumptions:
+                host_state = host_state_map.get(state_key)
+                if host_state is not None:
+                    host_state.consume_from_instance(instance)
+            pending_updates = self.pending_updates
+            self.pending_updates = None
+            self.host_state_map = host_state_map
+            self.compute_node_map = compute_node_map
+            self.host_state_generations = {}
+            self.last_full_sync = timeutils.utcnow()
+            self.full_sync_needed = False
+            for update in pending_updates:
+                self.update_host_state(*update)
+        finally:
+            self.pending_consumptions = None
+            self.pending_updates = None
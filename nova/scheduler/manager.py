@@ -28,15 +28,20 @@ from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova.conductor import api as conductor_api
 from nova.conductor.tasks import live_migrate
+from nova import context as nova_context
+from nova import db
 from nova import exception
 from nova import manager
 from nova.objects import instance as instance_obj
 from nova.openstack.common import excutils
+from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import loopingcall
 from nova.openstack.common import periodic_task
 from nova import quota
+from nova.scheduler import stats
 from nova.scheduler import utils as scheduler_utils
 
 
@@ -53,9 +58,21 @@ scheduler_driver_opts = [
                     'Please note this is likely to interact with the value '
                     'of service_down_time, but exactly how they interact '
                     'will depend on your choice of scheduler driver.'),
+    cfg.IntOpt('scheduler_host_state_prefetch_interval',
+               default=0,
+               help='How often in seconds the host states are rebuilt from '
+                    'the compute nodes in the background. Scheduling '
+                    'requests then use the last host states built instead '
+                    'of reading the compute nodes themselves. 0 disables '
+                    'the prefetching.'),
+    cfg.IntOpt('scheduler_host_state_prefetch_page_size',
+               default=500,
+               help='Number of compute nodes read by each database query '
+                    'when prefetching host states.'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(scheduler_driver_opts)
+CONF.import_opt('scheduler_claim_resources', 'nova.scheduler.host_manager')
 
 QUOTAS = quota.QUOTAS
 
@@ -73,6 +90,39 @@ class SchedulerManager(manager.Manager):
         super(SchedulerManager, self).__init__(service_name='scheduler',
                                                *args, **kwargs)
         self.additional_endpoints.append(_SchedulerManagerV3Proxy(self))
+        self._prefetch_timer = None
+
+    def pre_start_hook(self):
+        """Build the host states once before serving requests, then keep
+        rebuilding them in the background if prefetching is enabled.
+        """
+        interval = CONF.scheduler_host_state_prefetch_interval
+        if interval <= 0:
+            return
+        if CONF.scheduler_host_state_prefetch_page_size <= 0:
+            raise exception.InvalidInput(reason=_(
+                    "scheduler_host_state_prefetch_page_size must be "
+                    "positive"))
+        self.driver.host_manager.prefetching = True
+        self._prefetch_host_states()
+        self._prefetch_timer = loopingcall.FixedIntervalLoopingCall(
+                self._prefetch_host_states)
+        self._prefetch_timer.start(interval=interval, initial_delay=interval)
+
+    def cleanup_host(self):
+        if self._prefetch_timer is not None:
+            self._prefetch_timer.stop()
+            self._prefetch_timer = None
+
+    def _prefetch_host_states(self):
+        context = nova_context.get_admin_context()
+        try:
+            self.driver.host_manager.prefetch_host_states(context,
+                    CONF.scheduler_host_state_prefetch_page_size)
+        except Exception:
+            # Requests keep using the previous host states, or read the
+            # compute nodes themselves if there are none yet.
+            LOG.exception(_("Failed to prefetch host states"))
 
     def create_volume(self, context, volume_id, snapshot_id,
                       reservations=None, image_id=None):
@@ -134,10 +184,11 @@ class SchedulerManager(manager.Manager):
         with compute_utils.EventReporter(context, conductor_api.LocalAPI(),
                                          'schedule', *instance_uuids):
             try:
-                return self.driver.schedule_run_instance(context,
-                        request_spec, admin_password, injected_files,
-                        requested_networks, is_first_time, filter_properties,
-                        legacy_bdm_in_spec)
+                with stats.timed('schedule_run_instance'):
+                    return self.driver.schedule_run_instance(context,
+                            request_spec, admin_password, injected_files,
+                            requested_networks, is_first_time,
+                            filter_properties, legacy_bdm_in_spec)
 
             except exception.NoValidHost as ex:
                 # don't re-raise
@@ -265,11 +316,21 @@ class SchedulerManager(manager.Manager):
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
 
+    @periodic_task.periodic_task
+    def _expire_compute_node_reservations(self, context):
+        if CONF.scheduler_claim_resources:
+            db.compute_node_reservation_expire(context)
+
     @periodic_task.periodic_task(spacing=CONF.scheduler_driver_task_period,
                                  run_immediately=True)
     def _run_periodic_tasks(self, context):
         self.driver.run_periodic_tasks(context)
 
+    @periodic_task.periodic_task(spacing=CONF.scheduler_stats_log_interval)
+    def _log_stats(self, context):
+        if stats.enabled():
+            stats.STATS.log_and_reset()
+
     # NOTE(russellb) This method can be removed in 3.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
@@ -294,14 +355,24 @@ class SchedulerManager(manager.Manager):
         The result should be a list of dicts with 'host', 'nodename' and
         'limits' as keys.
         """
-        dests = self.driver.select_destinations(context, request_spec,
-            filter_properties)
+        with stats.timed('select_destinations'):
+            dests = self.driver.select_destinations(context, request_spec,
+                filter_properties)
         return jsonutils.to_primitive(dests)
 
+    def update_host_state(self, context, host, node, values, generation):
+        """Apply a resource usage update sent by a compute node."""
+        self.driver.host_manager.update_host_state(host, node, values,
+                                                   generation)
+
+    def aggregates_changed(self, context):
+        """Forget host data derived from aggregates, which changed."""
+        self.driver.host_manager.aggregates_changed()
+
 
 class _SchedulerManagerV3Proxy(object):
 
-    target = messaging.Target(version='3.0')
+    target = messaging.Target(version='3.2')
 
     def __init__(self, manager):
         self.manager = manager
@@ -326,3 +397,10 @@ class _SchedulerManagerV3Proxy(object):
                 instance_type=instance_type, image=image,
                 request_spec=request_spec, filter_properties=filter_properties,
                 reservations=reservations)
+
+    def update_host_state(self, ctxt, host, node, values, generation):
+        return self.manager.update_host_state(ctxt, host=host, node=node,
+                values=values, generation=generation)
+
+    def aggregates_changed(self, ctxt):
+        return self.manager.aggregates_changed(ctxt)
@@ -27,6 +27,13 @@ rpcapi_opts = [
     cfg.StrOpt('scheduler_topic',
                default='scheduler',
                help='The topic scheduler nodes listen on'),
+    cfg.BoolOpt('scheduler_host_state_updates',
+                default=False,
+                help='Have compute nodes send every change of their '
+                     'resource usage to all schedulers, and have the '
+                     'schedulers keep their host states up to date from '
+                     'those updates instead of reading every compute node '
+                     'from the database for each request.'),
 ]
 
 CONF = cfg.CONF
@@ -80,6 +87,8 @@ class SchedulerAPI(object):
         ... - Deprecated select_hosts()
 
         3.0 - Removed backwards compat
+        3.1 - Add update_host_state()
+        3.2 - Add aggregates_changed()
     '''
 
     VERSION_ALIASES = {
@@ -127,3 +136,16 @@ class SchedulerAPI(object):
                    image=image_p, request_spec=request_spec,
                    filter_properties=filter_properties,
                    reservations=reservations_p)
+
+    def update_host_state(self, ctxt, host, node, values, generation):
+        if not self.client.can_send_version('3.1'):
+            return
+        cctxt = self.client.prepare(fanout=True, version='3.1')
+        cctxt.cast(ctxt, 'update_host_state', host=host, node=node,
+                   values=values, generation=generation)
+
+    def aggregates_changed(self, ctxt):
+        if not self.client.can_send_version('3.2'):
+            return
+        cctxt = self.client.prepare(fanout=True, version='3.2')
+        cctxt.cast(ctxt, 'aggregates_changed')
@@ -0,0 +1,149 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Timing statistics of the scheduler.
+
+When scheduler_collect_stats is set, the wall time of every filter and
+weigher, the number of hosts they are given and keep, the time spent reading
+host states from the database and the latency of whole scheduling requests
+are accumulated in STATS.  The scheduler manager logs and resets them every
+scheduler_stats_log_interval seconds; STATS.report() gives the current
+figures, e.g. from the eventlet backdoor.
+"""
+
+import contextlib
+import time
+
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+
+scheduler_stats_opts = [
+    cfg.BoolOpt('scheduler_collect_stats',
+                default=False,
+                help='Collect the time spent in each filter, weigher and '
+                     'database query of the scheduler, the number of hosts '
+                     'each filter rejects and the latency of scheduling '
+                     'requests.'),
+    cfg.IntOpt('scheduler_stats_log_interval',
+               default=600,
+               help='How often in seconds the collected scheduler '
+                    'statistics are logged and reset.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(scheduler_stats_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets.  The last
+# bucket counts everything slower.
+HISTOGRAM_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+def enabled():
+    return CONF.scheduler_collect_stats
+
+
+class Timing(object):
+    """Accumulated figures of one step of scheduling."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hosts_in = 0
+        self.hosts_out = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, elapsed, hosts_in, hosts_out):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.hosts_in += hosts_in
+        self.hosts_out += hosts_out
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if elapsed <= bound:
+                break
+        else:
+            i = len(HISTOGRAM_BOUNDS)
+        self.histogram[i] += 1
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'total': self.total,
+                'average': self.total / self.calls if self.calls else 0.0,
+                'max': self.max,
+                'hosts_in': self.hosts_in,
+                'hosts_out': self.hosts_out,
+                'histogram': list(self.histogram)}
+
+
+class SchedulerStats(object):
+    """Timings of scheduling steps, by step name."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.timings = {}
+        self.started = timeutils.utcnow()
+
+    def record(self, name, elapsed, hosts_in=0, hosts_out=0):
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = self.timings[name] = Timing()
+        timing.add(elapsed, hosts_in, hosts_out)
+
+    def report(self):
+        """Return the figures of every step as a dict of dicts."""
+        return dict((name, timing.to_dict())
+                    for name, timing in self.timings.iteritems())
+
+    def log_and_reset(self):
+        if self.timings:
+            LOG.info(_("Scheduler statistics since %s:"),
+                     timeutils.strtime(self.started))
+        for name, timing in sorted(self.report().iteritems()):
+            histogram = ' '.join('<=%ss:%d' % (bound, count)
+                                 for bound, count in
+                                 zip(HISTOGRAM_BOUNDS, timing['histogram']))
+            LOG.info(_("%(name)s: %(calls)d calls, %(average).6fs average, "
+                       "%(max).6fs max, %(hosts_in)d hosts in, "
+                       "%(hosts_out)d hosts out, latency %(histogram)s "
+                       ">%(last)ss:%(slower)d"),
+                     dict(timing, name=name, histogram=histogram,
+                          last=HISTOGRAM_BOUNDS[-1],
+                          slower=timing['histogram'][-1]))
+        self.reset()
+
+
+STATS = SchedulerStats()
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Record the wall time of the enclosed block under name."""
+    if not enabled():
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        STATS.record(name, time.time() - start)
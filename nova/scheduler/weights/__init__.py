@@ -17,8 +17,12 @@
 Scheduler host weights
 """
 
+import time
+
 from oslo.config import cfg
 
+from nova.scheduler import host_columns
+from nova.scheduler import stats
 from nova import weights
 
 CONF = cfg.CONF
@@ -37,7 +41,28 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    def weigh_batch(self, columns, weight_properties):
+        """Return an array with the weight of every host.
+
+        columns is a host_columns.HostColumns.  Override this in a subclass
+        to weigh every host in one array operation.  Returning None means
+        the weigher has no batch form and weigh_objects() is used instead.
+        """
+        return None
+
+
+def _normalize_batch(values, minval=None, maxval=None):
+    """Array version of nova.weights.normalize().
+
+    As in BaseWeigher.weigh_objects(), preset bounds are widened to cover
+    every weight.
+    """
+    minval = values.min() if minval is None else min(minval, values.min())
+    maxval = values.max() if maxval is None else max(maxval, values.max())
+    if minval == maxval:
+        return host_columns.numpy.zeros(len(values))
+    return (values - float(minval)) / (float(maxval) - float(minval))
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
@@ -46,6 +71,52 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def _weigh_objects(self, weigher, weighed_objs, weighing_properties):
+        if not stats.enabled():
+            return weigher.weigh_objects(weighed_objs, weighing_properties)
+        start = time.time()
+        values = weigher.weigh_objects(weighed_objs, weighing_properties)
+        stats.STATS.record('weigher.%s' % weigher.__class__.__name__,
+                           time.time() - start, len(weighed_objs),
+                           len(weighed_objs))
+        return values
+
+    def get_weighed_objects(self, weigher_classes, obj_list,
+            weighing_properties):
+        if not obj_list or not host_columns.batch_enabled():
+            return super(HostWeightHandler, self).get_weighed_objects(
+                    weigher_classes, obj_list, weighing_properties)
+
+        numpy = host_columns.numpy
+        columns = host_columns.HostColumns(obj_list)
+        totals = numpy.zeros(len(columns))
+        weighed_objs = None
+        for weigher_cls in weigher_classes:
+            weigher = weigher_cls()
+            start = time.time()
+            values = weigher.weigh_batch(columns, weighing_properties)
+            if values is None:
+                if weighed_objs is None:
+                    weighed_objs = [self.object_class(obj, 0.0)
+                                    for obj in columns.host_states]
+                values = self._weigh_objects(weigher, weighed_objs,
+                                             weighing_properties)
+                values = numpy.array(values, dtype=numpy.float64)
+            elif stats.enabled():
+                stats.STATS.record('weigher.%s' % weigher_cls.__name__,
+                                   time.time() - start, len(columns),
+                                   len(columns))
+            values = _normalize_batch(values,
+                                       minval=weigher.minval,
+                                       maxval=weigher.maxval)
+            totals += weigher.weight_multiplier() * values
+
+        # A stable sort keeps hosts of equal weight in their original order,
+        # like sorted() does in the per-host path.
+        order = numpy.argsort(-totals, kind='mergesort')
+        return [self.object_class(columns.host_states[i], float(totals[i]))
+                for i in order]
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
@@ -133,6 +133,22 @@ class QuotaSetsTest(test.TestCase):
 
         self.assertEqual(res_dict, body)
 
+    def test_quotas_update_cached_as_admin(self):
+        self.flags(quota_cache_ttl=60)
+        self.addCleanup(quota.QUOTAS.invalidate_limits)
+        self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
+        self.ext_mgr.is_loaded('os-extended-quotas').AndReturn(True)
+        self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
+        self.mox.ReplayAll()
+        req = fakes.HTTPRequest.blank('/v2/fake4/os-quota-sets/update_me',
+                                      use_admin_context=True)
+        self.assertEqual(10, self.controller.show(
+            req, 'update_me')['quota_set']['instances'])
+
+        body = {'quota_set': {'instances': 50}}
+        res_dict = self.controller.update(req, 'update_me', body)
+        self.assertEqual(50, res_dict['quota_set']['instances'])
+
     def test_quotas_update_zero_value_as_admin(self):
         self.ext_mgr.is_loaded('os-extended-quotas').AndReturn(True)
         self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
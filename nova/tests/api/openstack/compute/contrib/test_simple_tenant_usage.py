@@ -21,6 +21,7 @@ import webob
 
 from nova.api.openstack.compute.contrib import simple_tenant_usage
 from nova.compute import flavors
+from nova.compute import tenant_usage
 from nova.compute import vm_states
 from nova import context
 from nova import db
@@ -182,6 +183,21 @@ class SimpleTenantUsageTest(test.TestCase):
         for i in xrange(TENANTS):
             self.assertIsNone(usages[i].get('server_usages'))
 
+    def test_verify_simple_index_from_rollups(self):
+        self.flags(tenant_usage_rollup=True)
+        with mock.patch.object(tenant_usage, 'get_tenant_usage_totals',
+                               return_value=[]) as totals:
+            self.assertEqual([], self._get_tenant_usages(detailed='0'))
+        self.assertEqual(1, totals.call_count)
+
+    def test_verify_detailed_index_with_rollups(self):
+        self.flags(tenant_usage_rollup=True)
+        with mock.patch.object(tenant_usage,
+                               'get_tenant_usage_totals') as totals:
+            usages = self._get_tenant_usages('1')
+        self.assertFalse(totals.called)
+        self.assertEqual(TENANTS, len(usages))
+
     def test_verify_simple_index_empty_param(self):
         # NOTE(lzyeval): 'detailed=&start=..&end=..'
         usages = self._get_tenant_usages()
@@ -474,8 +490,8 @@ class SimpleTenantUsageControllerTest(test.TestCase):
         # system_metadata
         with mock.patch.object(db, 'instance_get_by_uuid',
                                return_value=self.baseinst):
-            flavor = self.controller._get_flavor(self.context,
-                                                 self.inst_obj, {})
+            flavor = tenant_usage.get_flavor(self.context, self.inst_obj,
+                                              {})
         self.assertEqual(flavor_obj.Flavor, type(flavor))
         self.assertEqual(FAKE_INST_TYPE['id'], flavor.id)
 
@@ -484,7 +500,7 @@ class SimpleTenantUsageControllerTest(test.TestCase):
         # system_metadata, then that's a bug
         self.inst_obj.system_metadata = {}
         self.assertRaises(KeyError,
-                          self.controller._get_flavor, self.context,
+                          tenant_usage.get_flavor, self.context,
                           self.inst_obj, {})
 
     def test_get_flavor_from_deleted_with_id(self):
@@ -493,7 +509,7 @@ class SimpleTenantUsageControllerTest(test.TestCase):
         # instance_type_id
         self.inst_obj.system_metadata = {}
         self.inst_obj.deleted = 1
-        flavor = self.controller._get_flavor(self.context, self.inst_obj, {})
+        flavor = tenant_usage.get_flavor(self.context, self.inst_obj, {})
         self.assertEqual(flavor_obj.Flavor, type(flavor))
         self.assertEqual(FAKE_INST_TYPE['id'], flavor.id)
 
@@ -503,7 +519,7 @@ class SimpleTenantUsageControllerTest(test.TestCase):
         self.inst_obj.system_metadata = {}
         self.inst_obj.deleted = 1
         self.inst_obj.instance_type_id = 99
-        flavor = self.controller._get_flavor(self.context, self.inst_obj, {})
+        flavor = tenant_usage.get_flavor(self.context, self.inst_obj, {})
         self.assertIsNone(flavor)
 
 
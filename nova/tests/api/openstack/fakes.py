@@ -466,6 +466,9 @@ def fake_instance_get_all_by_filters(num_servers=5, **kwargs):
         if 'use_slave' in kwargs:
             kwargs.pop('use_slave')
 
+        if 'columns' in kwargs:
+            kwargs.pop('columns')
+
         for i in xrange(num_servers):
             uuid = get_fake_uuid(i)
             server = stub_instance(id=i + 1, uuid=uuid,
@@ -17,6 +17,7 @@ from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova import exception
 from nova.openstack.common import gettextutils
+from nova.openstack.common import jsonutils
 from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests import utils
@@ -1209,6 +1210,95 @@ class ResponseObjectTest(test.NoDBTestCase):
             self.assertEqual(response.body, mtype)
 
 
+class StreamedResponseObjectTest(test.NoDBTestCase):
+    def setUp(self):
+        super(StreamedResponseObjectTest, self).setUp()
+        self.read = []
+        self.expected = {'servers': [{'id': 1}, {'id': 2}, {'id': 3}],
+                         'servers_links': [{'rel': 'next'}]}
+
+    def _chunks(self):
+        chunks = [{'servers': [{'id': 1}, {'id': 2}]},
+                  {'servers': []},
+                  {'servers': [{'id': 3}], 'servers_links': [{'rel': 'next'}]}]
+        for i, chunk in enumerate(chunks):
+            self.read.append(i)
+            yield chunk
+
+    def _get_response(self, extended=None, accept='application/json'):
+        chunks = self._chunks()
+
+        class Controller(object):
+            def index(self, req):
+                return wsgi.StreamedResponseObject('servers', chunks)
+
+        resource = wsgi.Resource(Controller())
+        if extended:
+            resource.register_extensions(extended)
+        req = webob.Request.blank('/tests')
+        req.accept = accept
+        req.environ['wsgiorg.routing_args'] = (None, {'action': 'index'})
+        return req.get_response(resource)
+
+    def test_stream_json(self):
+        response = self._get_response()
+        # Only the first chunk is read before the body is written out
+        self.assertEqual([0], self.read)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual('application/json', response.content_type)
+        self.assertEqual(self.expected, jsonutils.loads(response.body))
+        self.assertEqual([0, 1, 2], self.read)
+
+    def test_stream_extensions_per_chunk(self):
+        called = []
+
+        class ControllerExtended(wsgi.Controller):
+            @wsgi.extends
+            def index(self, req, resp_obj):
+                called.append(len(resp_obj.obj['servers']))
+                for server in resp_obj.obj['servers']:
+                    server['ext'] = True
+
+        response = self._get_response(ControllerExtended())
+        for server in self.expected['servers']:
+            server['ext'] = True
+        self.assertEqual(self.expected, jsonutils.loads(response.body))
+        self.assertEqual([2, 0, 1], called)
+
+    def test_stream_extension_response(self):
+        class ControllerExtended(wsgi.Controller):
+            @wsgi.extends
+            def index(self, req, resp_obj):
+                return webob.Response(status_int=409)
+
+        response = self._get_response(ControllerExtended())
+        self.assertEqual(409, response.status_int)
+        self.assertEqual([0], self.read)
+
+    def test_generator_extension_materializes(self):
+        called = []
+
+        class ControllerExtended(wsgi.Controller):
+            @wsgi.extends
+            def index(self, req):
+                resp_obj = yield
+                called.append(resp_obj.obj)
+
+        response = self._get_response(ControllerExtended())
+        self.assertEqual([self.expected], called)
+        self.assertEqual(self.expected, jsonutils.loads(response.body))
+
+    def test_xml_materializes(self):
+        response = self._get_response(accept='application/xml')
+        self.assertEqual([0, 1, 2], self.read)
+        self.assertEqual('application/xml', response.content_type)
+
+    def test_materialize(self):
+        robj = wsgi.StreamedResponseObject('servers', self._chunks())
+        robj.materialize()
+        self.assertEqual(self.expected, robj.obj)
+
+
 class ValidBodyTest(test.NoDBTestCase):
 
     def setUp(self):
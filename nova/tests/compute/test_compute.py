@@ -6558,22 +6558,126 @@ class ComputeTestCase(BaseTestCase):
         self.compute.driver.get_info(mox.IgnoreArg()).AndRaise(
             exception.InstanceNotFound(instance_id='fake-uuid'))
         self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
-                                                power_state.NOSTATE).AndRaise(
+                power_state.NOSTATE, use_slave=True,
+                power_state_updates=mox.IgnoreArg()).AndRaise(
             exception.InstanceNotFound(instance_id='fake-uuid'))
 
         self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
             {'state': power_state.RUNNING})
         self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
-                                                power_state.RUNNING,
-                                                use_slave=True)
+                power_state.RUNNING, use_slave=True,
+                power_state_updates=mox.IgnoreArg())
         self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
             {'state': power_state.SHUTDOWN})
         self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
-                                                power_state.SHUTDOWN,
-                                                use_slave=True)
+                power_state.SHUTDOWN, use_slave=True,
+                power_state_updates=mox.IgnoreArg())
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
+    def test_sync_power_states_bulk_save(self):
+        ctxt = self.context.elevated()
+        instances = [self._create_fake_instance(
+                        {'host': self.compute.host,
+                         'power_state': power_state.RUNNING})
+                     for i in range(3)]
+
+        def fake_stop(context, instance):
+            # A task starts on the third instance before the power states
+            # are saved.
+            if instance['uuid'] == instances[2]['uuid']:
+                db.instance_update(ctxt, instance['uuid'],
+                                   {'task_state': task_states.REBOOTING})
+
+        self.stubs.Set(self.compute.driver, 'get_info',
+                       lambda instance: {'state': power_state.SHUTDOWN})
+        self.stubs.Set(self.compute.driver, 'get_num_instances', lambda: 3)
+        self.stubs.Set(self.compute.compute_api, 'stop', fake_stop)
+        with mock.patch.object(instance_obj.Instance, 'save') as save:
+            self.compute._sync_power_states(ctxt)
+            self.assertFalse(save.called)
+
+        states = [db.instance_get_by_uuid(ctxt, instance['uuid'])
+                  ['power_state'] for instance in instances]
+        self.assertEqual([power_state.SHUTDOWN, power_state.SHUTDOWN,
+                          power_state.RUNNING], states)
+        # The power state skipped by the bulk save is not confirmed
+        self.assertEqual(sorted([instances[0]['uuid'], instances[1]['uuid']]),
+                         sorted(self.compute._power_state_confirmed))
+
+    def test_sync_power_states_cached_host_stats(self):
+        ctxt = self.context.elevated()
+        for i in range(2):
+            self._create_fake_instance({'host': self.compute.host})
+        scope = []
+
+        @contextlib.contextmanager
+        def fake_cached_host_stats():
+            scope.append('enter')
+            yield
+            scope.append('exit')
+
+        def fake_get_info(instance):
+            scope.append('get_info')
+            return {'state': power_state.NOSTATE}
+
+        self.stubs.Set(self.compute.driver, 'cached_host_stats',
+                       fake_cached_host_stats)
+        self.stubs.Set(self.compute.driver, 'get_info', fake_get_info)
+        self.compute._sync_power_states(ctxt)
+        self.assertEqual(['enter', 'get_info', 'get_info', 'exit'], scope)
+
+    def test_sync_power_states_from_events(self):
+        self.flags(sync_power_state_from_events=True,
+                   sync_power_state_max_age=3600,
+                   sync_power_state_max_instances=2)
+        ctxt = self.context.elevated()
+        uuids = [self._create_fake_instance({'host': self.compute.host})
+                 ['uuid'] for i in range(3)]
+        now = time.time()
+        self.compute._power_state_confirmed = {uuids[0]: now,
+                                               uuids[1]: now - 7200,
+                                               'gone': now - 7200}
+        checked = []
+
+        def fake_get_info(instance):
+            checked.append(instance['uuid'])
+            return {'state': power_state.NOSTATE}
+
+        self.stubs.Set(self.compute.driver, 'get_info', fake_get_info)
+        self.compute._sync_power_states(ctxt)
+        # Never confirmed first, then the least recently confirmed
+        self.assertEqual([uuids[2], uuids[1]], checked)
+        self.assertEqual(sorted(uuids),
+                         sorted(self.compute._power_state_confirmed))
+        self.assertTrue(self.compute._power_state_confirmed[uuids[1]] >= now)
+
+        checked[:] = []
+        self.compute._sync_power_states(ctxt)
+        self.assertEqual([], checked)
+
+    def test_lifecycle_event_confirms_power_state(self):
+        instance = self._create_fake_instance()
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+        self.compute._sync_instance_power_state(
+            mox.IgnoreArg(), mox.IgnoreArg(), power_state.RUNNING
+            ).AndReturn(True)
+        self.compute._sync_instance_power_state(
+            mox.IgnoreArg(), mox.IgnoreArg(), power_state.SHUTDOWN
+            ).AndReturn(False)
+        self.mox.ReplayAll()
+        self.compute.handle_events(
+                event.LifecycleEvent(instance['uuid'],
+                                     event.EVENT_LIFECYCLE_STARTED))
+        self.assertIn(instance['uuid'], self.compute._power_state_confirmed)
+
+        # Not confirmed when the power states were not compared
+        self.compute._power_state_confirmed.clear()
+        self.compute.handle_events(
+                event.LifecycleEvent(instance['uuid'],
+                                     event.EVENT_LIFECYCLE_STOPPED))
+        self.assertEqual({}, self.compute._power_state_confirmed)
+
     def _test_lifecycle_event(self, lifecycle_event, power_state):
         instance = self._create_fake_instance()
         uuid = instance['uuid']
@@ -9695,6 +9799,22 @@ class ComputeAPIAggrTestCase(BaseTestCase):
         self.assertIn(fake_host, aggr['hosts'])
         self.assertIn(fake_host, aggr_no_az['hosts'])
 
+    def test_aggregate_changes_notify_scheduler(self):
+        values = _create_service_entries(self.context)
+        fake_zone = values.keys()[0]
+        fake_host = values[fake_zone][0]
+        aggr = self.api.create_aggregate(self.context,
+                                         'fake_aggregate', fake_zone)
+        with mock.patch.object(self.api.scheduler_rpcapi,
+                               'aggregates_changed') as aggregates_changed:
+            self.api.add_host_to_aggregate(self.context, aggr['id'],
+                                           fake_host)
+            self.api.update_aggregate_metadata(self.context, aggr['id'],
+                                               {'foo': 'bar'})
+            self.api.remove_host_from_aggregate(self.context, aggr['id'],
+                                                fake_host)
+            self.assertEqual(3, aggregates_changed.call_count)
+
     def test_add_host_no_az_metadata(self):
         # NOTE(mtreinish) based on how create works this is not how the
         # the metadata is supposed to end up in the database but it has
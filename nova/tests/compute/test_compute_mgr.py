@@ -769,8 +769,18 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                                            vm_states.ACTIVE)
         instance.refresh(use_slave=False)
         self.mox.ReplayAll()
-        self.compute._sync_instance_power_state(self.context, instance,
-                                                power_state.RUNNING)
+        self.assertTrue(self.compute._sync_instance_power_state(
+                self.context, instance, power_state.RUNNING))
+
+    def test_sync_instance_power_state_pending_task(self):
+        instance = self._get_sync_instance(power_state.RUNNING,
+                                           vm_states.ACTIVE,
+                                           task_state=task_states.REBOOTING)
+        instance.refresh(use_slave=False)
+        self.mox.ReplayAll()
+        self.assertFalse(self.compute._sync_instance_power_state(
+                self.context, instance, power_state.SHUTDOWN))
+        self.assertEqual(power_state.RUNNING, instance.power_state)
 
     def test_sync_instance_power_state_running_stopped(self):
         instance = self._get_sync_instance(power_state.RUNNING,
@@ -27,6 +27,7 @@ from nova.compute import vm_states
 from nova import context
 from nova import db
 from nova.objects import base as obj_base
+from nova.objects import instance as instance_obj
 from nova.objects import migration as migration_obj
 from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
@@ -536,6 +537,92 @@ class TrackerTestCase(BaseTrackerTestCase):
             jsonutils.loads(self.tracker.compute_node['pci_stats']))
 
 
+class HostStateUpdateTestCase(BaseTrackerTestCase):
+
+    def setUp(self):
+        super(HostStateUpdateTestCase, self).setUp()
+        self.flags(scheduler_host_state_updates=True)
+        self.sent = []
+
+        def fake_update_host_state(ctxt, host, node, values, generation):
+            self.sent.append((host, node, values, generation))
+
+        self.stubs.Set(self.tracker.scheduler_rpcapi, 'update_host_state',
+                       fake_update_host_state)
+
+    def test_claim_sends_changed_fields(self):
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, len(self.sent))
+        host, node, values, generation = self.sent[0]
+        self.assertEqual((self.tracker.host, self.tracker.nodename, 1),
+                         (host, node, generation))
+        self.assertEqual(FAKE_VIRT_MEMORY_MB, values['free_ram_mb'])
+
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self.assertEqual(2, len(self.sent))
+        values, generation = self.sent[1][2:]
+        self.assertEqual(2, generation)
+        self.assertEqual(FAKE_VIRT_MEMORY_MB - 3 - FAKE_VIRT_MEMORY_OVERHEAD,
+                         values['free_ram_mb'])
+        self.assertNotIn('memory_mb', values)
+        self.assertNotIn('host_ip', values)
+
+    def test_no_update_without_changes(self):
+        self.tracker.update_available_resource(self.context)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, len(self.sent))
+
+    def test_updates_disabled(self):
+        self.flags(scheduler_host_state_updates=False)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual([], self.sent)
+
+
+class IncrementalAuditTestCase(BaseTrackerTestCase):
+
+    def test_unchanged_resources_not_written(self):
+        self.updated = False
+        self.tracker.update_available_resource(self.context)
+        self.assertFalse(self.updated)
+
+    def test_changed_resources_written(self):
+        self.tracker.driver.memory_mb += 1
+        with mock.patch.object(db, 'compute_node_update',
+                               side_effect=self._fake_compute_node_update
+                               ) as update:
+            self.tracker.update_available_resource(self.context)
+        values = update.call_args[0][2]
+        self.assertEqual(FAKE_VIRT_MEMORY_MB + 1, values['memory_mb'])
+        self.assertEqual(FAKE_VIRT_MEMORY_MB + 1, values['free_ram_mb'])
+        self.assertNotIn('cpu_info', values)
+
+    def test_usage_kept_between_audits(self):
+        self.flags(resource_audit_interval=3600)
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self.tracker.driver.memory_mb += 1
+
+        with mock.patch.object(instance_obj.InstanceList,
+                               'get_by_host_and_node') as get_instances:
+            self.tracker.update_available_resource(self.context)
+        self.assertFalse(get_instances.called)
+        self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+        self._assert(FAKE_VIRT_MEMORY_MB + 1 - 3 - FAKE_VIRT_MEMORY_OVERHEAD,
+                     'free_ram_mb')
+        self._assert(2, 'local_gb_used')
+
+        self.tracker.last_full_audit = 0
+        with mock.patch.object(instance_obj.InstanceList,
+                               'get_by_host_and_node',
+                               return_value=[]) as get_instances:
+            self.tracker.update_available_resource(self.context)
+        self.assertTrue(get_instances.called)
+        self._assert(0, 'memory_mb_used')
+
+
 class TrackerPciStatsTestCase(BaseTrackerTestCase):
 
     def test_update_compute_node(self):
@@ -0,0 +1,177 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the hourly rollups of the usage of the tenants."""
+
+import datetime
+
+import iso8601
+import mock
+
+from nova.compute import flavors
+from nova.compute import tenant_usage
+from nova import context
+from nova import db
+from nova import exception
+from nova.openstack.common import timeutils
+from nova import test
+
+NOW = datetime.datetime(2014, 4, 2, 12, 30, 0)
+
+
+def _utc(value):
+    return value.replace(tzinfo=iso8601.iso8601.Utc())
+
+
+class TenantUsageRollupTestCase(test.TestCase):
+
+    def setUp(self):
+        super(TenantUsageRollupTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.flags(tenant_usage_rollup=True)
+        timeutils.set_time_override(NOW)
+        self.addCleanup(timeutils.clear_time_override)
+        self.flavor = flavors.get_flavor_by_name('m1.small')
+
+    def _create_instance(self, project_id, launched_at, terminated_at=None):
+        sys_meta = flavors.save_flavor_info({}, self.flavor)
+        return db.instance_create(self.context,
+                                  {'project_id': project_id,
+                                   'instance_type_id': self.flavor['id'],
+                                   'launched_at': launched_at,
+                                   'terminated_at': terminated_at,
+                                   'vm_state': 'active',
+                                   'system_metadata': sys_meta})
+
+    def _get_usages(self, begin, end):
+        return dict((usage['project_id'], usage) for usage in
+                    db.tenant_usage_rollup_get_by_window(self.context,
+                                                         begin, end))
+
+    def test_rollup_hour(self):
+        hour = datetime.datetime(2014, 4, 2, 10, 0, 0)
+        self._create_instance('p1', hour - datetime.timedelta(days=1))
+        self._create_instance('p1', hour + datetime.timedelta(minutes=30))
+        self._create_instance('p2', hour - datetime.timedelta(days=1),
+                              hour + datetime.timedelta(minutes=15))
+        self._create_instance('p3', hour + datetime.timedelta(hours=1))
+
+        self.assertEqual(2, tenant_usage.rollup_hour(self.context, hour))
+        usages = self._get_usages(hour, hour + datetime.timedelta(hours=1))
+        self.assertEqual(['p1', 'p2'], sorted(usages))
+        self.assertEqual(1.5, usages['p1']['hours'])
+        self.assertEqual(1.5 * self.flavor['vcpus'],
+                         usages['p1']['vcpus_hours'])
+        self.assertEqual(1.5 * self.flavor['memory_mb'],
+                         usages['p1']['memory_mb_hours'])
+        self.assertEqual(1.5 * (self.flavor['root_gb'] +
+                                self.flavor['ephemeral_gb']),
+                         usages['p1']['local_gb_hours'])
+        self.assertEqual(0.25, usages['p2']['hours'])
+
+    def test_rollup_hour_twice(self):
+        hour = datetime.datetime(2014, 4, 2, 10, 0, 0)
+        tenant_usage.rollup_hour(self.context, hour)
+        self.assertRaises(exception.TaskAlreadyRunning,
+                          tenant_usage.rollup_hour, self.context, hour)
+
+    def test_rollup_tenant_usages(self):
+        self.flags(tenant_usage_rollup_hours=5,
+                   tenant_usage_rollup_max_hours=2)
+        last = datetime.datetime(2014, 4, 2, 11, 0, 0)
+        db.tenant_usage_rollup_create(self.context, last,
+                                      last + datetime.timedelta(hours=1), [])
+        with mock.patch.object(tenant_usage, 'rollup_hour') as rollup_hour:
+            tenant_usage.rollup_tenant_usages(self.context)
+        self.assertEqual([last - datetime.timedelta(hours=1),
+                          last - datetime.timedelta(hours=2)],
+                         [call[0][1] for call in rollup_hour.call_args_list])
+
+    def test_rollup_tenant_usages_done(self):
+        self.flags(tenant_usage_rollup_hours=2)
+        for hours in (1, 2):
+            tenant_usage.rollup_hour(
+                    self.context, datetime.datetime(2014, 4, 2, 12, 0, 0) -
+                    datetime.timedelta(hours=hours))
+        with mock.patch.object(tenant_usage, 'rollup_hour') as rollup_hour:
+            tenant_usage.rollup_tenant_usages(self.context)
+        self.assertFalse(rollup_hour.called)
+
+    def test_rollup_tenant_usages_concurrently(self):
+        self.flags(tenant_usage_rollup_hours=2)
+        with mock.patch.object(tenant_usage, 'rollup_hour',
+                side_effect=exception.TaskAlreadyRunning(
+                    task_name='tenant_usage_rollup', host='')) as rollup_hour:
+            tenant_usage.rollup_tenant_usages(self.context)
+        self.assertEqual(2, rollup_hour.call_count)
+
+    def test_rollup_tenant_usages_disabled(self):
+        self.flags(tenant_usage_rollup=False)
+        with mock.patch.object(tenant_usage, 'rollup_hour') as rollup_hour:
+            tenant_usage.rollup_tenant_usages(self.context)
+        self.assertFalse(rollup_hour.called)
+
+    def _check_totals(self, start, stop):
+        expected = dict((usage['tenant_id'], usage) for usage in
+                        tenant_usage.get_tenant_usages(
+                            self.context, start, stop, detailed=False))
+        totals = dict((usage['tenant_id'], usage) for usage in
+                      tenant_usage.get_tenant_usage_totals(
+                          self.context, start, stop))
+        self.assertEqual(sorted(expected), sorted(totals))
+        for tenant_id, usage in expected.items():
+            for key, value in usage.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(value, totals[tenant_id][key])
+                else:
+                    self.assertEqual(value, totals[tenant_id][key])
+
+    def test_get_tenant_usage_totals(self):
+        launched_at = datetime.datetime(2014, 4, 2, 1, 20, 0)
+        self._create_instance('p1', launched_at)
+        self._create_instance('p2', launched_at,
+                              datetime.datetime(2014, 4, 2, 9, 40, 0))
+        # The hours from 2:00 to 12:00 are rolled up, but 5:00
+        for hour in range(2, 12):
+            if hour != 5:
+                tenant_usage.rollup_hour(
+                        self.context, datetime.datetime(2014, 4, 2, hour))
+
+        with mock.patch.object(tenant_usage, 'get_tenant_usages',
+                               wraps=tenant_usage.get_tenant_usages) as live:
+            self._check_totals(_utc(datetime.datetime(2014, 4, 2, 0, 10, 0)),
+                               _utc(NOW))
+        # The first call is the one of _check_totals() itself, the others
+        # read the hours which are not rolled up from the instances.
+        self.assertEqual(
+                [(_utc(datetime.datetime(2014, 4, 2, 0, 10, 0)),
+                  _utc(datetime.datetime(2014, 4, 2, 2, 0, 0))),
+                 (_utc(datetime.datetime(2014, 4, 2, 5, 0, 0)),
+                  _utc(datetime.datetime(2014, 4, 2, 6, 0, 0))),
+                 (_utc(datetime.datetime(2014, 4, 2, 12, 0, 0)), _utc(NOW))],
+                [call[0][1:3] for call in live.call_args_list[1:]])
+
+    def test_get_tenant_usage_totals_no_rollup(self):
+        self._create_instance('p1', datetime.datetime(2014, 4, 2, 1, 20, 0))
+        self._check_totals(_utc(datetime.datetime(2014, 4, 2, 0, 10, 0)),
+                           _utc(NOW))
+
+    def test_get_tenant_usage_totals_within_hour(self):
+        self._create_instance('p1', datetime.datetime(2014, 4, 2, 1, 20, 0))
+        tenant_usage.rollup_tenant_usages(self.context)
+        with mock.patch.object(db, 'tenant_usage_rollup_get_periods') as get:
+            self._check_totals(_utc(datetime.datetime(2014, 4, 2, 10, 10, 0)),
+                               _utc(datetime.datetime(2014, 4, 2, 10, 50, 0)))
+        self.assertFalse(get.called)
@@ -23,6 +23,7 @@ from oslo import messaging
 from nova.api.ec2 import ec2utils
 from nova.compute import flavors
 from nova.compute import task_states
+from nova.compute import tenant_usage
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova import conductor
@@ -121,6 +122,22 @@ class _BaseTestCase(object):
         self.assertEqual(instance['vm_state'], vm_states.STOPPED)
         self.assertEqual(new_inst['vm_state'], instance['vm_state'])
 
+    def test_instance_update_bulk(self):
+        instance1 = self._create_fake_instance()
+        instance2 = self._create_fake_instance(
+                {'task_state': task_states.REBOOTING})
+        updates = {'vm_state': vm_states.STOPPED, 'expected_task_state': None}
+        result = self.conductor.instance_update_bulk(self.context,
+                {instance1['uuid']: dict(updates),
+                 instance2['uuid']: dict(updates)})
+        self.assertEqual([instance1['uuid']],
+                         [instance['uuid'] for instance in result])
+        self.assertEqual(vm_states.STOPPED, result[0]['vm_state'])
+        instance1 = db.instance_get_by_uuid(self.context, instance1['uuid'])
+        instance2 = db.instance_get_by_uuid(self.context, instance2['uuid'])
+        self.assertEqual(vm_states.STOPPED, instance1['vm_state'])
+        self.assertEqual(vm_states.ACTIVE, instance2['vm_state'])
+
     def test_action_event_start(self):
         self.mox.StubOutWithMock(db, 'action_event_start')
         db.action_event_start(self.context, mox.IgnoreArg())
@@ -802,6 +819,12 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         self.assertIn('dict', updates)
         self.assertEqual({'foo': 'bar'}, updates['dict'])
 
+    def test_rollup_tenant_usages(self):
+        with mock.patch.object(tenant_usage,
+                               'rollup_tenant_usages') as rollup:
+            self.conductor.periodic_tasks(self.context)
+        rollup.assert_called_once_with(self.context)
+
     def test_aggregate_metadata_add(self):
         aggregate = {'name': 'fake aggregate', 'id': 'fake-id'}
         metadata = {'foo': 'bar'}
@@ -1783,6 +1806,7 @@ class ConductorV2ManagerProxyTestCase(test.NoDBTestCase):
         methods = [
             # (method, number_of_args)
             ('instance_update', 3),
+            ('instance_update_bulk', 2),
             ('instance_get_by_uuid', 2),
             ('migration_get_in_progress_by_host_and_node', 2),
             ('aggregate_host_add', 2),
@@ -24,6 +24,7 @@ import iso8601
 import types
 import uuid as stdlib_uuid
 
+import fixtures
 import mock
 import mox
 import netaddr
@@ -1561,6 +1562,57 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         filtered_instances = db.instance_get_all_by_filters(self.ctxt, {})
         self._assertEqualListsOfInstances(instances, filtered_instances)
 
+    def test_instance_get_all_by_filters_pages(self):
+        created_at = timeutils.utcnow()
+        for i in range(3):
+            self.create_instance_with_args(created_at=created_at,
+                                           display_name='same')
+        for i in range(2):
+            self.create_instance_with_args(
+                    created_at=created_at + datetime.timedelta(seconds=i),
+                    display_name='name%d' % i)
+        for sort_key, sort_dir in [('created_at', 'asc'),
+                                   ('created_at', 'desc'),
+                                   ('display_name', 'desc')]:
+            expected = [instance['uuid'] for instance in
+                        db.instance_get_all_by_filters(self.ctxt, {},
+                                                       sort_key, sort_dir)]
+            self.assertEqual(5, len(expected))
+            listed = []
+            marker = None
+            while True:
+                page = db.instance_get_all_by_filters(self.ctxt, {},
+                        sort_key, sort_dir, limit=2, marker=marker)
+                if not page:
+                    break
+                listed.extend(instance['uuid'] for instance in page)
+                marker = page[-1]['uuid']
+            self.assertEqual(expected, listed)
+
+    def test_instance_get_all_by_filters_columns(self):
+        i1 = self.create_instance_with_args(display_name='one',
+                                            metadata={'foo': 'bar'})
+        self.create_instance_with_args(display_name='two')
+        self.create_instance_with_args(display_name='three')
+        result = db.instance_get_all_by_filters(self.ctxt,
+                {'display_name': 't'}, 'display_name', 'asc',
+                columns=['display_name'], columns_to_join=[])
+        self.assertEqual(['three', 'two'],
+                         [instance['display_name'] for instance in result])
+        self.assertEqual(set(['uuid', 'display_name', 'metadata',
+                              'system_metadata']), set(result[0]))
+        page = db.instance_get_all_by_filters(self.ctxt, {},
+                'display_name', 'asc', limit=1, marker=result[0]['uuid'],
+                columns=['display_name'], columns_to_join=[])
+        self.assertEqual(['two'], [instance['display_name']
+                                   for instance in page])
+        result = db.instance_get_all_by_filters(self.ctxt,
+                {'uuid': [i1['uuid']]}, columns=[],
+                columns_to_join=['metadata'])
+        self.assertEqual(1, len(result))
+        self.assertEqual({'foo': 'bar'},
+                         utils.instance_meta(result[0]))
+
     def test_instance_metadata_get_multi(self):
         uuids = [self.create_instance_with_args()['uuid'] for i in range(3)]
         meta = sqlalchemy_api._instance_metadata_get_multi(self.ctxt, uuids)
@@ -1891,6 +1943,39 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual('building', old_ref['vm_state'])
         self.assertEqual('needscoffee', new_ref['vm_state'])
 
+    def test_instance_update_bulk(self):
+        instances = [self.create_instance_with_args(vm_state='building'),
+                     self.create_instance_with_args(vm_state='building'),
+                     self.create_instance_with_args(vm_state='active')]
+        updates = dict((instance['uuid'],
+                        {'vm_state': 'needscoffee',
+                         'expected_vm_state': 'building',
+                         'metadata': {'mk1': 'mv1'}})
+                       for instance in instances)
+        updates[instances[1]['uuid']]['vm_state'] = 'needstea'
+        updates[str(stdlib_uuid.uuid4())] = {'vm_state': 'needscoffee'}
+        results = db.instance_update_bulk(self.ctxt, updates,
+                                          columns_to_join=['metadata'])
+        results = dict((old_ref['uuid'], (old_ref, new_ref))
+                       for old_ref, new_ref in results)
+        self.assertEqual(set([instances[0]['uuid'], instances[1]['uuid']]),
+                         set(results))
+        old_ref, new_ref = results[instances[1]['uuid']]
+        self.assertEqual('building', old_ref['vm_state'])
+        self.assertEqual('needstea', new_ref['vm_state'])
+        self.assertEqual({'mk1': 'mv1'},
+                         utils.metadata_to_dict(new_ref['metadata']))
+        self.assertEqual(['needscoffee', 'needstea', 'active'],
+                         [db.instance_get_by_uuid(self.ctxt,
+                                                  instance['uuid'])['vm_state']
+                          for instance in instances])
+        # The updates are not consumed.
+        self.assertIn('expected_vm_state', updates[instances[0]['uuid']])
+
+    def test_instance_update_bulk_bad_uuid(self):
+        self.assertRaises(exception.InvalidUUID, db.instance_update_bulk,
+                          self.ctxt, {'bad-uuid': {'vm_state': 'active'}})
+
     def test_instance_update_and_get_original_metadata(self):
         instance = self.create_instance_with_args()
         columns_to_join = ['metadata']
@@ -4470,6 +4555,81 @@ class TaskLogTestCase(test.TestCase):
                           message=self.message)
 
 
+class TenantUsageRollupTestCase(test.TestCase):
+
+    def setUp(self):
+        super(TenantUsageRollupTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.hour = datetime.datetime(2014, 4, 1, 10, 0, 0)
+
+    def _usage(self, project_id, hours):
+        return {'project_id': project_id,
+                'hours': hours,
+                'vcpus_hours': 2 * hours,
+                'memory_mb_hours': 512 * hours,
+                'local_gb_hours': 10 * hours}
+
+    def _rollup(self, hour, usages):
+        db.tenant_usage_rollup_create(self.context, hour,
+                                      hour + datetime.timedelta(hours=1),
+                                      usages)
+
+    def test_tenant_usage_rollup_create(self):
+        self._rollup(self.hour, [self._usage('p1', 1)])
+        self.assertEqual([self.hour], db.tenant_usage_rollup_get_periods(
+                self.context, self.hour,
+                self.hour + datetime.timedelta(hours=1)))
+        result = db.task_log_get(self.context, 'tenant_usage_rollup',
+                                 self.hour,
+                                 self.hour + datetime.timedelta(hours=1), '')
+        self.assertEqual('DONE', result['state'])
+        self.assertEqual(1, result['task_items'])
+
+    def test_tenant_usage_rollup_create_duplicate(self):
+        self._rollup(self.hour, [self._usage('p1', 1)])
+        self.assertRaises(exception.TaskAlreadyRunning, self._rollup,
+                          self.hour, [self._usage('p2', 1)])
+        usages = db.tenant_usage_rollup_get_by_window(
+                self.context, self.hour,
+                self.hour + datetime.timedelta(hours=1))
+        self.assertEqual(['p1'], [usage['project_id'] for usage in usages])
+
+    def test_tenant_usage_rollup_create_no_usage(self):
+        self._rollup(self.hour, [])
+        self.assertEqual([self.hour], db.tenant_usage_rollup_get_periods(
+                self.context, self.hour,
+                self.hour + datetime.timedelta(hours=1)))
+
+    def test_tenant_usage_rollup_get_periods_window(self):
+        for i in range(3):
+            self._rollup(self.hour + datetime.timedelta(hours=i), [])
+        periods = db.tenant_usage_rollup_get_periods(
+                self.context, self.hour + datetime.timedelta(hours=1),
+                self.hour + datetime.timedelta(hours=2, minutes=30))
+        self.assertEqual([self.hour + datetime.timedelta(hours=1)], periods)
+
+    def test_tenant_usage_rollup_get_by_window(self):
+        for i in range(3):
+            self._rollup(self.hour + datetime.timedelta(hours=i),
+                         [self._usage('p1', 1), self._usage('p2', 0.5)])
+        usages = db.tenant_usage_rollup_get_by_window(
+                self.context, self.hour,
+                self.hour + datetime.timedelta(hours=2))
+        usages = dict((usage['project_id'], usage) for usage in usages)
+        self.assertEqual(2, usages['p1']['hours'])
+        self.assertEqual(4, usages['p1']['vcpus_hours'])
+        self.assertEqual(1024, usages['p1']['memory_mb_hours'])
+        self.assertEqual(20, usages['p1']['local_gb_hours'])
+        self.assertEqual(1, usages['p2']['hours'])
+
+    def test_tenant_usage_rollup_get_by_window_project(self):
+        self._rollup(self.hour, [self._usage('p1', 1), self._usage('p2', 1)])
+        usages = db.tenant_usage_rollup_get_by_window(
+                self.context, self.hour,
+                self.hour + datetime.timedelta(hours=1), project_id='p2')
+        self.assertEqual(['p2'], [usage['project_id'] for usage in usages])
+
+
 class BlockDeviceMappingTestCase(test.TestCase):
     def setUp(self):
         super(BlockDeviceMappingTestCase, self).setUp()
@@ -5631,6 +5791,144 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, result,
                                         ignored_keys=['stats'])
 
+    def test_compute_node_get_all_by_pages(self):
+        service_data = self.service_dict.copy()
+        service_data['host'] = 'host2'
+        service = db.service_create(self.ctxt, service_data)
+        node_ids = [self.item['id']]
+        for name in ['node2', 'node3']:
+            compute_node_data = self.compute_node_dict.copy()
+            compute_node_data['service_id'] = service['id']
+            compute_node_data['hypervisor_hostname'] = name
+            node_ids.append(db.compute_node_create(self.ctxt,
+                                                   compute_node_data)['id'])
+
+        first = db.compute_node_get_all(self.ctxt, False, limit=2)
+        self.assertEqual(node_ids[:2], [node['id'] for node in first])
+        self.assertEqual(self.service['id'], first[0]['service']['id'])
+        self.assertEqual(service['id'], first[1]['service']['id'])
+        second = db.compute_node_get_all(self.ctxt, False, limit=2,
+                                         marker=first[-1]['id'])
+        self.assertEqual(node_ids[2:], [node['id'] for node in second])
+        self.assertEqual(service['id'], second[0]['service']['id'])
+        self.assertEqual([], db.compute_node_get_all(self.ctxt, False,
+                                                     limit=2,
+                                                     marker=node_ids[-1]))
+
+    def _claim_resources(self, instance_uuid, resources=None, ratios=None,
+                         expire=None):
+        if resources is None:
+            resources = {'memory_mb': 512, 'vcpus': 1, 'local_gb': 10}
+        if ratios is None:
+            ratios = {'memory_mb': 1.0, 'vcpus': 1.0, 'local_gb': 1.0}
+        if expire is None:
+            expire = timeutils.utcnow() + datetime.timedelta(seconds=300)
+        return db.compute_node_claim_resources(self.ctxt, self.item['id'],
+                instance_uuid, resources, ratios, expire)
+
+    def test_compute_node_claim_resources(self):
+        instances = [db.instance_create(self.ctxt, {}) for i in xrange(3)]
+        self.assertTrue(self._claim_resources(instances[0]['uuid']))
+        self.assertTrue(self._claim_resources(instances[1]['uuid']))
+        # The memory is all reserved.
+        self.assertFalse(self._claim_resources(instances[2]['uuid']))
+        # Resources without a ratio are not checked.
+        self.assertTrue(self._claim_resources(instances[2]['uuid'],
+                                              ratios={}))
+        # The usage of the compute node is left to the resource tracker.
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(0, node['memory_mb_used'])
+        self.assertEqual(1024, node['free_ram_mb'])
+
+    def test_compute_node_claim_resources_used(self):
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'memory_mb_used': 768})
+        self.assertFalse(self._claim_resources(None))
+        self.assertTrue(self._claim_resources(None, {'memory_mb': 256}))
+
+    def test_compute_node_claim_resources_without_instance(self):
+        # The resources are only checked
+        self.assertTrue(self._claim_resources(None))
+        self.assertTrue(self._claim_resources(None))
+        self.assertTrue(self._claim_resources(None))
+
+    def test_compute_node_claim_resources_kept_on_update(self):
+        instances = [db.instance_create(self.ctxt, {}) for i in xrange(3)]
+        self.assertTrue(self._claim_resources(instances[0]['uuid']))
+        self.assertTrue(self._claim_resources(instances[1]['uuid']))
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'memory_mb_used': 0, 'free_ram_mb': 1024})
+        self.assertFalse(self._claim_resources(instances[2]['uuid']))
+
+    def test_compute_node_claim_resources_migration(self):
+        instances = [db.instance_create(self.ctxt, {'host': 'other'})
+                     for i in xrange(3)]
+        self.assertTrue(self._claim_resources(instances[0]['uuid']))
+        self.assertTrue(self._claim_resources(instances[1]['uuid']))
+        self.assertFalse(self._claim_resources(instances[2]['uuid']))
+        # The resize claim of the first instance creates its migration
+        # and accounts for its resources in the usage.
+        db.migration_create(self.ctxt,
+                            {'instance_uuid': instances[0]['uuid'],
+                             'source_compute': 'other',
+                             'dest_compute': 'host1',
+                             'dest_node': 'abracadabra104',
+                             'status': 'pre-migrating'})
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'memory_mb_used': 256})
+        self.assertTrue(self._claim_resources(instances[2]['uuid'],
+                                              {'memory_mb': 256}))
+
+    def test_compute_node_claim_resources_released(self):
+        instances = [db.instance_create(self.ctxt, {}) for i in xrange(3)]
+        self.assertTrue(self._claim_resources(instances[0]['uuid']))
+        self.assertTrue(self._claim_resources(instances[1]['uuid']))
+        # The first instance claims its resources on the compute host.
+        db.compute_node_update(self.ctxt, self.item['id'],
+                               {'memory_mb_used': 512})
+        db.instance_update(self.ctxt, instances[0]['uuid'],
+                           {'host': 'host1', 'node': 'abracadabra104'})
+        self.assertFalse(self._claim_resources(instances[2]['uuid']))
+        # The second one is deleted before it claims them.
+        db.instance_destroy(self.ctxt, instances[1]['uuid'])
+        self.assertTrue(self._claim_resources(instances[2]['uuid']))
+
+    def test_compute_node_claim_resources_rescheduled(self):
+        instances = [db.instance_create(self.ctxt, {}) for i in xrange(2)]
+        self.assertTrue(self._claim_resources(instances[0]['uuid']))
+        self.assertTrue(self._claim_resources(instances[0]['uuid']))
+        self.assertTrue(self._claim_resources(instances[1]['uuid']))
+
+    def test_compute_node_claim_resources_expired(self):
+        instances = [db.instance_create(self.ctxt, {}) for i in xrange(5)]
+        now = timeutils.utcnow()
+        self.assertTrue(self._claim_resources(instances[0]['uuid'],
+                                              expire=now))
+        self.assertTrue(self._claim_resources(instances[1]['uuid'],
+                                              expire=now))
+        timeutils.set_time_override(now + datetime.timedelta(seconds=1))
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertTrue(self._claim_resources(instances[2]['uuid']))
+        self.assertTrue(self._claim_resources(instances[3]['uuid']))
+        self.assertFalse(self._claim_resources(instances[4]['uuid']))
+
+    def test_compute_node_reservation_expire(self):
+        instances = [db.instance_create(self.ctxt, {}) for i in xrange(2)]
+        now = timeutils.utcnow()
+        self.assertTrue(self._claim_resources(instances[0]['uuid'],
+                                              expire=now))
+        self.assertTrue(self._claim_resources(instances[1]['uuid'],
+                expire=now + datetime.timedelta(seconds=60)))
+        db.compute_node_reservation_expire(self.ctxt)
+        reservations = sqlalchemy_api.model_query(self.ctxt,
+                models.ComputeNodeReservation).all()
+        self.assertEqual([instances[1]['uuid']],
+                         [r['instance_uuid'] for r in reservations])
+
+    def test_compute_node_claim_resources_deleted(self):
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        self.assertFalse(self._claim_resources(None))
+
     def test_compute_node_get(self):
         compute_node_id = self.item['id']
         node = db.compute_node_get(self.ctxt, compute_node_id)
@@ -6328,6 +6626,127 @@ class Ec2TestCase(test.TestCase):
                           self.ctxt, 100500)
 
 
+class SlaveReadTestCase(test.NoDBTestCase):
+    """Tests for the routing of reads to the slave databases."""
+
+    def setUp(self):
+        super(SlaveReadTestCase, self).setUp()
+        self.stubs.Set(sqlalchemy_api, '_MASTER_FACADE', None)
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_FACADES', {})
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_ROUTER',
+                       sqlalchemy_api._SlaveRouter())
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(connection='sqlite:///%s/master.sqlite' % tempdir,
+                   slave_connection='sqlite:///%s/slave.sqlite' % tempdir,
+                   slave_max_lag=10, slave_lag_check_interval=0,
+                   group='database')
+        self.master = get_engine()
+        self.slave = sqlalchemy_api._get_slave_facade(
+                CONF.database.slave_connection).get_engine()
+        self.now = timeutils.utcnow()
+        for engine in (self.master, self.slave):
+            self._create_tables(engine)
+            self._set_heartbeat(engine, self.now)
+        self.context = context.get_admin_context()
+        self.master_uuid = self._create_instance(self.master)
+        self.slave_uuid = self._create_instance(self.slave)
+
+    def _create_tables(self, engine):
+        # Some index names are reused by several tables, which SQLite
+        # does not allow: only create the tables read by the tests.
+        models.BASE.metadata.create_all(engine, tables=[
+                model.__table__ for model in (
+                    models.Service, models.Instance, models.InstanceInfoCache,
+                    models.InstanceMetadata, models.InstanceSystemMetadata,
+                    models.SecurityGroup, models.SecurityGroupIngressRule,
+                    models.SecurityGroupInstanceAssociation)])
+
+    def _set_heartbeat(self, engine, updated_at):
+        engine.execute(models.Service.__table__.delete())
+        engine.execute(models.Service.__table__.insert(),
+                       host='host', binary='nova-compute', topic='compute',
+                       report_count=0, disabled=False, deleted=0,
+                       created_at=updated_at, updated_at=updated_at)
+
+    def _create_instance(self, engine):
+        uuid = uuidutils.generate_uuid()
+        engine.execute(models.Instance.__table__.insert(),
+                       uuid=uuid, host='host', deleted=0,
+                       created_at=self.now)
+        return uuid
+
+    def _get_uuids(self):
+        return [instance['uuid'] for instance in
+                db.instance_get_all_by_host(self.context, 'host')]
+
+    def test_no_slave(self):
+        self.flags(slave_connection=None, group='database')
+        self.assertEqual([self.master_uuid], self._get_uuids())
+
+    def test_read_from_slave(self):
+        self.assertEqual([self.slave_uuid], self._get_uuids())
+        # Writes still go to the master.
+        db.instance_update(self.context, self.master_uuid, {'host': 'other'})
+        self.assertEqual([self.slave_uuid], self._get_uuids())
+
+    def test_slave_lagging(self):
+        self._set_heartbeat(self.master,
+                            self.now + datetime.timedelta(seconds=11))
+        self.assertEqual([self.master_uuid], self._get_uuids())
+
+    def test_slave_lag_checked_periodically(self):
+        self.flags(slave_lag_check_interval=60, group='database')
+        self.assertEqual([self.slave_uuid], self._get_uuids())
+        self._set_heartbeat(self.master,
+                            self.now + datetime.timedelta(seconds=11))
+        self.assertEqual([self.slave_uuid], self._get_uuids())
+
+    def test_slave_without_heartbeat(self):
+        self.slave.execute(models.Service.__table__.delete())
+        self.assertEqual([self.master_uuid], self._get_uuids())
+
+    def test_slave_broken(self):
+        self.slave.execute('DROP TABLE services')
+        self.assertEqual([self.master_uuid], self._get_uuids())
+
+    def test_read_policy(self):
+        self._set_heartbeat(self.master,
+                            self.now + datetime.timedelta(seconds=11))
+        self.flags(slave_read_policy={'instance_get_all_by_host': '60'},
+                   group='database')
+        self.assertEqual([self.slave_uuid], self._get_uuids())
+        self.flags(slave_read_policy={'instance_get_all_by_host': '-1'},
+                   group='database')
+        self._set_heartbeat(self.master, self.now)
+        self.assertEqual([self.master_uuid], self._get_uuids())
+
+    def test_use_slave(self):
+        instances = db.instance_get_all_by_filters(self.context, {},
+                                                   use_slave=True)
+        self.assertEqual([self.slave_uuid],
+                         [instance['uuid'] for instance in instances])
+
+    def test_not_routed(self):
+        # Reads not known to be safe on a slave stay on the master.
+        self.assertRaises(exception.InstanceNotFound,
+                          db.instance_get_by_uuid, self.context,
+                          self.slave_uuid)
+
+    def test_several_slaves(self):
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(slave_connections=['sqlite:///%s/slave2.sqlite' % tempdir],
+                   group='database')
+        slave2 = sqlalchemy_api._get_slave_facade(
+                CONF.database.slave_connections[0]).get_engine()
+        self._create_tables(slave2)
+        self._set_heartbeat(slave2, self.now)
+        slave2_uuid = self._create_instance(slave2)
+        uuids = set()
+        for i in range(4):
+            uuids.update(self._get_uuids())
+        self.assertEqual(set([self.slave_uuid, slave2_uuid]), uuids)
+
+
 class ArchiveTestCase(test.TestCase):
 
     def setUp(self):
@@ -6564,6 +6983,81 @@ class ArchiveTestCase(test.TestCase):
         num = db.archive_deleted_rows_for_table(self.context, "console_pools")
         self.assertEqual(num, 1)
 
+    def _enable_foreign_keys(self):
+        # SQLite doesn't enforce foreign key constraints without a pragma.
+        dialect = self.engine.url.get_dialect()
+        if dialect == sqlite.dialect:
+            import sqlite3
+            tup = sqlite3.sqlite_version_info
+            if tup[0] < 3 or (tup[0] == 3 and tup[1] < 7):
+                self.skipTest(
+                    'sqlite version too old for reliable SQLA foreign_keys')
+            self.conn.execute("PRAGMA foreign_keys = ON")
+
+    def test_archived_table_groups(self):
+        groups = sqlalchemy_api._get_archived_table_groups(self.engine)
+        names = [[table.name for table, shadow_table in group]
+                 for group in groups]
+        group = [group for group in names if 'consoles' in group][0]
+        # consoles.pool_id depends on console_pools.id
+        self.assertIn('console_pools', group)
+        self.assertTrue(group.index('consoles') <
+                        group.index('console_pools'))
+        self.assertNotIn('migrate_version', sum(names, []))
+
+    def test_archive_deleted_rows_fk_order(self):
+        self._enable_foreign_keys()
+        ins_stmt = self.console_pools.insert().values(deleted=1)
+        result = self.conn.execute(ins_stmt)
+        id1 = result.inserted_primary_key[0]
+        self.ids.append(id1)
+        ins_stmt = self.consoles.insert().values(deleted=1,
+                                                 pool_id=id1)
+        result = self.conn.execute(ins_stmt)
+        id2 = result.inserted_primary_key[0]
+        self.ids.append(id2)
+        # consoles is archived before console_pools, in a single run.
+        num = db.archive_deleted_rows(self.context)
+        self.assertEqual(2, num)
+        rows = self.conn.execute(select([self.shadow_consoles])).fetchall()
+        self.assertEqual([id2], [row['id'] for row in rows])
+        rows = self.conn.execute(
+                select([self.shadow_console_pools])).fetchall()
+        self.assertEqual([id1], [row['id'] for row in rows])
+
+    def test_archive_deleted_rows_batches(self):
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr,
+                                                                 deleted=1)
+            self.conn.execute(ins_stmt)
+        batches = []
+        num = db.archive_deleted_rows(
+                self.context, max_rows=5, batch_size=2,
+                progress=lambda name, rows: batches.append((name, rows)))
+        self.assertEqual(5, num)
+        self.assertEqual([('instance_id_mappings', 2),
+                          ('instance_id_mappings', 2),
+                          ('instance_id_mappings', 1)], batches)
+        qsiim = select([self.shadow_instance_id_mappings]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                                self.uuidstrs))
+        rows = self.conn.execute(qsiim).fetchall()
+        self.assertEqual(5, len(rows))
+
+    def test_archive_deleted_rows_workers(self):
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr,
+                                                                 deleted=1)
+            self.conn.execute(ins_stmt)
+            ins_stmt2 = self.instances.insert().values(uuid=uuidstr,
+                                                       deleted=1)
+            self.conn.execute(ins_stmt2)
+        num = db.archive_deleted_rows(self.context, max_rows=10,
+                                      batch_size=4, workers=4)
+        self.assertEqual(10, num)
+        num = db.archive_deleted_rows(self.context, batch_size=4, workers=4)
+        self.assertEqual(2, num)
+
     def test_archive_deleted_rows_2_tables(self):
         # Add 6 rows to each table
         for uuidstr in self.uuidstrs:
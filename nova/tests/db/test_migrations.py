@@ -742,6 +742,45 @@ class TestNovaMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
         # confirm compute_node_stats exists
         db_utils.get_table(engine, 'compute_node_stats')
 
+    def _check_235(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_project_id_deleted_created_at_'
+                                'id_idx',
+                                ['project_id', 'deleted', 'created_at', 'id'])
+
+    def _post_downgrade_235(self, engine):
+        instances = db_utils.get_table(engine, 'instances')
+        self.assertNotIn('instances_project_id_deleted_created_at_id_idx',
+                         [idx.name for idx in instances.indexes])
+
+    def _check_236(self, engine, data):
+        for table_name in ('tenant_usages', 'shadow_tenant_usages'):
+            for column in ('project_id', 'period_beginning', 'hours',
+                           'vcpus_hours', 'memory_mb_hours',
+                           'local_gb_hours'):
+                self.assertColumnExists(engine, table_name, column)
+        self.assertIndexMembers(engine, 'tenant_usages',
+                                'tenant_usages_period_beginning_idx',
+                                ['period_beginning'])
+
+    def _post_downgrade_236(self, engine):
+        self.assertTableNotExists(engine, 'tenant_usages')
+        self.assertTableNotExists(engine, 'shadow_tenant_usages')
+
+    def _check_237(self, engine, data):
+        for table_name in ('compute_node_reservations',
+                           'shadow_compute_node_reservations'):
+            for column in ('compute_node_id', 'instance_uuid', 'memory_mb',
+                           'vcpus', 'local_gb', 'expire'):
+                self.assertColumnExists(engine, table_name, column)
+        for column in ('compute_node_id', 'instance_uuid'):
+            self.assertIndexMembers(engine, 'compute_node_reservations',
+                    'compute_node_reservations_%s_idx' % column, [column])
+
+    def _post_downgrade_237(self, engine):
+        self.assertTableNotExists(engine, 'compute_node_reservations')
+        self.assertTableNotExists(engine, 'shadow_compute_node_reservations')
+
 
 class TestBaremetalMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
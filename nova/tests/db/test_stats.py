@@ -0,0 +1,156 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For database API statistics.
+"""
+
+import fixtures
+import mock
+
+from nova import context
+from nova import db
+from nova.db import stats
+from nova import exception
+from nova import manager
+from nova.openstack.common import periodic_task
+from nova import test
+
+
+class FakeManager(manager.Manager):
+    @periodic_task.periodic_task
+    def _list_services(self, context):
+        db.service_get_all(context)
+
+
+class DbApiStatsTestCase(test.TestCase):
+    """Test collection of database API statistics."""
+
+    def setUp(self):
+        super(DbApiStatsTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        for i in range(3):
+            db.service_create(self.context, {'host': 'host%d' % i,
+                                             'binary': 'nova-compute',
+                                             'topic': 'compute'})
+        self.flags(db_collect_stats=True)
+        stats.STATS.reset()
+        self.addCleanup(stats.STATS.reset)
+
+    def test_timing(self):
+        timing = stats.Timing()
+        timing.add(0.0005, 1, 10)
+        timing.add(0.003, 2, 0)
+        timing.add(60, 1, 1)
+        result = timing.to_dict()
+        self.assertEqual(3, result['calls'])
+        self.assertEqual(60, result['max'])
+        self.assertEqual(4, result['statements'])
+        self.assertEqual(11, result['rows'])
+        self.assertEqual([1, 1, 0, 0, 0, 0, 0, 0, 1], result['histogram'])
+
+    def test_function_stats(self):
+        db.service_get_all(self.context)
+        db.service_get_all(self.context)
+        report = stats.STATS.report()
+        self.assertEqual(['service_get_all'], report['functions'].keys())
+        timing = report['functions']['service_get_all']
+        self.assertEqual(2, timing['calls'])
+        self.assertEqual(2, timing['statements'])
+        self.assertEqual(6, timing['rows'])
+
+    def test_disabled(self):
+        self.flags(db_collect_stats=False)
+        db.service_get_all(self.context)
+        self.assertEqual({}, stats.STATS.report()['functions'])
+
+    def test_request_stats(self):
+        db.service_get_all(self.context)
+        db.service_get_by_args(self.context, 'host0', 'nova-compute')
+        report = stats.STATS.report()
+        request = report['requests'][self.context.request_id]
+        self.assertEqual(2, request['calls'])
+        self.assertEqual(2, request['statements'])
+        self.assertEqual(4, request['rows'])
+        self.assertEqual({'service_get_all': 1, 'service_get_by_args': 1},
+                         request['functions'])
+
+    def test_max_requests(self):
+        self.flags(db_stats_max_requests=2)
+        contexts = [context.get_admin_context() for i in range(3)]
+        for ctxt in contexts + contexts[1:2]:
+            db.service_get_all(ctxt)
+        self.assertEqual(sorted([contexts[1].request_id,
+                                 contexts[2].request_id]),
+                         sorted(stats.STATS.report()['requests']))
+
+    def test_nested_calls(self):
+        def outer(context):
+            db.service_get_all(context)
+            db.service_get_all(context)
+
+        stats.instrument('outer', outer)(self.context)
+        report = stats.STATS.report()
+        self.assertEqual(1, report['functions']['outer']['calls'])
+        self.assertEqual(2, report['functions']['outer']['statements'])
+        self.assertEqual(2, report['functions']['service_get_all']['calls'])
+        self.assertEqual(2, report['functions']['service_get_all']
+                                  ['statements'])
+
+    def test_failed_call(self):
+        self.assertRaises(exception.ServiceNotFound, db.service_get,
+                          self.context, 42)
+        timing = stats.STATS.report()['functions']['service_get']
+        self.assertEqual(1, timing['calls'])
+        self.assertEqual(0, timing['rows'])
+
+    def test_periodic_task_stats(self):
+        fake_manager = FakeManager()
+        fake_manager.periodic_tasks(self.context)
+        db.service_get_all(self.context)
+        report = stats.STATS.report()
+        task = report['tasks']['FakeManager._list_services']
+        self.assertEqual({'service_get_all': 1}, task['functions'])
+        self.assertEqual(2, report['functions']['service_get_all']['calls'])
+
+    def test_dump_and_reset(self):
+        path = self.useFixture(fixtures.TempDir()).path
+        self.flags(db_stats_log_interval=0, db_stats_dir=path)
+        with mock.patch.object(stats.LOG, 'debug') as debug:
+            db.service_get_all(self.context)
+            self.assertTrue(debug.called)
+        self.assertEqual({}, stats.STATS.report()['functions'])
+
+        reports = stats.load_reports(path)
+        self.assertEqual(1, len(reports))
+        self.assertEqual(1, reports[0]['functions']['service_get_all']
+                                   ['calls'])
+
+    def test_merge_reports(self):
+        db.service_get_all(self.context)
+        first = stats.STATS.report()
+        stats.STATS.reset()
+        db.service_get_all(self.context)
+        db.service_get_all(context.get_admin_context())
+        second = stats.STATS.report()
+
+        merged = stats.merge_reports([first, second])
+        timing = merged['functions']['service_get_all']
+        self.assertEqual(3, timing['calls'])
+        self.assertEqual(9, timing['rows'])
+        self.assertEqual(3, sum(timing['histogram']))
+        self.assertEqual(timing['total'] / 3, timing['average'])
+        request = merged['requests'][self.context.request_id]
+        self.assertEqual({'service_get_all': 2}, request['functions'])
+        self.assertEqual(2, len(merged['requests']))
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import datetime
 
 import iso8601
@@ -1072,10 +1073,133 @@ class _TestInstanceListObject(object):
         self.assertTrue(instances[0].obj_attr_is_set('system_metadata'))
         self.assertEqual({'foo': 'bar'}, instances[0].system_metadata)
 
+    def test_save(self):
+        db_insts = [fake_instance.fake_db_instance(id=i) for i in range(3)]
+        inst_list = instance._make_instance_list(
+            self.context, instance.InstanceList(), db_insts, [])
+        inst_list[0].power_state = 4
+        inst_list[1].power_state = 4
+        updated = dict(db_insts[0], power_state=4)
+        with contextlib.nested(
+            mock.patch.object(db, 'instance_update_bulk',
+                              return_value=[(db_insts[0], updated)]),
+            mock.patch.object(notifications, 'send_update')
+        ) as (update_bulk, send_update):
+            skipped = inst_list.save(self.context,
+                                     expected_task_state=[None])
+        self.assertEqual([db_insts[1]['uuid']], skipped)
+        expected = {'power_state': 4, 'expected_task_state': [None]}
+        update_bulk.assert_called_once_with(
+            self.context,
+            {db_insts[0]['uuid']: expected, db_insts[1]['uuid']: expected},
+            update_cells=False, columns_to_join=['system_metadata'])
+        self.assertEqual(4, inst_list[0].power_state)
+        self.assertEqual(set(), inst_list[0].obj_what_changed())
+        self.assertEqual(set(['power_state']),
+                         inst_list[1].obj_what_changed())
+        send_update.assert_called_once_with(self.context, db_insts[0],
+                                            updated)
+
+    def test_save_nothing(self):
+        db_insts = [fake_instance.fake_db_instance()]
+        inst_list = instance._make_instance_list(
+            self.context, instance.InstanceList(), db_insts, [])
+        with mock.patch.object(db, 'instance_update_bulk') as update_bulk:
+            self.assertEqual([], inst_list.save(self.context))
+        self.assertFalse(update_bulk.called)
+
 
 class TestInstanceListObject(test_objects._LocalTest,
                              _TestInstanceListObject):
-    pass
+    def _get_listing(self, db_insts, **kwargs):
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               return_value=db_insts):
+            return instance.InstanceList.get_by_filters(
+                self.context, {}, expected_attrs=[], **kwargs)
+
+    def test_get_by_filters_columns(self):
+        db_insts = [{'uuid': 'fake-uuid', 'display_name': 'foo',
+                     'metadata': [], 'system_metadata': []}]
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               return_value=db_insts) as get_all:
+            inst_list = instance.InstanceList.get_by_filters(
+                self.context, {}, expected_attrs=['info_cache', 'metadata'],
+                columns=['display_name'])
+        self.assertEqual(set(['uuid', 'display_name']),
+                         set(get_all.call_args[1]['columns']))
+        self.assertEqual(['metadata'],
+                         get_all.call_args[1]['columns_to_join'])
+        self.assertEqual('foo', inst_list[0].display_name)
+        self.assertEqual({}, inst_list[0].metadata)
+        self.assertFalse(inst_list[0].obj_attr_is_set('host'))
+
+    def test_load_metadata_for_listing(self):
+        db_insts = [fake_instance.fake_db_instance(id=1),
+                    fake_instance.fake_db_instance(id=2)]
+        inst_list = self._get_listing(db_insts)
+        meta = [dict(instance_uuid=db_inst['uuid'], key='foo', value='bar')
+                for db_inst in db_insts]
+        loaded = [{'uuid': db_inst['uuid'], 'metadata': [md],
+                   'system_metadata': []}
+                  for db_inst, md in zip(db_insts, meta)]
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               return_value=loaded) as get_all:
+            self.assertEqual({'foo': 'bar'}, inst_list[0].metadata)
+            self.assertEqual({'foo': 'bar'}, inst_list[1].metadata)
+        self.assertEqual(1, get_all.call_count)
+        self.assertEqual(sorted(inst.uuid for inst in inst_list),
+                         sorted(get_all.call_args[0][1]['uuid']))
+        self.assertEqual(['uuid'], get_all.call_args[1]['columns'])
+        self.assertEqual(['metadata'],
+                         get_all.call_args[1]['columns_to_join'])
+        self.assertEqual(set(), inst_list[1].obj_what_changed())
+
+    def test_load_columns_for_listing(self):
+        db_insts = [fake_instance.fake_db_instance(id=1),
+                    fake_instance.fake_db_instance(id=2)]
+        inst_list = self._get_listing(
+            [{'uuid': db_inst['uuid'], 'metadata': [], 'system_metadata': []}
+             for db_inst in db_insts],
+            columns=[])
+        inst_list[1].host = 'other-host'
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               return_value=db_insts) as get_all:
+            self.assertEqual('fake-host', inst_list[0].host)
+            self.assertEqual(2, inst_list[1].id)
+        self.assertEqual(1, get_all.call_count)
+        self.assertIn('id', get_all.call_args[1]['columns'])
+        self.assertEqual('other-host', inst_list[1].host)
+        self.assertEqual(set(['host']), inst_list[1].obj_what_changed())
+
+    def test_load_columns_not_listed(self):
+        inst = instance.Instance(context=self.context, uuid='fake-uuid')
+        self.assertRaises(exception.ObjectActionError,
+                          getattr, inst, 'host')
+
+    def test_load_columns_for_deserialized_listing(self):
+        db_insts = [fake_instance.fake_db_instance(id=1),
+                    fake_instance.fake_db_instance(id=2)]
+        inst_list = self._get_listing(
+            [{'uuid': db_inst['uuid'], 'metadata': [], 'system_metadata': []}
+             for db_inst in db_insts],
+            columns=[])
+        inst_list = instance.InstanceList.obj_from_primitive(
+            inst_list.obj_to_primitive(), context=self.context)
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               return_value=db_insts) as get_all:
+            self.assertEqual('fake-host', inst_list[0].host)
+            self.assertEqual(2, inst_list[1].id)
+        self.assertEqual(1, get_all.call_count)
+
+    def test_load_columns_for_deserialized_instance(self):
+        db_insts = [{'uuid': 'fake-uuid', 'metadata': [],
+                     'system_metadata': []}]
+        inst_list = self._get_listing(db_insts, columns=[])
+        inst = instance.Instance.obj_from_primitive(
+            inst_list[0].obj_to_primitive(), context=self.context)
+        self.assertIsNone(inst._listing)
+        self.assertRaises(exception.ObjectActionError,
+                          getattr, inst, 'host')
 
 
 class TestRemoteInstanceListObject(test_objects._RemoteTest,
@@ -62,6 +62,19 @@ class CachingSchedulerTestCase(test_scheduler.SchedulerTestCase):
         self.assertEqual(["asdf"], self.driver.all_host_states)
         self.assertEqual(["asdf"], result)
 
+    @mock.patch.object(caching_scheduler.CachingScheduler,
+                       "_get_up_hosts")
+    def test_get_all_host_states_prefetched(self, mock_up_hosts):
+        self.driver.host_manager.prefetching = True
+        with mock.patch.object(self.driver.host_manager,
+                               "get_all_host_states") as mock_get_hosts:
+            mock_get_hosts.return_value = ["asdf"]
+
+            result = self.driver._get_all_host_states(self.context)
+
+            self.assertFalse(mock_up_hosts.called)
+            self.assertEqual(["asdf"], result)
+
     def test_get_up_hosts(self):
         with mock.patch.object(self.driver.host_manager,
                                "get_all_host_states") as mock_get_hosts:
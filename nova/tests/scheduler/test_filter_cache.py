@@ -0,0 +1,149 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the filter result cache.
+"""
+
+from nova import context
+from nova import db
+from nova.openstack.common import timeutils
+from nova.scheduler import filter_cache
+from nova.scheduler import filters
+from nova.scheduler import host_manager
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+class FilterResultCacheTestCase(test.NoDBTestCase):
+    """Test reuse and invalidation of cached filter results."""
+
+    def setUp(self):
+        super(FilterResultCacheTestCase, self).setUp()
+        self.flags(scheduler_filter_result_cache_ttl=60)
+        self.flags(scheduler_available_filters=[
+            'nova.scheduler.filters.all_filters'])
+        self.host_manager = host_manager.HostManager()
+        self.hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                      for i in range(3)]
+        self.context = context.RequestContext('fake', 'fake')
+        self.metadata = {'host0': {'filter_tenant_id': set(['tenant1'])},
+                         'host1': {'filter_tenant_id': set(['tenant2'])},
+                         'host2': {}}
+        self.db_calls = []
+
+        def fake_metadata_get_by_host(ctxt, host, key=None):
+            self.db_calls.append(host)
+            return self.metadata[host]
+
+        self.stubs.Set(db, 'aggregate_metadata_get_by_host',
+                       fake_metadata_get_by_host)
+
+    def _filter(self, project_id):
+        filter_properties = {'context': self.context,
+                             'request_spec': {'instance_properties':
+                                              {'project_id': project_id}}}
+        hosts = self.host_manager.get_filtered_hosts(self.hosts,
+                filter_properties, ['AggregateMultiTenancyIsolation'])
+        return [host.host for host in hosts]
+
+    def test_same_request_reuses_results(self):
+        self.assertEqual(['host0', 'host2'], self._filter('tenant1'))
+        self.assertEqual(['host0', 'host2'], self._filter('tenant1'))
+        self.assertEqual(['host0', 'host1', 'host2'], self.db_calls)
+
+    def test_other_request_computes_results(self):
+        self.assertEqual(['host0', 'host2'], self._filter('tenant1'))
+        self.assertEqual(['host1', 'host2'], self._filter('tenant2'))
+        self.assertEqual(6, len(self.db_calls))
+
+    def test_cache_disabled(self):
+        self.flags(scheduler_filter_result_cache_ttl=0)
+        self._filter('tenant1')
+        self._filter('tenant1')
+        self.assertEqual(6, len(self.db_calls))
+
+    def test_host_state_change_invalidates_host(self):
+        self._filter('tenant1')
+        self.hosts[1].consume_from_instance({'root_gb': 1, 'ephemeral_gb': 0,
+                                             'memory_mb': 512, 'vcpus': 1})
+        self._filter('tenant1')
+        self.assertEqual(['host0', 'host1', 'host2', 'host1'], self.db_calls)
+
+    def test_aggregates_changed_invalidates_results(self):
+        self.assertEqual(['host0', 'host2'], self._filter('tenant1'))
+        self.metadata['host1'] = {'filter_tenant_id': set(['tenant1'])}
+        self.host_manager.aggregates_changed()
+        self.assertEqual(['host0', 'host1', 'host2'], self._filter('tenant1'))
+        self.assertEqual(6, len(self.db_calls))
+
+    def test_results_expire(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self._filter('tenant1')
+        timeutils.advance_time_seconds(61)
+        self._filter('tenant1')
+        self.assertEqual(6, len(self.db_calls))
+        self.assertEqual(1, len(self.host_manager.filter_handler.
+                                result_cache.results))
+
+    def test_filter_without_fingerprint_not_cached(self):
+        self.assertIsNone(filters.BaseHostFilter().cache_fingerprint({}))
+        self.host_manager.get_filtered_hosts(self.hosts,
+                {'instance_type': {'memory_mb': 512}}, ['RamFilter'])
+        self.assertEqual({},
+                         self.host_manager.filter_handler.result_cache.results)
+
+    def test_freeze(self):
+        self.assertEqual((('a', (1, 2)), ('b', (('c', None),))),
+                         filter_cache.freeze({'b': {'c': None}, 'a': [1, 2]}))
+        self.assertEqual(hash(filter_cache.freeze({'a': {'b': [1]}})),
+                         hash(filter_cache.freeze({'a': {'b': [1]}})))
+
+
+class HostStateGenerationTestCase(test.NoDBTestCase):
+    """Test when a HostState records that it changed."""
+
+    def setUp(self):
+        super(HostStateGenerationTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.host_state = host_manager.HostState('host1', 'node1')
+        self.compute = dict(fakes.COMPUTE_NODES[0],
+                            updated_at=timeutils.utcnow())
+
+    def test_update_from_same_compute_node(self):
+        self.host_state.update_from_compute_node(self.compute)
+        generation = self.host_state.generation
+        self.host_state.update_from_compute_node(self.compute)
+        self.assertEqual(generation, self.host_state.generation)
+
+    def test_update_from_newer_compute_node(self):
+        self.host_state.update_from_compute_node(self.compute)
+        generation = self.host_state.generation
+        timeutils.advance_time_seconds(1)
+        self.host_state.update_from_compute_node(
+                dict(self.compute, updated_at=timeutils.utcnow()))
+        self.assertNotEqual(generation, self.host_state.generation)
+
+    def test_update_capabilities(self):
+        generation = self.host_state.generation
+        self.host_state.update_capabilities({}, {'host': 'host1'})
+        self.assertEqual(generation, self.host_state.generation)
+        self.host_state.update_capabilities({'foo': 'bar'})
+        self.assertNotEqual(generation, self.host_state.generation)
+
+    def test_generations_are_unique(self):
+        other = host_manager.HostState('host1', 'node1')
+        self.assertNotEqual(other.generation, self.host_state.generation)
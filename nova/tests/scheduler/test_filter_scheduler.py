@@ -18,6 +18,7 @@ Tests For Filter Scheduler.
 
 import contextlib
 import mock
+import random
 import uuid
 
 import mox
@@ -526,6 +527,149 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEqual(50, hosts[0].weight)
 
+    def _schedule_placements(self, num_instances, single_pass, seed):
+        self.flags(scheduler_single_pass_placement=single_pass)
+        sched = fakes.FakeFilterScheduler()
+        rand = random.Random(seed)
+        hosts = []
+        for i in xrange(40):
+            hosts.append(fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                    {'free_ram_mb': rand.choice([512, 1024, 2048, 4096]),
+                     'total_usable_ram_mb': 4096,
+                     'free_disk_mb': rand.randint(1, 64) * 1024,
+                     'total_usable_disk_gb': 64,
+                     'vcpus_total': 4, 'vcpus_used': rand.randint(0, 8),
+                     'metrics': {'foo': host_manager.MetricItem(
+                            value=rand.randint(0, 3), timestamp=None,
+                            source='fake')}}))
+        self.stubs.Set(sched, '_get_all_host_states', lambda ctxt: hosts)
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 8,
+                               'memory_mb': 512,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux'}
+        request_spec = {'instance_properties': instance_properties,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 8,
+                                          'ephemeral_gb': 0, 'swap': 0,
+                                          'vcpus': 1},
+                        'num_instances': num_instances}
+        selected = sched._schedule(self.context, request_spec, {})
+        return [(h.obj.host, h.weight) for h in selected]
+
+    def test_single_pass_placement_matches_loop(self):
+        self.flags(scheduler_default_filters=['RamFilter', 'CoreFilter',
+                                              'DiskFilter'])
+        self.flags(scheduler_host_subset_size=1)
+        for seed, weight_setting in enumerate([[], ['foo=1.0'],
+                                               ['foo=-3.0']]):
+            self.flags(weight_setting=weight_setting, group='metrics')
+            expected = self._schedule_placements(250, False, seed)
+            self.assertEqual(expected,
+                             self._schedule_placements(250, True, seed))
+            # Hosts run out of capacity before every instance is placed
+            self.assertTrue(40 < len(expected) < 250)
+
+    def test_single_pass_placement_host_subset(self):
+        self.flags(scheduler_default_filters=['RamFilter'])
+        self.flags(scheduler_host_subset_size=3)
+        selected = self._schedule_placements(20, True, 0)
+        self.assertEqual(20, len(selected))
+
+    def _schedule_with_claims(self, single_pass):
+        self.flags(scheduler_claim_resources=True,
+                   scheduler_single_pass_placement=single_pass,
+                   scheduler_default_filters=['RamFilter'],
+                   ram_weight_multiplier=1.0)
+        sched = fakes.FakeFilterScheduler()
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'compute_node_id': i,
+                                      'free_ram_mb': 4096 - 1024 * i,
+                                      'total_usable_ram_mb': 4096})
+                 for i in xrange(3)]
+        self.stubs.Set(sched, '_get_all_host_states', lambda ctxt: hosts)
+        claims = []
+
+        def fake_claim_resources(context, compute_id, instance_uuid,
+                                 resources, ratios, expire):
+            claims.append((compute_id, instance_uuid))
+            # Another scheduler took the resources of host0.
+            return compute_id != 0
+
+        self.stubs.Set(db, 'compute_node_claim_resources',
+                       fake_claim_resources)
+        instance_properties = {'project_id': 1, 'root_gb': 8,
+                               'memory_mb': 512, 'ephemeral_gb': 0,
+                               'vcpus': 1, 'os_type': 'Linux'}
+        request_spec = {'instance_properties': instance_properties,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 8,
+                                          'ephemeral_gb': 0, 'swap': 0,
+                                          'vcpus': 1},
+                        'num_instances': 2}
+        selected = sched._schedule(self.context, request_spec, {},
+                                   ['uuid1', 'uuid2'])
+        self.assertEqual(['host1', 'host1'], [h.obj.host for h in selected])
+        self.assertEqual([(0, 'uuid1'), (1, 'uuid1'), (1, 'uuid2')], claims)
+        # Only the claimed resources were consumed.
+        self.assertEqual(4096, hosts[0].free_ram_mb)
+        self.assertEqual(2048, hosts[1].free_ram_mb)
+
+    def test_schedule_claims_resources(self):
+        self._schedule_with_claims(False)
+
+    def test_single_pass_placement_claims_resources(self):
+        self._schedule_with_claims(True)
+
+    def test_schedule_claim_conflicts_exhaust_hosts(self):
+        self.flags(scheduler_claim_resources=True,
+                   scheduler_default_filters=['RamFilter'])
+        sched = fakes.FakeFilterScheduler()
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'compute_node_id': i,
+                                      'free_ram_mb': 4096,
+                                      'total_usable_ram_mb': 4096})
+                 for i in xrange(2)]
+        self.stubs.Set(sched, '_get_all_host_states', lambda ctxt: hosts)
+        self.stubs.Set(db, 'compute_node_claim_resources',
+                       lambda *args: False)
+        request_spec = {'instance_properties': {'project_id': 1,
+                                                'root_gb': 8,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'},
+                        'instance_type': {'memory_mb': 512},
+                        'num_instances': 1}
+        self.assertEqual([], sched._schedule(self.context, request_spec, {}))
+
+    def test_single_pass_placement_not_used_with_group(self):
+        self.flags(scheduler_single_pass_placement=True)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        self.stubs.Set(sched, '_setup_instance_group',
+                       lambda ctxt, filter_properties: True)
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                       fake_get_filtered_hosts)
+        self.mox.StubOutWithMock(sched, '_schedule_single_pass')
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+        self.mox.ReplayAll()
+
+        request_spec = {'num_instances': 2,
+                        'instance_type': {'memory_mb': 512, 'root_gb': 512,
+                                          'ephemeral_gb': 0, 'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 512,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        filter_properties = {'group_hosts': set()}
+        selected = sched._schedule(fake_context, request_spec,
+                                   filter_properties)
+        self.assertEqual(2, len(selected))
+
     def test_select_destinations(self):
         """select_destinations is basically a wrapper around _schedule().
 
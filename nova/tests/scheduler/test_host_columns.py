@@ -0,0 +1,139 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For batch (columnar) host filtering and weighing.
+"""
+
+import testtools
+
+from nova.scheduler import filters
+from nova.scheduler import host_columns
+from nova.scheduler import host_manager
+from nova.scheduler import weights
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+BATCH_FILTERS = ['RamFilter', 'CoreFilter', 'DiskFilter',
+                 'NumInstancesFilter', 'IoOpsFilter']
+
+
+def _make_hosts():
+    hosts = []
+    for i in range(12):
+        hosts.append(fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                {'free_ram_mb': 256 * (i % 5) - 256,
+                 'total_usable_ram_mb': 1024,
+                 'free_disk_mb': 1024 * (i % 4),
+                 'total_usable_disk_gb': 4,
+                 'vcpus_total': i % 3,
+                 'vcpus_used': i % 7 * 4,
+                 'num_io_ops': i % 10,
+                 'num_instances': i * 5,
+                 'service': {'disabled': False}}))
+    return hosts
+
+
+@testtools.skipIf(host_columns.numpy is None, 'numpy is not installed')
+class BatchFilterTestCase(test.NoDBTestCase):
+    """Test the batch forms of filters give the per-host results."""
+
+    def setUp(self):
+        super(BatchFilterTestCase, self).setUp()
+        self.filter_handler = filters.HostFilterHandler()
+        classes = self.filter_handler.get_matching_classes(
+                ['nova.scheduler.filters.all_filters'])
+        self.class_map = dict((cls.__name__, cls) for cls in classes)
+        self.filter_properties = {'instance_type': {'memory_mb': 512,
+                                                    'vcpus': 2,
+                                                    'root_gb': 1,
+                                                    'ephemeral_gb': 1,
+                                                    'swap': 256}}
+
+    def _filter(self, filter_names, hosts, batch):
+        self.flags(scheduler_use_batch_filters=batch)
+        filter_classes = [self.class_map[name] for name in filter_names]
+        return self.filter_handler.get_filtered_objects(filter_classes,
+                hosts, self.filter_properties)
+
+    def test_batch_disabled_without_numpy(self):
+        self.flags(scheduler_use_batch_filters=True)
+        self.stubs.Set(host_columns, 'numpy', None)
+        self.assertFalse(host_columns.batch_enabled())
+
+    def test_each_batch_filter_matches_host_passes(self):
+        for name in BATCH_FILTERS:
+            hosts = _make_hosts()
+            expected = [host.host for host in
+                        self._filter([name], hosts, batch=False)]
+            expected_limits = [host.limits for host in hosts]
+
+            hosts = _make_hosts()
+            result = [host.host for host in
+                      self._filter([name], hosts, batch=True)]
+            self.assertEqual(expected, result, name)
+            self.assertEqual(expected_limits,
+                             [host.limits for host in hosts], name)
+
+    def test_mixed_batch_and_per_host_filters(self):
+        hosts = _make_hosts()
+        hosts[2].service = {'disabled': True}
+        names = ['RamFilter', 'ComputeFilter', 'NumInstancesFilter']
+        self.stubs.Set(self.class_map['ComputeFilter'], 'host_passes',
+                       lambda self, host_state, props:
+                            not host_state.service['disabled'])
+        expected = self._filter(names, hosts, batch=False)
+        result = self._filter(names, hosts, batch=True)
+        self.assertEqual(expected, result)
+        self.assertNotIn(hosts[2], result)
+
+    def test_no_hosts_pass(self):
+        self.filter_properties['instance_type']['memory_mb'] = 1024 * 1024
+        self.assertEqual([], self._filter(['RamFilter', 'CoreFilter'],
+                                          _make_hosts(), batch=True))
+
+    def test_per_host_filter_stops_filtering(self):
+        self.stubs.Set(self.class_map['ComputeFilter'], 'filter_all',
+                       lambda self, objs, props: None)
+        self.assertIsNone(self._filter(['RamFilter', 'ComputeFilter'],
+                                       _make_hosts(), batch=True))
+
+
+@testtools.skipIf(host_columns.numpy is None, 'numpy is not installed')
+class BatchWeigherTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(BatchWeigherTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.weight_classes = self.weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.all_weighers'])
+
+    def _weigh(self, batch):
+        self.flags(scheduler_use_batch_filters=batch)
+        hosts = _make_hosts()
+        for host in hosts:
+            host.metrics = {'foo': host_manager.MetricItem(
+                    value=host.num_io_ops, timestamp=None, source='fake')}
+        return [(w.obj.host, w.weight) for w in
+                self.weight_handler.get_weighed_objects(self.weight_classes,
+                                                        hosts, {})]
+
+    def test_batch_weighing_matches_per_host(self):
+        self.flags(weight_setting=['foo=-2.0'], group='metrics')
+        self.assertEqual(self._weigh(batch=False), self._weigh(batch=True))
+
+    def test_batch_weighing_stacking(self):
+        self.flags(ram_weight_multiplier=-1.0)
+        self.flags(weight_setting=['foo=1.0'], group='metrics')
+        self.assertEqual(self._weigh(batch=False), self._weigh(batch=True))
@@ -1531,6 +1531,35 @@ class HostFiltersTestCase(test.NoDBTestCase):
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_aggregate_multi_tenancy_isolation_preloaded_metadata(self):
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        filt_cls = self.class_map['AggregateMultiTenancyIsolation']()
+        filter_properties = {'context': self.context,
+                             'request_spec': {
+                                 'instance_properties': {
+                                     'project_id': 'my_tenantid'}}}
+        host = fakes.FakeHostState('host1', 'compute',
+                {'aggregate_metadata': {'filter_tenant_id':
+                                        set(['other_tenantid']),
+                                        'foo': set(['bar'])}})
+        self.assertFalse(filt_cls.host_passes(host, filter_properties))
+        host = fakes.FakeHostState('host2', 'compute',
+                                   {'aggregate_metadata': {}})
+        self.assertTrue(filt_cls.host_passes(host, filter_properties))
+
+    def test_availability_zone_filter_preloaded_metadata(self):
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        request = self._make_zone_request('az1')
+        host = fakes.FakeHostState('host1', 'node1',
+                {'aggregate_metadata': {'availability_zone': set(['az1'])}})
+        self.assertTrue(filt_cls.host_passes(host, request))
+        host = fakes.FakeHostState('host1', 'node1',
+                {'aggregate_metadata': {'availability_zone': set(['az2'])}})
+        self.assertFalse(filt_cls.host_passes(host, request))
+
     def _fake_pci_support_requests(self, pci_requests):
         self.pci_requests = pci_requests
         return self.pci_request_result
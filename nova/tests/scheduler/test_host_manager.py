@@ -15,6 +15,10 @@
 """
 Tests For HostManager
 """
+import datetime
+
+import mock
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -314,6 +318,26 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
 
+    def test_claim_from_instance(self):
+        self.flags(scheduler_claim_resources=True, scheduler_claim_expire=60,
+                   ram_allocation_ratio=1.5)
+        host_state = host_manager.HostState('host1', 'node1')
+        host_state.update_from_compute_node(fakes.COMPUTE_NODES[0])
+        instance = dict(root_gb=1, ephemeral_gb=1, memory_mb=512, vcpus=1,
+                        vm_state=vm_states.BUILDING, task_state=None,
+                        os_type='Linux', project_id='12345')
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        with mock.patch.object(db, 'compute_node_claim_resources',
+                               return_value=True) as claim:
+            self.assertTrue(self.host_manager.claim_from_instance('ctxt',
+                    host_state, instance, 'fake-uuid'))
+        claim.assert_called_once_with('ctxt', 1, 'fake-uuid',
+                {'memory_mb': 512, 'vcpus': 1, 'local_gb': 2},
+                {'memory_mb': 1.5, 'vcpus': 16.0, 'local_gb': 1.0},
+                now + datetime.timedelta(seconds=60))
+        self.assertEqual(1, host_state.num_instances)
+
 
 class HostManagerChangedNodesTestCase(test.NoDBTestCase):
     """Test case for HostManager class."""
@@ -373,6 +397,290 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerHostStateUpdatesTestCase(test.NoDBTestCase):
+    """Test case for keeping host states fresh from compute updates."""
+
+    def setUp(self):
+        super(HostManagerHostStateUpdatesTestCase, self).setUp()
+        self.flags(scheduler_host_state_updates=True)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.set_time_override()
+        self.services = [dict(host='host1', topic='compute', disabled=False),
+                         dict(host='host1', topic='network', disabled=True)]
+        self.stubs.Set(db, 'service_get_all',
+                       lambda context: self.services)
+
+    def _stub_compute_node_get_all(self, times=1):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        for i in xrange(times):
+            db.compute_node_get_all(self.context).AndReturn(
+                    fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+    def _host_state(self):
+        return self.host_manager.host_state_map[('host1', 'node1')]
+
+    def test_updates_applied_without_db(self):
+        self._stub_compute_node_get_all()
+        self.host_manager.get_all_host_states(self.context)
+
+        self.host_manager.update_host_state('host1', 'node1',
+                {'free_ram_mb': 128,
+                 'updated_at': '2014-01-01T00:00:00.000000'}, 1)
+        self.host_manager.update_host_state('host1', 'node1',
+                {'vcpus_used': 0}, 2)
+        self.host_manager.get_all_host_states(self.context)
+
+        host_state = self._host_state()
+        self.assertEqual(128, host_state.free_ram_mb)
+        self.assertEqual(0, host_state.vcpus_used)
+        self.assertEqual(1024, host_state.total_usable_ram_mb)
+
+    def test_missed_update_resyncs(self):
+        self._stub_compute_node_get_all(times=2)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.host_manager.update_host_state('host1', 'node1',
+                                            {'free_ram_mb': 128}, 1)
+        self.host_manager.update_host_state('host1', 'node1',
+                                            {'free_ram_mb': 64}, 3)
+        self.assertEqual(64, self._host_state().free_ram_mb)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(512, self._host_state().free_ram_mb)
+
+    def test_repeated_update_ignored(self):
+        self._stub_compute_node_get_all()
+        self.host_manager.get_all_host_states(self.context)
+
+        self.host_manager.update_host_state('host1', 'node1',
+                                            {'free_ram_mb': 128}, 4)
+        self.host_manager.update_host_state('host1', 'node1',
+                                            {'free_ram_mb': 64}, 4)
+        self.assertEqual(128, self._host_state().free_ram_mb)
+        self.assertFalse(self.host_manager.full_sync_needed)
+
+    def test_unknown_node_resyncs(self):
+        self._stub_compute_node_get_all(times=2)
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.update_host_state('host9', 'node9',
+                                            {'free_ram_mb': 128}, 1)
+        self.host_manager.get_all_host_states(self.context)
+
+    def test_resync_interval(self):
+        self.flags(scheduler_host_state_resync_interval=50)
+        self._stub_compute_node_get_all(times=2)
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(30)
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(21)
+        self.host_manager.get_all_host_states(self.context)
+
+    def test_resync_interval_below_service_down_time(self):
+        self.flags(scheduler_host_state_resync_interval=60,
+                   service_down_time=60)
+        self.assertRaises(exception.InvalidInput, host_manager.HostManager)
+
+    def test_services_refreshed_without_resync(self):
+        self._stub_compute_node_get_all()
+        self.host_manager.get_all_host_states(self.context)
+        self.assertFalse(self._host_state().service['disabled'])
+
+        updated_at = timeutils.utcnow()
+        self.services[0] = dict(host='host1', topic='compute', disabled=True,
+                                updated_at=updated_at)
+        self.host_manager.get_all_host_states(self.context)
+        service = self._host_state().service
+        self.assertTrue(service['disabled'])
+        self.assertEqual(updated_at, service['updated_at'])
+
+    def test_updates_disabled(self):
+        self.flags(scheduler_host_state_updates=False)
+        self._stub_compute_node_get_all(times=2)
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+
+class HostManagerPreloadAggregatesTestCase(test.NoDBTestCase):
+    """Test case for attaching aggregate metadata to host states."""
+
+    def setUp(self):
+        super(HostManagerPreloadAggregatesTestCase, self).setUp()
+        self.flags(scheduler_preload_aggregates=True)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.stubs.Set(db, 'service_get_all', lambda context: [])
+        self.aggregates = [
+            {'hosts': ['host1', 'host2'],
+             'metadetails': {'availability_zone': 'az1', 'foo': 'bar'}},
+            {'hosts': ['host1'], 'metadetails': {'foo': 'baz'}},
+            {'hosts': ['host3'], 'metadetails': {}}]
+
+    def _metadata(self, host, node):
+        return self.host_manager.host_state_map[(host, node)].\
+                aggregate_metadata
+
+    def test_aggregates_attached(self):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(self.context).AndReturn(self.aggregates)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual({'availability_zone': set(['az1']),
+                          'foo': set(['bar', 'baz'])},
+                         self._metadata('host1', 'node1'))
+        self.assertEqual({'availability_zone': set(['az1']),
+                          'foo': set(['bar'])},
+                         self._metadata('host2', 'node2'))
+        self.assertEqual({}, self._metadata('host3', 'node3'))
+        self.assertEqual({}, self._metadata('host4', 'node4'))
+
+    def test_aggregates_reloaded_when_changed(self):
+        self.flags(scheduler_host_state_updates=True)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(self.context).AndReturn(self.aggregates)
+        db.aggregate_get_all(self.context).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+        generation = self.host_manager.host_state_map[
+                ('host1', 'node1')].generation
+        self.host_manager.aggregates_changed()
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual({}, self._metadata('host1', 'node1'))
+        self.assertNotEqual(generation, self.host_manager.host_state_map[
+                ('host1', 'node1')].generation)
+
+    def test_aggregates_not_preloaded(self):
+        self.flags(scheduler_preload_aggregates=False)
+        fakes.mox_host_manager_db_calls(self.mox, self.context)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        self.assertIsNone(self._metadata('host1', 'node1'))
+
+
+class HostManagerPrefetchTestCase(test.NoDBTestCase):
+    """Test case for building host states in the background."""
+
+    def setUp(self):
+        super(HostManagerPrefetchTestCase, self).setUp()
+        self.host_manager = host_manager.HostManager()
+        self.host_manager.prefetching = True
+        self.context = 'fake_context'
+        self.stubs.Set(db, 'service_get_all', lambda context: [])
+        self.instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=512,
+                             vcpus=1)
+        self.pages = []
+
+        def fake_compute_node_get_all(context, limit=None, marker=None):
+            self.pages.append(marker)
+            nodes = [node for node in fakes.COMPUTE_NODES
+                     if marker is None or node['id'] > marker]
+            return nodes[:limit]
+
+        self.stubs.Set(db, 'compute_node_get_all', fake_compute_node_get_all)
+
+    def _host_state(self, host, node):
+        return self.host_manager.host_state_map[(host, node)]
+
+    def test_prefetch_host_states(self):
+        self.host_manager.prefetch_host_states(self.context, 2)
+        self.assertEqual([None, 2, 4], self.pages)
+        self.assertEqual(set([('host1', 'node1'), ('host2', 'node2'),
+                              ('host3', 'node3'), ('host4', 'node4')]),
+                         set(self.host_manager.host_state_map.keys()))
+        self.assertIsNone(self.host_manager.pending_consumptions)
+
+        # Requests use the prefetched host states without reading the
+        # compute nodes.
+        host_states = list(self.host_manager.get_all_host_states(
+                self.context))
+        self.assertEqual(4, len(host_states))
+        self.assertEqual(3, len(self.pages))
+
+    def test_prefetch_replaces_host_states(self):
+        self.host_manager.prefetch_host_states(self.context, 10)
+        old_state = self._host_state('host1', 'node1')
+        self.host_manager.prefetch_host_states(self.context, 10)
+        self.assertIsNot(old_state, self._host_state('host1', 'node1'))
+
+    def test_consumption_during_prefetch_carried_over(self):
+        self.host_manager.prefetch_host_states(self.context, 10)
+        old_state = self._host_state('host1', 'node1')
+        free_ram_mb = old_state.free_ram_mb
+
+        def consume_while_fetching(context, limit=None, marker=None):
+            self.host_manager.consume_from_instance(old_state, self.instance)
+            return fakes.COMPUTE_NODES
+
+        self.stubs.Set(db, 'compute_node_get_all', consume_while_fetching)
+        self.host_manager.prefetch_host_states(self.context, 10)
+        new_state = self._host_state('host1', 'node1')
+        self.assertIsNot(old_state, new_state)
+        self.assertEqual(free_ram_mb - 512, old_state.free_ram_mb)
+        self.assertEqual(free_ram_mb - 512, new_state.free_ram_mb)
+        self.assertEqual(1, new_state.num_instances)
+
+    def test_updates_during_prefetch_replayed(self):
+        self.flags(scheduler_host_state_updates=True)
+        self.host_manager.prefetch_host_states(self.context, 10)
+
+        def update_while_fetching(context, limit=None, marker=None):
+            self.host_manager.update_host_state('host1', 'node1',
+                                                {'free_ram_mb': 128}, 1)
+            return fakes.COMPUTE_NODES
+
+        self.stubs.Set(db, 'compute_node_get_all', update_while_fetching)
+        self.host_manager.prefetch_host_states(self.context, 10)
+        self.assertEqual(128, self._host_state('host1', 'node1').free_ram_mb)
+        self.assertEqual({('host1', 'node1'): 1},
+                         self.host_manager.host_state_generations)
+        self.assertIsNone(self.host_manager.pending_updates)
+
+        # A missed update is still detected
+        self.host_manager.update_host_state('host1', 'node1',
+                                            {'free_ram_mb': 64}, 3)
+        self.assertTrue(self.host_manager.full_sync_needed)
+
+    def test_services_refreshed_between_prefetches(self):
+        self.host_manager.prefetch_host_states(self.context, 10)
+        self.stubs.Set(db, 'service_get_all', lambda context: [
+                dict(host='host1', topic='compute', disabled=True)])
+        self.host_manager.get_all_host_states(self.context)
+        self.assertTrue(
+                self._host_state('host1', 'node1').service['disabled'])
+
+    def test_consume_from_replaced_host_state(self):
+        self.host_manager.prefetch_host_states(self.context, 10)
+        old_state = self._host_state('host1', 'node1')
+        self.host_manager.prefetch_host_states(self.context, 10)
+        new_state = self._host_state('host1', 'node1')
+        free_ram_mb = new_state.free_ram_mb
+        self.host_manager.consume_from_instance(old_state, self.instance)
+        self.assertEqual(free_ram_mb - 512, new_state.free_ram_mb)
+
+    def test_failed_prefetch_keeps_host_states(self):
+        self.host_manager.prefetch_host_states(self.context, 10)
+        host_state_map = self.host_manager.host_state_map
+
+        def fail(context, limit=None, marker=None):
+            raise test.TestingException()
+
+        self.stubs.Set(db, 'compute_node_get_all', fail)
+        self.assertRaises(test.TestingException,
+                          self.host_manager.prefetch_host_states,
+                          self.context, 10)
+        self.assertIs(host_state_map, self.host_manager.host_state_map)
+        self.assertIsNone(self.host_manager.pending_consumptions)
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
@@ -500,3 +808,43 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertEqual('source1', host.metrics['res1'].source)
         self.assertEqual('string2', host.metrics['res2'].value)
         self.assertEqual('source2', host.metrics['res2'].source)
+
+    def test_stats_parsed_once(self):
+        stats = jsonutils.dumps({'num_instances': '2', 'num_proj_12345': '2',
+                                 'io_workload': '1'})
+        compute = dict(stats=stats, memory_mb=0, free_disk_gb=0, local_gb=0,
+                       local_gb_used=0, free_ram_mb=0, vcpus=0, vcpus_used=0,
+                       updated_at=None, host_ip='127.0.0.1',
+                       hypervisor_version=0)
+        host = host_manager.HostState("fakehost", "fakenode")
+
+        with mock.patch.object(host_manager, 'parse_stats',
+                               wraps=host_manager.parse_stats) as parse:
+            host.update_from_compute_node(compute)
+            host.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                            memory_mb=0, vcpus=0,
+                                            project_id='12345'))
+            self.assertEqual(3, host.num_instances_by_project['12345'])
+            host.update_from_compute_node(compute)
+            self.assertEqual(1, parse.call_count)
+
+        self.assertEqual(2, host.num_instances)
+        self.assertEqual(2, host.num_instances_by_project['12345'])
+        self.assertEqual(1, host.num_io_ops)
+
+    def test_parse_stats(self):
+        parsed = host_manager.parse_stats(jsonutils.dumps(
+                {'num_instances': '3', 'num_vm_active': '3',
+                 'num_task_None': 3, 'num_os_type_linux': '3',
+                 'num_proj_12345': '3', 'io_workload': '0', 'foo': 'bar'}))
+        self.assertEqual(3, parsed.num_instances)
+        self.assertEqual(0, parsed.num_io_ops)
+        self.assertEqual({'active': 3}, parsed.vm_states)
+        self.assertEqual({'None': 3}, parsed.task_states)
+        self.assertEqual({'linux': 3}, parsed.num_instances_by_os_type)
+        self.assertEqual({'12345': 3}, parsed.num_instances_by_project)
+        self.assertEqual('bar', parsed.stats['foo'])
+
+    def test_host_state_has_no_dict(self):
+        host = host_manager.HostState("fakehost", "fakenode")
+        self.assertFalse(hasattr(host, '__dict__'))
@@ -82,3 +82,13 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
         self._test_scheduler_api('select_destinations', rpc_method='call',
                 request_spec='fake_request_spec',
                 filter_properties='fake_prop')
+
+    def test_update_host_state(self):
+        self._test_scheduler_api('update_host_state', rpc_method='cast',
+                host='fake_host', node='fake_node',
+                values={'free_ram_mb': 512}, generation=2,
+                fanout=True, version='3.1')
+
+    def test_aggregates_changed(self):
+        self._test_scheduler_api('aggregates_changed', rpc_method='cast',
+                fanout=True, version='3.2')
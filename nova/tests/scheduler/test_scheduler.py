@@ -72,6 +72,54 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
         manager = self.manager
         self.assertIsInstance(manager.driver, self.driver_cls)
 
+    def test_pre_start_hook_without_prefetch(self):
+        with mock.patch.object(self.manager.driver.host_manager,
+                               'prefetch_host_states') as prefetch:
+            self.manager.pre_start_hook()
+            self.assertFalse(prefetch.called)
+        self.assertFalse(self.manager.driver.host_manager.prefetching)
+
+    @mock.patch('nova.openstack.common.loopingcall.FixedIntervalLoopingCall')
+    def test_pre_start_hook_prefetches_host_states(self, mock_timer):
+        self.flags(scheduler_host_state_prefetch_interval=30,
+                   scheduler_host_state_prefetch_page_size=100)
+        host_manager = self.manager.driver.host_manager
+        with mock.patch.object(host_manager,
+                               'prefetch_host_states') as prefetch:
+            self.manager.pre_start_hook()
+            self.assertEqual(1, prefetch.call_count)
+            self.assertEqual(100, prefetch.call_args[0][1])
+        self.assertTrue(host_manager.prefetching)
+        mock_timer.assert_called_once_with(
+                self.manager._prefetch_host_states)
+        mock_timer.return_value.start.assert_called_once_with(
+                interval=30, initial_delay=30)
+
+        self.manager.cleanup_host()
+        mock_timer.return_value.stop.assert_called_once_with()
+
+    def test_pre_start_hook_invalid_page_size(self):
+        self.flags(scheduler_host_state_prefetch_interval=30,
+                   scheduler_host_state_prefetch_page_size=0)
+        self.assertRaises(exception.InvalidInput,
+                          self.manager.pre_start_hook)
+
+    def test_expire_compute_node_reservations(self):
+        with mock.patch.object(db, 'compute_node_reservation_expire') as exp:
+            self.manager._expire_compute_node_reservations(self.context)
+            self.assertFalse(exp.called)
+            self.flags(scheduler_claim_resources=True)
+            self.manager._expire_compute_node_reservations(self.context)
+            exp.assert_called_once_with(self.context)
+
+    def test_prefetch_host_states_failure_is_logged(self):
+        with mock.patch.object(self.manager.driver.host_manager,
+                               'prefetch_host_states',
+                               side_effect=test.TestingException()):
+            with mock.patch.object(manager.LOG, 'exception') as log:
+                self.manager._prefetch_host_states()
+                self.assertTrue(log.called)
+
     def test_show_host_resources(self):
         host = 'fake_host'
 
@@ -582,3 +630,17 @@ class SchedulerV3PassthroughTestCase(test.TestCase):
                 ) as prep_resize:
             self.proxy.prep_resize(None, None, None, None, None, None, None)
             prep_resize.assert_called_once()
+
+    def test_update_host_state(self):
+        with mock.patch.object(self.manager.driver.host_manager,
+                               'update_host_state') as update_host_state:
+            self.proxy.update_host_state(None, 'host1', 'node1',
+                                         {'free_ram_mb': 512}, 3)
+            update_host_state.assert_called_once_with(
+                    'host1', 'node1', {'free_ram_mb': 512}, 3)
+
+    def test_aggregates_changed(self):
+        with mock.patch.object(self.manager.driver.host_manager,
+                               'aggregates_changed') as aggregates_changed:
+            self.proxy.aggregates_changed(None)
+            aggregates_changed.assert_called_once_with()
@@ -0,0 +1,123 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For scheduler statistics.
+"""
+
+import mock
+from oslo.config import cfg
+
+from nova.scheduler import filters
+from nova.scheduler import host_columns
+from nova.scheduler import manager
+from nova.scheduler import stats
+from nova.scheduler import weights
+from nova import test
+from nova.tests.scheduler import fakes
+
+CONF = cfg.CONF
+CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
+
+
+class SchedulerStatsTestCase(test.NoDBTestCase):
+    """Test collection of scheduler statistics."""
+
+    def setUp(self):
+        super(SchedulerStatsTestCase, self).setUp()
+        self.flags(scheduler_collect_stats=True, ram_allocation_ratio=1.0)
+        stats.STATS.reset()
+        self.addCleanup(stats.STATS.reset)
+        self.hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                          {'free_ram_mb': 512 * i,
+                                           'total_usable_ram_mb': 2048})
+                      for i in range(4)]
+        self.filter_handler = filters.HostFilterHandler()
+        self.filter_classes = self.filter_handler.get_matching_classes(
+                ['nova.scheduler.filters.ram_filter.RamFilter',
+                 'nova.scheduler.filters.all_hosts_filter.AllHostsFilter'])
+
+    def test_timing(self):
+        timing = stats.Timing()
+        timing.add(0.002, 10, 4)
+        timing.add(0.003, 10, 6)
+        timing.add(60, 0, 0)
+        result = timing.to_dict()
+        self.assertEqual(3, result['calls'])
+        self.assertEqual(60, result['max'])
+        self.assertEqual(20, result['hosts_in'])
+        self.assertEqual(10, result['hosts_out'])
+        self.assertEqual([0, 2, 0, 0, 0, 0, 0, 0, 0, 1], result['histogram'])
+
+    def test_timed(self):
+        with stats.timed('foo'):
+            pass
+        self.assertEqual(1, stats.STATS.report()['foo']['calls'])
+
+    def test_timed_disabled(self):
+        self.flags(scheduler_collect_stats=False)
+        with stats.timed('foo'):
+            pass
+        self.assertEqual({}, stats.STATS.report())
+
+    def _check_filter_stats(self):
+        result = self.filter_handler.get_filtered_objects(
+                self.filter_classes, self.hosts,
+                {'instance_type': {'memory_mb': 1024}})
+        self.assertEqual(2, len(result))
+        report = stats.STATS.report()
+        self.assertEqual(4, report['filter.RamFilter']['hosts_in'])
+        self.assertEqual(2, report['filter.RamFilter']['hosts_out'])
+        self.assertEqual(2, report['filter.AllHostsFilter']['hosts_in'])
+        self.assertEqual(2, report['filter.AllHostsFilter']['hosts_out'])
+
+    def test_filter_stats(self):
+        self._check_filter_stats()
+
+    def test_filter_stats_batch(self):
+        if host_columns.numpy is None:
+            self.skipTest('numpy is not installed')
+        self.flags(scheduler_use_batch_filters=True)
+        self._check_filter_stats()
+
+    def test_weigher_stats(self):
+        weight_handler = weights.HostWeightHandler()
+        weight_classes = weight_handler.get_matching_classes(
+                ['nova.scheduler.weights.ram.RAMWeigher'])
+        weight_handler.get_weighed_objects(weight_classes, self.hosts, {})
+        report = stats.STATS.report()
+        self.assertEqual(1, report['weigher.RAMWeigher']['calls'])
+        self.assertEqual(4, report['weigher.RAMWeigher']['hosts_in'])
+
+    def test_no_stats_when_disabled(self):
+        self.flags(scheduler_collect_stats=False)
+        self.filter_handler.get_filtered_objects(self.filter_classes,
+                self.hosts, {'instance_type': {'memory_mb': 1024}})
+        self.assertEqual({}, stats.STATS.report())
+
+    def test_select_destinations_latency(self):
+        sched_manager = manager.SchedulerManager()
+        with mock.patch.object(sched_manager.driver, 'select_destinations',
+                               return_value=[]):
+            sched_manager.select_destinations(None, {}, {})
+        self.assertEqual(1,
+                         stats.STATS.report()['select_destinations']['calls'])
+
+    def test_log_and_reset(self):
+        stats.STATS.record('foo', 0.5, 3, 1)
+        with mock.patch.object(stats.LOG, 'info') as info:
+            sched_manager = manager.SchedulerManager()
+            sched_manager._log_stats(None)
+            self.assertEqual(2, info.call_count)
+        self.assertEqual({}, stats.STATS.report())
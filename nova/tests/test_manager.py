@@ -0,0 +1,129 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the periodic task runner of the managers.
+"""
+
+import datetime
+
+from eventlet import event
+from eventlet import greenpool
+
+from nova import context
+from nova import manager
+from nova.openstack.common import periodic_task
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class FakeManager(manager.Manager):
+    def __init__(self):
+        super(FakeManager, self).__init__()
+        self._periodic_spacing = self._periodic_spacing.copy()
+        self._periodic_last_run = self._periodic_last_run.copy()
+        self.runs = []
+        self.release = event.Event()
+        self.fail = False
+
+    @periodic_task.periodic_task
+    def _first(self, context):
+        self.runs.append('first')
+        if self.fail:
+            raise test.TestingException()
+
+    @manager.periodic_task_options(priority=10)
+    @periodic_task.periodic_task
+    def _urgent(self, context):
+        self.runs.append('urgent')
+
+    @manager.periodic_task_options(priority=-10, deadline=0.01)
+    @periodic_task.periodic_task
+    def _slow(self, context):
+        self.runs.append('slow')
+        self.release.wait()
+        self.runs.append('slow done')
+
+
+class PeriodicTaskRunnerTestCase(test.NoDBTestCase):
+    """Test the periodic task runner of the managers."""
+
+    def setUp(self):
+        super(PeriodicTaskRunnerTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.manager = FakeManager()
+
+    def test_priorities(self):
+        self.manager.release.send()
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(['urgent', 'first', 'slow', 'slow done'],
+                         self.manager.runs)
+
+    def test_parallel_deadline(self):
+        self.flags(periodic_task_workers=2)
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(['urgent', 'first', 'slow'], self.manager.runs)
+        self.assertEqual(set(['_slow']), self.manager._periodic_running)
+
+        # The slow task is not started again while it still runs
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(['urgent', 'first', 'slow', 'urgent', 'first'],
+                         self.manager.runs)
+
+        self.manager.release.send()
+        self.manager._periodic_pool.waitall()
+        self.assertEqual('slow done', self.manager.runs[-1])
+        self.assertEqual(set(), self.manager._periodic_running)
+        self.assertEqual(1, self.manager.periodic_task_stats['_slow']['runs'])
+
+    def test_busy_workers(self):
+        self.flags(periodic_task_workers=2)
+        pool = self.manager._periodic_pool = greenpool.GreenPool(2)
+        for i in range(2):
+            pool.spawn_n(self.manager.release.wait)
+        self.assertEqual(1, self.manager.periodic_tasks(self.context))
+        self.assertEqual([], self.manager.runs)
+
+        self.manager.release.send()
+        pool.waitall()
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(['urgent', 'first', 'slow', 'slow done'],
+                         self.manager.runs)
+
+    def test_raise_on_error(self):
+        self.flags(periodic_task_workers=2)
+        self.manager.release.send()
+        self.manager.fail = True
+        self.assertRaises(test.TestingException,
+                          self.manager.periodic_tasks, self.context,
+                          raise_on_error=True)
+        self.manager.periodic_tasks(self.context)
+        self.assertEqual(2, self.manager.periodic_task_stats['_first']['runs'])
+
+    def test_stats(self):
+        self.manager.release.send()
+        now = timeutils.utcnow()
+        self.manager._periodic_spacing['_first'] = 60
+        self.manager._periodic_last_run['_first'] = (
+                now - datetime.timedelta(seconds=90))
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+
+        self.manager.periodic_tasks(self.context)
+        stats = self.manager.periodic_task_stats['_first']
+        self.assertEqual(1, stats['runs'])
+        self.assertEqual(30, stats['lag'])
+        self.assertEqual(30, stats['max_lag'])
+        self.assertEqual(0, stats['run_time'])
+        self.assertEqual(0, self.manager.periodic_task_stats['_urgent']['lag'])
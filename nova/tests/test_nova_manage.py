@@ -21,6 +21,7 @@ import sys
 from nova.cmd import manage
 from nova import context
 from nova import db
+from nova.db import stats as db_stats
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova import test
@@ -397,6 +398,50 @@ class DBCommandsTestCase(test.TestCase):
     def test_archive_deleted_rows_negative(self):
         self.assertEqual(1, self.commands.archive_deleted_rows(-1))
 
+    def test_archive_deleted_rows_negative_workers(self):
+        self.assertEqual(1, self.commands.archive_deleted_rows(workers='0'))
+
+    def test_archive_deleted_rows(self):
+        def fake_archive_deleted_rows(context, max_rows, batch_size,
+                                      workers, progress):
+            self.assertEqual((10, 5, 2), (max_rows, batch_size, workers))
+            progress('instances', 5)
+            progress('instances', 3)
+            progress('consoles', 2)
+            return 10
+
+        self.stubs.Set(db, 'archive_deleted_rows', fake_archive_deleted_rows)
+        output = StringIO.StringIO()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', output))
+        self.commands.archive_deleted_rows('10', batch_size='5', workers='2')
+        result = output.getvalue()
+        self.assertIn("%-40s %d" % ('consoles', 2), result)
+        self.assertIn("%-40s %d" % ('instances', 8), result)
+        self.assertIn("10 rows archived in", result)
+
+    def test_stats_no_path(self):
+        self.assertEqual(1, self.commands.stats())
+
+    def test_stats(self):
+        path = self.useFixture(fixtures.TempDir()).path
+        self.flags(db_collect_stats=True, db_stats_dir=path)
+        self.addCleanup(db_stats.STATS.reset)
+        db_stats.STATS.reset()
+        ctxt = context.get_admin_context()
+        db.service_get_all(ctxt)
+        db.service_get_all(ctxt)
+        db_stats.STATS.dump_and_reset()
+
+        output = StringIO.StringIO()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', output))
+        self.assertIsNone(self.commands.stats(sort='calls'))
+        lines = output.getvalue().splitlines()
+        self.assertEqual(['service_get_all', '2'], lines[1].split()[:2])
+        self.assertIn(ctxt.request_id, output.getvalue())
+
+    def test_stats_invalid_sort(self):
+        self.assertEqual(1, self.commands.stats(path='.', sort='foo'))
+
 
 class ServiceCommandsTestCase(test.TestCase):
     def setUp(self):
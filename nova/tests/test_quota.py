@@ -16,6 +16,8 @@
 
 import datetime
 
+import eventlet
+import mock
 from oslo.config import cfg
 
 from nova import compute
@@ -759,6 +761,23 @@ class QuotaEngineTestCase(test.TestCase):
                 ('expire', context),
                 ])
 
+    def test_invalidate_limits(self):
+        driver = FakeDriver()
+        driver.invalidate_limits = lambda: driver.called.append(
+                ('invalidate_limits',))
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.invalidate_limits()
+
+        self.assertEqual(driver.called, [('invalidate_limits',)])
+
+    def test_invalidate_limits_not_implemented(self):
+        # FakeDriver does not implement invalidate_limits
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.invalidate_limits()
+
+        self.assertEqual(driver.called, [])
+
     def test_resources(self):
         quota_obj = self._make_quota_obj(None)
 
@@ -1118,6 +1137,50 @@ class DbQuotaDriverTestCase(test.TestCase):
                     ),
                 ))
 
+    def _get_project_quotas_cached(self, times=2):
+        self._stub_get_by_project()
+        results = [self.driver.get_project_quotas(
+                       FakeContext('test_project', 'test_class'),
+                       quota.QUOTAS._resources, 'test_project')
+                   for i in range(times)]
+        self.assertEqual(results[0], results[-1])
+
+    def test_get_project_quotas_cached(self):
+        self.flags(quota_cache_ttl=60)
+        self._get_project_quotas_cached()
+        # Only the usages are read again
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_project',
+                'quota_usage_get_all_by_project',
+                'quota_class_get_all_by_name',
+                'quota_class_get_default',
+                'quota_usage_get_all_by_project',
+                ])
+
+    def test_get_project_quotas_cache_expired(self):
+        self.flags(quota_cache_ttl=60)
+        self._get_project_quotas_cached(times=1)
+        timeutils.advance_time_seconds(61)
+        self.calls = []
+        self._get_project_quotas_cached(times=1)
+        self.assertEqual(4, len(self.calls))
+
+    def test_get_project_quotas_cache_invalidated(self):
+        self.flags(quota_cache_ttl=60)
+        self._get_project_quotas_cached(times=1)
+        self.driver.invalidate_limits()
+        self.calls = []
+        self._get_project_quotas_cached(times=1)
+        self.assertEqual(4, len(self.calls))
+
+    def test_get_project_quotas_cache_authorized(self):
+        self.flags(quota_cache_ttl=60)
+        self._get_project_quotas_cached(times=1)
+        self.assertRaises(exception.NotAuthorized,
+                          self.driver.get_project_quotas,
+                          FakeContext('other_project', 'test_class'),
+                          quota.QUOTAS._resources, 'test_project')
+
     def test_get_user_quotas_alt_context_no_class(self):
         self.maxDiff = None
         self._stub_get_by_project_and_user()
@@ -2086,11 +2149,16 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                      until_refresh=None),
                 ]
 
+        self.sessions = []
+        self.locked_resources = []
+
         def fake_get_session():
-            return FakeSession()
+            self.sessions.append(FakeSession())
+            return self.sessions[-1]
 
         def fake_get_project_user_quota_usages(context, session, project_id,
-                                               user_id):
+                                               user_id, resources=None):
+            self.locked_resources.append(sorted(resources))
             return self.usages.copy(), self.usages.copy()
 
         def fake_quota_usage_create(context, project_id, user_id, resource,
@@ -2431,6 +2499,131 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         reservations_list = self._update_reservations_list(False, True)
         self.compare_reservation(result, reservations_list)
 
+    def test_quota_reserve_locks_delta_usages(self):
+        context = self._init_usages(1, 2, 1024, 1)
+        sqa_api.quota_reserve(context, self.resources, self.quotas,
+                              self.quotas, dict(fixed_ips=2), self.expire,
+                              0, 0)
+        self.assertEqual([['fixed_ips']], self.locked_resources)
+
+    def _make_reservation_request(self, user_id):
+        return sqa_api._QuotaReservation(
+                FakeContext('test_project', 'test_class'), self.resources,
+                self.quotas, self.quotas, self.deltas, self.expire, 0, 0,
+                'test_project', user_id)
+
+    def test_quota_reserve_batch(self):
+        self._init_usages(1, 2, 1024, 1)
+        batch = [self._make_reservation_request('user%d' % i)
+                 for i in range(3)]
+        sqa_api._quota_reserve_batch(batch)
+
+        # All the reservations are made in a single transaction
+        self.assertEqual(1, len(self.sessions))
+        self.assertEqual(4, len(batch[0].get_result()))
+        self.assertEqual(4, len(batch[1].get_result()))
+        self.assertRaises(exception.OverQuota, batch[2].get_result)
+        self.usages_list[0]["in_use"] = 1
+        self.usages_list[0]["reserved"] = 4
+        self.usages_list[1]["in_use"] = 2
+        self.usages_list[1]["reserved"] = 8
+        self.usages_list[2]["in_use"] = 1024
+        self.usages_list[2]["reserved"] = 4 * 1024
+        self.usages_list[3]["in_use"] = 1
+        self.usages_list[3]["reserved"] = 4
+        self.compare_usage(self.usages, self.usages_list)
+
+    def test_quota_reserve_batch_failure(self):
+        batch = [self._make_reservation_request('user%d' % i)
+                 for i in range(3)]
+
+        def fake_quota_reserve(session, reservation, synced):
+            if reservation.user_id == 'user1':
+                raise exception.QuotaError()
+            return [reservation.user_id], [], None
+
+        with mock.patch.object(sqa_api, '_quota_reserve',
+                               side_effect=fake_quota_reserve):
+            sqa_api._quota_reserve_batch(batch)
+
+        # The failing reservation does not fail the others
+        self.assertEqual(['user0'], batch[0].get_result())
+        self.assertRaises(exception.QuotaError, batch[1].get_result)
+        self.assertEqual(['user2'], batch[2].get_result())
+
+    def test_quota_reserve_batcher(self):
+        batcher = sqa_api._QuotaReserveBatcher()
+        requests = [self._make_reservation_request('user%d' % i)
+                    for i in range(3)]
+        batches = []
+        threads = []
+
+        def fake_quota_reserve_batch(batch):
+            batches.append([request.user_id for request in batch])
+            if len(batches) == 1:
+                # The other callers queue up while the first batch runs
+                threads.extend(eventlet.spawn(batcher.reserve, request)
+                               for request in requests[1:])
+                eventlet.sleep(0)
+            for request in batch:
+                request.set_result(request.user_id)
+
+        with mock.patch.object(sqa_api, '_quota_reserve_batch',
+                               side_effect=fake_quota_reserve_batch):
+            self.assertEqual('user0', batcher.reserve(requests[0]))
+            self.assertEqual(['user1', 'user2'],
+                             [thread.wait() for thread in threads])
+        self.assertEqual([['user0'], ['user1', 'user2']], batches)
+
+    def test_quota_reserve_batcher_interrupted(self):
+        batcher = sqa_api._QuotaReserveBatcher()
+        requests = [self._make_reservation_request('user%d' % i)
+                    for i in range(4)]
+        threads = []
+
+        def fake_quota_reserve_batch(batch):
+            if batch[0] is requests[0]:
+                threads.extend(eventlet.spawn(batcher.reserve, request)
+                               for request in requests[1:3])
+                eventlet.sleep(0)
+                batch[0].set_result('user0')
+            else:
+                # The lead of the second batch times out
+                raise eventlet.Timeout()
+
+        with mock.patch.object(sqa_api, '_quota_reserve_batch',
+                               side_effect=fake_quota_reserve_batch):
+            self.assertEqual('user0', batcher.reserve(requests[0]))
+            self.assertRaises(eventlet.Timeout, threads[0].wait)
+            self.assertRaises(exception.NovaException, threads[1].wait)
+        self.assertEqual({}, batcher._waiting)
+        self.assertEqual(set(), batcher._running)
+
+    def test_quota_reserve_batcher_waiter_interrupted(self):
+        batcher = sqa_api._QuotaReserveBatcher()
+        requests = [self._make_reservation_request('user%d' % i)
+                    for i in range(3)]
+        batches = []
+        threads = []
+
+        def fake_quota_reserve_batch(batch):
+            batches.append([request.user_id for request in batch])
+            if len(batches) == 1:
+                threads.extend(eventlet.spawn(batcher.reserve, request)
+                               for request in requests[1:])
+                eventlet.sleep(0)
+                # The first caller waiting is killed
+                threads[0].kill()
+            for request in batch:
+                request.set_result(request.user_id)
+
+        with mock.patch.object(sqa_api, '_quota_reserve_batch',
+                               side_effect=fake_quota_reserve_batch):
+            self.assertEqual('user0', batcher.reserve(requests[0]))
+            self.assertEqual('user2', threads[1].wait())
+        self.assertEqual([['user0'], ['user2']], batches)
+        self.assertEqual(set(), batcher._running)
+
 
 class NoopQuotaDriverTestCase(test.TestCase):
     def setUp(self):
@@ -15,6 +15,7 @@
 import os
 import StringIO
 
+from nova.virt import images
 from nova.virt.libvirt import utils as libvirt_utils
 
 
@@ -94,6 +95,14 @@ def get_disk_backing_file(path):
     return disk_backing_files.get(path, None)
 
 
+def get_cached_qemu_img_info(path):
+    return images.qemu_img_info(path)
+
+
+def invalidate_qemu_img_info(path):
+    pass
+
+
 def get_disk_type(path):
     return disk_type
 
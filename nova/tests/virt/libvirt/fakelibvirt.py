@@ -113,6 +113,13 @@ VIR_NODE_CPU_STATS_ALL_CPUS = -1
 
 VIR_DOMAIN_START_PAUSED = 1
 
+VIR_DOMAIN_STATS_STATE = 1
+VIR_DOMAIN_STATS_CPU_TOTAL = 2
+VIR_DOMAIN_STATS_BALLOON = 4
+VIR_DOMAIN_STATS_VCPU = 8
+VIR_DOMAIN_STATS_INTERFACE = 16
+VIR_DOMAIN_STATS_BLOCK = 32
+
 # libvirtError enums
 # (Intentionally different from what's in libvirt. We do this to check,
 #  that consumers of the library are using the symbolic names rather than
@@ -575,6 +582,49 @@ class Domain(object):
     def blockJobInfo(self, disk, flags):
         return {}
 
+    def _get_stats(self, stats):
+        """Return the statistics of the domain of the groups stats, as
+        virConnectGetAllDomainStats() does.
+        """
+        state, max_mem, mem, vcpus, cpu_time = self.info()
+        result = {}
+        if stats & VIR_DOMAIN_STATS_STATE:
+            result['state.state'] = state
+            result['state.reason'] = 0
+        if stats & VIR_DOMAIN_STATS_CPU_TOTAL:
+            result['cpu.time'] = cpu_time
+        if stats & VIR_DOMAIN_STATS_BALLOON:
+            result['balloon.current'] = mem
+            result['balloon.maximum'] = max_mem
+        if stats & VIR_DOMAIN_STATS_VCPU:
+            result['vcpu.current'] = vcpus
+            result['vcpu.maximum'] = vcpus
+            for number, vcpu_state, vcpu_time, cpu in self.vcpus()[0]:
+                result['vcpu.%d.state' % number] = vcpu_state
+                result['vcpu.%d.time' % number] = vcpu_time
+        if stats & VIR_DOMAIN_STATS_INTERFACE:
+            nics = self._def['devices'].get('nics', [])
+            result['net.count'] = len(nics)
+            for i in range(len(nics)):
+                name = 'vnet%d' % i
+                values = self.interfaceStats(name)
+                result['net.%d.name' % i] = name
+                for key, value in zip(('rx.bytes', 'rx.pkts', 'rx.errs',
+                                       'rx.drop', 'tx.bytes', 'tx.pkts',
+                                       'tx.errs', 'tx.drop'), values):
+                    result['net.%d.%s' % (i, key)] = value
+        if stats & VIR_DOMAIN_STATS_BLOCK:
+            disks = self._def['devices'].get('disks', [])
+            result['block.count'] = len(disks)
+            for i, disk in enumerate(disks):
+                name = disk.get('target_dev')
+                values = self.blockStats(name)
+                result['block.%d.name' % i] = name
+                for key, value in zip(('rd.reqs', 'rd.bytes', 'wr.reqs',
+                                       'wr.bytes', 'errors'), values):
+                    result['block.%d.%s' % (i, key)] = value
+        return result
+
 
 class DomainSnapshot(object):
     def __init__(self, name, domain):
@@ -1001,6 +1051,15 @@ class Connection(object):
     def listDefinedDomains(self):
         return []
 
+    def listAllDomains(self, flags):
+        return self._vms.values()
+
+    def getAllDomainStats(self, stats, flags):
+        return self.domainListGetStats(self._vms.values(), stats, flags)
+
+    def domainListGetStats(self, doms, stats, flags):
+        return [(dom, dom._get_stats(stats)) for dom in doms]
+
     def listDevices(self, cap, flags):
         return []
 
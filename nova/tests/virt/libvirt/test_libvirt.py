@@ -6063,6 +6063,8 @@ class LibvirtConnTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByName = fake_lookup_name
+        # Without the bulk statistics of the domains
+        libvirt_driver.LibvirtDriver._conn.getLibVersion = lambda: 9007
 
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         actual = conn.get_diagnostics({"name": "testvirt"})
@@ -6143,6 +6145,8 @@ class LibvirtConnTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByName = fake_lookup_name
+        # Without the bulk statistics of the domains
+        libvirt_driver.LibvirtDriver._conn.getLibVersion = lambda: 9007
 
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         actual = conn.get_diagnostics({"name": "testvirt"})
@@ -6217,6 +6221,8 @@ class LibvirtConnTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByName = fake_lookup_name
+        # Without the bulk statistics of the domains
+        libvirt_driver.LibvirtDriver._conn.getLibVersion = lambda: 9007
 
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         actual = conn.get_diagnostics({"name": "testvirt"})
@@ -6293,6 +6299,8 @@ class LibvirtConnTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByName = fake_lookup_name
+        # Without the bulk statistics of the domains
+        libvirt_driver.LibvirtDriver._conn.getLibVersion = lambda: 9007
 
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         actual = conn.get_diagnostics({"name": "testvirt"})
@@ -6375,6 +6383,8 @@ class LibvirtConnTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByName = fake_lookup_name
+        # Without the bulk statistics of the domains
+        libvirt_driver.LibvirtDriver._conn.getLibVersion = lambda: 9007
 
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         actual = conn.get_diagnostics({"name": "testvirt"})
@@ -9238,6 +9248,139 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
         self.assertEqual(vol_usage, [])
 
 
+class LibvirtDomainStatsTestCase(test.TestCase):
+    """Test the information of all the domains collected at once."""
+
+    def setUp(self):
+        super(LibvirtDomainStatsTestCase, self).setUp()
+        self.driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+
+    def _create_conn(self, version=1002008):
+        conn = fakelibvirt.Connection('qemu:///system', version=version)
+        self.stubs.Set(libvirt_driver.LibvirtDriver, '_conn', conn)
+        for name, vcpus in (('instance-1', 2), ('instance-2', 3)):
+            conn.createXML("""
+                <domain type='kvm'>
+                    <name>%s</name>
+                    <memory>2048</memory>
+                    <vcpu>%d</vcpu>
+                    <devices>
+                        <disk type='file'>
+                            <source file='filename'/>
+                            <target dev='vda' bus='virtio'/>
+                        </disk>
+                        <interface type='network'>
+                            <mac address='52:54:00:a4:38:38'/>
+                            <source network='default'/>
+                        </interface>
+                    </devices>
+                </domain>""" % (name, vcpus), 0)
+        return conn
+
+    def test_get_vcpu_used(self):
+        conn = self._create_conn()
+        with contextlib.nested(
+                mock.patch.object(conn, 'getAllDomainStats',
+                                  wraps=conn.getAllDomainStats),
+                mock.patch.object(conn, 'lookupByID')) as (
+                        get_stats, lookup):
+            self.assertEqual(5, self.driver.get_vcpu_used())
+        self.assertEqual(1, get_stats.call_count)
+        self.assertFalse(lookup.called)
+
+    def test_get_vcpu_used_list_all_domains(self):
+        conn = self._create_conn(version=9013)
+        with contextlib.nested(
+                mock.patch.object(conn, 'listAllDomains',
+                                  wraps=conn.listAllDomains),
+                mock.patch.object(conn, 'getAllDomainStats'),
+                mock.patch.object(conn, 'lookupByID')) as (
+                        list_all, get_stats, lookup):
+            self.assertEqual(5, self.driver.get_vcpu_used())
+        self.assertEqual(1, list_all.call_count)
+        self.assertFalse(get_stats.called)
+        self.assertFalse(lookup.called)
+
+    def test_get_info_cached_host_stats(self):
+        conn = self._create_conn()
+        expected = self.driver.get_info({'name': 'instance-2'})
+        with contextlib.nested(
+                mock.patch.object(conn, 'getAllDomainStats',
+                                  wraps=conn.getAllDomainStats),
+                mock.patch.object(conn, 'lookupByName')) as (
+                        get_stats, lookup):
+            with self.driver.cached_host_stats():
+                self.assertEqual(expected,
+                                 self.driver.get_info({'name': 'instance-2'}))
+                self.driver.get_info({'name': 'instance-1'})
+                self.driver.get_vcpu_used()
+        self.assertEqual(1, get_stats.call_count)
+        self.assertFalse(lookup.called)
+
+    def test_get_info_host_stats_per_context(self):
+        conn = self._create_conn()
+        with mock.patch.object(conn, 'getAllDomainStats',
+                               wraps=conn.getAllDomainStats) as get_stats:
+            with self.driver.cached_host_stats():
+                self.driver.get_info({'name': 'instance-1'})
+                with self.driver.cached_host_stats():
+                    self.driver.get_info({'name': 'instance-2'})
+                self.assertEqual(1, get_stats.call_count)
+            # Another context takes a fresh snapshot
+            with self.driver.cached_host_stats():
+                self.driver.get_info({'name': 'instance-1'})
+        self.assertEqual(2, get_stats.call_count)
+
+    def test_get_info_without_cached_host_stats(self):
+        conn = self._create_conn()
+        with mock.patch.object(conn, 'getAllDomainStats') as get_stats:
+            info = self.driver.get_info({'name': 'instance-1'})
+        self.assertFalse(get_stats.called)
+        self.assertEqual(2, info['num_cpu'])
+        self.assertEqual(power_state.RUNNING, info['state'])
+
+    def test_get_info_missing_from_host_stats(self):
+        self._create_conn()
+        with self.driver.cached_host_stats():
+            self.driver.get_info({'name': 'instance-1'})
+            self.assertRaises(exception.InstanceNotFound,
+                              self.driver.get_info, {'name': 'instance-3'})
+
+    def test_get_info_incomplete_stats(self):
+        conn = self._create_conn()
+        domain = conn.lookupByName('instance-1')
+        with contextlib.nested(
+                mock.patch.object(conn, 'getAllDomainStats',
+                                  return_value=[(domain, {})]),
+                mock.patch.object(domain, 'info',
+                                  wraps=domain.info)) as (get_stats, info):
+            with self.driver.cached_host_stats():
+                self.assertEqual(
+                        power_state.RUNNING,
+                        self.driver.get_info({'name': 'instance-1'})['state'])
+        self.assertEqual(1, info.call_count)
+
+    def test_get_diagnostics(self):
+        self._create_conn()
+        self.assertEqual({'cpu0_time': 120405L,
+                          'cpu1_time': 120405L,
+                          'vda_read': 10000242400,
+                          'vda_read_req': 2,
+                          'vda_write': 2343424234,
+                          'vda_write_req': 234,
+                          'vda_errors': 34,
+                          'vnet0_rx': 10000242400,
+                          'vnet0_rx_drop': 2,
+                          'vnet0_rx_errors': 0,
+                          'vnet0_rx_packets': 1234,
+                          'vnet0_tx': 213412343233,
+                          'vnet0_tx_drop': 3,
+                          'vnet0_tx_errors': 23,
+                          'vnet0_tx_packets': 34214234,
+                          'memory': 2048},
+                         self.driver.get_diagnostics({'name': 'instance-1'}))
+
+
 class LibvirtNonblockingTestCase(test.TestCase):
     """Test libvirtd calls are nonblocking."""
 
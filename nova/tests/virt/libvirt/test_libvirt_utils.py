@@ -16,12 +16,14 @@
 import functools
 import os
 
+import fixtures
 import mock
 from oslo.config import cfg
 
 from nova.openstack.common import processutils
 from nova import test
 from nova import utils
+from nova.virt import images
 from nova.virt.libvirt import utils as libvirt_utils
 
 CONF = cfg.CONF
@@ -244,3 +246,57 @@ blah BLAH: bb
             mock.call('scp', 'src', 'host:dest'),
         ])
         self.assertEqual(2, mock_execute.call_count)
+
+    def _write_disk(self, path, contents):
+        with open(path, 'w') as f:
+            f.write(contents)
+        # Even if the modification time is unchanged at its resolution
+        os.utime(path, (0, 0))
+
+    @mock.patch.object(images, 'qemu_img_info')
+    def test_get_cached_qemu_img_info(self, mock_info):
+        self.addCleanup(libvirt_utils._qemu_img_infos.clear)
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path, 'disk')
+        self._write_disk(path, 'data')
+
+        info = libvirt_utils.get_cached_qemu_img_info(path)
+        self.assertEqual(mock_info.return_value, info)
+        self.assertEqual(info, libvirt_utils.get_cached_qemu_img_info(path))
+        mock_info.assert_called_once_with(path)
+
+        # The size changed
+        self._write_disk(path, 'more data')
+        libvirt_utils.get_cached_qemu_img_info(path)
+        self.assertEqual(2, mock_info.call_count)
+
+        # Replaced by another file
+        os.rename(path, path + '.old')
+        self._write_disk(path, 'new data!')
+        libvirt_utils.get_cached_qemu_img_info(path)
+        self.assertEqual(3, mock_info.call_count)
+
+    @mock.patch.object(images, 'qemu_img_info')
+    def test_invalidate_qemu_img_info(self, mock_info):
+        self.addCleanup(libvirt_utils._qemu_img_infos.clear)
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        paths = [os.path.join(tmpdir, 'instance', 'disk'),
+                 os.path.join(tmpdir, 'instance', 'disk.local'),
+                 os.path.join(tmpdir, 'instance2', 'disk')]
+        for path in paths:
+            if not os.path.exists(os.path.dirname(path)):
+                os.mkdir(os.path.dirname(path))
+            self._write_disk(path, 'data')
+            libvirt_utils.get_cached_qemu_img_info(path)
+        mock_info.reset_mock()
+
+        libvirt_utils.invalidate_qemu_img_info(paths[0])
+        libvirt_utils.get_cached_qemu_img_info(paths[0])
+        mock_info.assert_called_once_with(paths[0])
+
+        mock_info.reset_mock()
+        libvirt_utils.invalidate_qemu_img_info(
+                os.path.join(tmpdir, 'instance'))
+        for path in paths:
+            libvirt_utils.get_cached_qemu_img_info(path)
+        self.assertEqual([mock.call(paths[0]), mock.call(paths[1])],
+                         mock_info.call_args_list)
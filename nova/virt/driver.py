@@ -20,6 +20,7 @@ Driver base-classes:
     types that support that contract
 """
 
+import contextlib
 import sys
 
 from oslo.config import cfg
@@ -172,6 +173,19 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    @contextlib.contextmanager
+    def cached_host_stats(self):
+        """Context within which get_info() may answer from a snapshot of all
+        the instances of the host.
+
+        Periodic tasks looking at every instance of the host run within this
+        context, so that the drivers able to collect the information of all
+        the instances at once do it once rather than for every instance.
+        The information is then as old as the first get_info() call within
+        the context.
+        """
+        yield
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
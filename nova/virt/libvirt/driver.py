@@ -38,6 +38,7 @@ Supports KVM, LXC, QEMU, UML, and XEN.
 
 """
 
+import contextlib
 import errno
 import eventlet
 import functools
@@ -343,6 +344,18 @@ MIN_QEMU_LIVESNAPSHOT_VERSION = (1, 3, 0)
 MIN_LIBVIRT_BLOCKIO_VERSION = (0, 10, 2)
 # BlockJobInfo management requirement
 MIN_LIBVIRT_BLOCKJOBINFO_VERSION = (1, 1, 1)
+# Listing of all the domains at once
+MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION = (0, 9, 13)
+# Statistics of all the domains at once
+MIN_LIBVIRT_BULK_STATS_VERSION = (1, 2, 8)
+
+# virDomainStatsTypes
+VIR_DOMAIN_STATS_STATE = 1
+VIR_DOMAIN_STATS_CPU_TOTAL = 2
+VIR_DOMAIN_STATS_BALLOON = 4
+VIR_DOMAIN_STATS_VCPU = 8
+VIR_DOMAIN_STATS_INTERFACE = 16
+VIR_DOMAIN_STATS_BLOCK = 32
 
 
 def libvirt_error_handler(context, err):
@@ -350,6 +363,21 @@ def libvirt_error_handler(context, err):
     pass
 
 
+class DomainStatsSnapshot(object):
+    """The information of all the domains of the host, collected at once.
+
+    :param infos: the information of each domain, as returned by
+                  LibvirtDriver.get_info(), by domain name
+    """
+
+    def __init__(self, infos):
+        self.infos = infos
+
+    def active_infos(self):
+        """Return the information of the running domains."""
+        return [info for info in self.infos.itervalues() if info['id'] >= 0]
+
+
 class LibvirtDriver(driver.ComputeDriver):
 
     capabilities = {
@@ -372,6 +400,8 @@ class LibvirtDriver(driver.ComputeDriver):
         self._wrapped_conn_lock = threading.Lock()
         self._caps = None
         self._vcpu_total = 0
+        self._domain_stats_support = None
+        self._domain_stats_local = threading.local()
         self.read_only = read_only
         self.firewall_driver = firewall.load_driver(
             DEFAULT_FIREWALL_DRIVER,
@@ -1185,6 +1215,7 @@ class LibvirtDriver(driver.ComputeDriver):
             # for the second time.
             utils.execute('rm', '-rf', target, delay_on_retry=True,
                           attempts=5)
+            libvirt_utils.invalidate_qemu_img_info(target)
 
         if instance['host'] != CONF.host:
             self._undefine_domain(instance)
@@ -3553,8 +3584,16 @@ class LibvirtDriver(driver.ComputeDriver):
         libvirt error is.
 
         """
+        if getattr(self._domain_stats_local, 'depth', 0):
+            snapshot = self._get_domain_stats()
+            if snapshot is not None and instance['name'] in snapshot.infos:
+                return snapshot.infos[instance['name']]
         virt_dom = self._lookup_by_name(instance['name'])
-        (state, max_mem, mem, num_cpu, cpu_time) = virt_dom.info()
+        return self._get_domain_info(virt_dom, virt_dom.info())
+
+    @staticmethod
+    def _get_domain_info(virt_dom, info):
+        (state, max_mem, mem, num_cpu, cpu_time) = info
         return {'state': LIBVIRT_POWER_STATE[state],
                 'max_mem': max_mem,
                 'mem': mem,
@@ -3562,6 +3601,95 @@ class LibvirtDriver(driver.ComputeDriver):
                 'cpu_time': cpu_time,
                 'id': virt_dom.ID()}
 
+    @contextlib.contextmanager
+    def cached_host_stats(self):
+        """Answer get_info() from a snapshot of all the domains taken with
+        the bulk calls of libvirt.
+
+        The snapshot is taken the first time it is needed within the
+        outermost cached_host_stats() of the calling thread, and dropped
+        when that one exits, so it is never shared with another task.
+        """
+        local = self._domain_stats_local
+        local.depth = getattr(local, 'depth', 0) + 1
+        if local.depth == 1:
+            local.snapshot = None
+        try:
+            yield
+        finally:
+            local.depth -= 1
+            if not local.depth:
+                local.snapshot = None
+
+    def _get_domain_stats_support(self):
+        """Return which bulk call libvirt supports to collect the
+        information of all the domains: 'stats', 'list' or None.
+        """
+        if self._domain_stats_support is None:
+            if (self.has_min_version(MIN_LIBVIRT_BULK_STATS_VERSION) and
+                    hasattr(self._conn, 'getAllDomainStats')):
+                self._domain_stats_support = 'stats'
+            elif (self.has_min_version(MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION)
+                    and hasattr(self._conn, 'listAllDomains')):
+                self._domain_stats_support = 'list'
+            else:
+                self._domain_stats_support = ''
+        return self._domain_stats_support or None
+
+    def _get_domain_stats(self):
+        """Return a DomainStatsSnapshot of all the domains, or None if
+        libvirt cannot list all the domains at once.
+
+        Within cached_host_stats(), the snapshot of the context is reused.
+        """
+        local = self._domain_stats_local
+        cached = getattr(local, 'depth', 0)
+        if cached and local.snapshot is not None:
+            return local.snapshot
+
+        support = self._get_domain_stats_support()
+        if support is None:
+            return None
+        infos = {}
+        if support == 'stats':
+            # One call for all the domains
+            all_stats = self._conn.getAllDomainStats(
+                    VIR_DOMAIN_STATS_STATE | VIR_DOMAIN_STATS_CPU_TOTAL |
+                    VIR_DOMAIN_STATS_BALLOON | VIR_DOMAIN_STATS_VCPU, 0)
+            domains = [(dom, self._get_info_from_stats(stats))
+                       for dom, stats in all_stats]
+        else:
+            # One call for the list, then one call for each domain
+            domains = [(dom, None) for dom in self._conn.listAllDomains(0)]
+        for dom, info in domains:
+            try:
+                if info is None:
+                    info = dom.info()
+                infos[dom.name()] = self._get_domain_info(dom, info)
+            except libvirt.libvirtError as e:
+                # The domain went away since it was listed
+                LOG.debug(_("Could not get the information of domain "
+                            "%(name)s: %(ex)s"), {'name': dom.name(), 'ex': e})
+        snapshot = DomainStatsSnapshot(infos)
+        if cached:
+            local.snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _get_info_from_stats(stats):
+        """Return the virDomainGetInfo() tuple of a domain from its bulk
+        statistics, or None if they are not complete, e.g. for some
+        domains which are not running.
+        """
+        try:
+            return (stats['state.state'],
+                    stats['balloon.maximum'],
+                    stats['balloon.current'],
+                    stats['vcpu.current'],
+                    stats.get('cpu.time', 0))
+        except KeyError:
+            return None
+
     def _create_domain(self, xml=None, domain=None,
                        instance=None, launch_flags=0, power_on=True):
         """Create a domain.
@@ -3870,6 +3998,10 @@ class LibvirtDriver(driver.ComputeDriver):
         if CONF.libvirt.virt_type == 'lxc':
             return total + 1
 
+        snapshot = self._get_domain_stats()
+        if snapshot is not None:
+            return sum(info['num_cpu'] for info in snapshot.active_infos())
+
         dom_ids = self.list_instance_ids()
         for dom_id in dom_ids:
             try:
@@ -3907,9 +4039,18 @@ class LibvirtDriver(driver.ComputeDriver):
         idx3 = m.index('Cached:')
         if CONF.libvirt.virt_type == 'xen':
             used = 0
-            for domain_id in self.list_instance_ids():
+            snapshot = self._get_domain_stats()
+            if snapshot is not None:
+                domains = [(info['id'], info['mem'])
+                           for info in snapshot.active_infos()]
+            else:
+                domains = [(domain_id, None)
+                           for domain_id in self.list_instance_ids()]
+            for domain_id, dom_mem in domains:
                 try:
-                    dom_mem = int(self._lookup_by_id(domain_id).info()[2])
+                    if dom_mem is None:
+                        dom_mem = self._lookup_by_id(domain_id).info()[2]
+                    dom_mem = int(dom_mem)
                 except exception.InstanceNotFound:
                     LOG.info(_("libvirt can't find a domain with id: %s")
                              % domain_id)
@@ -4201,7 +4342,8 @@ class LibvirtDriver(driver.ComputeDriver):
 
         # Temporary: convert supported_instances into a string, while keeping
         # the RPC version as JSON. Can be changed when RPC broadcast is removed
-        stats = self.get_host_stats(refresh=True)
+        with self.cached_host_stats():
+            stats = self.get_host_stats(refresh=True)
         stats['supported_instances'] = jsonutils.dumps(
                 stats['supported_instances'])
         return stats
@@ -4843,8 +4985,12 @@ class LibvirtDriver(driver.ComputeDriver):
 
             disk_type = driver_nodes[cnt].get('type')
             if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+                # qemu-img only runs again when the disk changed
+                img_info = libvirt_utils.get_cached_qemu_img_info(path)
+                backing_file = img_info.backing_file
+                if backing_file:
+                    backing_file = os.path.basename(backing_file)
+                virt_size = img_info.virtual_size
                 over_commit_size = int(virt_size) - dk_size
             else:
                 backing_file = ""
@@ -4995,6 +5141,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         try:
             utils.execute('mv', inst_base, inst_base_resize)
+            libvirt_utils.invalidate_qemu_img_info(inst_base)
             # if we are migrating the instance with shared storage then
             # create the directory.  If it is a remote node the directory
             # has already been created
@@ -5076,6 +5223,8 @@ class LibvirtDriver(driver.ComputeDriver):
                               '-O', 'qcow2', info['path'], path_qcow)
                 utils.execute('mv', path_qcow, info['path'])
 
+            libvirt_utils.invalidate_qemu_img_info(info['path'])
+
         disk_info = blockinfo.get_disk_info(CONF.libvirt.virt_type,
                                             instance,
                                             block_device_info,
@@ -5160,6 +5309,8 @@ class LibvirtDriver(driver.ComputeDriver):
             return result
 
         domain = self._lookup_by_name(instance['name'])
+        if self._get_domain_stats_support() == 'stats':
+            return self._get_diagnostics_from_stats(domain)
         output = {}
         # get cpu time, might launch an exception if the method
         # is not supported by the underlying hypervisor being
@@ -5214,6 +5365,50 @@ class LibvirtDriver(driver.ComputeDriver):
             pass
         return output
 
+    def _get_diagnostics_from_stats(self, domain):
+        """Return the diagnostics of domain from its bulk statistics, which
+        libvirt returns in one call rather than one for each device.
+        """
+        stats = self._conn.domainListGetStats(
+                [domain], VIR_DOMAIN_STATS_BALLOON | VIR_DOMAIN_STATS_VCPU |
+                VIR_DOMAIN_STATS_INTERFACE | VIR_DOMAIN_STATS_BLOCK, 0)[0][1]
+        output = {}
+        for i in range(stats.get('vcpu.current', 0)):
+            if 'vcpu.%d.time' % i in stats:
+                output['cpu%d_time' % i] = stats['vcpu.%d.time' % i]
+        for i in range(stats.get('block.count', 0)):
+            prefix = 'block.%d.' % i
+            if prefix + 'rd.reqs' not in stats:
+                continue
+            disk = stats[prefix + 'name']
+            output[disk + '_read_req'] = stats[prefix + 'rd.reqs']
+            output[disk + '_read'] = stats[prefix + 'rd.bytes']
+            output[disk + '_write_req'] = stats[prefix + 'wr.reqs']
+            output[disk + '_write'] = stats[prefix + 'wr.bytes']
+            output[disk + '_errors'] = stats.get(prefix + 'errors', -1)
+        for i in range(stats.get('net.count', 0)):
+            prefix = 'net.%d.' % i
+            if prefix + 'rx.bytes' not in stats:
+                continue
+            interface = stats[prefix + 'name']
+            output[interface + '_rx'] = stats[prefix + 'rx.bytes']
+            output[interface + '_rx_packets'] = stats[prefix + 'rx.pkts']
+            output[interface + '_rx_errors'] = stats[prefix + 'rx.errs']
+            output[interface + '_rx_drop'] = stats[prefix + 'rx.drop']
+            output[interface + '_tx'] = stats[prefix + 'tx.bytes']
+            output[interface + '_tx_packets'] = stats[prefix + 'tx.pkts']
+            output[interface + '_tx_errors'] = stats[prefix + 'tx.errs']
+            output[interface + '_tx_drop'] = stats[prefix + 'tx.drop']
+        output["memory"] = stats['balloon.maximum']
+        # The bulk statistics of the balloon are only its size
+        try:
+            mem = domain.memoryStats()
+            for key in mem.keys():
+                output["memory-" + key] = mem[key]
+        except (libvirt.libvirtError, AttributeError):
+            pass
+        return output
+
     def instance_on_disk(self, instance):
         # ensure directories exist and are writable
         instance_path = libvirt_utils.get_instance_path(instance)
@@ -5255,6 +5450,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 LOG.error(_('Failed to cleanup directory %(target)s: '
                             '%(e)s'), {'target': target, 'e': e},
                             instance=instance)
+            libvirt_utils.invalidate_qemu_img_info(target)
 
         # It is possible that the delete failed, if so don't mark the instance
         # as cleaned.
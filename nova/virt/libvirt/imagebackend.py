@@ -340,6 +340,7 @@ class Raw(Image):
                 # class Raw is misnamed, format may not be 'raw' in all cases
                 use_cow = self.driver_format == 'qcow2'
                 disk.extend(target, size, use_cow=use_cow)
+                libvirt_utils.invalidate_qemu_img_info(target)
 
         generating = 'image_id' not in kwargs
         if generating:
@@ -382,6 +383,7 @@ class Qcow2(Image):
             libvirt_utils.create_cow_image(base, target)
             if size:
                 disk.extend(target, size, use_cow=True)
+                libvirt_utils.invalidate_qemu_img_info(target)
 
         # Download the unmodified base image unless we already have a copy.
         if not os.path.exists(base):
@@ -167,6 +167,7 @@ def create_image(disk_format, path, size):
                  If no suffix is given, it will be interpreted as bytes.
     """
     execute('qemu-img', 'create', '-f', disk_format, path, size)
+    invalidate_qemu_img_info(path)
 
 
 def create_cow_image(backing_file, path, size=None):
@@ -203,6 +204,7 @@ def create_cow_image(backing_file, path, size=None):
         cow_opts = ['-o', csv_opts]
     cmd = base_cmd + cow_opts + [path]
     execute(*cmd)
+    invalidate_qemu_img_info(path)
 
 
 def create_lvm_image(vg, lv, size, sparse=False):
@@ -481,6 +483,40 @@ def get_disk_backing_file(path, basename=True):
     return backing_file
 
 
+# The qemu-img info of the disk images, with the inode, modification time
+# and size of the file when qemu-img ran, by path
+_qemu_img_infos = {}
+
+
+def get_cached_qemu_img_info(path):
+    """Get the qemu-img info of a disk image, running qemu-img only when
+    the file changed since the last time
+
+    :param path: Path to the disk image
+    :returns: the QemuImgInfo of the image
+    """
+    st = os.stat(path)
+    key = (st.st_ino, st.st_mtime, st.st_size)
+    cached = _qemu_img_infos.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    info = images.qemu_img_info(path)
+    _qemu_img_infos[path] = (key, info)
+    return info
+
+
+def invalidate_qemu_img_info(path):
+    """Forget the cached qemu-img info of a disk image
+
+    :param path: Path to the disk image, or to a directory to forget all
+                 the disk images under it
+    """
+    prefix = os.path.join(path, '')
+    for cached_path in _qemu_img_infos.keys():
+        if cached_path == path or cached_path.startswith(prefix):
+            del _qemu_img_infos[cached_path]
+
+
 def copy_image(src, dest, host=None):
     """Copy a disk image to an existing directory
 
@@ -121,6 +121,13 @@ class BaseWeigher(object):
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
+    def _weigh_objects(self, weigher, weighed_objs, weighing_properties):
+        """Return the weights of weighed_objs given by one weigher.
+
+        Can be overridden in a subclass to change how a weigher is applied.
+        """
+        return weigher.weigh_objects(weighed_objs, weighing_properties)
+
     def get_weighed_objects(self, weigher_classes, obj_list,
             weighing_properties):
         """Return a sorted (descending), normalized list of WeighedObjects."""
@@ -131,7 +138,8 @@ class BaseWeightHandler(loadables.BaseLoader):
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
         for weigher_cls in weigher_classes:
             weigher = weigher_cls()
-            weights = weigher.weigh_objects(weighed_objs, weighing_properties)
+            weights = self._weigh_objects(weigher, weighed_objs,
+                                          weighing_properties)
 
             # Normalize the weights
             weights = normalize(weights,
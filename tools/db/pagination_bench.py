@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the instance listing pages at increasing depths.
+
+Fills the instances table with active and soft-deleted instances spread
+over a few projects, then times the query behind GET /servers/detail, i.e.
+instance_get_all_by_filters() sorted by created_at with a marker, for
+markers further and further into the listing of one project.  The page
+latency should not grow with the depth.
+
+The schema is created by the regular migrations, so that an older
+version can be compared with --version.  Any SQLAlchemy URL can be given
+with --connection; a temporary SQLite database is used by default.
+
+Run like:
+
+    ./tools/db/pagination_bench.py --instances 200000
+    ./tools/db/pagination_bench.py --instances 200000 --version 234
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova.openstack.common import timeutils
+from nova.openstack.common import uuidutils
+
+CONF = cfg.CONF
+
+INSERT_BATCH = 5000
+
+
+def fill_instances(num_instances, num_projects, deleted_ratio):
+    engine = sqlalchemy_api.get_engine()
+    instances = models.Instance.__table__
+    start = timeutils.utcnow() - datetime.timedelta(seconds=num_instances)
+    rows = []
+    for i in xrange(num_instances):
+        # Several instances share each created_at, as happens with
+        # multiple create requests.
+        row = {'uuid': uuidutils.generate_uuid(),
+               'project_id': 'project%d' % (i % num_projects),
+               'user_id': 'user',
+               'display_name': 'server%d' % i,
+               'vm_state': 'active',
+               'created_at': start + datetime.timedelta(seconds=i // 3),
+               'deleted': 0}
+        if (i * deleted_ratio) % 1 >= 1 - deleted_ratio:
+            row['deleted'] = i + 1
+            row['vm_state'] = 'deleted'
+            row['deleted_at'] = row['created_at']
+        rows.append(row)
+        if len(rows) == INSERT_BATCH:
+            engine.execute(instances.insert(), rows)
+            rows = []
+    if rows:
+        engine.execute(instances.insert(), rows)
+
+
+def list_page(ctxt, page_size, marker):
+    return db.instance_get_all_by_filters(ctxt, {'deleted': False},
+                                          'created_at', 'desc',
+                                          limit=page_size, marker=marker)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Time instance listing pages at increasing depths.')
+    parser.add_argument('--instances', type=int, default=100000,
+                        help='number of instances (default: 100000)')
+    parser.add_argument('--projects', type=int, default=4,
+                        help='number of projects (default: 4)')
+    parser.add_argument('--deleted-ratio', type=float, default=0.5,
+                        help='fraction of deleted instances (default: 0.5)')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--depths', type=int, default=6,
+                        help='number of depths timed (default: 6)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='times each page is listed (default: 5)')
+    parser.add_argument('--connection', default=None,
+                        help='SQLAlchemy URL of an empty database '
+                             '(default: a temporary SQLite database)')
+    parser.add_argument('--version', type=int, default=None,
+                        help='migrate the schema to this version only')
+    args = parser.parse_args()
+
+    config.parse_args([sys.argv[0]], default_config_files=[])
+    db_path = None
+    connection = args.connection
+    if connection is None:
+        fd, db_path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % db_path
+    CONF.set_override('connection', connection, group='database')
+
+    try:
+        migration.db_sync(args.version)
+        start = time.time()
+        fill_instances(args.instances, args.projects, args.deleted_ratio)
+        print('Schema version %s, %d instances loaded in %.1fs' %
+              (migration.db_version(), args.instances, time.time() - start))
+
+        ctxt = context.RequestContext('user', 'project0', is_admin=False)
+        # The uuids of the project in listing order, to pick markers from.
+        uuids = [instance['uuid'] for instance in
+                 db.instance_get_all_by_filters(ctxt, {'deleted': False},
+                                                'created_at', 'desc',
+                                                columns_to_join=[])]
+        print('%d instances listed by project0' % len(uuids))
+        print()
+        print('%10s %12s %12s' % ('depth', 'page (ms)', 'rows'))
+        for step in xrange(args.depths):
+            depth = step * (len(uuids) - args.page_size) // max(
+                    args.depths - 1, 1)
+            marker = uuids[depth - 1] if depth else None
+            timings = []
+            for i in xrange(args.repeat):
+                start = time.time()
+                page = list_page(ctxt, args.page_size, marker)
+                timings.append(time.time() - start)
+            print('%10d %12.2f %12d' %
+                  (depth, 1000 * min(timings), len(page)))
+    finally:
+        if db_path is not None:
+            os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the libvirt calls made by the periodic tasks of a compute host.
+
+Defines domains on the fake libvirt connection of the tests, then runs the
+driver side of a power state sync (get_info() of every instance) and of a
+resource audit (get_vcpu_used()) within cached_host_stats(), as the compute
+manager does, and counts the calls made to libvirt:
+
+* legacy: libvirt older than 0.9.13, every domain is looked up and queried
+  on its own;
+* list: libvirt 0.9.13 or newer, virConnectListAllDomains() lists the
+  domains at once, then each one is queried;
+* stats: libvirt 1.2.8 or newer, virConnectGetAllDomainStats() returns the
+  information of all the domains in one call.
+
+Each call can be delayed by --latency milliseconds to account for the round
+trip to libvirtd.  The calls answered by the client library itself, such as
+virDomainGetName(), are not counted.
+
+Run like:
+
+    ./tools/libvirt_stats_bench.py --domains 200 --latency 1
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import sys
+import time
+
+# Sets up eventlet before nova.tests checks it
+from nova import cmd  # noqa
+from nova import config
+from nova.tests.virt.libvirt import fakelibvirt
+from nova.virt import fake
+from nova.virt.libvirt import driver as libvirt_driver
+
+VERSIONS = (('legacy', 9007), ('list', 9013), ('stats', 1002008))
+
+# Answered by the client library, without a call to libvirtd
+LOCAL_CALLS = ('name', 'ID', 'UUIDString')
+
+DOMAIN_XML = """
+<domain type='kvm'>
+    <name>instance-%08x</name>
+    <memory>2097152</memory>
+    <vcpu>%d</vcpu>
+</domain>
+"""
+
+
+class CountingProxy(object):
+    """Count and delay the calls made to a libvirt connection or domain."""
+
+    def __init__(self, obj, calls, latency):
+        self._obj = obj
+        self._calls = calls
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if (name.startswith('_') or name in LOCAL_CALLS or
+                not callable(attr)):
+            return attr
+
+        def call(*args, **kwargs):
+            self._calls[name] += 1
+            if self._latency:
+                time.sleep(self._latency)
+            return self._wrap(attr(*args, **kwargs))
+        return call
+
+    def _wrap(self, result):
+        if isinstance(result, fakelibvirt.Domain):
+            return CountingProxy(result, self._calls, self._latency)
+        if isinstance(result, list):
+            return [self._wrap(item) for item in result]
+        if isinstance(result, tuple) and result:
+            return (self._wrap(result[0]),) + result[1:]
+        return result
+
+
+class BenchDriver(libvirt_driver.LibvirtDriver):
+    # Set by instance rather than connected by the property of the driver
+    _conn = None
+
+
+def create_connection(version, num_domains):
+    conn = fakelibvirt.Connection('qemu:///system', version=version)
+    for i in xrange(num_domains):
+        conn.createXML(DOMAIN_XML % (i + 1, 1 + i % 4), 0)
+    return conn
+
+
+def run(version, num_domains, latency):
+    calls = collections.Counter()
+    driver = BenchDriver(fake.FakeVirtAPI(), False)
+    driver._conn = CountingProxy(create_connection(version, num_domains),
+                                 calls, latency)
+    names = [dom.name() for dom in driver._conn.listAllDomains(0)]
+    calls.clear()
+
+    start = time.time()
+    with driver.cached_host_stats():
+        for name in names:
+            driver.get_info({'name': name})
+    sync_time = time.time() - start
+    sync_calls = sum(calls.values())
+
+    # Timed on its own rather than sharing the snapshot of the sync
+    driver._domain_stats = None
+    start = time.time()
+    with driver.cached_host_stats():
+        driver.get_vcpu_used()
+    audit_time = time.time() - start
+    audit_calls = sum(calls.values()) - sync_calls
+    return sync_calls, sync_time, audit_calls, audit_time, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Count the libvirt calls of the periodic tasks.')
+    parser.add_argument('--domains', type=int, default=100,
+                        help='number of domains (default: 100)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay of each libvirt call in milliseconds '
+                             '(default: 0)')
+    parser.add_argument('--calls', action='store_true',
+                        help='print the calls made by each libvirt API')
+    args = parser.parse_args()
+
+    config.parse_args([sys.argv[0]], default_config_files=[])
+    libvirt_driver.libvirt = fakelibvirt
+
+    print('%d domains, %.1fms per libvirt call' %
+          (args.domains, args.latency))
+    print()
+    print('%8s %12s %12s %12s %12s' % ('path', 'sync calls', 'sync (ms)',
+                                       'audit calls', 'audit (ms)'))
+    for label, version in VERSIONS:
+        sync_calls, sync_time, audit_calls, audit_time, calls = run(
+                version, args.domains, args.latency / 1000.0)
+        print('%8s %12d %12.1f %12d %12.1f' %
+              (label, sync_calls, 1000 * sync_time, audit_calls,
+               1000 * audit_time))
+        if args.calls:
+            for name, count in sorted(calls.items()):
+                print('%21s %d' % (name, count))
+
+
+if __name__ == '__main__':
+    main()
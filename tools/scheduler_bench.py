@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the scheduler against a synthetic population of hosts.
+
+Builds compute nodes with varied capacity and usage, instance statistics,
+metrics, PCI device pools and host aggregates (availability zones, tenant
+isolation, extra specs and allocation ratios), then replays a mix of
+requests through the FilterScheduler or the CachingScheduler and reports
+throughput, latency percentiles and memory use.
+
+The compute nodes and aggregates are either returned straight from memory
+(--backend fake), or read from a SQLite database (--backend sqlite) through
+the regular DB API.  No other service is needed: the instance record updates
+and the RPC casts to compute hosts made by schedule_run_instance are
+replaced with no-ops.
+
+Run like:
+
+    ./tools/scheduler_bench.py --hosts 10000 --requests 500
+    ./tools/scheduler_bench.py --driver caching --backend sqlite \\
+        --set scheduler_use_batch_filters=True --stats
+"""
+
+from __future__ import print_function
+
+import argparse
+import ast
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+from oslo.messaging import conffixture as messaging_conffixture
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova import exception
+from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova.openstack.common import uuidutils
+from nova.scheduler import driver
+from nova.scheduler import stats
+
+CONF = cfg.CONF
+CONF.import_opt('scheduler_default_filters', 'nova.scheduler.host_manager')
+CONF.import_opt('pci_alias', 'nova.pci.pci_request')
+CONF.import_opt('weight_setting', 'nova.scheduler.weights.metrics',
+                group='metrics')
+CONF.import_opt('service_down_time', 'nova.service')
+
+DRIVERS = {
+    'filter': 'nova.scheduler.filter_scheduler.FilterScheduler',
+    'caching': 'nova.scheduler.caching_scheduler.CachingScheduler',
+}
+
+FILTERS = ['RetryFilter', 'AvailabilityZoneFilter', 'RamFilter',
+           'CoreFilter', 'DiskFilter', 'ComputeFilter',
+           'ComputeCapabilitiesFilter', 'ImagePropertiesFilter',
+           'AggregateInstanceExtraSpecsFilter',
+           'AggregateMultiTenancyIsolation', 'PciPassthroughFilter']
+
+FLAVORS = [
+    {'name': 'm1.small', 'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20},
+    {'name': 'm1.medium', 'memory_mb': 4096, 'vcpus': 2, 'root_gb': 40},
+    {'name': 'm1.large', 'memory_mb': 8192, 'vcpus': 4, 'root_gb': 80},
+    {'name': 'ssd.medium', 'memory_mb': 4096, 'vcpus': 2, 'root_gb': 40,
+     'extra_specs': {'aggregate_instance_extra_specs:ssd': 'true'}},
+    {'name': 'nic.large', 'memory_mb': 8192, 'vcpus': 4, 'root_gb': 80,
+     'extra_specs': {'pci_passthrough:alias': 'nic:1'}},
+]
+
+PCI_ALIAS = '{"name": "nic", "vendor_id": "8086", "product_id": "1520"}'
+
+IMAGE_PROPERTIES = [
+    {},
+    {'architecture': 'x86_64', 'hypervisor_type': 'qemu'},
+    {'architecture': 'x86_64', 'vm_mode': 'hvm'},
+]
+
+NUM_ZONES = 3
+NUM_TENANTS = 50
+NUM_ISOLATED_TENANTS = 5
+
+
+def make_compute_nodes(num_hosts, rand):
+    """Return compute node records, each with its service record."""
+    now = timeutils.utcnow()
+    nodes = []
+    for i in xrange(num_hosts):
+        memory_mb = rand.choice([65536, 131072, 262144])
+        vcpus = rand.choice([16, 32, 48, 64])
+        local_gb = rand.choice([500, 1000, 2000])
+        usage = rand.uniform(0, 0.8)
+        vcpus_used = int(vcpus * usage)
+        memory_mb_used = int(memory_mb * usage)
+        local_gb_used = int(local_gb * usage)
+        num_instances = vcpus_used // 2
+        node_stats = {'num_instances': num_instances,
+                      'num_vm_active': num_instances,
+                      'num_task_None': num_instances,
+                      'num_os_type_linux': num_instances,
+                      'io_workload': rand.randint(0, 4)}
+        for project in rand.sample(xrange(NUM_TENANTS),
+                                   min(num_instances, 5)):
+            node_stats['num_proj_tenant%d' % project] = 1
+        metrics = [{'name': 'cpu.percent', 'value': rand.randint(0, 100),
+                    'timestamp': timeutils.strtime(now),
+                    'source': 'scheduler_bench'}]
+        if i % 10 == 0:
+            pci_stats = jsonutils.dumps([{'vendor_id': '8086',
+                                          'product_id': '1520',
+                                          'extra_info': {},
+                                          'count': rand.randint(1, 8)}])
+        else:
+            pci_stats = None
+        host = 'host%05d' % i
+        service = {'id': i + 1, 'host': host, 'binary': 'nova-compute',
+                   'topic': 'compute', 'report_count': 1, 'disabled': False,
+                   'disabled_reason': None, 'created_at': now,
+                   'updated_at': now, 'deleted_at': None, 'deleted': 0}
+        nodes.append({
+            'id': i + 1, 'service_id': i + 1, 'service': service,
+            'vcpus': vcpus, 'memory_mb': memory_mb, 'local_gb': local_gb,
+            'vcpus_used': vcpus_used, 'memory_mb_used': memory_mb_used,
+            'local_gb_used': local_gb_used,
+            'free_ram_mb': memory_mb - memory_mb_used,
+            'free_disk_gb': local_gb - local_gb_used,
+            'disk_available_least': local_gb - local_gb_used,
+            'current_workload': node_stats['io_workload'],
+            'running_vms': num_instances,
+            'hypervisor_type': 'QEMU', 'hypervisor_version': 1002000,
+            'hypervisor_hostname': 'node%05d' % i,
+            'cpu_info': '{}', 'host_ip': '10.0.%d.%d' % (i // 250, i % 250),
+            'supported_instances': jsonutils.dumps(
+                    [['x86_64', 'qemu', 'hvm'], ['i686', 'qemu', 'hvm']]),
+            'metrics': jsonutils.dumps(metrics),
+            'pci_stats': pci_stats, 'extra_resources': None,
+            'stats': jsonutils.dumps(node_stats),
+            'created_at': now, 'updated_at': now, 'deleted_at': None,
+            'deleted': 0})
+    return nodes
+
+
+def make_aggregates(hosts, num_aggregates, rand):
+    """Return aggregates as dicts with 'name', 'hosts' and 'metadetails'.
+
+    Every host is in one availability zone aggregate; the other aggregates
+    are random sets of hosts with SSD, tenant isolation or allocation ratio
+    metadata.
+    """
+    aggregates = []
+    for zone in xrange(NUM_ZONES):
+        aggregates.append({'name': 'az%d' % zone,
+                           'hosts': hosts[zone::NUM_ZONES],
+                           'metadetails': {'availability_zone':
+                                           'az%d' % zone}})
+    for i in xrange(num_aggregates):
+        kind = i % 3
+        if kind == 0:
+            metadata = {'ssd': 'true'}
+        elif kind == 1:
+            metadata = {'filter_tenant_id':
+                        'tenant%d' % (i % NUM_ISOLATED_TENANTS)}
+        else:
+            metadata = {'cpu_allocation_ratio': '%.1f' % rand.uniform(1, 16),
+                        'ram_allocation_ratio': '1.0'}
+        size = rand.randint(1, max(1, len(hosts) // 20))
+        aggregates.append({'name': 'aggregate%d' % i,
+                           'hosts': rand.sample(hosts, size),
+                           'metadetails': metadata})
+    return aggregates
+
+
+def make_requests(num_requests, max_instances, rand):
+    """Return (request_spec, filter_properties) tuples."""
+    requests = []
+    for i in xrange(num_requests):
+        flavor = dict(rand.choice(FLAVORS), ephemeral_gb=0, swap=0)
+        flavor.setdefault('extra_specs', {})
+        if rand.random() < 0.8:
+            num_instances = 1
+        else:
+            num_instances = rand.randint(2, max(2, max_instances))
+        if rand.random() < 0.3:
+            zone = 'az%d' % rand.randrange(NUM_ZONES)
+        else:
+            zone = None
+        instance_properties = {'project_id':
+                               'tenant%d' % rand.randrange(NUM_TENANTS),
+                               'os_type': 'linux',
+                               'availability_zone': zone,
+                               'memory_mb': flavor['memory_mb'],
+                               'vcpus': flavor['vcpus'],
+                               'root_gb': flavor['root_gb'],
+                               'ephemeral_gb': 0,
+                               'vm_state': 'building',
+                               'task_state': 'scheduling'}
+        request_spec = {'instance_properties': instance_properties,
+                        'instance_type': flavor,
+                        'image': {'properties':
+                                  rand.choice(IMAGE_PROPERTIES)},
+                        'num_instances': num_instances,
+                        'instance_uuids': [uuidutils.generate_uuid()
+                                           for n in xrange(num_instances)]}
+        requests.append((request_spec, {'scheduler_hints': {}}))
+    return requests
+
+
+class FakeBackend(object):
+    """Serve compute nodes and aggregates from memory."""
+
+    def __init__(self, nodes, aggregates):
+        self.nodes = nodes
+        self.aggregates = aggregates
+        self.host_metadata = {}
+        for aggregate in aggregates:
+            for host in aggregate['hosts']:
+                metadata = self.host_metadata.setdefault(host, {})
+                for key, value in aggregate['metadetails'].iteritems():
+                    metadata.setdefault(key, set()).add(value)
+
+    def compute_node_get_all(self, context, no_date_fields=False):
+        return self.nodes
+
+    def aggregate_get_all(self, context):
+        return self.aggregates
+
+    def aggregate_metadata_get_by_host(self, context, host, key=None):
+        metadata = self.host_metadata.get(host, {})
+        if key is None:
+            return metadata
+        return dict((k, v) for k, v in metadata.iteritems() if k == key)
+
+    def install(self):
+        db.compute_node_get_all = self.compute_node_get_all
+        db.aggregate_get_all = self.aggregate_get_all
+        db.aggregate_metadata_get_by_host = (
+                self.aggregate_metadata_get_by_host)
+
+
+def load_sqlite(path, nodes, aggregates):
+    """Create the tables needed by the scheduler in SQLite and fill them."""
+    CONF.set_override('connection', 'sqlite:///%s' % path, group='database')
+    engine = sqlalchemy_api.get_engine()
+    tables = [model.__table__ for model in
+              (models.Service, models.ComputeNode, models.Aggregate,
+               models.AggregateHost, models.AggregateMetadata)]
+    models.BASE.metadata.create_all(engine, tables=tables)
+    now = timeutils.utcnow()
+    with engine.begin() as conn:
+        conn.execute(models.Service.__table__.insert(),
+                     [node['service'] for node in nodes])
+        conn.execute(models.ComputeNode.__table__.insert(),
+                     [dict((k, v) for k, v in node.iteritems()
+                           if k != 'service') for node in nodes])
+        for aggregate_id, aggregate in enumerate(aggregates, 1):
+            conn.execute(models.Aggregate.__table__.insert(),
+                         {'id': aggregate_id, 'name': aggregate['name'],
+                          'created_at': now, 'deleted': 0})
+            conn.execute(models.AggregateHost.__table__.insert(),
+                         [{'aggregate_id': aggregate_id, 'host': host,
+                           'created_at': now, 'deleted': 0}
+                          for host in aggregate['hosts']])
+            conn.execute(models.AggregateMetadata.__table__.insert(),
+                         [{'aggregate_id': aggregate_id, 'key': key,
+                           'value': value, 'created_at': now, 'deleted': 0}
+                          for key, value in
+                          aggregate['metadetails'].iteritems()])
+
+
+def stub_side_effects(scheduler):
+    """Drop what schedule_run_instance does beyond choosing hosts."""
+    def instance_update_db(context, instance_uuid, extra_values=None):
+        return {'uuid': instance_uuid}
+
+    def handle_schedule_error(context, ex, instance_uuid, request_spec):
+        scheduler.bench_errors += 1
+
+    driver.instance_update_db = instance_update_db
+    driver.handle_schedule_error = handle_schedule_error
+    scheduler.compute_rpcapi.run_instance = lambda *args, **kwargs: None
+    scheduler.bench_errors = 0
+
+
+def current_rss_mb():
+    """Return the resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() / 1024.0 / 1024.0
+    except IOError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def percentile(sorted_values, percent):
+    """Return the nearest-rank percentile of a sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def set_option(setting):
+    """Apply a '[group.]name=value' setting from the command line."""
+    name, _sep, value = setting.partition('=')
+    group = None
+    if '.' in name:
+        group, name = name.split('.', 1)
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    CONF.set_override(name, value, group=group)
+
+
+def replay(scheduler, requests, method):
+    ctxt = context.get_admin_context()
+    latencies = []
+    failed = 0
+    for request_spec, filter_properties in requests:
+        start = time.time()
+        try:
+            if method == 'select_destinations':
+                scheduler.select_destinations(ctxt, request_spec,
+                                              filter_properties)
+            else:
+                errors = scheduler.bench_errors
+                scheduler.schedule_run_instance(ctxt, request_spec, None,
+                        None, None, True, filter_properties, False)
+                if scheduler.bench_errors > errors:
+                    failed += 1
+        except exception.NoValidHost:
+            failed += 1
+        latencies.append(time.time() - start)
+    return latencies, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Benchmark the scheduler with synthetic hosts.')
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='number of compute nodes (default: 1000)')
+    parser.add_argument('--aggregates', type=int, default=None,
+                        help='number of aggregates besides availability '
+                             'zones (default: hosts / 100)')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='number of requests to replay (default: 200)')
+    parser.add_argument('--max-instances', type=int, default=10,
+                        help='largest number of instances in a request '
+                             '(default: 10)')
+    parser.add_argument('--driver', choices=sorted(DRIVERS),
+                        default='filter')
+    parser.add_argument('--method', default='select_destinations',
+                        choices=['select_destinations',
+                                 'schedule_run_instance'])
+    parser.add_argument('--backend', choices=['fake', 'sqlite'],
+                        default='fake')
+    parser.add_argument('--db-path', default=None,
+                        help='SQLite database file, kept after the run '
+                             '(default: a temporary file)')
+    parser.add_argument('--filters', default=','.join(FILTERS),
+                        help='comma separated filter class names')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='[GROUP.]NAME=VALUE',
+                        help='override a configuration option, may be '
+                             'given more than once')
+    parser.add_argument('--stats', action='store_true',
+                        help='print per filter and weigher timings')
+    parser.add_argument('--config-file', action='append', default=[])
+    args = parser.parse_args()
+
+    messaging_conf = messaging_conffixture.ConfFixture(CONF)
+    messaging_conf.transport_driver = 'fake'
+    config.parse_args([sys.argv[0]] + ['--config-file=%s' % path
+                                       for path in args.config_file],
+                      default_config_files=[])
+    logging.setup('nova')
+    CONF.set_override('scheduler_default_filters', args.filters.split(','))
+    CONF.set_override('pci_alias', [PCI_ALIAS])
+    CONF.set_override('weight_setting', ['cpu.percent=-1.0'],
+                      group='metrics')
+    # The synthetic services never report, keep them up.
+    CONF.set_override('service_down_time', 10 ** 9)
+    CONF.set_override('scheduler_collect_stats', args.stats)
+    for setting in args.set:
+        set_option(setting)
+
+    rand = random.Random(args.seed)
+    num_aggregates = args.aggregates
+    if num_aggregates is None:
+        num_aggregates = args.hosts // 100
+    nodes = make_compute_nodes(args.hosts, rand)
+    aggregates = make_aggregates([node['service']['host'] for node in nodes],
+                                 num_aggregates, rand)
+    requests = make_requests(args.requests, args.max_instances, rand)
+
+    db_path = None
+    if args.backend == 'sqlite':
+        db_path = args.db_path
+        if db_path is None:
+            fd, db_path = tempfile.mkstemp(suffix='.sqlite')
+            os.close(fd)
+        load_sqlite(db_path, nodes, aggregates)
+    else:
+        FakeBackend(nodes, aggregates).install()
+    del nodes
+
+    scheduler = importutils.import_object(DRIVERS[args.driver])
+    stub_side_effects(scheduler)
+    ctxt = context.get_admin_context()
+
+    rss = current_rss_mb()
+    start = time.time()
+    if args.driver == 'caching':
+        scheduler.run_periodic_tasks(ctxt)
+    else:
+        list(scheduler.host_manager.get_all_host_states(ctxt))
+    load_time = time.time() - start
+    host_states_mb = current_rss_mb() - rss
+
+    start = time.time()
+    latencies, failed = replay(scheduler, requests, args.method)
+    elapsed = time.time() - start
+
+    if args.backend == 'sqlite' and args.db_path is None:
+        os.unlink(db_path)
+
+    latencies.sort()
+    instances = sum(spec['num_instances'] for spec, props in requests)
+    print('Driver: %s, method: %s, backend: %s' %
+          (DRIVERS[args.driver], args.method, args.backend))
+    print('Hosts: %d, aggregates: %d' %
+          (args.hosts, num_aggregates + NUM_ZONES))
+    print('Requests: %d (%d instances), %d failed' %
+          (len(requests), instances, failed))
+    print('Initial host state load: %.3fs' % load_time)
+    print('Throughput: %.2f requests/s' % (len(requests) / elapsed))
+    print('Latency: p50 %.2fms, p90 %.2fms, p99 %.2fms, max %.2fms' %
+          tuple(1000 * value for value in
+                (percentile(latencies, 50), percentile(latencies, 90),
+                 percentile(latencies, 99), latencies[-1])))
+    print('Memory: %.1fMB for host states, %.1fMB peak RSS' %
+          (host_states_mb, peak_rss_mb()))
+    if args.stats:
+        print()
+        print('%-45s %8s %12s %12s %10s %10s' %
+              ('step', 'calls', 'total (s)', 'max (ms)', 'hosts in',
+               'hosts out'))
+        for name, timing in sorted(stats.STATS.report().iteritems()):
+            print('%-45s %8d %12.3f %12.3f %10d %10d' %
+                  (name, timing['calls'], timing['total'],
+                   1000 * timing['max'], timing['hosts_in'],
+                   timing['hosts_out']))
+
+
+if __name__ == '__main__':
+    main()